@@ -56,6 +56,7 @@ def default_config():
         "actions": [],
         "debug_rules": False,
         "rule_optimizer": True,
+        "event_processing_workers": 0,
         "log_level": {
             "cmk.mkeventd": cmk.utils.log.INFO,
             "cmk.mkeventd.EventServer": cmk.utils.log.INFO,
@@ -77,7 +78,7 @@ def default_config():
         "eventsocket_queue_len": 10,
         "hostname_translation": {},
         "archive_orphans": False,
-        "archive_mode": "file",
+        "archive_mode": "file",  # "file", "indexed" or "mongodb"
         "translate_snmptraps": False,
         "snmp_credentials": [v1_v2_credential],
         "event_limit": {
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2019             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+
+"""In-memory store of the current events of the Event Console
+
+The events are kept in a dictionary by event ID. Because event IDs are
+assigned in ascending order, the ID order is the age order of the events.
+
+Secondary indexes map the rule ID, the host name, the combination of rule ID,
+host and application and the phase of the events to the IDs of the matching
+events. The keys an event is indexed with are remembered per event, so an
+event is always removed from the right index buckets, even if it has been
+modified since. After changing a stored event, reindex() has to be called to
+move it to the right buckets.
+
+The store also keeps track of the events added, changed and removed since the
+last call of take_changes(), which is used to journal the changes of the
+status of the Event Console.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple  # pylint: disable=unused-import
+
+Event = Dict[str, Any]  # pylint: disable=invalid-name
+_IndexKeys = Tuple[Any, Any, Tuple[Any, Any, Any], Any]  # pylint: disable=invalid-name
+
+
+class EventStore(object):
+    def __init__(self, events=None):
+        # type: (Optional[Iterable[Event]]) -> None
+        super(EventStore, self).__init__()
+        self._events = {}  # type: Dict[int, Event]
+        self._index_keys = {}  # type: Dict[int, _IndexKeys]
+        self._by_rule = {}  # type: Dict[Any, Dict[int, Event]]
+        self._by_host = {}  # type: Dict[Any, Dict[int, Event]]
+        self._by_rule_host_application = {}  # type: Dict[Tuple[Any, Any, Any], Dict[int, Event]]
+        self._by_phase = {}  # type: Dict[Any, Dict[int, Event]]
+        # IDs in age order, None when it needs to be recomputed
+        self._ordered_ids = []  # type: Optional[List[int]]
+        # No ID below this one is in the store
+        self._min_id = 0
+        # Changes since the last call of take_changes()
+        self._changed_ids = set()  # type: Set[int]
+        self._removed_ids = set()  # type: Set[int]
+
+        for event in events or []:
+            self.add(event)
+        self._changed_ids.clear()
+
+    def __len__(self):
+        # type: () -> int
+        return len(self._events)
+
+    def __contains__(self, event):
+        # type: (Event) -> bool
+        return self._events.get(event["id"]) is event
+
+    def events(self):
+        # type: () -> List[Event]
+        """Returns all events, oldest first"""
+        if self._ordered_ids is None:
+            self._ordered_ids = sorted(self._events)
+        return [self._events[event_id] for event_id in self._ordered_ids]
+
+    def get(self, event_id):
+        # type: (int) -> Optional[Event]
+        return self._events.get(event_id)
+
+    def add(self, event):
+        # type: (Event) -> None
+        event_id = event["id"]
+        if event_id in self._events:
+            raise KeyError("Event %d is already present" % event_id)
+
+        self._events[event_id] = event
+        self._index(event_id, event)
+        self._changed_ids.add(event_id)
+        self._removed_ids.discard(event_id)
+
+        if self._ordered_ids is not None:
+            if self._ordered_ids and self._ordered_ids[-1] > event_id:
+                self._ordered_ids = None
+            else:
+                self._ordered_ids.append(event_id)
+
+        if event_id < self._min_id:
+            self._min_id = event_id
+
+    def remove(self, event):
+        # type: (Event) -> None
+        event_id = event["id"]
+        if self._events.get(event_id) is not event:
+            raise KeyError("Event %d is not present" % event_id)
+
+        del self._events[event_id]
+        self._unindex(event_id)
+        self._ordered_ids = None
+        self._changed_ids.discard(event_id)
+        self._removed_ids.add(event_id)
+
+    def reindex(self, event):
+        # type: (Event) -> None
+        """Update the indexes after an event has been changed"""
+        event_id = event["id"]
+        if self._events.get(event_id) is not event:
+            return  # Not (or no longer) stored
+        self._changed_ids.add(event_id)
+        if self._index_keys[event_id] != _index_keys(event):
+            self._unindex(event_id)
+            self._index(event_id, event)
+
+    def take_changes(self):
+        # type: () -> Tuple[List[Event], List[int]]
+        """Returns the events added or changed and the IDs of the events removed
+        since the last call"""
+        changed = [self._events[event_id] for event_id in sorted(self._changed_ids)]
+        removed = sorted(self._removed_ids)
+        self._changed_ids.clear()
+        self._removed_ids.clear()
+        return changed, removed
+
+    def oldest(self):
+        # type: () -> Optional[Event]
+        if not self._events:
+            return None
+        while self._min_id not in self._events:
+            self._min_id += 1
+        return self._events[self._min_id]
+
+    def oldest_of_rule(self, rule_id):
+        # type: (Any) -> Optional[Event]
+        return _oldest(self._by_rule.get(rule_id))
+
+    def oldest_of_host(self, host):
+        # type: (Any) -> Optional[Event]
+        return _oldest(self._by_host.get(host))
+
+    def of_rule(self, rule_id):
+        # type: (Any) -> List[Event]
+        """Returns the events of a rule, oldest first"""
+        return self._sorted(self._by_rule.get(rule_id))
+
+    def of_rule_host_application(self, rule_id, host, application):
+        # type: (Any, Any, Any) -> List[Event]
+        """Returns the events of a rule with the given host and application, oldest first"""
+        return self._sorted(self._by_rule_host_application.get((rule_id, host, application)))
+
+    def of_rule_host(self, rule_id, host):
+        # type: (Any, Any) -> List[Event]
+        """Returns the events of a rule with the given host, oldest first"""
+        return [event for event in self._sorted(self._by_host.get(host)) if event["rule_id"] == rule_id]
+
+    def of_phase(self, phase):
+        # type: (Any) -> List[Event]
+        """Returns the events in the given phase, oldest first"""
+        return self._sorted(self._by_phase.get(phase))
+
+    def _sorted(self, bucket):
+        # type: (Optional[Dict[int, Event]]) -> List[Event]
+        if not bucket:
+            return []
+        return [bucket[event_id] for event_id in sorted(bucket)]
+
+    def _index(self, event_id, event):
+        # type: (int, Event) -> None
+        keys = self._index_keys[event_id] = _index_keys(event)
+        rule_id, host, rule_host_application, phase = keys
+        self._by_rule.setdefault(rule_id, {})[event_id] = event
+        self._by_host.setdefault(host, {})[event_id] = event
+        self._by_rule_host_application.setdefault(rule_host_application, {})[event_id] = event
+        self._by_phase.setdefault(phase, {})[event_id] = event
+
+    def _unindex(self, event_id):
+        # type: (int) -> None
+        rule_id, host, rule_host_application, phase = self._index_keys.pop(event_id)
+        _remove_from_bucket(self._by_rule, rule_id, event_id)
+        _remove_from_bucket(self._by_host, host, event_id)
+        _remove_from_bucket(self._by_rule_host_application, rule_host_application, event_id)
+        _remove_from_bucket(self._by_phase, phase, event_id)
+
+
+def _index_keys(event):
+    # type: (Event) -> _IndexKeys
+    rule_id, host, application = event.get("rule_id"), event.get("host"), event.get("application")
+    return rule_id, host, (rule_id, host, application), event.get("phase")
+
+
+def _remove_from_bucket(index, key, event_id):
+    # type: (Dict[Any, Dict[int, Event]], Any, int) -> None
+    bucket = index[key]
+    del bucket[event_id]
+    if not bucket:
+        del index[key]
+
+
+def _oldest(bucket):
+    # type: (Optional[Dict[int, Event]]) -> Optional[Event]
+    if not bucket:
+        return None
+    return bucket[min(bucket)]
@@ -33,6 +33,7 @@ import time
 import six
 
 import cmk.ec.actions
+import cmk.ec.history_segments
 import cmk.utils.render
 
 # TODO: As one can see clearly below, we should really have a class hierarchy here...
@@ -48,6 +49,7 @@ class History(object):
         self._history_columns = history_columns
         self._lock = threading.Lock()
         self._mongodb = MongoDB()
+        self._segments = None
         self._active_history_period = ActiveHistoryPeriod()
         self.reload_configuration(config)
 
@@ -55,29 +57,39 @@ class History(object):
         self._config = config
         if self._config['archive_mode'] == 'mongodb':
             _reload_configuration_mongodb(self)
+        elif self._config['archive_mode'] == 'indexed':
+            _reload_configuration_indexed(self)
         else:
             _reload_configuration_files(self)
 
     def flush(self):
         if self._config['archive_mode'] == 'mongodb':
             _flush_mongodb(self)
+        elif self._config['archive_mode'] == 'indexed':
+            _flush_indexed(self)
         else:
             _flush_files(self)
 
     def add(self, event, what, who="", addinfo=""):
         if self._config['archive_mode'] == 'mongodb':
             _add_mongodb(self, event, what, who, addinfo)
+        elif self._config['archive_mode'] == 'indexed':
+            _add_indexed(self, event, what, who, addinfo)
         else:
             _add_files(self, event, what, who, addinfo)
 
     def get(self, query):
         if self._config['archive_mode'] == 'mongodb':
             return _get_mongodb(self, query)
+        elif self._config['archive_mode'] == 'indexed':
+            return _get_indexed(self, query)
         return _get_files(self, self._logger, query)
 
     def housekeeping(self):
         if self._config['archive_mode'] == 'mongodb':
             _housekeeping_mongodb(self)
+        elif self._config['archive_mode'] == 'indexed':
+            _housekeeping_indexed(self)
         else:
             _housekeeping_files(self)
 
@@ -322,15 +334,19 @@ def _housekeeping_files(history):
 def _add_files(history, event, what, who, addinfo):
     _log_event(history._config, history._logger, event, what, who, addinfo)
     with history._lock:
-        columns = [str(time.time()), scrub_string(what), scrub_string(who), scrub_string(addinfo)]
-        columns += [
-            quote_tab(event.get(colname[6:], defval))  # drop "event_"
-            for colname, defval in history._event_columns
-        ]
-
+        columns = _history_line_columns(history, event, what, who, addinfo)
         with get_logfile(history._config, history._settings.paths.history_dir.value,
                          history._active_history_period).open(mode='ab') as f:
-            f.write("\t".join(map(cmk.ec.actions.to_utf8, columns)) + "\n")
+            f.write("\t".join(columns) + "\n")
+
+
+def _history_line_columns(history, event, what, who, addinfo):
+    columns = [str(time.time()), scrub_string(what), scrub_string(who), scrub_string(addinfo)]
+    columns += [
+        quote_tab(event.get(colname[6:], defval))  # drop "event_"
+        for colname, defval in history._event_columns
+    ]
+    return map(cmk.ec.actions.to_utf8, columns)
 
 
 def quote_tab(col):
@@ -410,7 +426,11 @@ def _expire_logfiles(settings, config, logger, lock_history, flush):
 
 
 def _get_files(history, logger, query):
-    filters, limit = query.filters, query.limit
+    return _get_logfile_entries(history, logger, query, query.limit)
+
+
+def _get_logfile_entries(history, logger, query, limit):
+    filters = query.filters
     history_entries = []
     if not history._settings.paths.history_dir.value.exists():
         return []
@@ -597,6 +617,78 @@ def _get_logfile_timespan(path):
     return first_entry, last_entry
 
 
+#.
+#   .--Indexed-------------------------------------------------------------.
+#   |               ___           _                   _                    |
+#   |              |_ _|_ __   __| | _____  _____  __| |                   |
+#   |               | || '_ \ / _` |/ _ \ \/ / _ \/ _` |                   |
+#   |               | || | | | (_| |  __/>  <  __/ (_| |                   |
+#   |              |___|_| |_|\__,_|\___/_/\_\___|\__,_|                   |
+#   |                                                                      |
+#   +----------------------------------------------------------------------+
+#   | The history in time partitioned segment files with indexes for the   |
+#   | most frequently used filters, see cmk.ec.history_segments.           |
+#   '----------------------------------------------------------------------'
+
+# Columns of the history with inverted indexes in the segments
+_INDEXED_COLUMNS = ['event_id', 'event_host', 'event_rule_id', 'event_application']
+
+
+def _reload_configuration_indexed(history):
+    if history._segments is not None:
+        return
+
+    # Position of the columns in the history lines, see _add_files
+    indexed_columns = {
+        colname: 4 + nr
+        for nr, (colname, _defval) in enumerate(history._event_columns)
+        if colname in _INDEXED_COLUMNS
+    }
+    history._segments = cmk.ec.history_segments.HistorySegments(
+        history._settings.paths.history_dir.value, indexed_columns, history._logger)
+
+
+def _flush_indexed(history):
+    _flush_files(history)
+    history._segments.expire()
+
+
+def _housekeeping_indexed(history):
+    _housekeeping_files(history)
+    history._segments.expire(time.time() - history._config["history_lifetime"] * 86400)
+
+
+def _add_indexed(history, event, what, who, addinfo):
+    _log_event(history._config, history._logger, event, what, who, addinfo)
+    with history._lock:
+        history._segments.add(_current_history_period(history._config),
+                              _history_line_columns(history, event, what, who, addinfo))
+
+
+def _get_indexed(history, query):
+    limit = query.limit
+    entries = []
+    for line_no, line in history._segments.entries(query.filters):
+        if limit is not None and len(entries) >= limit:
+            break
+
+        try:
+            parts = line.decode('utf-8').split('\t')
+            _convert_history_line(history, parts)
+            values = [line_no] + parts
+            if query.filter_row(values):
+                entries.append(values)
+        except Exception as e:
+            history._logger.exception("Invalid line '%s' in history segment: %s" % (line, e))
+
+    # Entries of log files written before switching to the indexed history
+    if limit is None:
+        entries += _get_logfile_entries(history, history._logger, query, None)
+    elif len(entries) < limit:
+        entries += _get_logfile_entries(history, history._logger, query, limit - len(entries))
+    return entries
+
+
 # Rip out/replace any characters which have a special meaning in the UTF-8
 # encoded history files, see e.g. quote_tab. In theory this shouldn't be
 # necessary, because there are a bunch of bytes which are not contained in any
@@ -0,0 +1,388 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2018             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+"""Time partitioned and indexed files for the history of the Event Console
+
+The history entries are written to segment files in the history directory.
+They contain the same tab separated lines as the plain history log files. A
+segment belongs to one history period and holds at most SEGMENT_MAX_ENTRIES
+entries. Each segment has an index, which is kept in memory while the
+segment is written and saved next to it as soon as the segment is complete:
+
+* A sparse time index: The entries are grouped into blocks of BLOCK_ENTRIES
+  entries. The file offset and the time range of each block is known.
+* Inverted indexes mapping the lower case values of some columns, e.g. the
+  host name, to the blocks containing them.
+
+Queries only read the blocks which may contain matching entries, the newest
+first, and can stop as soon as enough entries have been found.
+"""
+
+import collections
+import json
+import threading
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple  # pylint: disable=unused-import
+
+import cmk.utils.render
+
+BLOCK_ENTRIES = 128
+SEGMENT_MAX_ENTRIES = 100000
+
+# Maximum number of indexes of complete segments to keep in memory
+_INDEX_CACHE_SIZE = 64
+
+# Operators which can be answered by the inverted indexes
+_INDEX_OPERATORS = ["=", "=~", "in"]
+
+
+def index_key(value):
+    # type: (Any) -> unicode
+    if isinstance(value, str):
+        value = value.decode("utf-8")
+    elif not isinstance(value, unicode):
+        value = unicode(value)
+    return value.lower()
+
+
+def _time_range_may_match(operator_name, predicate, argument, min_time, max_time):
+    # type: (str, Any, Any, float, float) -> bool
+    if operator_name in [">", ">=", "<", "<="]:
+        return predicate(min_time) or predicate(max_time)
+    if operator_name == "=":
+        return min_time <= argument <= max_time
+    return True
+
+
+class SegmentIndex(object):
+    """The sparse time index and the inverted indexes of a segment"""
+    def __init__(self, column_names):
+        # type: (Iterable[str]) -> None
+        super(SegmentIndex, self).__init__()
+        self.size = 0
+        self.num_entries = 0
+        # Offset, minimum and maximum time of the entries per block
+        self.blocks = []  # type: List[List[Any]]
+        # Block numbers per value of the indexed columns
+        self.columns = {name: {} for name in column_names}  # type: Dict[str, Dict[unicode, List[int]]]
+
+    @classmethod
+    def from_dict(cls, data):
+        # type: (Dict[str, Any]) -> SegmentIndex
+        index = cls([])
+        index.size = data["size"]
+        index.num_entries = data["num_entries"]
+        index.blocks = data["blocks"]
+        index.columns = data["columns"]
+        return index
+
+    def to_dict(self):
+        # type: () -> Dict[str, Any]
+        return {
+            "size": self.size,
+            "num_entries": self.num_entries,
+            "blocks": self.blocks,
+            "columns": self.columns,
+        }
+
+    def add(self, length, timestamp, keys):
+        # type: (int, float, Dict[str, unicode]) -> None
+        """Adds the entry written to the end of the segment"""
+        if self.num_entries % BLOCK_ENTRIES == 0:
+            self.blocks.append([self.size, timestamp, timestamp])
+        else:
+            block = self.blocks[-1]
+            if timestamp < block[1]:
+                block[1] = timestamp
+            elif timestamp > block[2]:
+                block[2] = timestamp
+
+        block_nr = len(self.blocks) - 1
+        for name, key in keys.iteritems():
+            block_nrs = self.columns[name].setdefault(key, [])
+            if not block_nrs or block_nrs[-1] != block_nr:
+                block_nrs.append(block_nr)
+
+        self.num_entries += 1
+        self.size += length
+
+    def candidate_blocks(self, filters):
+        # type: (List[Tuple[str, str, Any, Any]]) -> List[Tuple[int, int, int]]
+        """Returns (block number, start offset, end offset) of the blocks which
+        may contain entries matching all filters, the newest block first"""
+        candidates = None
+        for column_name, operator_name, predicate, argument in filters:
+            if column_name == "history_time":
+                block_nrs = [
+                    block_nr for block_nr, (_offset, min_time, max_time) in enumerate(self.blocks)
+                    if _time_range_may_match(operator_name, predicate, argument, min_time, max_time)
+                ]
+            elif column_name in self.columns and operator_name in _INDEX_OPERATORS:
+                column_index = self.columns[column_name]
+                block_nrs = []
+                for value in (argument if operator_name == "in" else [argument]):
+                    block_nrs += column_index.get(index_key(value), [])
+            else:
+                continue
+
+            if candidates is None:
+                candidates = set(block_nrs)
+            else:
+                candidates.intersection_update(block_nrs)
+
+        if candidates is None:
+            candidates = xrange(len(self.blocks))
+
+        ends = [block[0] for block in self.blocks[1:]] + [self.size]
+        return [(block_nr, self.blocks[block_nr][0], ends[block_nr])
+                for block_nr in sorted(candidates, reverse=True)]
+
+
+class HistorySegments(object):
+    """The segment files of the history
+
+    indexed_columns maps the names of the indexed columns to their position
+    in the history lines."""
+    def __init__(self, directory, indexed_columns, logger):
+        super(HistorySegments, self).__init__()
+        self._directory = directory
+        self._indexed_columns = indexed_columns  # type: Dict[str, int]
+        self._logger = logger
+        self._lock = threading.Lock()
+
+        # The segment currently written to. The index is None when the newest
+        # segment is already complete.
+        self._active_path = None
+        self._active_period = None  # type: Optional[int]
+        self._active_seq = None  # type: Optional[int]
+        self._active_index = None  # type: Optional[SegmentIndex]
+
+        self._index_cache = collections.OrderedDict()  # type: Dict[Any, SegmentIndex]
+
+    def add(self, period, columns):
+        # type: (int, List[str]) -> None
+        """Appends an entry to the segments of the given history period
+
+        The columns are the UTF-8 encoded columns of the entry, the first one
+        being the time of the entry."""
+        line = "\t".join(columns) + "\n"
+        keys = {
+            name: index_key(columns[position])
+            for name, position in self._indexed_columns.iteritems()
+        }
+        with self._lock:
+            self._activate_segment(period)
+            with self._active_path.open(mode="ab") as f:
+                f.write(line)
+            self._active_index.add(len(line), float(columns[0]), keys)
+
+    def _activate_segment(self, period):
+        # type: (int) -> None
+        if self._active_path is None:
+            self._resume_newest_segment()
+
+        if self._active_path is None:
+            seq = 0
+        else:
+            if period <= self._active_period and self._active_index is not None \
+               and self._active_index.num_entries < SEGMENT_MAX_ENTRIES:
+                return
+
+            # Continue with a newer period, e.g. after switching from
+            # daily to weekly rotation
+            period = max(period, self._active_period)
+            seq = self._active_seq + 1 if period == self._active_period else 0
+            if self._active_index is not None:
+                self._complete_segment(self._active_path, self._active_index)
+
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._active_period, self._active_seq = period, seq
+        self._active_path = self._directory / ("%d-%d.seg" % (period, seq))
+        self._active_index = SegmentIndex(self._indexed_columns)
+
+    def _resume_newest_segment(self):
+        # type: () -> None
+        segments = self._segments()
+        if not segments:
+            return
+
+        self._active_period, self._active_seq, self._active_path = segments[0]
+        if _index_path(self._active_path).exists():
+            self._active_index = None
+        else:
+            self._active_index = self._scan_segment(self._active_path)
+
+    def _scan_segment(self, path):
+        # type: (Any) -> SegmentIndex
+        """Creates the index of a segment which has not been completed"""
+        index = SegmentIndex(self._indexed_columns)
+        with path.open(mode="r+b") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    # Partially written entry, e.g. because of a crash
+                    f.truncate(index.size)
+                    break
+                columns = line[:-1].split("\t")
+                keys = {
+                    name: index_key(columns[position]) if position < len(columns) else u""
+                    for name, position in self._indexed_columns.iteritems()
+                }
+                try:
+                    timestamp = float(columns[0])
+                except ValueError:
+                    timestamp = 0.0
+                index.add(len(line), timestamp, keys)
+        return index
+
+    def _complete_segment(self, path, index):
+        # type: (Any, SegmentIndex) -> None
+        index_path = _index_path(path)
+        tmp_path = index_path.parent / (index_path.name + ".new")
+        with tmp_path.open(mode="wb") as f:
+            json.dump(index.to_dict(), f)
+        tmp_path.rename(index_path)
+        self._cache_index(path, index)
+
+    def _cache_index(self, path, index):
+        # type: (Any, SegmentIndex) -> None
+        self._index_cache[path] = index
+        while len(self._index_cache) > _INDEX_CACHE_SIZE:
+            self._index_cache.popitem(last=False)
+
+    def _load_index(self, path):
+        # type: (Any) -> SegmentIndex
+        try:
+            return self._index_cache[path]
+        except KeyError:
+            pass
+
+        index_path = _index_path(path)
+        if index_path.exists():
+            with index_path.open(mode="rb") as f:
+                index = SegmentIndex.from_dict(json.load(f))
+            self._cache_index(path, index)
+        else:
+            # Left over from a crash before completing the segment
+            index = self._scan_segment(path)
+            self._complete_segment(path, index)
+        return index
+
+    def _segments(self):
+        # type: () -> List[Tuple[int, int, Any]]
+        """Returns (period, sequence number, path) of all segments, the newest first"""
+        if not self._directory.exists():
+            return []
+
+        segments = []
+        for path in self._directory.glob("*.seg"):
+            try:
+                period, seq = map(int, str(path.name)[:-4].split("-"))
+            except ValueError:
+                continue
+            segments.append((period, seq, path))
+        segments.sort(reverse=True)
+        return segments
+
+    def entries(self, filters):
+        # type: (List[Tuple[str, str, Any, Any]]) -> Iterator[Tuple[int, str]]
+        """Yields (line number in segment, line) of the entries which may match
+        all filters, the newest entry first"""
+        # Checking the indexed columns of the lines of the candidate blocks is
+        # cheap compared to converting the lines for the filters
+        line_filters = [
+            (self._indexed_columns[column_name],
+             set(index_key(value) for value in (argument if operator_name == "in" else [argument])))
+            for column_name, operator_name, _predicate, argument in filters
+            if column_name in self._indexed_columns and operator_name in _INDEX_OPERATORS
+        ]
+
+        for _period, _seq, path in self._segments():
+            with self._lock:
+                if path == self._active_path and self._active_index is not None:
+                    index = self._active_index
+                else:
+                    try:
+                        index = self._load_index(path)
+                    except Exception as e:
+                        self._logger.exception("Cannot read index of history segment %s: %s" %
+                                               (path, e))
+                        continue
+                # The blocks of the active segment may grow, but the offsets
+                # computed here stay valid.
+                blocks = index.candidate_blocks(filters)
+
+            if not blocks:
+                continue
+
+            try:
+                f = path.open(mode="rb")
+            except IOError:
+                continue  # Has just been expired
+
+            with f:
+                for block_nr, start, end in blocks:
+                    f.seek(start)
+                    lines = f.read(end - start).split("\n")
+                    lines.pop()  # Nothing after the last newline
+                    first_line_no = block_nr * BLOCK_ENTRIES + 1
+                    for nr in xrange(len(lines) - 1, -1, -1):
+                        if not line_filters or _line_may_match(lines[nr], line_filters):
+                            yield first_line_no + nr, lines[nr]
+
+    def expire(self, min_mtime=None):
+        # type: (Optional[float]) -> None
+        """Deletes the segments not modified since min_mtime, all segments for None"""
+        with self._lock:
+            for _period, _seq, path in self._segments():
+                mtime = path.stat().st_mtime
+                if min_mtime is not None and mtime >= min_mtime:
+                    continue
+
+                self._logger.info("Deleting history segment %s (modified %s)" %
+                                  (path, cmk.utils.render.date_and_time(mtime)))
+                index_path = _index_path(path)
+                if index_path.exists():
+                    index_path.unlink()
+                path.unlink()
+                self._index_cache.pop(path, None)
+                if path == self._active_path:
+                    self._active_path = None
+                    self._active_index = None
+
+
+def _line_may_match(line, line_filters):
+    # type: (str, List[Tuple[int, Any]]) -> bool
+    columns = line.split("\t")
+    try:
+        for position, keys in line_filters:
+            if position >= len(columns) or index_key(columns[position]) not in keys:
+                return False
+    except UnicodeDecodeError:
+        pass  # Let the caller report the broken line
+    return True
+
+
+def _index_path(path):
+    return path.parent / (str(path.name)[:-4] + ".idx")
@@ -33,8 +33,11 @@
 
 import abc
 import ast
+import collections
 import errno
 import json
+import logging
+import multiprocessing
 import os
 import pprint
 import re
@@ -54,9 +57,12 @@ import cmk
 import cmk.utils.daemon
 import cmk.utils.defines
 import cmk.ec.actions
+import cmk.ec.event_store
 import cmk.ec.export
 import cmk.ec.history
+import cmk.ec.rule_prefilter
 import cmk.ec.settings
+import cmk.ec.status_journal
 import cmk.ec.snmp
 import cmk.utils.log
 import cmk.utils.paths
@@ -592,9 +598,9 @@ class Perfcounters(object):
 
         self._logger = logger.getChild("Perfcounters")
 
-    def count(self, counter):
+    def count(self, counter, amount=1):
         with self._lock:
-            self._counters[counter] += 1
+            self._counters[counter] += amount
 
     def count_time(self, counter, ptime):
         with self._lock:
@@ -653,6 +659,73 @@ class Perfcounters(object):
             return row
 
 
+class _Poller(object):
+    """Waits for readable file descriptors, using epoll where it is available"""
+    def __init__(self):
+        super(_Poller, self).__init__()
+        self._fds = set()
+        self._epoll = select.epoll() if hasattr(select, "epoll") else None
+
+    def register(self, fd):
+        self._fds.add(fd)
+        if self._epoll is not None:
+            self._epoll.register(fd, select.EPOLLIN)
+
+    # Needs to be called before closing the file descriptor
+    def unregister(self, fd):
+        self._fds.discard(fd)
+        if self._epoll is not None:
+            self._epoll.unregister(fd)
+
+    def poll(self, timeout):
+        try:
+            if self._epoll is not None:
+                return set(fd for fd, _mask in self._epoll.poll(timeout))
+            return set(select.select(list(self._fds), [], [], timeout)[0])
+        except (IOError, select.error) as e:
+            if e.args[0] == errno.EINTR:
+                return set()
+            raise
+
+    def close(self):
+        if self._epoll is not None:
+            self._epoll.close()
+
+
+def _set_receive_buffer_size(sock):
+    # Give message bursts some room, the kernel caps this at net.core.rmem_max
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, EventServer.udp_receive_buffer_size)
+    except socket.error:
+        pass
+
+
+# The event server of the worker processes. It is set by the event server
+# thread right before the worker pool is created, so that the forked workers
+# inherit the configuration and the compiled rules.
+_g_worker_event_server = None
+
+
+def _init_event_worker():
+    # The workers are forked from the multi threaded event daemon. A lock of
+    # the logging module held by another thread at that moment would never be
+    # released in the worker, so it would hang as soon as it logs something.
+    logging._lock = threading.RLock()  # pylint: disable=protected-access
+    for handler_ref in logging._handlerList:  # pylint: disable=protected-access
+        handler = handler_ref()
+        if handler is not None:
+            handler.createLock()
+
+    # The main process handles the signals and terminates the workers
+    for signum in [signal.SIGHUP, signal.SIGINT, signal.SIGQUIT]:
+        signal.signal(signum, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def _prepare_lines_in_worker(chunks):
+    return _g_worker_event_server.prepare_lines(chunks)
+
+
 #.
 #   .--EventServer---------------------------------------------------------.
 #   |      _____                 _   ____                                  |
@@ -667,6 +740,17 @@ class Perfcounters(object):
 
 
 class EventServer(ECServerThread):
+    # Size of the reads from the sockets and the event pipe
+    receive_buffer_size = 65536
+    udp_receive_buffer_size = 4 * 1024 * 1024
+    # Maximum number of syslog datagrams read in one go
+    max_datagrams_per_read = 1000
+    # Maximum number of line batches the worker processes may be ahead
+    max_pending_batches_per_worker = 4
+    # Seconds to wait for a batch of the worker processes before giving up on
+    # them and processing the lines in the event server thread
+    worker_batch_timeout = 30
+
     month_names = {
         "Jan": 1,
         "Feb": 2,
@@ -696,6 +780,10 @@ class EventServer(ECServerThread):
         self._snmptrap = None
 
         self._rules = []
+        self._rules_generation = 0
+        self._rule_hash = {}
+        self._rule_hash_keys = []
+        self._rule_prefilter = None
         self._hash_stats = []
         for _unused_facility in xrange(32):
             self._hash_stats.append([0] * 8)
@@ -710,6 +798,12 @@ class EventServer(ECServerThread):
         self._rule_matcher = RuleMatcher(self._logger, config)
         self._event_creator = EventCreator(self._logger, config)
 
+        self._worker_pool = None
+        self._worker_count = 0
+        self._worker_generation = None
+        self._unprepared_chunks = []
+        self._pending_batches = collections.deque()
+
         self.create_pipe()
         self.open_eventsocket()
         self.open_syslog()
@@ -823,6 +917,8 @@ class EventServer(ECServerThread):
                 self._syslog.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
                 self._syslog.bind(("0.0.0.0", endpoint.value))
                 self._logger.info("Opened builtin syslog server on UDP port %d" % endpoint.value)
+            if self._syslog is not None:
+                _set_receive_buffer_size(self._syslog)
         except Exception as e:
             raise Exception("Cannot start builtin syslog server: %s" % e)
 
@@ -859,6 +955,8 @@ class EventServer(ECServerThread):
                 self._snmptrap.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
                 self._snmptrap.bind(("0.0.0.0", endpoint.value))
                 self._logger.info("Opened builtin snmptrap server on UDP port %d" % endpoint.value)
+            if self._snmptrap is not None:
+                _set_receive_buffer_size(self._snmptrap)
         except Exception as e:
             raise Exception("Cannot start builtin snmptrap server: %s" % e)
 
@@ -887,148 +985,172 @@ class EventServer(ECServerThread):
     def serve(self):
         pipe_fragment = ''
         pipe = self.open_pipe()
-        listen_list = [pipe]
+        poller = _Poller()
+        poller.register(pipe)
 
         # Wait for incoming syslog packets via UDP
         if self._syslog is not None:
-            listen_list.append(self._syslog.fileno())
+            poller.register(self._syslog.fileno())
 
         # Wait for new connections for events via TCP socket
         if self._syslog_tcp is not None:
-            listen_list.append(self._syslog_tcp)
+            poller.register(self._syslog_tcp.fileno())
 
         # Wait for new connections for events via unix socket
         if self._eventsocket:
-            listen_list.append(self._eventsocket)
+            poller.register(self._eventsocket.fileno())
 
         # Wait for incomding SNMP traps
         if self._snmptrap is not None:
-            listen_list.append(self._snmptrap.fileno())
+            poller.register(self._snmptrap.fileno())
 
         # Keep list of client connections via UNIX socket and
         # read data that is not yet processed. Map from
         # fd to (fileobject, data)
         client_sockets = {}
         select_timeout = 1
-        while not self._terminate_event.is_set():
-            try:
-                readable = select.select(listen_list + client_sockets.keys(), [], [],
-                                         select_timeout)[0]
-            except select.error as e:
-                if e[0] == errno.EINTR:
-                    continue
-                raise
-            data = None
-
-            # Accept new connection on event unix socket
-            if self._eventsocket in readable:
-                client_socket, address = self._eventsocket.accept()
-                # pylint: disable=no-member
-                client_sockets[client_socket.fileno()] = (client_socket, address, "")
-
-            # Same for the TCP syslog socket
-            if self._syslog_tcp and self._syslog_tcp in readable:
-                client_socket, address = self._syslog_tcp.accept()
-                # pylint: disable=no-member
-                client_sockets[client_socket.fileno()] = (client_socket, address, "")
-
-            # Read data from existing event unix socket connections
-            # NOTE: We modify client_socket in the loop, so we need to copy below!
-            for fd, (cs, address, previous_data) in list(client_sockets.iteritems()):
-                if fd in readable:
-                    # Receive next part of data
-                    try:
-                        new_data = cs.recv(4096)
-                    except Exception:
-                        new_data = ""
-                        address = None
-
-                    # Put together with incomplete messages from last time
-                    data = previous_data + new_data
-
-                    # Do we have incomplete data? (if the socket has been
-                    # closed then we consider the pending message always
-                    # as complete, even if there was no trailing \n)
-                    if new_data and not data.endswith("\n"):  # keep fragment
-                        # Do we have any complete messages?
-                        if '\n' in data:
-                            complete, rest = data.rsplit("\n", 1)
-                            self.process_raw_lines(complete + "\n", address)
+        try:
+            while not self._terminate_event.is_set():
+                self._update_workers()
+
+                # Do not keep prepared lines of the worker processes waiting
+                readable = poller.poll(0.01 if self._pending_batches else select_timeout)
+                data = None
+
+                # Accept new connection on event unix socket
+                if self._eventsocket and self._eventsocket.fileno() in readable:
+                    client_socket, address = self._eventsocket.accept()
+                    # pylint: disable=no-member
+                    client_sockets[client_socket.fileno()] = (client_socket, address, "")
+                    poller.register(client_socket.fileno())
+
+                # Same for the TCP syslog socket
+                if self._syslog_tcp and self._syslog_tcp.fileno() in readable:
+                    client_socket, address = self._syslog_tcp.accept()
+                    # pylint: disable=no-member
+                    client_sockets[client_socket.fileno()] = (client_socket, address, "")
+                    poller.register(client_socket.fileno())
+
+                # Read data from existing event unix socket connections
+                # NOTE: We modify client_socket in the loop, so we need to copy below!
+                for fd, (cs, address, previous_data) in list(client_sockets.iteritems()):
+                    if fd in readable:
+                        # Receive next part of data
+                        try:
+                            new_data = cs.recv(self.receive_buffer_size)
+                        except Exception:
+                            new_data = ""
+                            address = None
+
+                        # Put together with incomplete messages from last time
+                        data = previous_data + new_data
+
+                        # Do we have incomplete data? (if the socket has been
+                        # closed then we consider the pending message always
+                        # as complete, even if there was no trailing \n)
+                        if new_data and not data.endswith("\n"):  # keep fragment
+                            # Do we have any complete messages?
+                            if '\n' in data:
+                                complete, rest = data.rsplit("\n", 1)
+                                self.ingest_raw_lines(complete + "\n", address)
+                            else:
+                                rest = data  # keep for next time
+
+                        # Only complete messages
                         else:
-                            rest = data  # keep for next time
+                            if data:
+                                self.ingest_raw_lines(data, address)
+                            rest = ""
 
-                    # Only complete messages
-                    else:
-                        if data:
-                            self.process_raw_lines(data, address)
-                        rest = ""
+                        # Connection still open?
+                        if new_data:
+                            client_sockets[fd] = (cs, address, rest)
+                        else:
+                            poller.unregister(fd)
+                            cs.close()
+                            del client_sockets[fd]
 
-                    # Connection still open?
-                    if new_data:
-                        client_sockets[fd] = (cs, address, rest)
-                    else:
-                        cs.close()
-                        del client_sockets[fd]
+                # Read data from pipe
+                if pipe in readable:
+                    try:
+                        data = os.read(pipe, self.receive_buffer_size)
+                        if data:
+                            # Prepend previous beginning of message to read data
+                            data = pipe_fragment + data
+                            pipe_fragment = ""
 
-            # Read data from pipe
-            if pipe in readable:
-                try:
-                    data = os.read(pipe, 4096)
-                    if data:
-                        # Prepend previous beginning of message to read data
-                        data = pipe_fragment + data
-                        pipe_fragment = ""
-
-                        # Last message still incomplete?
-                        if data[-1] != '\n':
-                            if '\n' in data:  # at least one complete message contained
-                                messages, pipe_fragment = data.rsplit('\n', 1)
-                                self.process_raw_lines(messages + '\n')  # got lost in split
+                            # Last message still incomplete?
+                            if data[-1] != '\n':
+                                if '\n' in data:  # at least one complete message contained
+                                    messages, pipe_fragment = data.rsplit('\n', 1)
+                                    self.ingest_raw_lines(messages + '\n')  # got lost in split
+                                else:
+                                    pipe_fragment = data  # keep beginning of message, wait for \n
                             else:
-                                pipe_fragment = data  # keep beginning of message, wait for \n
-                        else:
-                            self.process_raw_lines(data)
-                    else:  # EOF
-                        os.close(pipe)
-                        pipe = self.open_pipe()
-                        listen_list[0] = pipe
-                        # Pending fragments from previos reads that are not terminated
-                        # by a \n are ignored.
-                        if pipe_fragment:
-                            self._logger.warning("Ignoring incomplete message '%s' from pipe" %
-                                                 pipe_fragment)
-                            pipe_fragment = ""
-                except Exception:
-                    pass
+                                self.ingest_raw_lines(data)
+                        else:  # EOF
+                            poller.unregister(pipe)
+                            os.close(pipe)
+                            pipe = self.open_pipe()
+                            poller.register(pipe)
+                            # Pending fragments from previos reads that are not terminated
+                            # by a \n are ignored.
+                            if pipe_fragment:
+                                self._logger.warning("Ignoring incomplete message '%s' from pipe" %
+                                                     pipe_fragment)
+                                pipe_fragment = ""
+                    except Exception:
+                        pass
 
-            # Read events from builtin syslog server
-            if self._syslog is not None and self._syslog.fileno() in readable:
-                self.process_raw_lines(*self._syslog.recvfrom(4096))
+                # Read events from builtin syslog server
+                if self._syslog is not None and self._syslog.fileno() in readable:
+                    self._receive_syslog_datagrams()
 
-            # Read events from builtin snmptrap server
-            if self._snmptrap is not None and self._snmptrap.fileno() in readable:
-                try:
-                    message, sender_address = self._snmptrap.recvfrom(65535)
-                    self.process_raw_data(
-                        lambda: self._snmp_trap_engine.process_snmptrap(message, sender_address))
-                except Exception:
-                    self._logger.exception(
-                        'Exception handling a SNMP trap from "%s". Skipping this one' %
-                        sender_address[0])
+                # Read events from builtin snmptrap server
+                if self._snmptrap is not None and self._snmptrap.fileno() in readable:
+                    # Keep the order of the messages
+                    self._dispatch_unprepared_chunks()
+                    self._process_pending_batches(wait=True)
+                    try:
+                        message, sender_address = self._snmptrap.recvfrom(65535)
+                        self.process_raw_data(
+                            lambda: self._snmp_trap_engine.process_snmptrap(message, sender_address))
+                    except Exception:
+                        self._logger.exception(
+                            'Exception handling a SNMP trap from "%s". Skipping this one' %
+                            sender_address[0])
 
+                try:
+                    # process the first spool file we get
+                    spool_file = next(self.settings.paths.spool_dir.value.glob('[!.]*'))
+                    self.ingest_raw_lines(spool_file.read_bytes())
+                    spool_file.unlink()
+                    select_timeout = 0  # enable fast processing to process further files
+                except StopIteration:
+                    select_timeout = 1  # restore default select timeout
+
+                self._dispatch_unprepared_chunks()
+                self._process_pending_batches()
+        finally:
+            self._stop_workers()
+            poller.close()
+
+    # Read all syslog messages that are waiting, up to a limit to not starve
+    # the other sources during message storms
+    def _receive_syslog_datagrams(self):
+        for _unused_nr in xrange(self.max_datagrams_per_read):
             try:
-                # process the first spool file we get
-                spool_file = next(self.settings.paths.spool_dir.value.glob('[!.]*'))
-                self.process_raw_lines(spool_file.read_bytes())
-                spool_file.unlink()
-                select_timeout = 0  # enable fast processing to process further files
-            except StopIteration:
-                select_timeout = 1  # restore default select timeout
+                data, address = self._syslog.recvfrom(65535, socket.MSG_DONTWAIT)
+            except socket.error as e:
+                if e.errno in [errno.EAGAIN, errno.EWOULDBLOCK]:
+                    break
+                raise
+            self.ingest_raw_lines(data, address)
 
     # Processes incoming data, just a wrapper between the real data and the
     # handler function to record some statistics etc.
-    def process_raw_data(self, handler):
-        self._perfcounters.count("messages")
+    def process_raw_data(self, handler, num_messages=1):
+        self._perfcounters.count("messages", num_messages)
         before = time.time()
         # In replication slave mode (when not took over), ignore all events
         if not is_replication_slave(self._config) or self._slave_status["mode"] != "sync":
@@ -1036,23 +1158,161 @@ class EventServer(ECServerThread):
         elif self.settings.options.debug:
             self._logger.info("Replication: we are in slave mode, ignoring event")
         elapsed = time.time() - before
-        self._perfcounters.count_time("processing", elapsed)
+        self._perfcounters.count_time("processing", elapsed / num_messages)
 
     # Takes several lines of messages, handles encoding and processes them separated
     def process_raw_lines(self, data, address=None):
-        lines = data.splitlines()
-        for line in lines:
-            line = scrub_and_decode(line.rstrip())
-            if line:
+        lines = [line for line in (scrub_and_decode(l.rstrip()) for l in data.splitlines()) if line]
+        if not lines:
+            return
+
+        def handler():
+            for line in lines:
                 try:
+                    self.process_line(line, address)
+                except Exception as e:
+                    self._logger.exception(
+                        'Exception handling a log line (skipping this one): %s' % e)
 
-                    def handler(line=line):
-                        self.process_line(line, address)
+        self.process_raw_data(handler, len(lines))
 
-                    self.process_raw_data(handler)
+    # Lines received while the worker processes are running are collected
+    # and handed over to them in batches
+    def ingest_raw_lines(self, data, address=None):
+        if self._worker_pool is None:
+            self.process_raw_lines(data, address)
+        else:
+            self._unprepared_chunks.append((data, address))
+
+    # With "event_processing_workers" the decoding and parsing of the received
+    # lines, the hostname translation and the rule prefiltering are done by a
+    # pool of worker processes. Only the rule matching that depends on the
+    # current events, i.e. counting, cancelling and the event limits, stays in
+    # this thread. The batches are processed in the order they were received.
+    # In case a worker fails on a batch, its lines are processed completely by
+    # this thread. When a worker does not respond in time, the pool is stopped
+    # and created again during the next loop.
+
+    def _update_workers(self):
+        num_workers = self._config.get("event_processing_workers", 0)
+        if num_workers == self._worker_count and self._worker_generation == self._rules_generation:
+            return
+
+        # The workers have been forked with an older configuration
+        self._stop_workers()
+        if num_workers:
+            global _g_worker_event_server
+            _g_worker_event_server = self
+            self._worker_pool = multiprocessing.Pool(num_workers, _init_event_worker)
+            self._worker_count = num_workers
+            self._worker_generation = self._rules_generation
+            self._logger.info("Started %d event processing worker processes" % num_workers)
+
+    def _stop_workers(self):
+        if self._worker_pool is None:
+            return
+        self._dispatch_unprepared_chunks()
+        self._process_pending_batches(wait=True)
+        if self._worker_pool is not None:
+            self._terminate_workers()
+        self._logger.info("Stopped the event processing worker processes")
+
+    def _terminate_workers(self):
+        self._worker_pool.terminate()
+        self._worker_pool.join()
+        self._worker_pool = None
+        self._worker_count = 0
+        self._worker_generation = None
+
+    def _dispatch_unprepared_chunks(self):
+        if not self._unprepared_chunks:
+            return
+        chunks, self._unprepared_chunks = self._unprepared_chunks, []
+        # Spread the chunks of this round over the workers
+        batch_size = (len(chunks) + self._worker_count - 1) // self._worker_count
+        for index in xrange(0, len(chunks), batch_size):
+            batch_chunks = chunks[index:index + batch_size]
+            self._pending_batches.append(
+                (batch_chunks,
+                 self._worker_pool.apply_async(_prepare_lines_in_worker, (batch_chunks,))))
+
+    def _process_pending_batches(self, wait=False):
+        max_pending = self._worker_count * self.max_pending_batches_per_worker
+        while self._pending_batches and (wait or self._pending_batches[0][1].ready() or
+                                         len(self._pending_batches) > max_pending):
+            chunks, batch = self._pending_batches.popleft()
+            try:
+                generation, prepared = batch.get(self.worker_batch_timeout)
+            except multiprocessing.TimeoutError:
+                self._logger.error("Event processing worker did not respond within %d seconds, "
+                                   "restarting the workers" % self.worker_batch_timeout)
+                self._process_chunks(chunks)
+                self._abandon_workers()
+                return
+            except Exception as e:
+                self._logger.exception("Exception in event processing worker: %s" % e)
+                self._process_chunks(chunks)
+                continue
+            self._process_prepared_lines(generation, prepared)
+
+    def _abandon_workers(self):
+        """Stop the workers and process the lines they have not finished in this thread"""
+        self._terminate_workers()
+        while self._pending_batches:
+            self._process_chunks(self._pending_batches.popleft()[0])
+        chunks, self._unprepared_chunks = self._unprepared_chunks, []
+        self._process_chunks(chunks)
+
+    def _process_chunks(self, chunks):
+        for data, address in chunks:
+            self.process_raw_lines(data, address)
+
+    def prepare_lines(self, chunks):
+        """Decodes and parses the received lines, runs in the worker processes
+
+        Returns the generation of the rules that have been used for
+        prefiltering and a list of (line, address, event, possible_rules)
+        tuples. In case the line could not be parsed, the event is None and
+        possible_rules is the error message."""
+        prepared = []
+        for data, address in chunks:
+            for line in data.splitlines():
+                line = scrub_and_decode(line.rstrip())
+                if not line:
+                    continue
+                try:
+                    event = self._event_creator.create_event_from_line(line, address)
+                    self.do_translate_hostname(event)
+                    prepared.append((line, address, event, self._possible_rules(event)))
+                except Exception:
+                    prepared.append((line, address, None, traceback.format_exc()))
+        return self._rules_generation, prepared
+
+    def _process_prepared_lines(self, generation, prepared):
+        if not prepared:
+            return
+
+        def handler():
+            for line, address, event, possible_rules in prepared:
+                if event is None:
+                    self._logger.error(
+                        'Exception handling a log line (skipping this one): %s' % possible_rules)
+                    continue
+
+                if self._config["debug_rules"]:
+                    self._log_processing(line, address)
+
+                # The rules have been changed since preparing the event
+                if generation != self._rules_generation:
+                    possible_rules = self._possible_rules(event)
+
+                try:
+                    self.process_translated_event(event, possible_rules)
                 except Exception as e:
-                    self._logger.exception('Exception handling a log line (skipping this one): %s' %
-                                           e)
+                    self._logger.exception(
+                        'Exception handling a log line (skipping this one): %s' % e)
+
+        self.process_raw_data(handler, len(prepared))
 
     def do_housekeeping(self):
         with self._event_status.lock:
@@ -1136,6 +1396,7 @@ class EventServer(ECServerThread):
                             event["count"] = max(0, event["count"] - new_tokens)
                             event[
                                 "last_token"] = last_token + new_tokens * secs_per_token  # not now! would be unfair
+                            self._event_status.event_changed(event)
                             if event["count"] == 0:
                                 self._logger.info(
                                     "Rule %s/%s, event %d: again without allowed rate, dropping event"
@@ -1161,6 +1422,7 @@ class EventServer(ECServerThread):
                     self._logger.info("Delayed event %d of rule %s is now activated." %
                                       (event["id"], event["rule_id"]))
                     event["phase"] = "open"
+                    self._event_status.event_changed(event)
                     self._history.add(event, "DELAYOVER")
                     if rule:
                         cmk.ec.actions.event_has_opened(self._history, self.settings, self._config,
@@ -1233,9 +1495,9 @@ class EventServer(ECServerThread):
                 # First look for case 1: rule that already have at least one hit
                 # and this events in the state "counting" exist.
                 events_to_delete = []
-                events = self._event_status.events()
+                events = self._event_status.events_of_rule(rule["id"])
                 for nr, event in enumerate(events):
-                    if event["rule_id"] == rule["id"] and event["phase"] == "counting":
+                    if event["phase"] == "counting":
                         # time has elapsed. Now lets see if we have reached
                         # the neccessary count:
                         if event["count"] < expected_count:  # no -> trigger alarm
@@ -1272,10 +1534,8 @@ class EventServer(ECServerThread):
         merge_event = None
         merge = rule["expect"].get("merge", "open")
         if merge != "never":
-            for event in self._event_status.events():
-                if event["rule_id"] == rule["id"] and \
-                        (event["phase"] == "open" or
-                         (event["phase"] == "ack" and merge == "acked")):
+            for event in self._event_status.events_of_rule(rule["id"]):
+                if event["phase"] == "open" or (event["phase"] == "ack" and merge == "acked"):
                     merge_event = event
                     break
 
@@ -1288,6 +1548,7 @@ class EventServer(ECServerThread):
             # Better rewrite (again). Rule might have changed. Also we have changed
             # the text and the user might have his own text added via set_text.
             self.rewrite_event(rule, merge_event, {}, set_first=False)
+            self._event_status.event_changed(merge_event)
             self._history.add(merge_event, "COUNTFAILED")
         else:
             # Create artifical event from scratch. Make sure that all important
@@ -1334,9 +1595,12 @@ class EventServer(ECServerThread):
     # Precompile regular expressions and similar stuff. Also convert legacy
     # "rules" parameter into new "rule_packs" parameter
     def compile_rules(self, legacy_rules, rule_packs):
+        self._rules_generation += 1
         self._rules = []
         self._rule_by_id = {}
         self._rule_hash = {}  # Speedup-Hash for rule execution
+        self._rule_hash_keys = []  # (facility or None for all, needed priorities) per rule
+        self._rule_prefilter = None
         count_disabled = 0
         count_rules = 0
         count_unspecific = 0
@@ -1413,6 +1677,12 @@ class EventServer(ECServerThread):
                         stats.append("%s(%d)" % (SyslogPriority(prio), len(entries)))
                     self._logger.info(" %-12s: %s" % (SyslogFacility(facility), " ".join(stats)))
 
+            self._rule_prefilter = cmk.ec.rule_prefilter.RulePrefilter(self._rules)
+            self._logger.info(
+                "Rule prefilter: %d rules - %d with required literals, %d unfiltered" %
+                (self._rule_prefilter.num_rules, self._rule_prefilter.num_filtered_rules,
+                 self._rule_prefilter.num_rules - self._rule_prefilter.num_filtered_rules))
+
     @staticmethod
     def _compile_matching_value(key, val):
         value = val.strip()
@@ -1431,14 +1701,17 @@ class EventServer(ECServerThread):
 
     def hash_rule(self, rule):
         # Construct rule hash for faster execution.
+        needed_prios = self._needed_priorities(rule)
         facility = rule.get("match_facility")
         if facility and not rule.get("invert_matching"):
-            self.hash_rule_facility(rule, facility)
+            self.hash_rule_facility(rule, facility, needed_prios)
         else:
-            for facility in xrange(32):  # all syslog facilities
-                self.hash_rule_facility(rule, facility)
+            facility = None
+            for f in xrange(32):  # all syslog facilities
+                self.hash_rule_facility(rule, f, needed_prios)
+        self._rule_hash_keys.append((facility, needed_prios))
 
-    def hash_rule_facility(self, rule, facility):
+    def _needed_priorities(self, rule):
         needed_prios = [False] * 8
         for key in ["match_priority", "cancel_priority"]:
             if key in rule:
@@ -1453,12 +1726,34 @@ class EventServer(ECServerThread):
 
         if rule.get("invert_matching"):
             needed_prios = [True] * 8
+        return needed_prios
 
+    def hash_rule_facility(self, rule, facility, needed_prios):
         prio_hash = self._rule_hash.setdefault(facility, {})
         for prio, need in enumerate(needed_prios):
             if need:
                 prio_hash.setdefault(prio, []).append(rule)
 
+    def _hashed_possible_rules(self, possible_rules, event, rule_candidates):
+        """Returns the possible rules of the hash bucket of the event
+
+        Same as filtering the rules of the bucket, but without looking at
+        all of them. The buckets keep the order of self._rules."""
+        facility, priority = event["facility"], event["priority"]
+        hashed = []
+        for position in possible_rules:
+            rule_facility, needed_prios = self._rule_hash_keys[position]
+            if needed_prios[priority] and rule_facility in (None, facility):
+                hashed.append(self._rules[position])
+
+        if self._config["debug_rules"]:
+            hashed_ids = set(id(rule) for rule in hashed)
+            for rule in rule_candidates:
+                if id(rule) not in hashed_ids:
+                    self._logger.info("Skipping rule %s/%s: required text not found" %
+                                      (rule["pack"], rule["id"]))
+        return hashed
+
     def output_hash_stats(self):
         self._logger.info("Top 20 of facility/priority:")
         entries = []
@@ -1479,17 +1774,29 @@ class EventServer(ECServerThread):
     def process_line(self, line, address):
         line = line.rstrip()
         if self._config["debug_rules"]:
-            if address:
-                self._logger.info(u"Processing message from %r: '%s'" % (address, line))
-            else:
-                self._logger.info(u"Processing message '%s'" % line)
+            self._log_processing(line, address)
 
         event = self._event_creator.create_event_from_line(line, address)
         self.process_event(event)
 
+    def _log_processing(self, line, address):
+        if address:
+            self._logger.info(u"Processing message from %r: '%s'" % (address, line))
+        else:
+            self._logger.info(u"Processing message '%s'" % line)
+
     def process_event(self, event):
         self.do_translate_hostname(event)
+        self.process_translated_event(event, self._possible_rules(event))
+
+    # Positions of the rules in self._rules which may match the event according
+    # to the rule prefilter, None when all rules have to be tried
+    def _possible_rules(self, event):
+        if self._rule_prefilter is None:
+            return None
+        return self._rule_prefilter.possible_rules(event)
 
+    def process_translated_event(self, event, possible_rules):
         # Log all incoming messages into a syslog-like text file if that is enabled
         if self._config["log_messages"]:
             self.log_message(event)
@@ -1501,12 +1808,18 @@ class EventServer(ECServerThread):
         else:
             rule_candidates = self._rules
 
+        # The other rules can not match, so skipping them does not change the
+        # handling of rule packs to skip
+        if possible_rules is not None:
+            rule_candidates = self._hashed_possible_rules(possible_rules, event, rule_candidates)
+
         skip_pack = None
         for rule in rule_candidates:
             if skip_pack and rule["pack"] == skip_pack:
                 continue  # still in the rule pack that we want to skip
             skip_pack = None  # new pack, reset skipping
 
+            self._event_status.count_rule_evaluation(rule["id"])
             try:
                 result = self.event_rule_matches(rule, event)
             except Exception as e:
@@ -1582,6 +1895,8 @@ class EventServer(ECServerThread):
                                                                 self._config, self._logger, self,
                                                                 self._event_columns, rule,
                                                                 existing_event)
+                            with self._event_status.lock:
+                                self._event_status.event_changed(existing_event)
 
                             self._history.add(existing_event, "COUNTREACHED")
 
@@ -1607,6 +1922,8 @@ class EventServer(ECServerThread):
                                 cmk.ec.actions.event_has_opened(self._history, self.settings,
                                                                 self._config, self._logger, self,
                                                                 self._event_columns, rule, event)
+                                with self._event_status.lock:
+                                    self._event_status.event_changed(event)
                                 if rule.get("autodelete"):
                                     event["phase"] = "closed"
                                     self._history.add(event, "AUTODELETE")
@@ -2865,6 +3182,7 @@ class StatusTableRules(StatusTable):
     columns = [
         ("rule_id", ""),
         ("rule_hits", 0),
+        ("rule_evaluations", 0),  # Times the conditions of the rule were evaluated
     ]
 
     def __init__(self, logger, event_status):
@@ -3174,6 +3492,7 @@ class StatusServer(ECServerThread):
             event["contact"] = contact
         if user:
             event["owner"] = user
+        self._event_status.event_changed(event)
         self._history.add(event, "UPDATE", user)
 
     def handle_command_create(self, arguments):
@@ -3193,6 +3512,7 @@ class StatusServer(ECServerThread):
         event["state"] = int(newstate)
         if user:
             event["owner"] = user
+        self._event_status.event_changed(event)
         self._history.add(event, "CHANGESTATE", user)
 
     def handle_command_reload(self):
@@ -3235,6 +3555,7 @@ class StatusServer(ECServerThread):
         event = self._event_status.event(int(event_id))
         if user:
             event["owner"] = user
+            self._event_status.event_changed(event)
 
         if action_id == "@NOTIFY":
             cmk.ec.actions.do_notify(self._event_server,
@@ -3368,7 +3689,16 @@ def run_eventd(terminate_main_event, settings, config, lock_configuration, histo
 #   '----------------------------------------------------------------------'
 
 
+# The entries of a counter dict which are new or differ from the saved one
+def _changed_items(counters, saved_counters):
+    return {key: value for key, value in counters.iteritems() if saved_counters.get(key) != value}
+
+
 class EventStatus(object):
+    # Write a snapshot instead of appending to the journal as soon as the
+    # journal is larger than the last snapshot, but at least this large
+    min_journal_size = 1024 * 1024
+
     def __init__(self, settings, config, perfcounters, history, logger):
         self.settings = settings
         self._config = config
@@ -3376,17 +3706,23 @@ class EventStatus(object):
         self.lock = threading.Lock()
         self._history = history
         self._logger = logger
+        self._journal = cmk.ec.status_journal.StatusJournal(
+            settings.paths.status_journal_file.value)
+        self._journal_seq = 0
+        self._snapshot_size = 0
         self.flush()
 
     def reload_configuration(self, config):
         self._config = config
 
     def flush(self):
-        self._events = []
+        self._events = cmk.ec.event_store.EventStore()
         self._next_event_id = 1
         self._rule_stats = {}
+        self._rule_evaluations = {}
         self._interval_starts = {}  # needed for expecting rules
         self._initialize_event_limit_status()
+        self._snapshot_needed = True
 
         # TODO: might introduce some performance counters, like:
         # - number of received messages
@@ -3394,12 +3730,22 @@ class EventStatus(object):
         # - number of rule misses
 
     def events(self):
-        return self._events
+        return self._events.events()
+
+    def events_of_rule(self, rule_id):
+        return self._events.of_rule(rule_id)
+
+    def events_in_phase(self, phase):
+        return self._events.of_phase(phase)
 
     def event(self, eid):
-        for event in self._events:
-            if event["id"] == eid:
-                return event
+        return self._events.get(eid)
+
+    # Needs to be called after changing an existing event to keep the indexes
+    # of the event store up to date and to journal the change. Protected by
+    # self.lock
+    def event_changed(self, event):
+        self._events.reindex(event)
 
     # Return beginning of current expectation interval. For new rules
     # we start with the next interval in future.
@@ -3443,62 +3789,162 @@ class EventStatus(object):
     def pack_status(self):
         return {
             "next_event_id": self._next_event_id,
-            "events": self._events,
+            "events": self._events.events(),
             "rule_stats": self._rule_stats,
+            "rule_evaluations": self._rule_evaluations,
             "interval_starts": self._interval_starts,
         }
 
     def unpack_status(self, status):
         self._next_event_id = status["next_event_id"]
-        self._events = status["events"]
+        self._events = cmk.ec.event_store.EventStore(status["events"])
         self._rule_stats = status["rule_stats"]
+        self._rule_evaluations = status.get("rule_evaluations", {})
         self._interval_starts = status["interval_starts"]
+        self._snapshot_needed = True
+
+    # The status is saved as snapshot of the whole status in the status file
+    # and the changes since then in the status journal. Normally only the
+    # changes since the last save are appended to the journal. The snapshot
+    # is written when requested, after the status has been replaced and when
+    # the journal has grown too large.
+    def save_status(self, snapshot=False):
+        if snapshot or self._snapshot_needed \
+           or self._journal.size() > max(self._snapshot_size, self.min_journal_size):
+            self._save_snapshot()
+        else:
+            self._save_changes()
 
-    def save_status(self):
+    def _save_snapshot(self):
         now = time.time()
         status = self.pack_status()
+        # The journal records up to this one are contained in the snapshot
+        status["journal_seq"] = self._journal_seq
+        data = cmk.ec.status_journal.encode_snapshot(status)
         path = self.settings.paths.status_file.value
         path_new = path.parent / (path.name + '.new')
-        # Believe it or not: cPickle is more than two times slower than repr()
         with path_new.open(mode='wb') as f:
-            f.write(repr(status) + "\n")
+            f.write(data)
             f.flush()
             os.fsync(f.fileno())
         path_new.rename(path)
+        self._journal.clear()
+        self._events.take_changes()
+        self._remember_saved_counters()
+        self._snapshot_size = len(data)
+        self._snapshot_needed = False
         elapsed = time.time() - now
         self._logger.verbose("Saved event state to %s in %.3fms." % (path, elapsed * 1000))
 
+    def _save_changes(self):
+        now = time.time()
+        changed_events, removed_event_ids = self._events.take_changes()
+        self._journal_seq += 1
+        self._journal.append({
+            "seq": self._journal_seq,
+            "next_event_id": self._next_event_id,
+            "events": changed_events,
+            "removed_events": removed_event_ids,
+            "rule_stats": _changed_items(self._rule_stats, self._saved_rule_stats),
+            "rule_evaluations": _changed_items(self._rule_evaluations,
+                                               self._saved_rule_evaluations),
+            "interval_starts": _changed_items(self._interval_starts, self._saved_interval_starts),
+        })
+        self._remember_saved_counters()
+        elapsed = time.time() - now
+        self._logger.verbose(
+            "Saved %d changed and %d removed events to %s in %.3fms." %
+            (len(changed_events), len(removed_event_ids),
+             self.settings.paths.status_journal_file.value, elapsed * 1000))
+
+    def _remember_saved_counters(self):
+        self._saved_rule_stats = self._rule_stats.copy()
+        self._saved_rule_evaluations = self._rule_evaluations.copy()
+        self._saved_interval_starts = self._interval_starts.copy()
+
     def reset_counters(self, rule_id):
         if rule_id:
             if rule_id in self._rule_stats:
                 del self._rule_stats[rule_id]
+            if rule_id in self._rule_evaluations:
+                del self._rule_evaluations[rule_id]
         else:
             self._rule_stats = {}
+            self._rule_evaluations = {}
+        # Removed counters can not be journaled
+        self._snapshot_needed = True
         self.save_status()
 
     def load_status(self, event_server):
         path = self.settings.paths.status_file.value
+        journal_seq = 0
         if path.exists():
             try:
-                status = ast.literal_eval(path.read_bytes())
+                data = path.read_bytes()
+                status = cmk.ec.status_journal.decode_snapshot(data)
                 self._next_event_id = status["next_event_id"]
-                self._events = status["events"]
+                self._events = cmk.ec.event_store.EventStore(status["events"])
                 self._rule_stats = status["rule_stats"]
+                self._rule_evaluations = status.get("rule_evaluations", {})
                 self._interval_starts = status.get("interval_starts", {})
-                self._initialize_event_limit_status()
+                journal_seq = status.get("journal_seq", 0)
+                self._snapshot_size = len(data)
                 self._logger.info("Loaded event state from %s." % path)
             except Exception as e:
                 self._logger.exception("Error loading event state from %s: %s" % (path, e))
                 raise
 
+        journal_path = self.settings.paths.status_journal_file.value
+        try:
+            num_records = self._replay_journal(journal_seq)
+        except Exception as e:
+            self._logger.exception("Error replaying the event state journal %s: %s" %
+                                   (journal_path, e))
+            raise
+        if num_records:
+            self._logger.info("Replayed %d changes from %s." % (num_records, journal_path))
+
+        self._initialize_event_limit_status()
+        self._events.take_changes()
+        self._remember_saved_counters()
+        # Replace the journal, it may end with an incompletely written record
+        self._snapshot_needed = True
+
         # Add new columns
-        for event in self._events:
+        for event in self._events.events():
             event.setdefault("ipaddress", "")
 
             if "core_host" not in event:
                 event_server.add_core_host_to_event(event)
                 event["host_in_downtime"] = False
 
+    # Apply the journal records saved after the snapshot with the given
+    # journal sequence number
+    def _replay_journal(self, journal_seq):
+        num_records = 0
+        for record in self._journal.records():
+            if record["seq"] <= journal_seq:
+                continue  # Already contained in the snapshot
+
+            self._next_event_id = record["next_event_id"]
+            for event in record["events"]:
+                existing_event = self._events.get(event["id"])
+                if existing_event is not None:
+                    self._events.remove(existing_event)
+                self._events.add(event)
+            for event_id in record["removed_events"]:
+                existing_event = self._events.get(event_id)
+                if existing_event is not None:
+                    self._events.remove(existing_event)
+            self._rule_stats.update(record["rule_stats"])
+            self._rule_evaluations.update(record["rule_evaluations"])
+            self._interval_starts.update(record["interval_starts"])
+            journal_seq = record["seq"]
+            num_records += 1
+
+        self._journal_seq = journal_seq
+        return num_records
+
     # Called on Event Console initialization from status file to initialize
     # the current event limit state -> Sets internal counters which are
     # updated during runtime.
@@ -3507,7 +3953,7 @@ class EventStatus(object):
 
         self.num_existing_events_by_host = {}
         self.num_existing_events_by_rule = {}
-        for event in self._events:
+        for event in self._events.events():
             self._count_event_add(event)
 
     def _count_event_add(self, event):
@@ -3530,7 +3976,7 @@ class EventStatus(object):
         self._perfcounters.count("events")
         event["id"] = self._next_event_id
         self._next_event_id += 1
-        self._events.append(event)
+        self._events.add(event)
         self.num_existing_events += 1
         self._count_event_add(event)
         self._history.add(event, "NEW")
@@ -3546,19 +3992,16 @@ class EventStatus(object):
         try:
             self._events.remove(event)
             self._count_event_remove(event)
-        except ValueError:
+        except KeyError:
             self._logger.exception("Cannot remove event %d: not present" % event["id"])
 
-    # protected by self.lock
-    def _remove_event_by_nr(self, index):
-        event = self._events.pop(index)
-        self._count_event_remove(event)
-
     # protected by self.lock
     def remove_oldest_event(self, ty, event):
         if ty == "overall":
             self._logger.verbose("  Removing oldest event")
-            self._remove_event_by_nr(0)
+            oldest_event = self._events.oldest()
+            if oldest_event is not None:
+                self.remove_event(oldest_event)
         elif ty == "by_rule":
             self._logger.verbose("  Removing oldest event of rule \"%s\"" % event["rule_id"])
             self._remove_oldest_event_of_rule(event["rule_id"])
@@ -3568,17 +4011,15 @@ class EventStatus(object):
 
     # protected by self.lock
     def _remove_oldest_event_of_rule(self, rule_id):
-        for event in self._events:
-            if event["rule_id"] == rule_id:
-                self.remove_event(event)
-                return
+        event = self._events.oldest_of_rule(rule_id)
+        if event is not None:
+            self.remove_event(event)
 
     # protected by self.lock
     def _remove_oldest_event_of_host(self, hostname):
-        for event in self._events:
-            if event["host"] == hostname:
-                self.remove_event(event)
-                return
+        event = self._events.oldest_of_host(hostname)
+        if event is not None:
+            self.remove_event(event)
 
     # protected by self.lock
     def get_num_existing_events_by(self, ty, event):
@@ -3596,47 +4037,46 @@ class EventStatus(object):
     def cancel_events(self, event_server, event_columns, new_event, match_groups, rule):
         with self.lock:
             to_delete = []
-            for nr, event in enumerate(self._events):
-                if event["rule_id"] == rule["id"]:
-                    if self.cancelling_match(match_groups, new_event, event, rule):
-                        # Fill a few fields of the cancelled event with data from
-                        # the cancelling event so that action scripts have useful
-                        # values and the logfile entry if more relevant.
-                        previous_phase = event["phase"]
-                        event["phase"] = "closed"
-                        # TODO: Why do we use OK below and not new_event["state"]???
-                        event["state"] = 0  # OK
-                        event["text"] = new_event["text"]
-                        # TODO: This is a hack and partial copy-n-paste from rewrite_events...
-                        if "set_text" in rule:
-                            event["text"] = replace_groups(rule["set_text"], event["text"],
-                                                           match_groups)
-                        event["time"] = new_event["time"]
-                        event["last"] = new_event["time"]
-                        event["priority"] = new_event["priority"]
-                        self._history.add(event, "CANCELLED")
-                        actions = rule.get("cancel_actions", [])
-                        if actions:
-                            if previous_phase != "open" \
-                               and rule.get("cancel_action_phases", "always") == "open":
-                                self._logger.info(
-                                    "Do not execute cancelling actions, event %s's phase "
-                                    "is not 'open' but '%s'" % (event["id"], previous_phase))
-                            else:
-                                cmk.ec.actions.do_event_actions(self._history,
-                                                                self.settings,
-                                                                self._config,
-                                                                self._logger,
-                                                                event_server,
-                                                                event_columns,
-                                                                actions,
-                                                                event,
-                                                                is_cancelling=True)
-
-                        to_delete.append(nr)
-
-            for nr in to_delete[::-1]:
-                self._remove_event_by_nr(nr)
+            for event in self._events.of_rule(rule["id"]):
+                if self.cancelling_match(match_groups, new_event, event, rule):
+                    # Fill a few fields of the cancelled event with data from
+                    # the cancelling event so that action scripts have useful
+                    # values and the logfile entry if more relevant.
+                    previous_phase = event["phase"]
+                    event["phase"] = "closed"
+                    # TODO: Why do we use OK below and not new_event["state"]???
+                    event["state"] = 0  # OK
+                    event["text"] = new_event["text"]
+                    # TODO: This is a hack and partial copy-n-paste from rewrite_events...
+                    if "set_text" in rule:
+                        event["text"] = replace_groups(rule["set_text"], event["text"],
+                                                       match_groups)
+                    event["time"] = new_event["time"]
+                    event["last"] = new_event["time"]
+                    event["priority"] = new_event["priority"]
+                    self._history.add(event, "CANCELLED")
+                    actions = rule.get("cancel_actions", [])
+                    if actions:
+                        if previous_phase != "open" \
+                           and rule.get("cancel_action_phases", "always") == "open":
+                            self._logger.info(
+                                "Do not execute cancelling actions, event %s's phase "
+                                "is not 'open' but '%s'" % (event["id"], previous_phase))
+                        else:
+                            cmk.ec.actions.do_event_actions(self._history,
+                                                            self.settings,
+                                                            self._config,
+                                                            self._logger,
+                                                            event_server,
+                                                            event_columns,
+                                                            actions,
+                                                            event,
+                                                            is_cancelling=True)
+
+                    to_delete.append(event)
+
+            for event in to_delete:
+                self.remove_event(event)
 
     def cancelling_match(self, match_groups, new_event, event, rule):
         debug = self._config["debug_rules"]
@@ -3714,6 +4154,11 @@ class EventStatus(object):
             self._rule_stats.setdefault(rule_id, 0)
             self._rule_stats[rule_id] += 1
 
+    def count_rule_evaluation(self, rule_id):
+        with self.lock:
+            self._rule_evaluations.setdefault(rule_id, 0)
+            self._rule_evaluations[rule_id] += 1
+
     def count_event_up(self, found, event):
         # Update event with new information from new occurrance,
         # but preserve certain attributes from the original (first)
@@ -3731,10 +4176,11 @@ class EventStatus(object):
                 preserve["contact"] = found["contact"]
         found.update(event)
         found.update(preserve)
+        self._events.reindex(found)
 
     def count_expected_event(self, event_server, event):
-        for ev in self._events:
-            if ev["rule_id"] == event["rule_id"] and ev["phase"] == "counting":
+        for ev in self._events.of_rule(event["rule_id"]):
+            if ev["phase"] == "counting":
                 self.count_event_up(ev, event)
                 return
 
@@ -3749,31 +4195,38 @@ class EventStatus(object):
         # we do never modify events that are already in the state "open"
         # since the event has been created because the count was too
         # low in the specified period of time.
-        for ev in self._events:
-            if ev["rule_id"] == event["rule_id"]:
-                if ev["phase"] == "ack" and not count["count_ack"]:
-                    continue  # skip acknowledged events
+        if count["separate_host"] and count["separate_application"]:
+            candidates = self._events.of_rule_host_application(event["rule_id"], event["host"],
+                                                               event["application"])
+        elif count["separate_host"]:
+            candidates = self._events.of_rule_host(event["rule_id"], event["host"])
+        else:
+            candidates = self._events.of_rule(event["rule_id"])
 
-                if count["separate_host"] and ev["host"] != event["host"]:
-                    continue  # treat events with separated hosts separately
+        for ev in candidates:
+            if ev["phase"] == "ack" and not count["count_ack"]:
+                continue  # skip acknowledged events
 
-                if count["separate_application"] and ev["application"] != event["application"]:
-                    continue  # same for application
+            if count["separate_host"] and ev["host"] != event["host"]:
+                continue  # treat events with separated hosts separately
 
-                if count["separate_match_groups"] and ev["match_groups"] != event["match_groups"]:
-                    continue
+            if count["separate_application"] and ev["application"] != event["application"]:
+                continue  # same for application
 
-                if count.get("count_duration"
-                            ) is not None and ev["first"] + count["count_duration"] < event["time"]:
-                    # Counting has been discontinued on this event after a certain time
-                    continue
+            if count["separate_match_groups"] and ev["match_groups"] != event["match_groups"]:
+                continue
 
-                if ev["host_in_downtime"] != event["host_in_downtime"]:
-                    continue  # treat events with different downtime states separately
+            if count.get("count_duration"
+                        ) is not None and ev["first"] + count["count_duration"] < event["time"]:
+                # Counting has been discontinued on this event after a certain time
+                continue
 
-                found = ev
-                self.count_event_up(found, event)
-                break
+            if ev["host_in_downtime"] != event["host_in_downtime"]:
+                continue  # treat events with different downtime states separately
+
+            found = ev
+            self.count_event_up(found, event)
+            break
         else:
             event["count"] = 1
             event["phase"] = "counting"
@@ -3783,26 +4236,28 @@ class EventStatus(object):
         # Did we just count the event that was just one too much?
         if found["phase"] == "counting" and found["count"] >= count["count"]:
             found["phase"] = "open"
+            self._events.reindex(found)
             return found  # do event action, return found copy of event
         return False  # do not do event action
 
     # locked with self.lock
     def delete_event(self, event_id, user):
-        for nr, event in enumerate(self._events):
-            if event["id"] == event_id:
-                event["phase"] = "closed"
-                if user:
-                    event["owner"] = user
-                self._history.add(event, "DELETE", user)
-                self._remove_event_by_nr(nr)
-                return
-        raise MKClientError("No event with id %s" % event_id)
+        event = self._events.get(event_id)
+        if event is None:
+            raise MKClientError("No event with id %s" % event_id)
+        event["phase"] = "closed"
+        if user:
+            event["owner"] = user
+        self._history.add(event, "DELETE", user)
+        self.remove_event(event)
 
     def get_events(self):
-        return self._events
+        return self._events.events()
 
     def get_rule_stats(self):
-        return sorted(self._rule_stats.iteritems(), key=lambda x: x[0])
+        rule_ids = set(self._rule_stats).union(self._rule_evaluations)
+        return [(rule_id, self._rule_stats.get(rule_id, 0), self._rule_evaluations.get(rule_id, 0))
+                for rule_id in sorted(rule_ids)]
 
 
 #.
@@ -4184,7 +4639,7 @@ def main():
         os.close(pipe)  # Close pipe
 
         logger.verbose("Saving final event state")
-        event_status.save_status()
+        event_status.save_status(snapshot=True)
 
         logger.verbose("Cleaning up sockets")
         settings.paths.unix_socket.value.unlink()
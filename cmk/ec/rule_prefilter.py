@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2019             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+
+
+"""Literal based prefilter for the rule matching of the Event Console
+
+Evaluating the regular expressions of all rules for every message does not
+scale to thousands of rules. Most patterns contain literal strings which
+have to occur in the text for the pattern to match, e.g. "kernel" for
+"kernel: .* error (\\d+)". These literals are extracted from the "match",
+"match_host" and "match_application" conditions (together with their
+cancelling counterparts) of the rules and searched for with one scan per
+text field using an Aho-Corasick automaton. Rules with a required literal that
+does not occur in the message can not match and are skipped.
+
+The extraction is conservative: Patterns for which no required literal can be
+determined do not exclude their rule. The texts are scanned in lower case,
+because the Event Console matches case insensitive.
+"""
+
+import re
+import sre_constants
+import sre_parse
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple  # pylint: disable=unused-import
+
+import six
+
+Rule = Dict[str, Any]  # pylint: disable=invalid-name
+# At least one of the literals has to occur in the text
+Literals = Set[str]  # pylint: disable=invalid-name
+
+# The event fields and the rule keys of the conditions on them. The keys of a
+# field are alternatives: One of the patterns (the positive or the cancelling
+# one) has to match the field.
+_FIELDS = [
+    ("text", ["match", "match_ok"]),
+    ("host", ["match_host"]),
+    ("application", ["match_application", "cancel_application"]),
+]
+
+
+class RulePrefilter(object):
+    """Selects the rules that may match an event
+
+    The rules are identified by their position in the list of rules given
+    to the constructor."""
+    def __init__(self, rules):
+        # type: (Iterable[Rule]) -> None
+        super(RulePrefilter, self).__init__()
+        self._matchers = {}  # type: Dict[str, MultiStringMatcher]
+        # Positions of the rules without required literals
+        self._unfiltered_rules = []  # type: List[int]
+        # Number of fields with required literals per rule position
+        self._num_required_fields = {}  # type: Dict[int, int]
+
+        for position, rule in enumerate(rules):
+            self._add_rule(position, rule)
+
+        for matcher in self._matchers.itervalues():
+            matcher.compile()
+
+        self.num_rules = len(self._unfiltered_rules) + len(self._num_required_fields)
+        self.num_filtered_rules = len(self._num_required_fields)
+
+    def _add_rule(self, position, rule):
+        # type: (int, Rule) -> None
+        num_fields = 0
+        if not rule.get("invert_matching"):
+            for field, keys in _FIELDS:
+                literals = _rule_literals(rule, keys)
+                if not literals:
+                    continue
+
+                matcher = self._matchers.setdefault(field, MultiStringMatcher())
+                for literal in literals:
+                    matcher.add(literal, position)
+                num_fields += 1
+
+        if num_fields:
+            self._num_required_fields[position] = num_fields
+        else:
+            self._unfiltered_rules.append(position)
+
+    def possible_rules(self, event):
+        # type: (Dict[str, Any]) -> List[int]
+        """Returns the positions of the rules which may match the event in ascending order"""
+        num_found_fields = {}  # type: Dict[int, int]
+        for field, matcher in self._matchers.iteritems():
+            for position in matcher.search(event.get(field, "").lower()):
+                num_found_fields[position] = num_found_fields.get(position, 0) + 1
+
+        possible = [
+            position for position, num_fields in num_found_fields.iteritems()
+            if num_fields == self._num_required_fields[position]
+        ]
+        possible.extend(self._unfiltered_rules)
+        possible.sort()
+        return possible
+
+
+def _rule_literals(rule, keys):
+    # type: (Rule, List[str]) -> Optional[Literals]
+    if "match" in keys and "match" not in rule:
+        return None  # A rule without "match" condition matches every text
+
+    literals = set()  # type: Literals
+    for key in keys:
+        if key not in rule:
+            continue
+        key_literals = required_literals(rule[key])
+        if not key_literals:
+            return None
+        literals.update(key_literals)
+    return literals or None
+
+
+def required_literals(pattern):
+    # type: (Any) -> Optional[Literals]
+    """Returns lower case strings of which one has to occur in a matching text
+
+    The pattern is either a compiled regex or a lower case string which is
+    matched as a substring (see cmk.ec.main.match()). Returns None when no
+    such strings can be determined."""
+    if pattern is None:
+        return None
+
+    if isinstance(pattern, six.string_types):
+        return {pattern} if pattern else None
+
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except (sre_constants.error, TypeError, ValueError):
+        return None
+
+    # With unicode case folding ASCII letters match some non-ASCII characters
+    # which do not lower case to the same letter (e.g. "s" and U+017F).
+    if parsed.pattern.flags & re.UNICODE:
+        return None
+
+    return _sequence_literals(parsed)
+
+
+def _sequence_literals(items):
+    # type: (Iterable[Tuple[str, Any]]) -> Optional[Literals]
+    """Determine the best set of required literals of a parsed regex sequence
+
+    Consecutive literal characters are collected to strings. Groups, repeats
+    that occur at least once and alternatives contribute the literals of their
+    contents. Of all the literal sets that are required, the one with the
+    longest shortest literal is the most selective one."""
+    candidates = []  # type: List[Literals]
+    run = []  # type: List[str]
+
+    def end_run():
+        if run:
+            candidates.append({"".join(run)})
+            del run[:]
+
+    for op, av in items:
+        if op == sre_constants.LITERAL and av < 128:
+            run.append(chr(av).lower())
+            continue
+
+        if op == sre_constants.AT:
+            continue  # zero width, the neighbouring literals stay adjacent
+
+        end_run()
+        literals = None
+        if op == sre_constants.SUBPATTERN:
+            literals = _sequence_literals(av[-1])
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+            literals = _sequence_literals(av[2])
+        elif op == sre_constants.BRANCH:
+            literals = _branch_literals(av[1])
+
+        if literals:
+            candidates.append(literals)
+    end_run()
+
+    if not candidates:
+        return None
+    return max(candidates, key=lambda literals: (min(len(l) for l in literals), -len(literals)))
+
+
+def _branch_literals(branches):
+    # type: (List[Any]) -> Optional[Literals]
+    literals = set()  # type: Literals
+    for branch in branches:
+        branch_literals = _sequence_literals(branch)
+        if not branch_literals:
+            return None  # This alternative may match without any literal
+        literals.update(branch_literals)
+    return literals
+
+
+class MultiStringMatcher(object):
+    """Aho-Corasick automaton to find all of many strings in one pass over a text"""
+    def __init__(self):
+        super(MultiStringMatcher, self).__init__()
+        self._goto = [{}]  # type: List[Dict[str, int]]
+        self._fail = [0]  # type: List[int]
+        # The values of the strings ending in a state
+        self._outputs = [set()]  # type: List[Set[Any]]
+
+    def add(self, string, value):
+        # type: (str, Any) -> None
+        state = 0
+        for char in string:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append(set())
+            state = next_state
+        self._outputs[state].add(value)
+
+    def compile(self):
+        # type: () -> None
+        """Computes the failure transitions, needs to be called after adding all strings"""
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, next_state in self._goto[state].iteritems():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[next_state] = fail
+                self._outputs[next_state].update(self._outputs[fail])
+
+    def search(self, text):
+        # type: (str) -> Set[Any]
+        """Returns the values of all strings occurring in the text"""
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        found = set()  # type: Set[Any]
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+        return found
@@ -61,6 +61,7 @@ Paths = NamedTuple('Paths', [
     ('slave_status_file', AnnotatedPath),
     ('spool_dir', AnnotatedPath),
     ('status_file', AnnotatedPath),
+    ('status_journal_file', AnnotatedPath),
     ('status_server_profile', AnnotatedPath),
     ('event_server_profile', AnnotatedPath),
     ('compiled_mibs_dir', AnnotatedPath),
@@ -91,6 +92,7 @@ def _default_paths(omd_root, default_config_dir):
         slave_status_file=AnnotatedPath('slave status', state_dir / 'slave_status'),
         spool_dir=AnnotatedPath('spool directory', state_dir / 'spool'),
         status_file=AnnotatedPath('status file', state_dir / 'status'),
+        status_journal_file=AnnotatedPath('status journal', state_dir / 'status.journal'),
         status_server_profile=AnnotatedPath('status server profile',
                                             state_dir / 'StatusServer.profile'),
         event_server_profile=AnnotatedPath('event server profile',
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2019             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+"""Snapshot and append-only journal of the Event Console status
+
+The status file is a snapshot of the whole status. Writing it takes long
+when there are many events, so the changes made since the last save are
+appended to the journal instead and the snapshot is only written from time
+to time. Both are stored marshalled, which is much faster to load than the
+Python literal the status file used to contain. The journal consists of
+length prefixed records. A record which has not been written completely,
+e.g. because of a crash, ends the journal.
+"""
+
+import ast
+import errno
+import marshal
+import os
+import struct
+
+from typing import Any, Dict, Iterator  # pylint: disable=unused-import
+
+_SNAPSHOT_MAGIC = "CMKECSTATUS1\n"
+
+
+def encode_snapshot(status):
+    # type: (Dict[str, Any]) -> str
+    return _SNAPSHOT_MAGIC + marshal.dumps(status)
+
+
+def decode_snapshot(data):
+    # type: (str) -> Dict[str, Any]
+    if data.startswith(_SNAPSHOT_MAGIC):
+        return marshal.loads(data[len(_SNAPSHOT_MAGIC):])
+    return ast.literal_eval(data)  # Written by an older version
+
+
+class StatusJournal(object):
+    _MAGIC = "CMKECJOURNAL1\n"
+    _LENGTH = struct.Struct("<I")
+
+    def __init__(self, path):
+        super(StatusJournal, self).__init__()
+        self._path = path
+
+    def append(self, record):
+        # type: (Dict[str, Any]) -> None
+        data = marshal.dumps(record)
+        with self._path.open(mode="ab") as f:
+            if f.tell() == 0:
+                f.write(self._MAGIC)
+            f.write(self._LENGTH.pack(len(data)) + data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def records(self):
+        # type: () -> Iterator[Dict[str, Any]]
+        try:
+            content = self._path.read_bytes()
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return
+            raise
+
+        if not content.startswith(self._MAGIC):
+            return
+
+        offset = len(self._MAGIC)
+        while offset + self._LENGTH.size <= len(content):
+            length = self._LENGTH.unpack_from(content, offset)[0]
+            offset += self._LENGTH.size
+            if offset + length > len(content):
+                return  # Incomplete record of an interrupted write
+            yield marshal.loads(content[offset:offset + length])
+            offset += length
+
+    def size(self):
+        # type: () -> int
+        try:
+            return self._path.stat().st_size
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return 0
+            raise
+
+    def clear(self):
+        # type: () -> None
+        try:
+            self._path.unlink()
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
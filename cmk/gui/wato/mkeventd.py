@@ -3049,6 +3049,32 @@ class ConfigVariableEventConsoleRuleOptimizer(ConfigVariable):
         )
 
 
+@config_variable_registry.register
+class ConfigVariableEventConsoleEventProcessingWorkers(ConfigVariable):
+    def group(self):
+        return ConfigVariableGroupEventConsoleGeneric
+
+    def domain(self):
+        return ConfigDomainEventConsole
+
+    def ident(self):
+        return "event_processing_workers"
+
+    def valuespec(self):
+        return Integer(
+            title=_("Event processing worker processes"),
+            help=_("Number of additional processes that decode and parse the incoming messages "
+                   "and preselect the rules that may match them. This spreads the processing "
+                   "of message storms over several CPU cores. Counting, cancelling and the "
+                   "event limits are still handled by the main process, which keeps the order "
+                   "of the messages. With <tt>0</tt> all messages are processed by the main "
+                   "process."),
+            minvalue=0,
+            maxvalue=64,
+            unit=_("processes"),
+        )
+
+
 @config_variable_registry.register
 class ConfigVariableEventConsoleActions(ConfigVariable):
     def group(self):
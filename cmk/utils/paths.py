@@ -62,6 +62,7 @@ log_dir = _omd_path("var/log")
 precompiled_checks_dir = _omd_path("var/check_mk/precompiled_checks")
 autochecks_dir = _omd_path("var/check_mk/autochecks")
 precompiled_hostchecks_dir = _omd_path("var/check_mk/precompiled")
+core_fingerprints_dir = _omd_path("var/check_mk/core_fingerprints")
 snmpwalks_dir = _omd_path("var/check_mk/snmpwalks")
 counters_dir = _omd_path("tmp/check_mk/counters")
 tcp_cache_dir = _omd_path("tmp/check_mk/cache")
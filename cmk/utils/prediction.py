@@ -31,6 +31,11 @@ import time
 import livestatus  # type: ignore
 from livestatus import MKLivestatusNotFoundError
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 from cmk.utils.exceptions import MKGeneralException
 import cmk.utils.debug
 import cmk.utils.log
@@ -83,19 +88,46 @@ class TimeSeries(object):
         twindow : 3-tuple, (start, end, step)
              description of target time interval
         """
-        upsa = []
-        i = 0
         start, end, step = twindow
-        current_times = rrd_timestamps(self.twindow)
         if start != self.start or end != self.end or step != self.step:
+            return [self.values[i] for i in self.upsample_indices(twindow, shift)]
+
+        return self.values
+
+    def upsample_indices(self, twindow, shift):
+        """Positions of the values backward filling the timestamps of twindow
+
+        Walking the target timestamps, the position advances by at most one
+        value per timestamp, as soon as the timestamp reaches the end of the
+        current measurement interval (shifted by shift)."""
+        start, end, step = twindow
+        current_times = rrd_timestamps(self.twindow)
+
+        if np is None:
+            indices = []
+            i = 0
             for t in range(start, end, step):
                 if t >= current_times[i] + shift:
                     i += 1
-                upsa.append(self.values[i])
-
-            return upsa
-
-        return self.values
+                indices.append(i)
+            return indices
+
+        # ended[n] is the number of measurement intervals ended until the
+        # n-th target timestamp. Advancing by at most one per timestamp, the
+        # position is the minimum of ended[m] + (n - m) over all m <= n and
+        # of n + 1.
+        targets = np.arange(start, end, step)
+        ended = np.searchsorted(np.array(current_times) + shift, targets, side="right")
+        offsets = np.arange(len(targets))
+        return np.minimum(np.minimum.accumulate(ended - offsets), 1) + offsets
+
+    def bfill_upsample_array(self, twindow, shift):
+        """Like bfill_upsample, but returns a float array holding NaN for missing values"""
+        values = np.array(self.values, dtype=float)
+        start, end, step = twindow
+        if start != self.start or end != self.end or step != self.step:
+            return values[self.upsample_indices(twindow, shift)]
+        return values
 
     def time_data_pairs(self):
         return list(zip(rrd_timestamps(self.twindow), self.values))
@@ -133,39 +165,62 @@ def get_rrd_data(hostname, service_description, varname, cf, fromtime, untiltime
 
     """
 
+    return get_rrd_data_of_windows(hostname,
+                                   service_description,
+                                   varname,
+                                   cf, [(fromtime, untiltime)],
+                                   max_entries=max_entries)[0]
+
+
+def get_rrd_data_of_windows(hostname,
+                            service_description,
+                            varname,
+                            cf,
+                            time_windows,
+                            max_entries=400):
+    """Fetch RRD historic metrics data of a specific service for several time ranges
+
+    All time windows are requested as separate rrddata columns of a single
+    livestatus query. Returns one TimeSeries object per time window, see
+    get_rrd_data for details."""
+
     step = 1
     rpn = "%s.%s" % (varname, cf.lower())  # "MAX" -> "max"
 
+    columns = []
+    for nr, (fromtime, untiltime) in enumerate(time_windows, 1):
+        columns.append("rrddata:m%d:%s:%s:%s:%s:%s" % ((nr,) + tuple(
+            map(livestatus.lqencode, map(str, (rpn, fromtime, untiltime, step, max_entries))))))
+
     lql = "GET services\n" \
-          "Columns: rrddata:m1:%s:%s:%s:%s:%s\n" \
+          "Columns: %s\n" \
           "OutputFormat: python\n" \
           "Filter: host_name = %s\n" \
-          "Filter: description = %s\n" % tuple(map(livestatus.lqencode,
-                                                   map(str, (rpn, fromtime, untiltime, step, max_entries,
-                                                             hostname, service_description))))
+          "Filter: description = %s\n" % ((" ".join(columns),) + tuple(
+              map(livestatus.lqencode, map(str, (hostname, service_description)))))
 
     try:
         connection = livestatus.SingleSiteConnection("unix:%s" %
                                                      cmk.utils.paths.livestatus_unix_socket)
-        response = connection.query_value(lql)
+        response = connection.query_row(lql)
     except MKLivestatusNotFoundError as e:
         if cmk.utils.debug.enabled():
             raise
         raise MKGeneralException("Cannot get historic metrics via Livestatus: %s" % e)
 
-    if response is None:
+    if not response or None in response:
         raise MKGeneralException("Cannot retrieve historic data with Nagios Core")
 
-    return TimeSeries(response)
+    return [TimeSeries(column) for column in response]
 
 
-def rrd_datacolum(hostname, service_description, varname, cf):
-    "Partial helper function to get rrd data"
+def rrd_datacolumn_of_windows(hostname, service_description, varname, cf):
+    "Partial helper function to get the rrd data of several time windows at once"
 
-    def time_boundaries(fromtime, untiltime):
-        return get_rrd_data(hostname, service_description, varname, cf, fromtime, untiltime)
+    def time_windows_data(time_windows):
+        return get_rrd_data_of_windows(hostname, service_description, varname, cf, time_windows)
 
-    return time_boundaries
+    return time_windows_data
 
 
 def predictions_dir(hostname, service_description, dsname, create=False):
@@ -25,6 +25,7 @@
 # Boston, MA 02110-1301 USA.
 """This module provides generic Check_MK ruleset processing functionality"""
 
+import re
 from typing import Any, Set, Optional, Generator, Dict, Text, Pattern, Tuple, List  # pylint: disable=unused-import
 
 from cmk.utils.rulesets.tuple_rulesets import (
@@ -92,8 +93,6 @@ class RulesetMatcher(object):
             nodes_of,
         )
 
-        self._service_match_cache = {}
-
     def is_matching_host_ruleset(self, match_object, ruleset):
         # type: (RulesetMatchObject, List[Dict]) -> bool
         """Compute outcome of a ruleset set that just says yes/no
@@ -122,8 +121,6 @@ class RulesetMatcher(object):
         # type: (RulesetMatchObject, List, bool) -> Generator
         """Returns a generator of the values of the matched rules
         Replaces host_extra_conf"""
-        self.tuple_transformer.transform_in_place(ruleset, is_service=False, is_binary=is_binary)
-
         # When the requested host is part of the local sites configuration,
         # then use only the sites hosts for processing the rules
         with_foreign_hosts = match_object.host_name not in \
@@ -163,59 +160,32 @@ class RulesetMatcher(object):
         # type: (RulesetMatchObject, List, bool) -> Generator
         """Returns a generator of the values of the matched rules
         Replaces service_extra_conf"""
-        self.tuple_transformer.transform_in_place(ruleset, is_service=True, is_binary=is_binary)
-
         with_foreign_hosts = match_object.host_name not in \
                                 self.ruleset_optimizer.all_processed_hosts()
         optimized_ruleset = self.ruleset_optimizer.get_service_ruleset(ruleset,
                                                                        with_foreign_hosts,
                                                                        is_binary=is_binary)
 
-        for value, hosts, service_labels_condition, service_description_condition in optimized_ruleset:
-            if match_object.host_name not in hosts:
-                continue
-
-            if match_object.service_description is None:
-                continue
-
-            service_cache_id = (
-                match_object.service_cache_id(),
-                service_description_condition,
-                tuple((label_id, _tags_or_labels_cache_id(label_spec))
-                      for label_id, label_spec in service_labels_condition.iteritems()),
-            )
+        if match_object.service_description is None:
+            return
 
-            if service_cache_id in self._service_match_cache:
-                match = self._service_match_cache[service_cache_id]
-            else:
-                match = self._matches_service_conditions(service_description_condition,
-                                                         service_labels_condition, match_object)
-                self._service_match_cache[service_cache_id] = match
-
-            if match:
-                yield value
-
-    def _matches_service_conditions(self, service_description_condition, service_labels_condition,
-                                    match_object):
-        # type: (Tuple[bool, Pattern[Text]], Dict[Text, Text], RulesetMatchObject) -> bool
-        if not self._matches_service_description_condition(service_description_condition,
-                                                           match_object):
-            return False
+        rules, service_description_conditions = optimized_ruleset
+        matching_conditions = service_description_conditions.matching_conditions(
+            match_object.service_description)
 
-        if service_labels_condition \
-           and not _matches_labels(match_object.service_labels, service_labels_condition):
-            return False
+        host_name = match_object.host_name
+        for value, hosts, service_labels_condition, condition_index in rules:
+            if host_name not in hosts:
+                continue
 
-        return True
+            if not matching_conditions[condition_index]:
+                continue
 
-    def _matches_service_description_condition(self, service_description_condition, match_object):
-        # type: (Tuple[bool, Pattern[Text]], RulesetMatchObject) -> bool
-        negate, pattern = service_description_condition
+            if service_labels_condition \
+               and not _matches_labels(match_object.service_labels, service_labels_condition):
+                continue
 
-        if match_object.service_description is not None \
-            and pattern.match(match_object.service_description) is not None:
-            return not negate
-        return negate
+            yield value
 
     # TODO: Find a way to use the generic get_values
     def get_values_for_generic_agent_host(self, ruleset):
@@ -250,7 +220,12 @@ class RulesetMatcher(object):
 
 class RulesetOptimizer(object):
     """Performs some precalculations on the configured rulesets to improve the
-    processing performance"""
+    processing performance
+
+    The host conditions of the rules are not evaluated host by host. Inverted
+    indexes map the tags, labels, folders and names to the sets of hosts having
+    them, so that the hosts matching a condition are computed with a few set
+    operations."""
     def __init__(self, ruleset_matcher, host_tag_lists, host_paths, labels, all_configured_hosts,
                  clusters_of, nodes_of):
         super(RulesetOptimizer, self).__init__()
@@ -269,27 +244,22 @@ class RulesetOptimizer(object):
         # may contain a reduced set of hosts, since each process handles a subset
         self._all_processed_hosts = self._all_configured_hosts
 
-        # A factor which indicates how much hosts share the same host tag configuration (excluding folders).
-        # len(all_processed_hosts) / len(different tag combinations)
-        # It is used to determine the best rule evualation method
-        self._all_processed_hosts_similarity = 1
-
         self._service_ruleset_cache = {}
         self._host_ruleset_cache = {}
         self._all_matching_hosts_match_cache = {}
 
         # Reference dirname -> hosts in this dir including subfolders
         self._folder_host_lookup = {}
-        # Provides a list of hosts with the same hosttags, excluding the folder
-        self._hosts_grouped_by_tags = {}
-        # Reference hostname -> tag group reference
-        self._host_grouped_ref = {}
 
-        # TODO: The folder will not be part of new dict tags anymore. This can
-        # be cleaned up then.
-        self._hosttags_without_folder = {}
+        # Inverted indexes: tag -> hosts having this tag, folder -> hosts
+        # directly located in this folder
+        self._hosts_by_tag = {}  # type: Dict[str, Set[str]]
+        self._hosts_by_folder = {}  # type: Dict[str, Set[str]]
+
+        # Inverted index of the host labels, which is created on demand:
+        # with_foreign_hosts -> (label id, label value) -> hosts
+        self._hosts_by_label = {}  # type: Dict[bool, Dict[Tuple[Text, Text], Set[str]]]
 
-        # TODO: Clean this one up?
         self._initialize_host_lookup()
 
     def all_processed_hosts(self):
@@ -315,23 +285,7 @@ class RulesetOptimizer(object):
         # the scope of relevant hosts has changed. This is -good-, since the values in this
         # lookup are iterated one by one later on in all_matching_hosts
         self._folder_host_lookup = {}
-
-        self._adjust_processed_hosts_similarity()
-
-    def _adjust_processed_hosts_similarity(self):
-        """ This function computes the tag similarities between of the processed hosts
-        The result is a similarity factor, which helps finding the most perfomant operation
-        for the current hostset """
-        used_groups = set()
-        for hostname in self._all_processed_hosts:
-            used_groups.add(self._host_grouped_ref[hostname])
-
-        if not used_groups:
-            self._all_processed_hosts_similarity = 1
-            return
-
-        self._all_processed_hosts_similarity = (1.0 * len(self._all_processed_hosts) /
-                                                len(used_groups))
+        self._hosts_by_label.pop(False, None)
 
     def get_host_ruleset(self, ruleset, with_foreign_hosts, is_binary):
         cache_id = id(ruleset), with_foreign_hosts
@@ -339,6 +293,11 @@ class RulesetOptimizer(object):
         if cache_id in self._host_ruleset_cache:
             return self._host_ruleset_cache[cache_id]
 
+        # The rules only need to be transformed once. Transforming them on
+        # every lookup would mean to iterate the whole ruleset again.
+        self._ruleset_matcher.tuple_transformer.transform_in_place(ruleset,
+                                                                   is_service=False,
+                                                                   is_binary=is_binary)
         ruleset = self._convert_host_ruleset(ruleset, with_foreign_hosts, is_binary)
         self._host_ruleset_cache[cache_id] = ruleset
         return ruleset
@@ -365,6 +324,9 @@ class RulesetOptimizer(object):
         if cache_id in self._service_ruleset_cache:
             return self._service_ruleset_cache[cache_id]
 
+        self._ruleset_matcher.tuple_transformer.transform_in_place(ruleset,
+                                                                   is_service=True,
+                                                                   is_binary=is_binary)
         cached_ruleset = self._convert_service_ruleset(ruleset,
                                                        with_foreign_hosts=with_foreign_hosts,
                                                        is_binary=is_binary)
@@ -372,7 +334,10 @@ class RulesetOptimizer(object):
         return cached_ruleset
 
     def _convert_service_ruleset(self, ruleset, with_foreign_hosts, is_binary):
+        """Precompute the matching hosts of all rules and merge the service
+        description conditions of all rules"""
         new_rules = []
+        service_description_conditions = ServiceDescriptionConditions()
         for rule in ruleset:
             if "options" in rule and "disabled" in rule["options"]:
                 continue
@@ -382,11 +347,13 @@ class RulesetOptimizer(object):
             hosts = self._all_matching_hosts(rule["condition"], with_foreign_hosts)
 
             # And now preprocess the configured patterns in the servlist
-            new_rules.append(
-                (rule["value"], hosts, rule["condition"].get("service_labels", {}),
-                 self._convert_pattern_list(rule["condition"].get("service_description"))))
+            condition_index = service_description_conditions.add(
+                self._convert_pattern_list(rule["condition"].get("service_description")))
 
-        return new_rules
+            new_rules.append((rule["value"], hosts, rule["condition"].get("service_labels", {}),
+                              condition_index))
+
+        return new_rules, service_description_conditions
 
     def _convert_pattern_list(self, patterns):
         # type: (List[Text]) -> Tuple[bool, Pattern[Text]]
@@ -432,50 +399,28 @@ class RulesetOptimizer(object):
 
         # Thin out the valid hosts further. If the rule is located in a folder
         # we only need the intersection of the folders hosts and the previously determined valid_hosts
-        valid_hosts = self.get_hosts_within_folder(rule_path,
-                                                   with_foreign_hosts).intersection(valid_hosts)
-
-        if tags and hostlist is None and not labels:
-            # TODO: Labels could also be optimized like the tags
-            matched_by_tags = self._match_hosts_by_tags(cache_id, valid_hosts, tags)
-            if matched_by_tags is not None:
-                return matched_by_tags
+        matching = self.get_hosts_within_folder(rule_path,
+                                                with_foreign_hosts).intersection(valid_hosts)
 
-        matching = set()  # type: Set[str]
         only_specific_hosts = hostlist is not None \
             and not isinstance(hostlist, dict) \
             and all(not isinstance(x, dict) for x in hostlist)
 
         if hostlist == []:
-            pass  # Empty host list -> Nothing matches
-        elif not tags and not labels and not hostlist:
-            # If no tags are specified and the hostlist only include @all (all hosts)
-            matching = valid_hosts
-        elif not tags and not labels and only_specific_hosts:
-            # If no tags are specified and there are only specific hosts we already have the matches
-            matching = valid_hosts.intersection(hostlist)
+            matching = set()  # Empty host list -> Nothing matches
         else:
-            # If the rule has only exact host restrictions, we can thin out the list of hosts to check
+            # Start with the cheapest conditions to keep the intermediate sets small
             if only_specific_hosts:
-                hosts_to_check = valid_hosts.intersection(hostlist)
-            else:
-                hosts_to_check = valid_hosts
+                matching = matching.intersection(hostlist)
 
-            for hostname in hosts_to_check:
-                # When no tag matching is requested, do not filter by tags. Accept all hosts
-                # and filter only by hostlist
-                if tags and not self.matches_host_tags(self._host_tag_lists[hostname], tags):
-                    continue
+            if tags:
+                matching = self._match_hosts_by_tags(matching, tags)
 
-                if labels:
-                    host_labels = self._labels.labels_of_host(self._ruleset_matcher, hostname)
-                    if not _matches_labels(host_labels, labels):
-                        continue
+            if labels:
+                matching = self._match_hosts_by_labels(matching, labels, with_foreign_hosts)
 
-                if not self.matches_host_name(hostlist, hostname):
-                    continue
-
-                matching.add(hostname)
+            if hostlist and not only_specific_hosts:
+                matching = self._match_hosts_by_name(matching, hostlist)
 
         self._all_matching_hosts_match_cache[cache_id] = matching
         return matching
@@ -561,72 +506,97 @@ class RulesetOptimizer(object):
             rule_path,
         )
 
-    # TODO: Generalize this optimization: Build some kind of key out of the tag conditions
-    # (positive, negative, ...). Make it work with the new tag group based "$or" handling.
-    def _match_hosts_by_tags(self, cache_id, valid_hosts, tags):
-        matching = set()
-        negative_match_tags = set()
-        positive_match_tags = set()
-        for tag in tags.values():
-            if isinstance(tag, dict):
-                if "$ne" in tag:
-                    negative_match_tags.add(tag["$ne"])
-                    continue
+    def _match_hosts_by_tags(self, hosts, tags):
+        # type: (Set[str], Dict[str, Any]) -> Set[str]
+        """Returns the hosts of the given hosts matching all tag conditions"""
+        for tag_spec in tags.values():
+            hosts = self._match_hosts_by_tag_spec(hosts, tag_spec)
+        return hosts
+
+    def _match_hosts_by_tag_spec(self, hosts, tag_spec):
+        # type: (Set[str], Any) -> Set[str]
+        if isinstance(tag_spec, dict):
+            if "$ne" in tag_spec:
+                return hosts.difference(self._hosts_by_tag.get(tag_spec["$ne"], ()))
+
+            if "$or" in tag_spec:
+                matching = set()  # type: Set[str]
+                for sub_tag_spec in tag_spec["$or"]:
+                    matching.update(self._match_hosts_by_tag_spec(hosts, sub_tag_spec))
+                return matching
+
+            if "$nor" in tag_spec:
+                matching = set(hosts)
+                for sub_tag_spec in tag_spec["$nor"]:
+                    matching.difference_update(self._match_hosts_by_tag_spec(hosts, sub_tag_spec))
+                return matching
+
+            raise NotImplementedError()
+
+        return hosts.intersection(self._hosts_by_tag.get(tag_spec, ()))
+
+    def _match_hosts_by_labels(self, hosts, labels, with_foreign_hosts):
+        # type: (Set[str], Dict[Text, Any], bool) -> Set[str]
+        """Returns the hosts of the given hosts matching all label conditions"""
+        hosts_by_label = self._get_hosts_by_label(with_foreign_hosts)
+        for label_id, label_spec in labels.iteritems():
+            if isinstance(label_spec, dict):
+                hosts = hosts.difference(hosts_by_label.get((label_id, label_spec["$ne"]), ()))
+            else:
+                hosts = hosts.intersection(hosts_by_label.get((label_id, label_spec), ()))
+        return hosts
 
-                if "$or" in tag:
-                    return None  # Can not be optimized, makes _all_matching_hosts proceed
+    def _get_hosts_by_label(self, with_foreign_hosts):
+        # type: (bool) -> Dict[Tuple[Text, Text], Set[str]]
+        try:
+            return self._hosts_by_label[with_foreign_hosts]
+        except KeyError:
+            pass
 
-                if "$nor" in tag:
-                    return None  # Can not be optimized, makes _all_matching_hosts proceed
+        if with_foreign_hosts:
+            relevant_hosts = self._all_configured_hosts
+        else:
+            relevant_hosts = self._all_processed_hosts
 
-                raise NotImplementedError()
+        hosts_by_label = {}  # type: Dict[Tuple[Text, Text], Set[str]]
+        for hostname in relevant_hosts:
+            for label in self._labels.labels_of_host(self._ruleset_matcher,
+                                                     hostname).iteritems():
+                hosts_by_label.setdefault(label, set()).add(hostname)
 
-            positive_match_tags.add(tag)
-
-        # TODO:
-        #if has_specific_folder_tag or self._all_processed_hosts_similarity < 3:
-        if self._all_processed_hosts_similarity < 3:
-            # Without shared folders
-            for hostname in valid_hosts:
-                host_tags = self._host_tag_lists[hostname]
-                if not positive_match_tags - host_tags:
-                    if not negative_match_tags.intersection(host_tags):
-                        matching.add(hostname)
-
-            self._all_matching_hosts_match_cache[cache_id] = matching
-            return matching
-
-        # With shared folders
-        checked_hosts = set()
-        for hostname in valid_hosts:
-            if hostname in checked_hosts:
-                continue
+        self._hosts_by_label[with_foreign_hosts] = hosts_by_label
+        return hosts_by_label
 
-            hosts_with_same_tag = self._filter_hosts_with_same_tags_as_host(hostname, valid_hosts)
-            checked_hosts.update(hosts_with_same_tag)
+    def _match_hosts_by_name(self, hosts, hostlist):
+        # type: (Set[str], Any) -> Set[str]
+        """Returns the hosts of the given hosts matching the host name condition
+        (explicit host names and regular expressions, optionally negated)"""
+        negate, hostlist = parse_negated_condition_list(hostlist)
 
-            tags = self._host_tag_lists[hostname]
-            if not positive_match_tags - tags:
-                if not negative_match_tags.intersection(tags):
-                    matching.update(hosts_with_same_tag)
+        host_names = set(entry for entry in hostlist if not isinstance(entry, dict))
+        matching = hosts.intersection(host_names)
 
-        self._all_matching_hosts_match_cache[cache_id] = matching
-        return matching
+        patterns = [regex(entry["$regex"]) for entry in hostlist if isinstance(entry, dict)]
+        if patterns:
+            for hostname in hosts.difference(matching):
+                if any(pattern.match(hostname) is not None for pattern in patterns):
+                    matching.add(hostname)
 
-    def _filter_hosts_with_same_tags_as_host(self, hostname, hosts):
-        return self._hosts_grouped_by_tags[self._host_grouped_ref[hostname]].intersection(hosts)
+        if negate:
+            return hosts.difference(matching)
+        return matching
 
     def get_hosts_within_folder(self, folder_path, with_foreign_hosts):
         # type: (str, bool) -> Set[str]
         cache_id = with_foreign_hosts, folder_path
         if cache_id not in self._folder_host_lookup:
-            hosts_in_folder = set()
-            relevant_hosts = self._all_configured_hosts if with_foreign_hosts else self._all_processed_hosts
-
-            for hostname in relevant_hosts:
-                host_path = self._host_paths.get(hostname, "/")
+            hosts_in_folder = set()  # type: Set[str]
+            for host_path, hosts in self._hosts_by_folder.iteritems():
                 if host_path.startswith(folder_path):
-                    hosts_in_folder.add(hostname)
+                    hosts_in_folder.update(hosts)
+
+            if not with_foreign_hosts:
+                hosts_in_folder.intersection_update(self._all_processed_hosts)
 
             self._folder_host_lookup[cache_id] = hosts_in_folder
             return hosts_in_folder
@@ -634,21 +604,84 @@ class RulesetOptimizer(object):
         return self._folder_host_lookup[cache_id]
 
     def _initialize_host_lookup(self):
-        # Determine hosttags without folder tag
         for hostname in self._all_configured_hosts:
-            tags_without_folder = set(self._host_tag_lists[hostname])
-            try:
-                tags_without_folder.remove(self._host_paths.get(hostname, "/"))
-            except (KeyError, ValueError):
-                pass
+            for tag in self._host_tag_lists[hostname]:
+                self._hosts_by_tag.setdefault(tag, set()).add(hostname)
 
-            self._hosttags_without_folder[hostname] = tags_without_folder
+            self._hosts_by_folder.setdefault(self._host_paths.get(hostname, "/"),
+                                             set()).add(hostname)
 
-        # Determine hosts with same tag setup (ignoring folder tag)
-        for hostname in self._all_configured_hosts:
-            group_ref = tuple(sorted(self._hosttags_without_folder[hostname]))
-            self._hosts_grouped_by_tags.setdefault(group_ref, set()).add(hostname)
-            self._host_grouped_ref[hostname] = group_ref
+
+_UNMERGEABLE_PATTERN = re.compile(r"\\[1-9]|\(\?[iLmsux]|\(\?P=")
+
+
+class ServiceDescriptionConditions(object):
+    """The distinct service description conditions of a service ruleset
+
+    The conditions are evaluated together for a service description and the
+    result is remembered. Most conditions don't match a given service, so all
+    conditions are merged into a single regex first: If it does not match,
+    none of the individual patterns can match.
+    """
+    def __init__(self):
+        super(ServiceDescriptionConditions, self).__init__()
+        self._conditions = []  # type: List[Tuple[bool, Pattern[Text]]]
+        self._condition_index = {}  # type: Dict[Tuple[bool, Text], int]
+        self._merged_pattern = None  # type: Optional[Pattern[Text]]
+        self._matching_conditions = {}  # type: Dict[Text, Tuple[bool, ...]]
+
+    def add(self, condition):
+        # type: (Tuple[bool, Pattern[Text]]) -> int
+        """Adds a condition (if not known yet) and returns its index"""
+        negate, pattern = condition
+        key = negate, pattern.pattern
+        try:
+            return self._condition_index[key]
+        except KeyError:
+            pass
+
+        self._conditions.append(condition)
+        self._condition_index[key] = len(self._conditions) - 1
+        self._merged_pattern = None
+        self._matching_conditions.clear()
+        return self._condition_index[key]
+
+    def matching_conditions(self, service_description):
+        # type: (Text) -> Tuple[bool, ...]
+        """Returns for each condition whether or not the service description matches it"""
+        try:
+            return self._matching_conditions[service_description]
+        except KeyError:
+            pass
+
+        if self._merged_pattern is None:
+            self._merged_pattern = self._merge_patterns()
+
+        if self._merged_pattern is not False \
+           and self._merged_pattern.match(service_description) is None:
+            result = tuple(negate for negate, _pattern in self._conditions)
+        else:
+            result = tuple((pattern.match(service_description) is not None) is not negate
+                           for negate, pattern in self._conditions)
+
+        self._matching_conditions[service_description] = result
+        return result
+
+    def _merge_patterns(self):
+        # type: () -> Any
+        """Combines all patterns to one. Returns False when this is not possible.
+
+        Back references and inline flags would change their meaning in the
+        combined pattern, so patterns using them are not combined."""
+        if any(_UNMERGEABLE_PATTERN.search(pattern.pattern)
+               for _negate, pattern in self._conditions):
+            return False
+
+        try:
+            return regex("|".join("(?:%s)" % pattern.pattern
+                                  for _negate, pattern in self._conditions))
+        except MKGeneralException:
+            return False
 
 
 def _tags_or_labels_cache_id(tag_or_label_spec):
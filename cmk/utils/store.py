@@ -31,6 +31,9 @@ import ast
 from contextlib import contextmanager
 import errno
 import fcntl
+import hashlib
+import imp
+import marshal
 import os
 import pprint
 import tempfile
@@ -43,6 +46,7 @@ except ImportError:
     from pathlib2 import Path
 
 import cmk.utils.log
+import cmk.utils.paths
 from cmk.utils.exceptions import MKGeneralException, MKTimeout
 from cmk.utils.i18n import _
 from cmk.utils.paths import default_config_dir
@@ -141,7 +145,7 @@ def load_mk_file(path, default=None, lock=False):
 
     try:
         try:
-            execfile(path, globals(), default)
+            exec(_load_mk_file_code(path), globals(), default)  # pylint: disable=exec-used
         except IOError as e:
             if e.errno != errno.ENOENT:  # No such file or directory
                 raise
@@ -180,12 +184,21 @@ def load_data_from_file(path, default=None, lock=False):
 
     try:
         try:
-            content = file(path).read().strip()
-            if not content:
-                # May be created empty during locking
-                return default
+            with open(path) as f:
+                cache_key = _load_cache_key(f)
+                data = _read_load_cache(path, "data", cache_key)
+                if data is not _CACHE_MISS:
+                    return data
 
-            return ast.literal_eval(content)
+                content = f.read().strip()
+                if not content:
+                    # May be created empty during locking
+                    return default
+
+                data = ast.literal_eval(content)
+
+            _write_load_cache(path, "data", cache_key, data)
+            return data
         except IOError as e:
             if e.errno != errno.ENOENT:  # No such file or directory
                 raise
@@ -299,6 +312,149 @@ def save_to_mk_file(path, key, value, pprint_value=False):
     save_mk_file(path, formated)
 
 
+#.
+#   .--Load cache----------------------------------------------------------.
+#   |           _                    _                  _                  |
+#   |          | |    ___   __ _  __| |   ___ __ _  ___| |__   ___         |
+#   |          | |   / _ \ / _` |/ _` |  / __/ _` |/ __| '_ \ / _ \        |
+#   |          | |__| (_) | (_| | (_| | | (_| (_| | (__| | | |  __/        |
+#   |          |_____\___/ \__,_|\__,_|  \___\__,_|\___|_| |_|\___|        |
+#   |                                                                      |
+#   +----------------------------------------------------------------------+
+#   | Parsing large .mk files (autochecks, rules, hosts, users) is slow    |
+#   | and the same files are read over and over again by the different    |
+#   | processes. The result of the parsing is cached in marshal format in  |
+#   | the tmp directory of the site: The data of files read with           |
+#   | load_data_from_file() and the compiled code of the files executed by |
+#   | load_mk_file(). A cache entry is only used as long as device, inode, |
+#   | size and times of the file are unchanged. Otherwise the text file is |
+#   | parsed again. The text files themselves are never touched. There is  |
+#   | one entry per file, which is replaced when the file changes. Entries |
+#   | of removed files are deleted by prune_load_cache().                  |
+#   '----------------------------------------------------------------------'
+
+# Can be set to False to always parse the text files
+load_cache_enabled = True
+
+_LOAD_CACHE_VERSION = 2
+_CACHE_MISS = object()
+
+
+def _load_cache_dir():
+    return os.path.join(cmk.utils.paths.tmp_dir, "store_cache")
+
+
+def _load_cache_source_path(path):
+    if isinstance(path, unicode):
+        path = path.encode("utf-8")
+    return os.path.abspath(path)
+
+
+def _load_cache_path(path, kind):
+    return os.path.join(_load_cache_dir(), "%s.%s" %
+                        (hashlib.sha1(_load_cache_source_path(path)).hexdigest(), kind))
+
+
+def _load_cache_key(f):
+    """Identifies the state of the opened file the cache entry was created from"""
+    st = os.fstat(f.fileno())
+    return (_LOAD_CACHE_VERSION, imp.get_magic(), st.st_dev, st.st_ino, st.st_size, st.st_mtime,
+            st.st_ctime)
+
+
+def _read_load_cache(path, kind, cache_key):
+    if not load_cache_enabled:
+        return _CACHE_MISS
+
+    try:
+        with open(_load_cache_path(path, kind), "rb") as f:
+            marshal.load(f)  # The path of the file, only needed for pruning
+            if marshal.load(f) != cache_key:
+                return _CACHE_MISS
+            return marshal.load(f)
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        return _CACHE_MISS
+
+
+def _write_load_cache(path, kind, cache_key, value):
+    if not load_cache_enabled:
+        return
+
+    try:
+        content = marshal.dumps(_load_cache_source_path(path)) + marshal.dumps(cache_key) \
+                + marshal.dumps(value)
+    except ValueError:
+        return  # Not marshalable. Simply don't cache it.
+
+    cache_path = _load_cache_path(path, kind)
+    tmp_path = None
+    try:
+        makedirs(os.path.dirname(cache_path))
+        with tempfile.NamedTemporaryFile("wb",
+                                         dir=os.path.dirname(cache_path),
+                                         prefix=".%s.new" % os.path.basename(cache_path),
+                                         delete=False) as tmp:
+            tmp_path = tmp.name
+            tmp.write(content)
+        os.rename(tmp_path, cache_path)
+    except (IOError, OSError) as e:
+        # The cache is only an optimization. Reading the text file still works.
+        logger.debug("Cannot write load cache of %r: %s", path, e)
+        if tmp_path:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+
+def prune_load_cache():
+    """Delete the cache entries of files that do not exist anymore
+
+    Entries that cannot be read, e.g. because they have been written by an
+    older version, are deleted as well."""
+    try:
+        names = os.listdir(_load_cache_dir())
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return
+        raise
+
+    for name in names:
+        if name.startswith("."):
+            continue  # Currently being written
+
+        cache_path = os.path.join(_load_cache_dir(), name)
+        try:
+            with open(cache_path, "rb") as f:
+                source_path = marshal.load(f)
+                if marshal.load(f)[0] != _LOAD_CACHE_VERSION:
+                    source_path = None
+        except (IOError, OSError, EOFError, ValueError, TypeError, IndexError):
+            source_path = None
+
+        if isinstance(source_path, str) and os.path.exists(source_path):
+            continue
+
+        try:
+            os.unlink(cache_path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+
+def _load_mk_file_code(path):
+    with open(path) as f:
+        cache_key = _load_cache_key(f)
+        code = _read_load_cache(path, "code", cache_key)
+        if code is not _CACHE_MISS:
+            return code
+
+        code = compile(f.read(), path, "exec")
+
+    _write_load_cache(path, "code", cache_key, code)
+    return code
+
+
 #.
 #   .--File locking--------------------------------------------------------.
 #   |          _____ _ _        _            _    _                        |
@@ -725,6 +725,37 @@ class Numeration(Leaf):
                len(removed_rows) + num_removed, delta_node
 
     def _get_categorized_rows(self, other):
+        """Splits the rows into own rows not found in other, other rows not
+        found in own rows and rows found in both.
+
+        The rows are indexed by their content, so the effort grows linearly
+        with the number of rows and not with the product of both lengths."""
+        try:
+            own_keys = [_row_key(row) for row in self._numeration]
+            other_keys = [_row_key(row) for row in other._numeration]
+        except TypeError:
+            # Rows containing unhashable values (e.g. lists) can only be
+            # compared one by one.
+            return self._get_categorized_rows_by_equality(other)
+
+        own_key_set = set(own_keys)
+        identical_keys = set()
+        identical_rows = []
+        remaining_other_rows = []
+        for key, row in zip(other_keys, other._numeration):
+            if key in own_key_set:
+                if key not in identical_keys:
+                    identical_keys.add(key)
+                    identical_rows.append(row)
+            else:
+                remaining_other_rows.append(row)
+
+        remaining_new_rows = [
+            row for key, row in zip(own_keys, self._numeration) if key not in identical_keys
+        ]
+        return remaining_new_rows, remaining_other_rows, identical_rows
+
+    def _get_categorized_rows_by_equality(self, other):
         identical_rows = []
         remaining_other_rows = []
         remaining_new_rows = []
@@ -1042,6 +1073,11 @@ def _compare_dict_keys(old_dict, new_dict):
            new_keys - old_keys
 
 
+def _row_key(row):
+    """Hashable key of a numeration row, equal for equal rows"""
+    return frozenset(row.iteritems())
+
+
 def _new_delta_tree_node(value):
     return (None, value)
 
@@ -29,6 +29,7 @@ from typing import Iterator, Any, Dict, Union, Tuple, Text, Optional, List  # py
 import os
 import sys
 import ast
+import marshal
 from pathlib2 import Path
 import six
 
@@ -96,6 +97,11 @@ class AutochecksManager(object):
     def _read_autochecks_of(self, hostname):
         # type: (str) -> List[Service]
         """Read automatically discovered checks of one host"""
+        if config.packed_config_loaded():
+            snapshot = load_autochecks_snapshot(hostname)
+            if snapshot is not None:
+                return snapshot
+
         autochecks = []
         for service in self._read_raw_autochecks_of(hostname):
             autochecks.append(
@@ -169,6 +175,83 @@ class AutochecksManager(object):
             )
 
 
+# The snapshots contain the autochecks of a host with the service descriptions
+# and the check parameters already computed. They are written when activating
+# the configuration and used by the check helpers, which work with the packed
+# configuration of the activation (e.g. the precompiled host checks). Loading
+# the check table of a host is then a single unmarshal.
+_SNAPSHOT_VERSION = 1
+
+
+def _snapshot_path(hostname):
+    # type: (str) -> str
+    return os.path.join(cmk.utils.paths.var_dir, "base", "autochecks", hostname)
+
+
+def _snapshot_key(hostname):
+    # type: (str) -> Optional[Tuple]
+    """A snapshot is valid as long as the autochecks and the packed config are unchanged"""
+    try:
+        autochecks_stat = os.stat("%s/%s.mk" % (cmk.utils.paths.autochecks_dir, hostname))
+        config_stat = os.stat(config.PackedConfig().path)
+    except OSError:
+        return None
+    return (_SNAPSHOT_VERSION, autochecks_stat.st_mtime, autochecks_stat.st_size,
+            config_stat.st_mtime, config_stat.st_size)
+
+
+def save_autochecks_snapshot(hostname, services):
+    # type: (str, List[Service]) -> None
+    path = _snapshot_path(hostname)
+
+    key = _snapshot_key(hostname)
+    if key is None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return
+
+    entries = [(s.check_plugin_name, s.item, s.description, s.parameters,
+                s.service_labels.to_dict()) for s in services]
+    try:
+        content = marshal.dumps((key, entries))
+    except ValueError:
+        return  # Some check parameters can not be stored. Read the autochecks instead.
+
+    store.makedirs(os.path.dirname(path))
+    store.save_file(path, content)
+
+
+def load_autochecks_snapshot(hostname):
+    # type: (str) -> Optional[List[Service]]
+    """Returns the services of the host or None in case there is no valid snapshot"""
+    key = _snapshot_key(hostname)
+    if key is None:
+        return None
+
+    try:
+        with open(_snapshot_path(hostname), "rb") as f:
+            snapshot_key, entries = marshal.load(f)
+    except (IOError, EOFError, ValueError, TypeError):
+        return None
+
+    if snapshot_key != key:
+        return None
+
+    cmk_base.console.vverbose("Loading autochecks snapshot of %s\n", hostname)
+    return [
+        Service(
+            check_plugin_name=check_plugin_name,
+            item=item,
+            description=description,
+            parameters=parameters,
+            service_labels=DiscoveredServiceLabels(
+                *[ServiceLabel(name, value) for name, value in labels.iteritems()]),
+        ) for check_plugin_name, item, description, parameters, labels in entries
+    ]
+
+
 def resolve_paramstring(check_plugin_name, parameters_unresolved):
     # type: (str, str) -> CheckParameters
     """Translates a parameter string (read from autochecks) to it's final value
@@ -702,9 +702,12 @@ class AutomationDeleteHosts(Automation):
                 "%s/%s" % (cmk.utils.paths.precompiled_hostchecks_dir, hostname),
                 "%s/%s.py" % (cmk.utils.paths.precompiled_hostchecks_dir, hostname),
                 "%s/%s.mk" % (cmk.utils.paths.autochecks_dir, hostname),
+                "%s/base/autochecks/%s" % (cmk.utils.paths.var_dir, hostname),
                 "%s/%s" % (cmk.utils.paths.counters_dir, hostname),
                 "%s/%s" % (cmk.utils.paths.tcp_cache_dir, hostname),
+                "%s/%s.section_index" % (cmk.utils.paths.tcp_cache_dir, hostname),
                 "%s/persisted/%s" % (cmk.utils.paths.var_dir, hostname),
+                "%s/snmp_shared_cache/%s" % (cmk.utils.paths.var_dir, hostname),
                 "%s/inventory/%s" % (cmk.utils.paths.var_dir, hostname),
                 "%s/inventory/%s.gz" % (cmk.utils.paths.var_dir, hostname),
                 "%s/agent_deployment/%s" % (cmk.utils.paths.var_dir, hostname),
@@ -723,6 +726,7 @@ class AutomationDeleteHosts(Automation):
             filename = "%s/%s/%s" % (cmk.utils.paths.data_source_cache_dir, data_source_name,
                                      hostname)
             self._delete_if_exists(filename)
+            self._delete_if_exists(filename + ".section_index")
 
         # softlinks for baked agents. obsolete packages are removed upon next bake action
         # TODO: Move to bakery code
@@ -930,13 +934,15 @@ automations.register(AutomationGetConfiguration())
 class AutomationGetCheckInformation(Automation):
     cmd = "get-check-information"
     needs_config = False
-    needs_checks = True
+    # The information is taken from the check plugin manifest
+    needs_checks = False
 
     def execute(self, args):
         manuals = man_pages.all_man_pages()
 
         check_infos = {}
-        for check_plugin_name, check in config.check_info.items():
+        for check_plugin_name, check in config.check_plugin_infos(
+                check_api.get_check_api_context).items():
             try:
                 manfile = manuals.get(check_plugin_name)
                 # TODO: Use cmk.utils.man_pages module standard functions to read the title
@@ -949,8 +955,7 @@ class AutomationGetCheckInformation(Automation):
                     check_infos[check_plugin_name]["group"] = check["group"]
                 check_infos[check_plugin_name]["service_description"] = check.get(
                     "service_description", "%s")
-                check_infos[check_plugin_name]["snmp"] = cmk_base.check_utils.is_snmp_check(
-                    check_plugin_name)
+                check_infos[check_plugin_name]["snmp"] = check["snmp"]
             except Exception as e:
                 if cmk.utils.debug.enabled():
                     raise
@@ -965,13 +970,15 @@ automations.register(AutomationGetCheckInformation())
 class AutomationGetRealTimeChecks(Automation):
     cmd = "get-real-time-checks"
     needs_config = False
-    needs_checks = True
+    # The information is taken from the check plugin manifest
+    needs_checks = False
 
     def execute(self, args):
         manuals = man_pages.all_man_pages()
 
         rt_checks = []
-        for check_plugin_name, check in config.check_info.items():
+        for check_plugin_name, check in config.check_plugin_infos(
+                check_api.get_check_api_context).items():
             if check["handle_real_time_checks"]:
                 # TODO: Use cmk.utils.man_pages module standard functions to read the title
                 title = check_plugin_name
@@ -995,7 +1002,8 @@ automations.register(AutomationGetRealTimeChecks())
 class AutomationGetCheckManPage(Automation):
     cmd = "get-check-manpage"
     needs_config = False
-    needs_checks = True
+    # Only the plugin file of the requested check is loaded
+    needs_checks = False
 
     def execute(self, args):
         if len(args) != 1:
@@ -1004,6 +1012,11 @@ class AutomationGetCheckManPage(Automation):
         check_plugin_name = args[0]
         manpage = man_pages.load_man_page(args[0])
 
+        try:
+            config.load_checks_of_plugins(check_api.get_check_api_context, [check_plugin_name])
+        except MKGeneralException:
+            pass  # e.g. active checks are no check plugins
+
         # Add a few informations from check_info. Note: active checks do not
         # have an entry in check_info
         if check_plugin_name in config.check_info:
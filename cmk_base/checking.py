@@ -151,6 +151,9 @@ def do_check(hostname, ipaddress, only_check_plugin_names=None):
         else:
             perfdata.append("execution_time=%.3f" % run_time)
 
+        if config.cpu_tracking_stats:
+            cpu_tracking.dump_host_stats(hostname)
+
         return status, infotexts, long_infotexts, perfdata
     finally:
         if _checkresult_file_fd is not None:
@@ -316,7 +319,8 @@ def execute_check(config_cache, multi_host_sections, hostname, ipaddress, check_
         # Call the actual check function
         item_state.reset_wrapped_counters()
 
-        raw_result = check_function(item, determine_check_params(params), section_content)
+        with cpu_tracking.track("check", check_plugin_name):
+            raw_result = check_function(item, determine_check_params(params), section_content)
         result = sanitize_check_result(raw_result,
                                        cmk_base.check_utils.is_snmp_check(check_plugin_name))
         item_state.raise_counter_wrap()
@@ -153,7 +153,13 @@ def set_check_variables_for_checks():
 #   '----------------------------------------------------------------------'
 
 
+_packed_config_loaded = False
+
+
 def load(with_conf_d=True, validate_hosts=True, exclude_parents_mk=False):
+    global _packed_config_loaded
+    _packed_config_loaded = False
+
     _initialize_config()
 
     vars_before_config = all_nonfunction_vars()
@@ -185,9 +191,18 @@ def load_packed_config():
 
     The validations which are performed during load() also don't need to be performed.
     """
+    global _packed_config_loaded
+    _packed_config_loaded = True
+
     PackedConfig().load()
 
 
+def packed_config_loaded():
+    # type: () -> bool
+    """Whether or not the configuration has been loaded from the packed config"""
+    return _packed_config_loaded
+
+
 def _initialize_config():
     _add_check_variables_to_default_config()
     load_default_config()
@@ -215,7 +230,7 @@ def _load_config(with_conf_d, exclude_parents_mk):
     global_dict = globals()
     global_dict.update(helper_vars)
 
-    for path in _get_config_file_paths(with_conf_d):
+    for path in get_config_file_paths(with_conf_d):
         _f = str(path)
         # During parent scan mode we must not read in old version of parents.mk!
         if exclude_parents_mk and _f.endswith("/parents.mk"):
@@ -271,7 +286,7 @@ def _transform_mgmt_config_vars_from_140_to_150():
 
 
 # Create list of all files to be included during configuration loading
-def _get_config_file_paths(with_conf_d):
+def get_config_file_paths(with_conf_d):
     list_of_files = [Path(cmk.utils.paths.main_config_file)]
     if with_conf_d:
         list_of_files += sorted(Path(cmk.utils.paths.check_mk_config_dir).glob("**/*.mk"),
@@ -409,6 +424,11 @@ class PackedConfig(object):
         super(PackedConfig, self).__init__()
         self._path = os.path.join(cmk.utils.paths.var_dir, "base", "precompiled_check_config.mk")
 
+    @property
+    def path(self):
+        # type: () -> str
+        return self._path
+
     def save(self):
         self._write(self._pack())
 
@@ -514,6 +534,15 @@ class PackedConfig(object):
     def _write(self, helper_config):
         store.makedirs(os.path.dirname(self._path))
 
+        # Keep the file untouched when nothing has changed. Its modification time
+        # is used to validate the data derived from it, e.g. the autochecks snapshots.
+        try:
+            if os.path.exists(self._path) and \
+               open(self._path + ".orig").read() == helper_config + "\n":
+                return
+        except IOError:
+            pass
+
         store.save_file(self._path + ".orig", helper_config + "\n")
 
         code = compile(helper_config, '<string>', 'exec')
@@ -1680,6 +1709,288 @@ def initialize_check_type_caches():
             tcp_cache.add(section_name)
 
 
+#.
+#   .--Manifest------------------------------------------------------------.
+#   |             __  __             _  __           _                     |
+#   |            |  \/  | __ _ _ __ (_)/ _| ___  ___| |_                   |
+#   |            | |\/| |/ _` | '_ \| | |_ / _ \/ __| __|                  |
+#   |            | |  | | (_| | | | | |  _|  __/\__ \ |_                   |
+#   |            |_|  |_|\__,_|_| |_|_|_|  \___||___/\__|                  |
+#   |                                                                      |
+#   +----------------------------------------------------------------------+
+#   | Find out what the check plugin files declare without executing them. |
+#   | This makes it possible to only load the plugin files that are needed |
+#   | for a specific task instead of all of them.                          |
+#   '----------------------------------------------------------------------'
+
+# Increase this when the format of the manifest entries changes
+_CHECK_MANIFEST_VERSION = 1
+
+# The keys of check_info that are taken over to the manifest. The values of
+# these keys need to be literals.
+_MANIFEST_CHECK_INFO_KEYS = [
+    "service_description",
+    "group",
+    "default_levels_variable",
+    "has_perfdata",
+    "handle_real_time_checks",
+    "node_info",
+    "includes",
+]
+
+# The keys of check_info of which only the presence is taken over to the manifest
+_MANIFEST_CHECK_INFO_FLAGS = [
+    "snmp_info",
+    "snmp_scan_function",
+]
+
+# These registries of the check API are understood by the manifest. Any other
+# access to them than an assignment of an item makes the manifest of a file
+# incomplete.
+_MANIFEST_REGISTRIES = [
+    "check_info",
+    "check_includes",
+    "check_default_levels",
+    "snmp_info",
+    "snmp_scan_functions",
+]
+
+_check_plugin_manifest = None  # type: Optional[Dict[str, Dict[str, Any]]]
+
+
+def check_plugin_manifest():
+    # type: () -> Dict[str, Dict[str, Any]]
+    """The manifest of all check plugin files, keyed by the file name
+
+    Files in local/ shadow the shipped files of the same name, like it is done
+    when loading the checks. The manifest is kept in the tmp directory and the
+    entries are only created again for the files that have changed."""
+    global _check_plugin_manifest
+    if _check_plugin_manifest is not None:
+        return _check_plugin_manifest
+
+    manifest_path = os.path.join(cmk.utils.paths.tmp_dir, "check_manifest.mk")
+    try:
+        stored = store.load_data_from_file(manifest_path, {})
+    except MKGeneralException:
+        stored = {}
+    if stored.get("version") != _CHECK_MANIFEST_VERSION:
+        stored = {}
+    stored_entries = stored.get("files", {})
+
+    entries, changed = {}, False
+    for path in get_plugin_paths(cmk.utils.paths.local_checks_dir, cmk.utils.paths.checks_dir):
+        file_name = os.path.basename(path)
+        if file_name[0] == "." or file_name[-1] == "~" or file_name in entries:
+            continue
+
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        stat = (st.st_mtime, st.st_size)
+
+        entry = stored_entries.get(path)
+        if entry is None or entry["stat"] != stat:
+            entry = _manifest_of_plugin(path)
+            entry["stat"] = stat
+            changed = True
+        entries[file_name] = entry
+
+    if changed or len(entries) != len(stored_entries):
+        store.makedirs(cmk.utils.paths.tmp_dir)
+        store.save_data_to_file(manifest_path, {
+            "version": _CHECK_MANIFEST_VERSION,
+            "files": {entry["path"]: entry for entry in entries.itervalues()},
+        },
+                                pretty=False)
+
+    _check_plugin_manifest = entries
+    return entries
+
+
+def _manifest_of_plugin(path):
+    # type: (str) -> Dict[str, Any]
+    """Parse the check plugin file to find out what it declares
+
+    Only the top level assignments of literal items to the check API
+    registries are understood, e.g. check_info["df"] = {...}. In case a file
+    declares something in another way, the entry is marked as incomplete."""
+    entry = {
+        "path": path,
+        "complete": True,
+        "checks": {},
+        "snmp_sections": [],
+        "scan_functions": [],
+        "includes": [],
+    }  # type: Dict[str, Any]
+
+    try:
+        tree = ast.parse(open(path).read())
+        entry["includes"] = includes_of_plugin(path)
+    except Exception:
+        entry["complete"] = False
+        return entry
+
+    num_understood = 0
+    for child in ast.iter_child_nodes(tree):
+        if not isinstance(child, ast.Assign) or len(child.targets) != 1:
+            continue
+
+        target = child.targets[0]
+        if not isinstance(target, ast.Subscript) or not isinstance(target.value, ast.Name) \
+           or target.value.id not in _MANIFEST_REGISTRIES:
+            continue
+
+        if not isinstance(target.slice, ast.Index) or not isinstance(target.slice.value, ast.Str):
+            continue
+        registry, name = target.value.id, target.slice.value.s
+
+        if registry == "check_info":
+            info = _manifest_check_info(child.value)
+            if info is None:
+                continue
+            entry["checks"][name] = info
+            if info["snmp_info"]:
+                entry["snmp_sections"].append(cmk_base.check_utils.section_name_of(name))
+            if info["snmp_scan_function"]:
+                entry["scan_functions"].append(cmk_base.check_utils.section_name_of(name))
+
+        elif registry == "check_default_levels":
+            if not isinstance(child.value, ast.Str) or name not in entry["checks"]:
+                continue
+            entry["checks"][name]["default_levels_variable"] = child.value.s
+
+        elif registry == "snmp_info":
+            entry["snmp_sections"].append(name)
+
+        elif registry == "snmp_scan_functions":
+            entry["scan_functions"].append(name)
+
+        num_understood += 1
+
+    num_accesses = len([
+        node for node in ast.walk(tree)
+        if isinstance(node, ast.Name) and node.id in _MANIFEST_REGISTRIES
+    ])
+    if num_accesses != num_understood:
+        entry["complete"] = False
+
+    return entry
+
+
+def _manifest_check_info(node):
+    # type: (ast.AST) -> Optional[Dict[str, Any]]
+    if not isinstance(node, ast.Dict) or not all(isinstance(k, ast.Str) for k in node.keys):
+        return None  # e.g. old style check declaration
+
+    info = {key: None for key in _MANIFEST_CHECK_INFO_KEYS}  # type: Dict[str, Any]
+    info.update({key: False for key in _MANIFEST_CHECK_INFO_FLAGS})
+    info.update({
+        "has_perfdata": False,
+        "handle_real_time_checks": False,
+        "node_info": False,
+        "includes": [],
+    })
+
+    for key_node, value_node in zip(node.keys, node.values):
+        key = key_node.s
+        if key in _MANIFEST_CHECK_INFO_FLAGS:
+            info[key] = not (isinstance(value_node, ast.Name) and value_node.id == "None")
+        elif key in _MANIFEST_CHECK_INFO_KEYS:
+            try:
+                info[key] = ast.literal_eval(value_node)
+            except ValueError:
+                return None
+
+    return info
+
+
+def check_plugin_files(check_plugin_names):
+    # type: (Iterable[str]) -> List[str]
+    """The check plugin files that need to be loaded for the given check plugins
+
+    The include files are not part of the list. They are loaded together
+    with the check plugin files by load_checks()."""
+    manifest = check_plugin_manifest()
+
+    files_by_check = {}  # type: Dict[str, str]
+    incomplete_files = []
+    for file_name in sorted(manifest):
+        entry = manifest[file_name]
+        for check_plugin_name in entry["checks"]:
+            files_by_check.setdefault(check_plugin_name, entry["path"])
+        if not entry["complete"]:
+            incomplete_files.append(entry["path"])
+
+    filenames, missing = [], []
+    for check_plugin_name in check_plugin_names:
+        section_name = cmk_base.check_utils.section_name_of(check_plugin_name)
+        found = False
+        for name in [section_name, check_plugin_name]:
+            path = files_by_check.get(name)
+            if path is None and name in manifest:
+                # e.g. the special agent plugins are only known by their file name
+                path = manifest[name]["path"]
+            if path is None:
+                continue
+
+            found = True
+            if path not in filenames:
+                filenames.append(path)
+
+        if not found:
+            missing.append(check_plugin_name)
+
+    if missing:
+        # The files the manifest does not fully understand may declare any check
+        if not incomplete_files:
+            raise MKGeneralException("Cannot find check file needed for check type %s" %
+                                     ", ".join(missing))
+        filenames += [path for path in incomplete_files if path not in filenames]
+
+    return filenames
+
+
+def load_checks_of_plugins(get_check_api_context, check_plugin_names):
+    """Load only the check plugin files needed for the given check plugins"""
+    load_checks(get_check_api_context, check_plugin_files(check_plugin_names))
+
+
+def check_plugin_infos(get_check_api_context):
+    # type: (Callable) -> Dict[str, Dict[str, Any]]
+    """Basic information about all check plugins, taken from the manifest
+
+    Contains the keys of _MANIFEST_CHECK_INFO_KEYS and "snmp". The check plugin
+    files the manifest does not fully understand are loaded to get their
+    information from check_info."""
+    manifest = check_plugin_manifest()
+
+    infos, snmp_sections, incomplete_files = {}, set(), []
+    for file_name in sorted(manifest):
+        entry = manifest[file_name]
+        if not entry["complete"]:
+            incomplete_files.append(entry["path"])
+            continue
+
+        snmp_sections.update(entry["snmp_sections"])
+        for check_plugin_name, info in entry["checks"].iteritems():
+            infos.setdefault(check_plugin_name,
+                             {key: info[key] for key in _MANIFEST_CHECK_INFO_KEYS})
+
+    if incomplete_files:
+        load_checks(get_check_api_context, incomplete_files)
+        snmp_sections.update(snmp_info)
+        for check_plugin_name, info in check_info.iteritems():
+            infos.setdefault(check_plugin_name,
+                             {key: info.get(key) for key in _MANIFEST_CHECK_INFO_KEYS})
+
+    for check_plugin_name, info in infos.iteritems():
+        info["snmp"] = cmk_base.check_utils.section_name_of(check_plugin_name) in snmp_sections
+
+    return infos
+
+
 #.
 #   .--Helpers-------------------------------------------------------------.
 #   |                  _   _      _                                        |
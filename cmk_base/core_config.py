@@ -25,12 +25,18 @@
 # Boston, MA 02110-1301 USA.
 
 import abc
+import errno
+import hashlib
+import marshal
+import multiprocessing
 import numbers
 import os
 import sys
 from typing import Text, Optional, Any, List, Dict  # pylint: disable=unused-import
 
+import cmk
 import cmk.utils.paths
+import cmk.utils.store as store
 import cmk.utils.tty as tty
 import cmk.utils.password_store
 from cmk.utils.exceptions import MKGeneralException
@@ -56,6 +62,201 @@ class MonitoringCore(object):
 _ignore_ip_lookup_failures = False
 _failed_ip_lookups = []
 
+#.
+#   .--Parallel------------------------------------------------------------.
+#   |                ____                 _ _      _                       |
+#   |               |  _ \ __ _ _ __ __ _| | | ___| |                      |
+#   |               | |_) / _` | '__/ _` | | |/ _ \ |                      |
+#   |               |  __/ (_| | | | (_| | | |  __/ |                      |
+#   |               |_|   \__,_|_|  \__,_|_|_|\___|_|                      |
+#   |                                                                      |
+#   +----------------------------------------------------------------------+
+#   | Spread the per host work of the config creation over several forked  |
+#   | processes. The processes are forked after the config cache has been  |
+#   | built, so they share it copy-on-write and don't need to reload it.   |
+#   '----------------------------------------------------------------------'
+
+# Below this number of hosts per process forking is not worth the effort
+_MIN_HOSTS_PER_PROCESS = 50
+
+# Number of shards each process gets. More shards balance the load better
+# when some hosts are much more expensive than others.
+_SHARDS_PER_PROCESS = 4
+
+
+def num_config_processes(num_hosts):
+    # type: (int) -> int
+    """Number of processes to use for processing the given number of hosts"""
+    processes = config.core_config_processes
+    if processes is None:
+        try:
+            processes = multiprocessing.cpu_count()
+        except NotImplementedError:
+            processes = 1
+
+    return max(1, min(processes, num_hosts // _MIN_HOSTS_PER_PROCESS))
+
+
+def host_shards(hostnames, num_shards):
+    # type: (List[str], int) -> List[List[str]]
+    """Split the hosts into contiguous shards of nearly equal size
+
+    Concatenating the shards results in the original host list again, which
+    keeps the output of the parallel config creation deterministic."""
+    num_shards = max(1, min(num_shards, len(hostnames)))
+    size, rest = divmod(len(hostnames), num_shards)
+    shards, start = [], 0
+    for index in xrange(num_shards):
+        end = start + size + (1 if index < rest else 0)
+        shards.append(hostnames[start:end])
+        start = end
+    return shards
+
+
+def map_host_shards(function, hostnames, processes):
+    """Call function for shards of the hosts in a pool of forked processes
+
+    The results are yielded in the order of the hosts. The function and its
+    results need to be picklable. Exceptions raised by the function are
+    raised in the calling process."""
+    shards = host_shards(list(hostnames), processes * _SHARDS_PER_PROCESS)
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap(function, shards):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+#.
+#   .--Fingerprints--------------------------------------------------------.
+#   |       _____ _                                  _       _             |
+#   |      |  ___(_)_ __   __ _  ___ _ __ _ __  _ __(_)_ __ | |_ ___       |
+#   |      | |_  | | '_ \ / _` |/ _ \ '__| '_ \| '__| | '_ \| __/ __|      |
+#   |      |  _| | | | | | (_| |  __/ |  | |_) | |  | | | | | |_\__ \      |
+#   |      |_|   |_|_| |_|\__, |\___|_|  | .__/|_|  |_|_| |_|\__|___/      |
+#   |                     |___/          |_|                               |
+#   +----------------------------------------------------------------------+
+#   | Find out which hosts need their part of the core configuration to be |
+#   | recreated. Each host gets a fingerprint of all inputs its part       |
+#   | depends on. Parts of hosts with an unchanged fingerprint are reused. |
+#   '----------------------------------------------------------------------'
+
+
+def incremental_config_enabled():
+    # type: () -> bool
+    # Without the DNS cache the addresses of the hosts may change without
+    # anything we could build a fingerprint of
+    return bool(config.core_config_incremental and config.use_dns_cache)
+
+
+def config_fingerprint():
+    # type: () -> str
+    """Fingerprint of the inputs the configuration of all hosts depends on
+
+    The rules have no identity that could be tracked per host, so any change
+    of the configuration files invalidates the parts of all hosts. The same
+    is true for the check plugins, because of the shared check includes."""
+    fingerprint = hashlib.sha1()
+    fingerprint.update(repr((cmk.__version__, config.monitoring_core)))
+
+    for path in config.get_config_file_paths(with_conf_d=True):
+        fingerprint.update("%s\0%s\0" % (path, _file_digest("%s" % path)))
+
+    for path in config.get_plugin_paths(cmk.utils.paths.local_checks_dir,
+                                        cmk.utils.paths.checks_dir):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        fingerprint.update("%s\0%d\0%d\0" % (path, st.st_mtime, st.st_size))
+
+    return fingerprint.hexdigest()
+
+
+def _file_digest(path):
+    # type: (str) -> str
+    try:
+        with open(path) as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except IOError:
+        return ""
+
+
+class HostFingerprints(object):
+    """The persisted fingerprints of the hosts parts of some configuration
+
+    Together with the fingerprint some data can be stored for each host,
+    e.g. the configuration created for it. Only the hosts that have been
+    updated during the current run are saved, so removed hosts vanish.
+
+    The stored data contains the whole configuration of all hosts and is
+    read on every activation. It is marshalled, because parsing it as
+    Python literal takes much longer."""
+    def __init__(self, config_cache, name):
+        super(HostFingerprints, self).__init__()
+        self._config_cache = config_cache
+        self._path = os.path.join(cmk.utils.paths.core_fingerprints_dir, "%s.marshal" % name)
+        self._config_fingerprint = config_fingerprint()
+        self._fingerprints = {}  # type: Dict[str, str]
+        self._stored = self._load()
+        self._updated = {}  # type: Dict[str, Any]
+
+    def fingerprint(self, hostname):
+        # type: (str) -> str
+        try:
+            return self._fingerprints[hostname]
+        except KeyError:
+            pass
+
+        host_config = self._config_cache.get_host_config(hostname)
+
+        fingerprint = hashlib.sha1(self._config_fingerprint)
+        fingerprint.update(hostname)
+        # The services of clusters are discovered on the nodes
+        for name in [hostname] + (host_config.nodes or []):
+            fingerprint.update("\0%s\0%s\0%s\0%r\0%r" % (
+                name,
+                _file_digest("%s/%s.mk" % (cmk.utils.paths.autochecks_dir, name)),
+                _file_digest("%s" % (cmk.utils.paths.discovered_host_labels_dir / (name + ".mk"))),
+                ip_lookup.cached_ip_address(name, 4),
+                ip_lookup.cached_ip_address(name, 6),
+            ))
+
+        result = self._fingerprints[hostname] = fingerprint.hexdigest()
+        return result
+
+    def is_unchanged(self, hostname):
+        # type: (str) -> bool
+        stored = self._stored.get(hostname)
+        return stored is not None and stored[0] == self.fingerprint(hostname)
+
+    def get_data(self, hostname):
+        """Data stored together with the fingerprint of an unchanged host"""
+        return self._stored[hostname][1]
+
+    def update(self, hostname, data=None):
+        self._updated[hostname] = (self.fingerprint(hostname), data)
+
+    def _load(self):
+        # type: () -> Dict[str, Any]
+        try:
+            with open(self._path, "rb") as f:
+                return marshal.load(f)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        except (EOFError, ValueError, TypeError):
+            pass  # Incomplete file, e.g. created empty during locking. Recreate everything.
+        return {}
+
+    def save(self):
+        store.makedirs(cmk.utils.paths.core_fingerprints_dir)
+        store.save_file(self._path, marshal.dumps(self._updated))
+
+
 #.
 #   .--Warnings------------------------------------------------------------.
 #   |            __        __               _                              |
@@ -215,6 +416,9 @@ def do_create_config(core, with_agents):
     create_core_config(core)
     console.output(tty.ok + "\n")
 
+    # Hosts may have been removed. Drop the load cache entries of their files.
+    store.prune_load_cache()
+
     if with_agents:
         try:
             import cmk_base.cee.agent_bakery
@@ -26,7 +26,9 @@
 """Code for support of Nagios (and compatible) cores"""
 
 import base64
+import cStringIO
 import os
+import re
 import sys
 import py_compile
 import tempfile
@@ -42,8 +44,8 @@ import cmk_base.console as console
 import cmk_base.config as config
 import cmk_base.core_config as core_config
 import cmk_base.ip_lookup as ip_lookup
+import cmk_base.autochecks as autochecks
 import cmk_base.data_sources as data_sources
-import cmk_base.check_utils
 import cmk_base.check_api_utils as check_api_utils
 
 
@@ -135,15 +137,20 @@ def create_config(outfile, hostnames):
 
     config_cache = config.get_config_cache()
 
+    # Reusing the parts of unchanged hosts is only possible when the whole
+    # configuration is created. Otherwise the other hosts would be dropped
+    # from the stored fingerprints.
+    fingerprints = None
     if hostnames is None:
         hostnames = config_cache.all_active_hosts()
+        if core_config.incremental_config_enabled():
+            fingerprints = core_config.HostFingerprints(config_cache, "nagios")
 
     cfg = NagiosConfig(outfile, hostnames)
 
     _output_conf_header(cfg)
 
-    for hostname in hostnames:
-        _create_nagios_config_host(cfg, config_cache, hostname)
+    _create_nagios_config_hosts(cfg, config_cache, hostnames, fingerprints)
 
     _create_nagios_config_contacts(cfg, hostnames)
     _create_nagios_config_hostgroups(cfg)
@@ -156,6 +163,106 @@ def create_config(outfile, hostnames):
         outfile.write("\n# extra_nagios_conf\n\n")
         outfile.write(config.extra_nagios_conf)
 
+    if fingerprints:
+        fingerprints.save()
+
+
+def _create_nagios_config_hosts(cfg, config_cache, hostnames, fingerprints=None):
+    parts = {}
+    if fingerprints:
+        for hostname in hostnames:
+            if fingerprints.is_unchanged(hostname):
+                parts[hostname] = fingerprints.get_data(hostname)
+
+        if parts:
+            console.verbose("Reusing configuration of %d unchanged hosts\n" % len(parts))
+
+    changed_hostnames = [h for h in hostnames if h not in parts]
+    processes = core_config.num_config_processes(len(changed_hostnames))
+    if processes <= 1:
+        parts.update(_create_nagios_config_shard(changed_hostnames))
+    else:
+        console.verbose("Creating configuration of %d hosts in %d processes...\n" %
+                        (len(changed_hostnames), processes))
+        for shard_parts in core_config.map_host_shards(_create_nagios_config_shard,
+                                                       changed_hostnames, processes):
+            parts.update(shard_parts)
+
+    for hostname in hostnames:
+        _add_nagios_config_host_part(cfg, parts[hostname])
+        if fingerprints:
+            fingerprints.update(hostname, parts[hostname])
+
+
+def _create_nagios_config_shard(hostnames):
+    """Create the host and service definitions of some hosts, possibly in a forked process
+
+    Returns the created config part of each host together with everything
+    needed to create the global definitions (groups, commands, ...). These
+    parts are added to the configuration by _add_nagios_config_host_part()."""
+    config_cache = config.get_config_cache()
+    failed_ip_lookups = core_config.failed_ip_lookups()
+
+    parts = {}
+    for hostname in hostnames:
+        num_warnings = len(core_config.g_configuration_warnings)
+        num_failed_ip_lookups = len(failed_ip_lookups)
+
+        cfg = NagiosConfig(cStringIO.StringIO(), [hostname])
+        _create_nagios_config_host(cfg, config_cache, hostname)
+
+        parts[hostname] = {
+            "config": cfg.outfile.getvalue(),
+            "warnings": core_config.g_configuration_warnings[num_warnings:],
+            "failed_ip_lookups": failed_ip_lookups[num_failed_ip_lookups:],
+            "hostgroups_to_define": sorted(cfg.hostgroups_to_define),
+            "servicegroups_to_define": sorted(cfg.servicegroups_to_define),
+            "contactgroups_to_define": sorted(cfg.contactgroups_to_define),
+            "checknames_to_define": sorted(cfg.checknames_to_define),
+            "active_checks_to_define": sorted(cfg.active_checks_to_define),
+            "custom_commands_to_define": sorted(cfg.custom_commands_to_define),
+            "hostcheck_commands_to_define": cfg.hostcheck_commands_to_define,
+        }
+
+        # The warnings and failed IP lookups are added again together with
+        # the config part. A forked process could not report them otherwise.
+        del core_config.g_configuration_warnings[num_warnings:]
+        del failed_ip_lookups[num_failed_ip_lookups:]
+
+    return parts
+
+
+_hostcheck_command_regex = re.compile(r"^(  check_command +check-mk-host-custom-)(\d+)$", re.M)
+
+
+def _add_nagios_config_host_part(cfg, part):
+    host_config = part["config"]
+
+    # The custom host check commands are numbered within each host. Shift the
+    # numbers, so that they are the same as when creating the config in one go.
+    offset = len(cfg.hostcheck_commands_to_define)
+    if offset and part["hostcheck_commands_to_define"]:
+        host_config = _hostcheck_command_regex.sub(
+            lambda m: "%s%d" % (m.group(1), int(m.group(2)) + offset), host_config)
+
+    for command, command_line in part["hostcheck_commands_to_define"]:
+        number = int(command.rsplit("-", 1)[1]) + offset
+        cfg.hostcheck_commands_to_define.append(("check-mk-host-custom-%d" % number,
+                                                 command_line))
+
+    cfg.outfile.write(host_config)
+
+    cfg.hostgroups_to_define.update(part["hostgroups_to_define"])
+    cfg.servicegroups_to_define.update(part["servicegroups_to_define"])
+    cfg.contactgroups_to_define.update(part["contactgroups_to_define"])
+    cfg.checknames_to_define.update(part["checknames_to_define"])
+    cfg.active_checks_to_define.update(part["active_checks_to_define"])
+    cfg.custom_commands_to_define.update(part["custom_commands_to_define"])
+
+    # The warnings have already been printed while creating the part
+    core_config.g_configuration_warnings.extend(part["warnings"])
+    core_config.failed_ip_lookups().extend(part["failed_ip_lookups"])
+
 
 def _output_conf_header(cfg):
     cfg.outfile.write("""#
@@ -851,26 +958,6 @@ def _extra_service_conf_of(cfg, config_cache, hostname, description):
 # check (for example df or mem.used). In case of checks with a period
 # (subchecks) we might have to include both "mem" and "mem.used". The
 # subcheck *may* be implemented in a separate file.
-def _find_check_plugins(checktype):
-    if '.' in checktype:
-        candidates = [cmk_base.check_utils.section_name_of(checktype), checktype]
-    else:
-        candidates = [checktype]
-
-    paths = []
-    for candidate in candidates:
-        filename = cmk.utils.paths.local_checks_dir + "/" + candidate
-        if os.path.exists(filename):
-            paths.append(filename)
-            continue
-
-        filename = cmk.utils.paths.checks_dir + "/" + candidate
-        if os.path.exists(filename):
-            paths.append(filename)
-
-    return paths
-
-
 def precompile_hostchecks():
     console.verbose("Creating precompiled host check config...\n")
     config.PackedConfig().save()
@@ -881,14 +968,67 @@ def precompile_hostchecks():
     config_cache = config.get_config_cache()
 
     console.verbose("Precompiling host checks...\n")
-    for host in config_cache.all_active_hosts():
+    hostnames = sorted(config_cache.all_active_hosts())
+
+    fingerprints = None
+    if core_config.incremental_config_enabled():
+        fingerprints = core_config.HostFingerprints(config_cache, "precompiled")
+        changed_hostnames = [
+            h for h in hostnames
+            if not fingerprints.is_unchanged(h) or not _precompiled_hostcheck_is_intact(
+                h, fingerprints.get_data(h))
+        ]
+        console.verbose("Reusing precompiled host checks of %d unchanged hosts\n" %
+                        (len(hostnames) - len(changed_hostnames)))
+    else:
+        changed_hostnames = hostnames
+
+    processes = core_config.num_config_processes(len(changed_hostnames))
+    if processes <= 1:
+        errors = _precompile_hostcheck_shard(changed_hostnames)
+    else:
+        errors = []
+        for shard_errors in core_config.map_host_shards(_precompile_hostcheck_shard,
+                                                        changed_hostnames, processes):
+            errors += shard_errors
+
+    if errors:
+        host, e = errors[0]
+        console.error("Error precompiling checks for host %s: %s\n" % (host, e))
+        sys.exit(5)
+
+    if fingerprints:
+        for hostname in hostnames:
+            fingerprints.update(hostname, _precompiled_hostcheck_exists(hostname))
+        fingerprints.save()
+
+
+def _precompiled_hostcheck_exists(hostname):
+    compiled_filename = cmk.utils.paths.precompiled_hostchecks_dir + "/" + hostname
+    # With delay_precompile the compiled file is a symlink to the source file
+    return os.path.lexists(compiled_filename) and os.path.exists(compiled_filename + ".py")
+
+
+def _precompiled_hostcheck_is_intact(hostname, had_hostcheck):
+    # Hosts without Check_MK checks don't get a host check
+    return not had_hostcheck or _precompiled_hostcheck_exists(hostname)
+
+
+def _precompile_hostcheck_shard(hostnames):
+    """Precompile the host checks of some hosts, possibly in a forked process
+
+    Stops at the first host that fails and returns the errors as list of
+    host name and error message, because the process exiting is up to the
+    caller."""
+    config_cache = config.get_config_cache()
+    for host in hostnames:
         try:
             _precompile_hostcheck(config_cache, host)
         except Exception as e:
             if cmk.utils.debug.enabled():
                 raise
-            console.error("Error precompiling checks for host %s: %s\n" % (host, e))
-            sys.exit(5)
+            return [(host, "%s" % e)]
+    return []
 
 
 # read python file and strip comments
@@ -914,6 +1054,8 @@ def _precompile_hostcheck(config_cache, hostname):
 
     check_api_utils.set_hostname(hostname)
 
+    autochecks.save_autochecks_snapshot(hostname, config_cache.get_autochecks_of(hostname))
+
     compiled_filename = cmk.utils.paths.precompiled_hostchecks_dir + "/" + hostname
     source_filename = compiled_filename + ".py"
     for fname in [compiled_filename, source_filename]:
@@ -1108,30 +1250,6 @@ def _get_needed_check_plugin_names(host_config):
 
 
 def _get_needed_check_file_names(needed_check_plugin_names):
-    # check info table
-    # We need to include all those plugins that are referenced in the host's
-    # check table.
-    filenames = []
-    for check_plugin_name in needed_check_plugin_names:
-        section_name = cmk_base.check_utils.section_name_of(check_plugin_name)
-        # Add library files needed by check (also look in local)
-        for lib in set(config.check_includes.get(section_name, [])):
-            if os.path.exists(cmk.utils.paths.local_checks_dir + "/" + lib):
-                to_add = cmk.utils.paths.local_checks_dir + "/" + lib
-            else:
-                to_add = cmk.utils.paths.checks_dir + "/" + lib
-
-            if to_add not in filenames:
-                filenames.append(to_add)
-
-        # Now add check file(s) itself
-        paths = _find_check_plugins(check_plugin_name)
-        if not paths:
-            raise MKGeneralException("Cannot find check file %s needed for check type %s" % \
-                                     (section_name, check_plugin_name))
-
-        for path in paths:
-            if path not in filenames:
-                filenames.append(path)
-
-    return filenames
+    # Only the check plugin files declaring the checks of the host's check
+    # table are loaded by the host check. The includes are loaded with them.
+    return config.check_plugin_files(sorted(needed_check_plugin_names))
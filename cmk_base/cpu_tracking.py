@@ -24,12 +24,20 @@
 # to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
 # Boston, MA 02110-1301 USA.
 
+import ast
+import collections
+import errno
 import os
 import time
-from typing import Dict, List  # pylint: disable=unused-import
+from typing import Deque, Dict, Iterator, List, Optional, Tuple  # pylint: disable=unused-import
+
+import cmk.utils.log
+import cmk.utils.paths
 
 import cmk_base.console as console
 
+logger = cmk.utils.log.get_logger(__name__)
+
 # TODO: Move state out of module scope
 # TODO: This should be rewritten to a context manager object. See cmk.utils.profile for
 #       an example how it could look like.
@@ -104,3 +112,189 @@ def _time_snapshot():
     # type: () -> List[float]
     # TODO: Create a better structure for this data
     return list(os.times()[:4]) + [time.time()]
+
+
+#.
+#   .--Details-------------------------------------------------------------.
+#   |                  ____       _        _ _                             |
+#   |                 |  _ \  ___| |_ __ _(_) |___                         |
+#   |                 | | | |/ _ \ __/ _` | | / __|                        |
+#   |                 | |_| |  __/ || (_| | | \__ \                        |
+#   |                 |____/ \___|\__\__,_|_|_|___/                        |
+#   |                                                                      |
+#   +----------------------------------------------------------------------+
+#   | Wall and CPU times of single data sources, parse functions and check |
+#   | functions. The records are collected in a ring buffer and appended   |
+#   | to a site wide stats file once per checked host.                     |
+#   '----------------------------------------------------------------------'
+
+# Number of detail records kept per process. Older records are dropped silently.
+_MAX_RECORDS = 10000
+# The stats file is rotated once it exceeds this size. One rotated file is kept.
+_MAX_STATS_FILE_SIZE = 10 * 1024 * 1024
+
+# Items: (kind, name, wall time, cpu time)
+records = collections.deque(maxlen=_MAX_RECORDS)  # type: Deque[Tuple[str, str, float, float]]
+# (kind, name) of the block currently being tracked, used by the sampling profiler
+current_record = None  # type: Optional[Tuple[str, str]]
+
+
+class track(object):
+    """Context manager recording the wall and CPU time of the enclosed block
+
+    The times are added to the ring buffer as a record of the given kind
+    (e.g. "source", "parse" or "check") and name (data source ID, section or
+    check plugin name). The tracked blocks are not nested, so the records
+    of a host do not count the same time twice."""
+    __slots__ = ["_kind", "_name", "_start"]
+
+    def __init__(self, kind, name):
+        # type: (str, str) -> None
+        self._kind = kind
+        self._name = name
+        self._start = []  # type: List[float]
+
+    def __enter__(self):
+        global current_record
+        current_record = (self._kind, self._name)
+        self._start = _time_snapshot()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        global current_record
+        end_snapshot = _time_snapshot()
+        current_record = None
+        records.append((self._kind, self._name, end_snapshot[4] - self._start[4],
+                        sum(end_snapshot[:4]) - sum(self._start[:4])))
+
+
+def clear_records():
+    # type: () -> None
+    records.clear()
+
+
+def aggregated_records():
+    # type: () -> List[Tuple[str, str, int, float, float]]
+    """Sums up the records of the ring buffer per kind and name
+
+    Returns a sorted list of (kind, name, count, wall time, cpu time)"""
+    aggregated = {}  # type: Dict[Tuple[str, str], List]
+    for kind, name, wall_time, cpu_time in records:
+        entry = aggregated.setdefault((kind, name), [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += wall_time
+        entry[2] += cpu_time
+    return sorted((kind, name, count, wall_time, cpu_time)
+                  for (kind, name), (count, wall_time, cpu_time) in aggregated.iteritems())
+
+
+def stats_file_path():
+    # type: () -> str
+    return os.path.join(cmk.utils.paths.tmp_dir, "cpu_tracking", "stats")
+
+
+def dump_host_stats(hostname):
+    # type: (str) -> None
+    """Appends the times of the last host check to the site wide stats file
+
+    Each host check results in one line. It is written with a single append
+    call, so concurrently running check helpers do not garble the file.
+
+    The stats are optional. Failing to write them must not affect the host
+    check, so errors are only logged."""
+    try:
+        total_times = times.get("TOTAL", [0.0] * 5)
+        line = "%r\n" % ((
+            int(time.time()),
+            hostname,
+            total_times[4],
+            sum(total_times[:4]),
+            aggregated_records(),
+        ),)
+        _append_stats_line(stats_file_path(), line)
+    except (IOError, OSError) as e:
+        logger.warning("Cannot write CPU tracking stats of %s: %s", hostname, e)
+    finally:
+        clear_records()
+
+
+def _append_stats_line(path, line):
+    # type: (str, str) -> None
+    try:
+        _rotate_stats_file(path)
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o660)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError as e:
+            # Created by a concurrently running check helper
+            if e.errno != errno.EEXIST:
+                raise
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o660)
+
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+def _rotate_stats_file(path):
+    # type: (str) -> None
+    try:
+        if os.stat(path).st_size > _MAX_STATS_FILE_SIZE:
+            os.rename(path, path + ".1")
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def load_host_stats(path=None):
+    # type: (Optional[str]) -> Iterator[Tuple]
+    """Yields the entries written by dump_host_stats(), oldest first"""
+    if path is None:
+        path = stats_file_path()
+
+    for file_path in [path + ".1", path]:
+        try:
+            stats_file = open(file_path)
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            continue
+
+        with stats_file:
+            for line in stats_file:
+                try:
+                    yield ast.literal_eval(line)
+                except (SyntaxError, ValueError):
+                    continue  # Truncated line, e.g. after a full disk
+
+
+def rank_host_stats(stats, top=10):
+    # type: (Iterator[Tuple], int) -> Tuple[List[Tuple], List[Tuple]]
+    """Ranks the hosts and the plugins by their summed up CPU time
+
+    Returns a pair of lists. The first one contains the hottest hosts as
+    (hostname, number of checks, wall time, cpu time) entries. The second
+    one contains the hottest data sources, parse and check functions as
+    (kind, name, count, wall time, cpu time) entries."""
+    hosts = {}  # type: Dict[str, List]
+    plugins = {}  # type: Dict[Tuple[str, str], List]
+    for _timestamp, hostname, wall_time, cpu_time, host_records in stats:
+        entry = hosts.setdefault(hostname, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += wall_time
+        entry[2] += cpu_time
+
+        for kind, name, count, plugin_wall_time, plugin_cpu_time in host_records:
+            entry = plugins.setdefault((kind, name), [0, 0.0, 0.0])
+            entry[0] += count
+            entry[1] += plugin_wall_time
+            entry[2] += plugin_cpu_time
+
+    top_hosts = sorted(((hostname,) + tuple(entry) for hostname, entry in hosts.iteritems()),
+                       key=lambda e: (-e[3], e[0]))
+    top_plugins = sorted((key + tuple(entry) for key, entry in plugins.iteritems()),
+                         key=lambda e: (-e[4], e[0], e[1]))
+    return top_hosts[:top], top_plugins[:top]
@@ -284,3 +284,56 @@ class DataSources(object):
                                                         host_sections.piggybacked_raw_data)
 
         return multi_host_sections
+
+
+def iter_hosts_with_prefetch(hostnames, max_cachefile_age=None):
+    """Iterate the given hosts while fetching their agent outputs in parallel
+
+    The hosts are processed in batches of config.tcp_fetch_parallel_connections
+    hosts. Before the hosts of a batch are yielded, the outputs of all their
+    Check_MK agents that need to be contacted are fetched in parallel. The
+    TCPDataSource of each host then uses the prefetched output instead of
+    connecting to the agent on its own.
+    """
+    max_connections = config.tcp_fetch_parallel_connections
+    if max_connections < 1 or len(hostnames) < 2:
+        for hostname in hostnames:
+            yield hostname
+        return
+
+    try:
+        for offset in range(0, len(hostnames), max_connections):
+            batch = hostnames[offset:offset + max_connections]
+            _prefetch_agent_outputs(batch, max_cachefile_age, max_connections)
+            for hostname in batch:
+                yield hostname
+    finally:
+        TCPDataSource.drop_prefetched_agent_outputs()
+
+
+def _prefetch_agent_outputs(hostnames, max_cachefile_age, max_connections):
+    config_cache = config.get_config_cache()
+
+    sources = []
+    for hostname in hostnames:
+        if config_cache.get_host_config(hostname).is_cluster:
+            continue
+
+        # Errors are not handled here. They occur again when the host is processed.
+        try:
+            ipaddress = ip_lookup.lookup_ip_address(hostname)
+            host_sources = DataSources(hostname, ipaddress)
+        except MKGeneralException:
+            continue
+
+        if max_cachefile_age is not None:
+            host_sources.set_max_cachefile_age(max_cachefile_age)
+        else:
+            host_sources.set_max_cachefile_age(config.check_max_cachefile_age)
+
+        for source in host_sources.get_data_sources():
+            if isinstance(source, TCPDataSource) and source.needs_agent_fetch():
+                sources.append(source)
+
+    console.verbose("Fetching agent data of %d hosts in parallel\n" % len(sources))
+    TCPDataSource.prefetch_agent_outputs(sources, max_connections)
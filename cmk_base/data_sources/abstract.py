@@ -48,6 +48,8 @@ from cmk_base.exceptions import MKAgentError, MKEmptyAgentData, MKSNMPError, \
                                 MKIPAddressLookupError
 from cmk_base.check_api_utils import state_markers
 
+from .agent_cache import MappedAgentData, read_mapped_cache_file, write_section_index
+from .agent_parser import parse_agent_data
 from .host_sections import HostSections
 
 
@@ -126,23 +128,24 @@ class DataSource(object):
         try:
             cpu_tracking.push_phase(self._cpu_tracking_id())
 
-            persisted_sections_from_disk = self._load_persisted_sections()
-            self._persisted_sections = persisted_sections_from_disk
+            with cpu_tracking.track("source", self.id()):
+                persisted_sections_from_disk = self._load_persisted_sections()
+                self._persisted_sections = persisted_sections_from_disk
 
-            raw_data, is_cached_data = self._get_raw_data()
+                raw_data, is_cached_data = self._get_raw_data()
 
-            self._host_sections = host_sections = self._convert_to_sections(raw_data)
-            assert isinstance(host_sections, HostSections)
+                self._host_sections = host_sections = self._convert_to_sections(raw_data)
+                assert isinstance(host_sections, HostSections)
 
-            if get_raw_data:
-                return raw_data
+                if get_raw_data:
+                    return raw_data
 
-            # Add information from previous persisted infos
-            host_sections = self._update_info_with_persisted_sections(persisted_sections_from_disk,
-                                                                      host_sections, is_cached_data)
-            self._persisted_sections = host_sections.persisted_sections
+                # Add information from previous persisted infos
+                host_sections = self._update_info_with_persisted_sections(
+                    persisted_sections_from_disk, host_sections, is_cached_data)
+                self._persisted_sections = host_sections.persisted_sections
 
-            return host_sections
+                return host_sections
 
         except MKTerminate:
             raise
@@ -198,38 +201,48 @@ class DataSource(object):
         raise NotImplementedError()
 
     def _read_cache_file(self):
-        assert self._max_cachefile_age is not None
-
         cachefile = self._cache_file_path()
+        if not self._is_cache_file_usable(cachefile):
+            return
+
+        result = self._read_cache_file_content(cachefile)
+        if not result:
+            self._logger.debug("Not using cache (Empty)")
+            return
+
+        self._logger.verbose("Using data from cache file %s" % (cachefile))
+        return self._from_cache_file(result)
+
+    def _read_cache_file_content(self, cachefile):
+        # type: (str) -> str
+        # TODO: Use some generic store file read function to generalize error handling,
+        # but there is currently no function that simply reads data from the file
+        return open(cachefile).read()
+
+    def _is_cache_file_usable(self, cachefile):
+        # type: (str) -> bool
+        assert self._max_cachefile_age is not None
 
         if not os.path.exists(cachefile):
             self._logger.debug("Not using cache (Does not exist)")
-            return
+            return False
 
         if self.is_agent_cache_disabled():
             self._logger.debug("Not using cache (Cache usage disabled)")
-            return
+            return False
 
         if not self._may_use_cache_file and not config.simulation_mode:
             self._logger.debug("Not using cache (Don't try it)")
-            return
+            return False
 
         may_use_outdated = config.simulation_mode or self._use_outdated_cache_file
         cachefile_age = cmk_base.utils.cachefile_age(cachefile)
         if not may_use_outdated and cachefile_age > self._max_cachefile_age:
             self._logger.debug("Not using cache (Too old. Age is %d sec, allowed is %s sec)" %
                                (cachefile_age, self._max_cachefile_age))
-            return
-
-        # TODO: Use some generic store file read function to generalize error handling,
-        # but there is currently no function that simply reads data from the file
-        result = open(cachefile).read()
-        if not result:
-            self._logger.debug("Not using cache (Empty)")
-            return
+            return False
 
-        self._logger.verbose("Using data from cache file %s" % (cachefile))
-        return self._from_cache_file(result)
+        return True
 
     def _write_cache_file(self, raw_data):
         if self.is_agent_cache_disabled():
@@ -529,6 +542,7 @@ class CheckMKAgentDataSource(DataSource):
     def __init__(self, hostname, ipaddress):
         super(CheckMKAgentDataSource, self).__init__(hostname, ipaddress)
         self._is_main_agent_data_source = False
+        self._written_header_lines = None
 
     # TODO: We should cleanup these old directories one day. Then we can remove this special case
     def set_main_agent_data_source(self):
@@ -561,102 +575,53 @@ class CheckMKAgentDataSource(DataSource):
 
         return super(CheckMKAgentDataSource, self)._persisted_sections_dir()
 
+    def run(self, hostname=None, ipaddress=None, get_raw_data=False):
+        result = super(CheckMKAgentDataSource, self).run(hostname, ipaddress, get_raw_data)
+        if get_raw_data and isinstance(result, MappedAgentData):
+            return str(result)
+        return result
+
+    def _read_cache_file_content(self, cachefile):
+        mapped_data = read_mapped_cache_file(cachefile)
+        if mapped_data is not None:
+            return mapped_data
+        return super(CheckMKAgentDataSource, self)._read_cache_file_content(cachefile)
+
+    def _write_cache_file(self, raw_data):
+        super(CheckMKAgentDataSource, self)._write_cache_file(raw_data)
+        if self.is_agent_cache_disabled():
+            return
+
+        cachefile = self._cache_file_path()
+        try:
+            header_lines = write_section_index(cachefile, raw_data)
+        except Exception as e:
+            raise MKGeneralException("Cannot write section index of cache file %s: %s" %
+                                     (cachefile, e))
+
+        # Save the scan of the raw data when parsing it right after writing it
+        self._written_header_lines = raw_data, header_lines
+
     def _convert_to_sections(self, raw_data):
         if config.agent_simulator:
-            raw_data = cmk_base.agent_simulator.process(raw_data)
+            raw_data = cmk_base.agent_simulator.process(str(raw_data))
 
-        return self._parse_info(raw_data.split("\n"))
+        return self._parse_info(raw_data)
 
-    def _parse_info(self, lines):
+    def _parse_info(self, raw_data):
         """Split agent output in chunks, splits lines by whitespaces.
 
         Returns a HostSections() object.
         """
-        sections = {}
-        # Unparsed info for other hosts. A dictionary, indexed by the piggybacked host name.
-        # The value is a list of lines which were received for this host.
-        piggybacked_raw_data = {}
-        persisted_sections = {}  # handle sections with option persist(...)
-        host = None
-        section_content = []
-        section_options = {}
-        agent_cache_info = {}
-        separator = None
-        encoding = None
-        for line in lines:
-            line = line.rstrip("\r")
-            stripped_line = line.strip()
-            if stripped_line[:4] == '<<<<' and stripped_line[-4:] == '>>>>':
-                host = stripped_line[4:-4]
-                if not host:
-                    host = None
-                else:
-                    host = config.translate_piggyback_host(self._hostname, host)
-                    if host == self._hostname:
-                        host = None  # unpiggybacked "normal" host
-
-                    # Protect Check_MK against unallowed host names. Normally source scripts
-                    # like agent plugins should care about cleaning their provided host names
-                    # up, but we need to be sure here to prevent bugs in Check_MK code.
-                    # a) Replace spaces by underscores
-                    if host:
-                        host = host.replace(" ", "_")
-
-            elif host:  # processing data for an other host
-                piggybacked_raw_data.setdefault(host, []).append(line)
-
-            # Found normal section header
-            # section header has format <<<name:opt1(args):opt2:opt3(args)>>>
-            elif stripped_line[:3] == '<<<' and stripped_line[-3:] == '>>>':
-                section_header = stripped_line[3:-3]
-                headerparts = section_header.split(":")
-                section_name = headerparts[0]
-                section_options = {}
-                for o in headerparts[1:]:
-                    opt_parts = o.split("(")
-                    opt_name = opt_parts[0]
-                    if len(opt_parts) > 1:
-                        opt_args = opt_parts[1][:-1]
-                    else:
-                        opt_args = None
-                    section_options[opt_name] = opt_args
-
-                section_content = sections.get(section_name, None)
-                if section_content is None:  # section appears in output for the first time
-                    section_content = []
-                    sections[section_name] = section_content
-                try:
-                    separator = chr(int(section_options["sep"]))
-                except Exception:
-                    separator = None
-
-                # Split of persisted section for server-side caching
-                if "persist" in section_options:
-                    until = int(section_options["persist"])
-                    cached_at = int(time.time())  # Estimate age of the data
-                    cache_interval = int(until - cached_at)
-                    agent_cache_info[section_name] = (cached_at, cache_interval)
-                    persisted_sections[section_name] = (cached_at, until, section_content)
-
-                if "cached" in section_options:
-                    agent_cache_info[section_name] = tuple(
-                        map(int, section_options["cached"].split(",")))
-
-                # The section data might have a different encoding
-                encoding = section_options.get("encoding")
-
-            elif stripped_line != '':
-                if "nostrip" not in section_options:
-                    line = stripped_line
-
-                if encoding:
-                    line = config.decode_incoming_string(line, encoding)
-                else:
-                    line = config.decode_incoming_string(line)
+        if isinstance(raw_data, MappedAgentData):
+            return parse_agent_data(self._hostname, raw_data.data, raw_data.header_lines)
 
-                section_content.append(line.split(separator))
+        header_lines = None
+        if self._written_header_lines is not None and self._written_header_lines[0] is raw_data:
+            header_lines = self._written_header_lines[1]
+        self._written_header_lines = None
 
-        return HostSections(sections, agent_cache_info, piggybacked_raw_data, persisted_sections)
+        return parse_agent_data(self._hostname, raw_data, header_lines)
 
     # TODO: refactor
     def _summary_result(self, for_checking):
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2014             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+
+"""Memory mapped access to the agent cache files
+
+Together with an agent cache file a small section index is written which
+holds the positions of the section header lines in the cache file. Cache files
+having a valid section index are memory mapped instead of being read. The
+sections are sliced from the mapped file once they are accessed (see
+agent_parser.parse_agent_data()).
+"""
+
+import errno
+import marshal
+import mmap
+import os
+
+import cmk.utils.store as store
+
+from .agent_parser import find_header_lines
+
+# Increase this in case the format of the section index changes
+_INDEX_VERSION = 1
+
+
+class MappedAgentData(object):
+    """The content of a memory mapped agent cache file
+
+    The data is only read from the file when it's sliced or converted to a string.
+    """
+    def __init__(self, data, header_lines):
+        super(MappedAgentData, self).__init__()
+        self.data = data
+        self.header_lines = header_lines
+
+    def __len__(self):
+        return len(self.data)
+
+    def __str__(self):
+        return self.data[:]
+
+
+def section_index_path(cachefile):
+    # type: (str) -> str
+    return cachefile + ".section_index"
+
+
+def write_section_index(cachefile, raw_data):
+    """Write the section index of a just written agent cache file
+
+    Returns the header lines found in the raw data."""
+    header_lines = find_header_lines(raw_data)
+    cache_stat = os.stat(cachefile)
+    store.save_file(
+        section_index_path(cachefile),
+        marshal.dumps((_INDEX_VERSION, cache_stat.st_size, cache_stat.st_mtime, header_lines)))
+    return header_lines
+
+
+def read_mapped_cache_file(cachefile):
+    """Map the given agent cache file into memory
+
+    Returns None in case there is no section index matching the current cache file.
+    The caller has to read the file in this case."""
+    try:
+        index = marshal.loads(open(section_index_path(cachefile), "rb").read())
+    except IOError as e:
+        if e.errno == errno.ENOENT:
+            return None
+        raise
+    except (EOFError, ValueError, TypeError):
+        return None  # Incomplete or broken index. Simply ignore it.
+
+    if not isinstance(index, tuple) or len(index) != 4 or index[0] != _INDEX_VERSION:
+        return None
+    _version, size, mtime, header_lines = index
+
+    with open(cachefile, "rb") as f:
+        cache_stat = os.fstat(f.fileno())
+        if cache_stat.st_size != size or cache_stat.st_mtime != mtime or not size:
+            return None
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # The cache file may have been replaced after the index has been written
+    # (e.g. by a parallel process). Verify that the header lines are still in place.
+    for start, end, header in header_lines:
+        if data[start:end].strip() != "<<<%s>>>" % header:
+            data.close()
+            return None
+
+    return MappedAgentData(data, header_lines)
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2014             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+
+"""Parser for the Check_MK agent output format
+
+The agent output is scanned once for section and piggyback headers. The text
+between two headers is kept as a single chunk. Section chunks are only decoded
+and split into rows once a section is accessed (see LazySections).
+"""
+
+import codecs
+import re
+import time
+
+import cmk_base.config as config
+
+from .host_sections import HostSections, LazySections, RawSection
+
+# Matches the lines that are section headers (<<<name:opt1(args):opt2>>>) or
+# piggyback headers (<<<<hostname>>>>). The header line may be surrounded by
+# whitespace (which includes a trailing "\r").
+_HEADER_LINE_RE = re.compile(r"^[^\S\n]*<<<(.*)>>>[^\S\n]*$", re.MULTILINE)
+
+
+def parse_agent_data(hostname, raw_data, header_lines=None):
+    """Split the raw agent output of a host into sections
+
+    The raw data may also be a memory mapped agent cache file. In this case the
+    sections reference the mapped data instead of copying it.
+
+    In case the header lines of the raw data are already known (see
+    find_header_lines()), the raw data is not scanned again.
+
+    Returns a HostSections() object."""
+    parser = _AgentDataParser(hostname)
+    parser.feed(raw_data, header_lines)
+    return parser.host_sections()
+
+
+def find_header_lines(raw_data):
+    """Returns the positions of all header lines of the raw agent output
+
+    Returns a list of (start, end, header) tuples. The header is the text
+    between the angle brackets of the header line."""
+    return [(match.start(), match.end(), match.group(1))
+            for match in _HEADER_LINE_RE.finditer(raw_data)]
+
+
+def parse_section_header(header):
+    """Split a section header into the section name and the options
+
+    The header has the format "name:opt1(args):opt2:opt3(args)"."""
+    headerparts = header.split(":")
+    section_options = {}
+    for o in headerparts[1:]:
+        opt_parts = o.split("(")
+        opt_name = opt_parts[0]
+        if len(opt_parts) > 1:
+            opt_args = opt_parts[1][:-1]
+        else:
+            opt_args = None
+        section_options[opt_name] = opt_args
+    return headerparts[0], section_options
+
+
+class _AgentDataParser(object):
+    def __init__(self, hostname):
+        super(_AgentDataParser, self).__init__()
+        self._hostname = hostname
+
+        self._section_chunks = {}
+        # Unparsed info for other hosts. A dictionary, indexed by the piggybacked host name.
+        # The value is a list of lines which were received for this host.
+        self._piggybacked_raw_data = {}
+        self._persisted_section_names = {}  # handle sections with option persist(...)
+        self._agent_cache_info = {}
+        self._translated_hosts = {}
+
+        # Parser state. Lines found before the first section header are dropped.
+        self._host = None
+        self._chunks = None
+        self._chunk_options = None
+
+    def feed(self, raw_data, header_lines=None):
+        if header_lines is None:
+            header_lines = find_header_lines(raw_data)
+
+        body_start = 0
+        for start, end, header in header_lines:
+            is_piggyback_header = len(header) >= 2 and header[0] == "<" and header[-1] == ">"
+            if self._host is not None and not is_piggyback_header:
+                continue  # Section headers of piggybacked hosts are just data
+
+            # The body ends with the newline in front of the header line. Two
+            # directly adjacent header lines have no body lines in between.
+            if start > body_start:
+                self._add_body(raw_data, body_start, start - 1)
+            body_start = end + 1
+
+            if is_piggyback_header:
+                self._start_piggybacked_host(header[1:-1])
+            else:
+                self._start_section(header)
+
+        if body_start <= len(raw_data):
+            self._add_body(raw_data, body_start, len(raw_data))
+
+    def _add_body(self, raw_data, start, end):
+        if self._host is not None:
+            raw_text = raw_data[start:end]
+            if "\r" in raw_text:
+                lines = [l.rstrip("\r") for l in raw_text.split("\n")]
+            else:
+                lines = raw_text.split("\n")
+            self._piggybacked_raw_data.setdefault(self._host, []).extend(lines)
+
+        elif self._chunks is not None:
+            if isinstance(raw_data, str):
+                raw_text = raw_data[start:end]
+            else:
+                # Don't copy the sections of mapped agent data before they are accessed
+                raw_text = buffer(raw_data, start, end - start)
+            self._chunks.append((raw_text,) + self._chunk_options)
+
+    def _start_piggybacked_host(self, host):
+        if not host:
+            self._host = None
+            return
+
+        try:
+            self._host = self._translated_hosts[host]
+        except KeyError:
+            self._host = self._translated_hosts[host] = self._translate_piggyback_host(host)
+
+    def _translate_piggyback_host(self, host):
+        host = config.translate_piggyback_host(self._hostname, host)
+        if host == self._hostname:
+            return None  # unpiggybacked "normal" host
+
+        # Protect Check_MK against unallowed host names. Normally source scripts
+        # like agent plugins should care about cleaning their provided host names
+        # up, but we need to be sure here to prevent bugs in Check_MK code.
+        # a) Replace spaces by underscores
+        if host:
+            host = host.replace(" ", "_")
+        return host or None
+
+    def _start_section(self, header):
+        section_name, section_options = parse_section_header(header)
+
+        self._chunks = self._section_chunks.setdefault(section_name, [])
+
+        try:
+            separator = chr(int(section_options["sep"]))
+        except Exception:
+            separator = None
+
+        # Split of persisted section for server-side caching
+        if "persist" in section_options:
+            until = int(section_options["persist"])
+            cached_at = int(time.time())  # Estimate age of the data
+            cache_interval = int(until - cached_at)
+            self._agent_cache_info[section_name] = (cached_at, cache_interval)
+            self._persisted_section_names[section_name] = (cached_at, until)
+
+        if "cached" in section_options:
+            self._agent_cache_info[section_name] = tuple(
+                map(int, section_options["cached"].split(",")))
+
+        # The section data might have a different encoding. Unknown encodings
+        # are reported now, not when the section is accessed.
+        encoding = section_options.get("encoding")
+        if encoding:
+            codecs.lookup(encoding)
+
+        self._chunk_options = (separator, "nostrip" in section_options, encoding)
+
+    def host_sections(self):
+        sections = LazySections(
+            (section_name, RawSection(chunks))
+            for section_name, chunks in self._section_chunks.iteritems())
+
+        # The persisted sections share the section content with the sections
+        persisted_sections = {}
+        for section_name, (cached_at, until) in self._persisted_section_names.iteritems():
+            persisted_sections[section_name] = (cached_at, until, sections[section_name])
+
+        return HostSections(sections, self._agent_cache_info, self._piggybacked_raw_data,
+                            persisted_sections)
@@ -30,6 +30,7 @@ import cmk.utils.debug
 
 import cmk_base.config as config
 import cmk_base.caching as caching
+import cmk_base.cpu_tracking as cpu_tracking
 import cmk_base.ip_lookup as ip_lookup
 import cmk_base.item_state as item_state
 import cmk_base.check_utils
@@ -37,6 +38,139 @@ import cmk_base.check_utils
 from cmk_base.exceptions import MKParseFunctionError
 
 
+class RawSection(object):
+    """The not yet split content of an agent section
+
+    Holds the raw chunks of one section as they were found in the agent output,
+    together with the header options needed to split them. A section that
+    occurs multiple times in the agent output consists of multiple chunks.
+    The lines of the section are only split when the section is accessed.
+    """
+    __slots__ = ["chunks"]
+
+    def __init__(self, chunks=()):
+        super(RawSection, self).__init__()
+        # Sequence of (raw_text, separator, nostrip, encoding) tuples. The raw
+        # text may be a buffer() referencing a memory mapped agent cache file.
+        self.chunks = tuple(chunks)
+
+    def extended(self, other):
+        return RawSection(self.chunks + other.chunks)
+
+    def parse(self):
+        section_content = []
+        for raw_text, separator, nostrip, encoding in self.chunks:
+            for line in _decode_block(str(raw_text), encoding or "utf-8"):
+                stripped_line = line.strip(_WHITESPACE)
+                if not stripped_line:
+                    continue
+
+                if nostrip:
+                    section_content.append(line.rstrip(u"\r").split(separator))
+                else:
+                    section_content.append(stripped_line.split(separator))
+        return section_content
+
+
+# The characters str.strip() removes from byte strings. The decoded unicode lines
+# must be stripped the same way the raw agent output lines were stripped before.
+_WHITESPACE = u" \t\n\r\x0b\x0c"
+
+
+def _decode_block(raw_text, encoding):
+    """Decode all lines of a section chunk at once
+
+    Only in case the chunk is not valid in the given encoding, the lines are
+    decoded one by one to be able to use the fallback encoding for the
+    offending lines only."""
+    try:
+        return raw_text.decode(encoding).split(u"\n")
+    except UnicodeDecodeError:
+        return [config.decode_incoming_string(l, encoding) for l in raw_text.split("\n")]
+
+
+class LazySections(dict):
+    """Dictionary from section name to section content which splits sections on access
+
+    The values may be RawSection() objects which are parsed and replaced by the
+    list of rows on the first access. Sections which are never accessed are
+    never split. All accessors of this dictionary only return parsed sections.
+    """
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, RawSection):
+            value = value.parse()
+            dict.__setitem__(self, key, value)
+        return value
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        dict.__setitem__(self, key, default)
+        return default
+
+    def pop(self, key, *args):
+        if key in self:
+            value = self[key]
+            dict.__delitem__(self, key)
+            return value
+        return dict.pop(self, key, *args)
+
+    def popitem(self):
+        if not self:
+            raise KeyError("popitem(): dictionary is empty")
+        key = next(iter(self))
+        return key, self.pop(key)
+
+    def itervalues(self):
+        for key in self.keys():
+            yield self[key]
+
+    def iteritems(self):
+        for key in self.keys():
+            yield key, self[key]
+
+    def values(self):
+        return list(self.itervalues())
+
+    def items(self):
+        return list(self.iteritems())
+
+    def copy(self):
+        return LazySections(self)
+
+    def __eq__(self, other):
+        if not isinstance(other, dict):
+            return NotImplemented
+        return dict(self.items()) == dict(other.items())
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, dict(self.items()))
+
+    def extend_sections(self, sections):
+        """Append the contents of the given sections to the sections of this object
+
+        Not yet parsed sections are kept unparsed as long as possible."""
+        for section_name in sections.keys():
+            other = dict.__getitem__(sections, section_name)
+            own = dict.get(self, section_name)
+            if isinstance(other, RawSection) and (own is None or isinstance(own, RawSection)):
+                dict.__setitem__(self, section_name, other if own is None else own.extended(other))
+            else:
+                self.setdefault(section_name, []).extend(sections[section_name])
+
+
 class HostSections(object):
     """A wrapper class for the host information read by the data sources
 
@@ -55,7 +189,7 @@ class HostSections(object):
                  piggybacked_raw_data=None,
                  persisted_sections=None):
         super(HostSections, self).__init__()
-        self.sections = sections if sections is not None else {}
+        self.sections = sections if sections is not None else LazySections()
         self.cache_info = cache_info if cache_info is not None else {}
         self.piggybacked_raw_data = piggybacked_raw_data if piggybacked_raw_data is not None else {}
         self.persisted_sections = persisted_sections if persisted_sections is not None else {}
@@ -67,8 +201,11 @@ class HostSections(object):
     #       Would this be correct here?
     def update(self, host_sections):
         """Update this host info object with the contents of another one"""
-        for section_name, lines in host_sections.sections.items():
-            self.sections.setdefault(section_name, []).extend(lines)
+        if isinstance(self.sections, LazySections):
+            self.sections.extend_sections(host_sections.sections)
+        else:
+            for section_name, lines in host_sections.sections.items():
+                self.sections.setdefault(section_name, []).extend(lines)
 
         for hostname, lines in host_sections.piggybacked_raw_data.items():
             self.piggybacked_raw_data.setdefault(hostname, []).extend(lines)
@@ -296,7 +433,8 @@ class MultiHostSections(object):
         orig_item_state_prefix = item_state.get_item_state_prefix()
         try:
             item_state.set_item_state_prefix(section_name, None)
-            return parse_function(section_content)
+            with cpu_tracking.track("parse", section_name):
+                return parse_function(section_content)
         except Exception:
             if cmk.utils.debug.enabled():
                 raise
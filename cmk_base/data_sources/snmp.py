@@ -61,6 +61,7 @@ class SNMPDataSource(DataSource):
         self._use_snmpwalk_cache = True
         self._ignore_check_interval = False
         self._fetched_check_plugin_names = []
+        self._walk_stats = None
 
     def id(self):
         return "snmp"
@@ -160,6 +161,8 @@ class SNMPDataSource(DataSource):
 
         snmp_config = self._host_config.snmp_config(self._ipaddress)
         info = {}
+        # The sections to fetch together with the tables to fetch for each section
+        sections = []
         for check_plugin_name in self._sort_check_plugin_names(check_plugin_names):
             # Is this an SNMP table check? Then snmp_info specifies the OID to fetch
             # Please note, that if the check_plugin_name is foo.bar then we lookup the
@@ -199,22 +202,31 @@ class SNMPDataSource(DataSource):
             # oid_info can now be a list: Each element  of that list is interpreted as one real oid_info
             # and fetches a separate snmp table.
             if isinstance(oid_info, list):
-                check_info = []
-                for entry in oid_info:
-                    check_info_part = snmp.get_snmp_table(snmp_config, check_plugin_name, entry,
-                                                          self._use_snmpwalk_cache)
-
-                    # If at least one query fails, we discard the whole info table
-                    if check_info_part is None:
-                        check_info = None
-                        break
-                    else:
-                        check_info.append(check_info_part)
+                table_requests = [(check_plugin_name, entry) for entry in oid_info]
             else:
-                check_info = snmp.get_snmp_table(snmp_config, check_plugin_name, oid_info,
-                                                 self._use_snmpwalk_cache)
-
-            info[section_name] = check_info
+                table_requests = [(check_plugin_name, oid_info)]
+            sections.append((section_name, isinstance(oid_info, list), table_requests))
+            info[section_name] = None
+
+        # Fetch the tables of all sections together to share identical and overlapping walks
+        all_table_requests = [r for _name, _is_list, requests in sections for r in requests]
+        tables, self._walk_stats = snmp.get_snmp_tables(snmp_config, all_table_requests,
+                                                        self._use_snmpwalk_cache)
+        self._logger.verbose(
+            "SNMP walks: %d requested, %d from walk cache, %d executed (%d saved)" %
+            (self._walk_stats.requested, self._walk_stats.cached, self._walk_stats.executed,
+             self._walk_stats.requested - self._walk_stats.cached - self._walk_stats.executed))
+
+        tables_iter = iter(tables)
+        for section_name, is_list, table_requests in sections:
+            section_tables = [next(tables_iter) for _request in table_requests]
+            if not is_list:
+                info[section_name] = section_tables[0]
+            # If at least one query fails, we discard the whole info table
+            elif None in section_tables:
+                info[section_name] = None
+            else:
+                info[section_name] = section_tables
 
         return info
 
@@ -24,12 +24,18 @@
 # to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
 # Boston, MA 02110-1301 USA.
 
+import errno
+import os
+import select
 import socket
+import time
+from typing import Dict, Tuple, Union  # pylint: disable=unused-import
 
 import cmk.utils.debug
 from cmk.utils.exceptions import MKTerminate
 import cmk.utils.werks
 
+import cmk_base.config as config
 from cmk_base.exceptions import MKAgentError, MKEmptyAgentData
 
 from .abstract import CheckMKAgentDataSource
@@ -49,6 +55,10 @@ from .abstract import CheckMKAgentDataSource
 
 class TCPDataSource(CheckMKAgentDataSource):
     _use_only_cache = False
+    # Agent outputs fetched in advance by prefetch_agent_outputs(). Indexed by
+    # (hostname, ipaddress, port). The values are either the raw agent output or
+    # the exception that occured while fetching it.
+    _prefetched_outputs = {}  # type: Dict[Tuple[str, str, int], Union[str, Exception]]
 
     def __init__(self, hostname, ipaddress):
         super(TCPDataSource, self).__init__(hostname, ipaddress)
@@ -76,6 +86,11 @@ class TCPDataSource(CheckMKAgentDataSource):
 
         return self._host_config.tcp_connect_timeout
 
+    def needs_agent_fetch(self):
+        """Whether or not the next run() will connect to the agent"""
+        return (not self._use_only_cache and not config.simulation_mode and
+                bool(self._ipaddress) and not self._is_cache_file_usable(self._cache_file_path()))
+
     def _execute(self):
         if self._use_only_cache:
             raise MKAgentError("Got no data: No usable cache file present at %s" %
@@ -85,8 +100,18 @@ class TCPDataSource(CheckMKAgentDataSource):
 
         port = self._get_port()
 
-        encryption_settings = self._host_config.agent_encryption
+        try:
+            output = self._prefetched_outputs.pop((self._hostname, self._ipaddress, port))
+        except KeyError:
+            output = self._fetch_agent_output(port)
+        else:
+            self._logger.debug("Using agent output fetched in parallel")
+            if isinstance(output, Exception):
+                raise output
+
+        return self._process_agent_output(output, port)
 
+    def _fetch_agent_output(self, port):
         socktype = (socket.AF_INET6 if self._host_config.is_ipv6_primary else socket.AF_INET)
         s = socket.socket(socktype, socket.SOCK_STREAM)
 
@@ -118,7 +143,10 @@ class TCPDataSource(CheckMKAgentDataSource):
             raise MKAgentError("Communication failed: %s" % e)
         finally:
             s.close()
-        output = ''.join(output)
+        return ''.join(output)
+
+    def _process_agent_output(self, output, port):
+        encryption_settings = self._host_config.agent_encryption
 
         if len(output) == 0:  # may be caused by xinetd not allowing our address
             raise MKEmptyAgentData("Empty output from agent at TCP port %d" % port)
@@ -178,3 +206,152 @@ class TCPDataSource(CheckMKAgentDataSource):
     @classmethod
     def use_only_cache(cls):
         cls._use_only_cache = True
+
+    @classmethod
+    def prefetch_agent_outputs(cls, sources, max_connections):
+        """Fetch the agent outputs of the given sources in parallel
+
+        The outputs are handed over to the next _execute() call of the source for
+        the same host, IP address and port. Previously prefetched outputs which
+        have not been used are dropped."""
+        connections = []
+        for source in sources:
+            key = (source._hostname, source._ipaddress, source._get_port())
+            family = socket.AF_INET6 if source._host_config.is_ipv6_primary else socket.AF_INET
+            connections.append(_AgentConnection(key, family, source._get_timeout()))
+
+        cls._prefetched_outputs = dict(_fetch_in_parallel(connections, max_connections))
+
+    @classmethod
+    def drop_prefetched_agent_outputs(cls):
+        cls._prefetched_outputs = {}
+
+
+#.
+#   .--Parallel fetch------------------------------------------------------.
+#   |        ____                 _ _      _    __      _       _          |
+#   |       |  _ \ __ _ _ __ __ _| | | ___| |  / _| ___| |_ ___| |__       |
+#   |       | |_) / _` | '__/ _` | | |/ _ \ | | |_ / _ \ __/ __| '_ \      |
+#   |       |  __/ (_| | | | (_| | | |  __/ | |  _|  __/ || (__| | | |     |
+#   |       |_|   \__,_|_|  \__,_|_|_|\___|_| |_|  \___|\__\___|_| |_|     |
+#   |                                                                      |
+#   +----------------------------------------------------------------------+
+#   | Fetch the output of many agents with non-blocking sockets in a      |
+#   | single process to overlap the time spent waiting for the agents.    |
+#   '----------------------------------------------------------------------'
+
+
+class _AgentConnection(object):
+    """State of a single non-blocking agent connection"""
+    def __init__(self, key, family, connect_timeout):
+        super(_AgentConnection, self).__init__()
+        self.key = key
+        self._family = family
+        self._connect_timeout = connect_timeout
+        self._chunks = []
+        self.sock = None
+        self.connected = False
+        self.deadline = None
+
+    @property
+    def address(self):
+        return self.key[1], self.key[2]
+
+    def connect(self):
+        self.sock = socket.socket(self._family, socket.SOCK_STREAM)
+        self.sock.setblocking(0)
+        self.deadline = time.time() + self._connect_timeout
+        err = self.sock.connect_ex(self.address)
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            raise socket.error(err, os.strerror(err))
+
+    def finish_connect(self):
+        err = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            raise socket.error(err, os.strerror(err))
+        # Like the blocking fetch there is no timeout for reading the agent output
+        self.connected = True
+        self.deadline = None
+
+    def receive(self):
+        """Returns True when the agent has closed the connection"""
+        data = self.sock.recv(65536)
+        if not data:
+            return True
+        self._chunks.append(data)
+        return False
+
+    def output(self):
+        return "".join(self._chunks)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+
+
+def _fetch_in_parallel(connections, max_connections):
+    """Fetch the agent outputs of the given connections
+
+    At most max_connections connections are in flight at the same time. Yields
+    pairs of connection key and the agent output or the occured exception."""
+    pending = list(reversed(connections))
+    in_flight = {}  # type: Dict[int, _AgentConnection]
+    poller = select.poll()
+
+    def _start(conn):
+        try:
+            conn.connect()
+        except socket.error as e:
+            conn.close()
+            return e
+        in_flight[conn.sock.fileno()] = conn
+        poller.register(conn.sock, select.POLLOUT)
+        return None
+
+    def _finish(fd):
+        conn = in_flight.pop(fd)
+        poller.unregister(fd)
+        conn.close()
+        return conn
+
+    try:
+        while pending or in_flight:
+            while pending and len(in_flight) < max_connections:
+                conn = pending.pop()
+                error = _start(conn)
+                if error is not None:
+                    yield conn.key, MKAgentError("Communication failed: %s" % error)
+
+            deadlines = [c.deadline for c in in_flight.itervalues() if c.deadline is not None]
+            if deadlines:
+                timeout_ms = max(0, int((min(deadlines) - time.time()) * 1000) + 1)
+            else:
+                timeout_ms = None
+
+            try:
+                events = poller.poll(timeout_ms)
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            for fd, event in events:
+                conn = in_flight[fd]
+                try:
+                    if not conn.connected:
+                        conn.finish_connect()
+                        poller.modify(fd, select.POLLIN)
+                    elif conn.receive():
+                        yield _finish(fd).key, conn.output()
+                except socket.error as e:
+                    if e.args[0] in (errno.EAGAIN, errno.EINTR):
+                        continue
+                    yield _finish(fd).key, MKAgentError("Communication failed: %s" % e)
+
+            now = time.time()
+            for fd, conn in in_flight.items():
+                if conn.deadline is not None and now > conn.deadline:
+                    yield _finish(fd).key, MKAgentError("Communication failed: timed out")
+    finally:
+        for conn in in_flight.itervalues():
+            conn.close()
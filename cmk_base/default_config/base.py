@@ -43,8 +43,11 @@ agent_encryption = []
 snmp_ports = []  # UDP ports used for SNMP
 tcp_connect_timeout = 5.0
 tcp_connect_timeouts = []
+tcp_fetch_parallel_connections = 256  # agents fetched in parallel for host lists (0: disable)
 use_dns_cache = True  # prevent DNS by using own cache file
 delay_precompile = False  # delay Python compilation to Nagios execution
+core_config_processes = None  # processes creating the core config (None: number of CPUs)
+core_config_incremental = True  # only recreate the core config of changed hosts
 restart_locking = "abort"  # also possible: "wait", None
 check_submission = "file"  # alternative: "pipe"
 agent_min_version = 0  # warn, if plugin has not at least version
@@ -60,6 +63,9 @@ fake_dns = None  # type: _typing.Optional[str]
 agent_simulator = False
 perfdata_format = "pnp"  # also possible: "standard"
 check_mk_perfdata_with_times = True
+# Append the wall and CPU times of the data sources, parse and check functions
+# of each checked host to tmp/check_mk/cpu_tracking/stats
+cpu_tracking_stats = True
 # TODO: Remove these options?
 debug_log = False  # deprecated
 monitoring_host = None  # deprecated
@@ -76,10 +82,18 @@ http_proxies = {}  # Global setting for managing HTTP proxy configs
 use_inline_snmp = True
 non_inline_snmp_hosts = []  # Ruleset to disable Inline-SNMP per host when
 # use_inline_snmp is enabled.
+use_pysnmp_backend = False  # Use PySNMP instead of the net-snmp commands for
+# the hosts not using Inline-SNMP
 
 snmp_limit_oid_range = []  # Ruleset to recduce fetched OIDs of a check, only inline SNMP
 snmp_bulk_size = []  # Ruleset to customize bulk size
 record_inline_snmp_stats = False
+# Shared SNMP cache of all processes (var/check_mk/snmp_shared_cache): Time to live
+# of single OID values (fetched by the SNMP scan) and of cachable walks in seconds
+# (None: no expiration) and maximum size of the cache of a host in bytes
+snmp_cache_single_oid_ttl = 300
+snmp_cache_walk_ttl = None  # type: _typing.Optional[int]
+snmp_cache_max_size = 10 * 1024 * 1024
 snmp_default_community = 'public'
 snmp_communities = []
 explicit_snmp_communities = {}  # override the rule based configuration
@@ -110,6 +124,8 @@ inventory_check_autotrigger = True  # Automatically trigger inv-check after auto
 always_cleanup_autochecks = None  # For compatiblity with old configuration
 
 periodic_discovery = []
+marked_host_discovery_processes = 4  # hosts discovered in parallel by --discover-marked-hosts
+marked_host_discovery_host_timeout = 60  # seconds the discovery of a single marked host may take
 
 # Nagios templates and other settings concerning generation
 # of Nagios configuration files. No need to change these values.
@@ -24,6 +24,8 @@
 # to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
 # Boston, MA 02110-1301 USA.
 
+import itertools
+import multiprocessing
 import os
 import socket
 import time
@@ -101,7 +103,8 @@ def do_discovery(hostnames, check_plugin_names, only_new):
     hostnames = sorted({h for h in hostnames if not config_cache.get_host_config(h).is_cluster})
 
     # Now loop through all hosts
-    for hostname in hostnames:
+    max_cachefile_age = config.inventory_max_cachefile_age if use_caches else 0
+    for hostname in data_sources.iter_hosts_with_prefetch(hostnames, max_cachefile_age):
         console.section_begin(hostname)
 
         try:
@@ -458,18 +461,17 @@ def _set_rediscovery_flag(hostname):
     touch(discovery_filename)
 
 
-class DiscoveryTimeout(Exception):
+class DiscoveryTimeout(MKTimeout):
     pass
 
 
-def _handle_discovery_timeout():
+def _handle_discovery_timeout(signum, stack_frame):
     raise DiscoveryTimeout()
 
 
-def _set_discovery_timeout():
+def _set_discovery_timeout(timeout):
     signal.signal(signal.SIGALRM, _handle_discovery_timeout)
-    # Add an additional 10 seconds as grace period
-    signal.alarm(_marked_host_discovery_timeout + 10)
+    signal.alarm(timeout)
 
 
 def _clear_discovery_timeout():
@@ -500,32 +502,53 @@ def discover_marked_hosts(core):
 
     # Fetch host state information from livestatus
     host_states = _fetch_host_states()
-    activation_required = False
 
-    try:
-        _set_discovery_timeout()
-        for hostname in hosts:
-            host_config = config_cache.get_host_config(hostname)
+    hostnames = []
+    for hostname in hosts:
+        if not _discover_marked_host_exists(config_cache, hostname):
+            continue
 
-            if not _discover_marked_host_exists(config_cache, hostname):
-                continue
+        # Only try to discover hosts with UP state
+        if host_states and host_states.get(hostname) != 0:
+            continue
+
+        hostnames.append(hostname)
+
+    jobs = [(hostname, now_ts, oldest_queued, end_time_ts) for hostname in hostnames]
 
-            # Only try to discover hosts with UP state
-            if host_states and host_states.get(hostname) != 0:
+    # The processes are forked after the config cache has been built, so they
+    # share it and don't need to load the configuration again
+    processes = max(1, min(config.marked_host_discovery_processes, len(jobs)))
+    pool = None
+    if processes > 1:
+        console.verbose("  Discovering %d hosts in %d processes\n" % (len(jobs), processes))
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(_discover_marked_host_job, jobs)
+    else:
+        results = itertools.imap(_discover_marked_host_job, jobs)
+
+    activation_required = False
+    num_skipped = 0
+    try:
+        for hostname, state, services_changed, duration in results:
+            if state == "skipped":
+                num_skipped += 1
                 continue
 
-            if _discover_marked_host(config_cache, host_config, now_ts, oldest_queued):
+            console.verbose("  %s: %s (%.1f sec)\n" % (hostname, state, duration))
+            if services_changed:
                 activation_required = True
 
-            if time.time() > end_time_ts:
-                console.verbose(
-                    "  Timeout of %d seconds reached. Lets do the remaining hosts next time." %
-                    _marked_host_discovery_timeout)
-                break
-    except DiscoveryTimeout:
-        pass
+        if pool:
+            pool.close()
     finally:
-        _clear_discovery_timeout()
+        if pool:
+            pool.terminate()
+            pool.join()
+
+    if num_skipped:
+        console.verbose("  Timeout of %d seconds reached. Lets do the remaining %d hosts next time.\n" %
+                        (_marked_host_discovery_timeout, num_skipped))
 
     if activation_required:
         console.verbose("\nRestarting monitoring core with updated configuration...\n")
@@ -535,6 +558,42 @@ def discover_marked_hosts(core):
             cmk_base.core.do_restart(core)
 
 
+def _discover_marked_host_job(job):
+    """Discover a marked host within its time budget, possibly in a forked process
+
+    The discovery of a host is interrupted when it takes longer than
+    marked_host_discovery_host_timeout. Hosts which are started after the
+    overall timeout has been reached are skipped. They keep their mark and
+    are discovered during the next run."""
+    hostname, now_ts, oldest_queued, end_time_ts = job
+
+    start_ts = time.time()
+    if start_ts > end_time_ts:
+        return hostname, "skipped", False, 0.0
+
+    # Add an additional 10 seconds as grace period to the overall timeout
+    timeout = min(config.marked_host_discovery_host_timeout, end_time_ts + 10 - start_ts)
+
+    config_cache = config.get_config_cache()
+    state, services_changed = "done", False
+    try:
+        _set_discovery_timeout(max(1, int(timeout)))
+        services_changed = _discover_marked_host(config_cache,
+                                                 config_cache.get_host_config(hostname), now_ts,
+                                                 oldest_queued)
+    except DiscoveryTimeout:
+        state = "timeout"
+    except Exception as e:
+        if cmk.utils.debug.enabled():
+            raise
+        console.verbose("  failed: %s\n" % e)
+        state = "failed"
+    finally:
+        _clear_discovery_timeout()
+
+    return hostname, state, services_changed, time.time() - start_ts
+
+
 def _fetch_host_states():
     host_states = {}
     try:
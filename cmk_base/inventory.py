@@ -70,7 +70,7 @@ def do_inv(hostnames):
     cmk.utils.store.makedirs(cmk.utils.paths.inventory_output_dir)
     cmk.utils.store.makedirs(cmk.utils.paths.inventory_archive_dir)
 
-    for hostname in hostnames:
+    for hostname in data_sources.iter_hosts_with_prefetch(hostnames):
         console.section_begin(hostname)
         try:
             config_cache = config.get_config_cache()
@@ -159,6 +159,11 @@ def cached_dns_lookup(hostname, family):
                                          (family, hostname, e))
 
 
+def cached_ip_address(hostname, family):
+    """Return the address of a host from the IP lookup cache without looking it up"""
+    return _initialize_ip_lookup_cache().get((hostname, family))
+
+
 def _initialize_ip_lookup_cache():
     # Already created and initialized. Simply return it!
     if cmk_base.config_cache.exists("ip_lookup"):
@@ -39,12 +39,18 @@ Do not store long-time things here. Also do not store complex
 structures like log files or stuff.
 """
 
+import abc
+import ast
+import errno
+import marshal
 import os
+import struct
 import traceback
+from typing import Any, Dict, Tuple  # pylint: disable=unused-import
 
 import cmk.utils.paths
 import cmk.utils.store
-from cmk.utils.exceptions import MKGeneralException
+from cmk.utils.exceptions import MKGeneralException, MKTimeout
 import cmk_base.cleanup
 
 # Constants for counters
@@ -67,42 +73,210 @@ class MKCounterWrapped(Exception):
         return self.reason
 
 
-class CachedItemStates(object):
+class ItemStateStore(object):
+    """Base class for the storage backends of the item states of a host
+
+    The item states of a host are loaded as two dictionaries: The already decoded
+    item states and the still encoded item states (key -> encoded value). The
+    encoded values are decoded by decode() once an item state is accessed.
+    """
+    __metaclass__ = abc.ABCMeta
+
+    @abc.abstractmethod
+    def load(self, path):
+        # type: (str) -> Tuple[Dict[Any, Any], Dict[Any, Any]]
+        raise NotImplementedError()
+
+    def decode(self, encoded_value):
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def save(self, path, updated_item_states, removed_item_state_keys, item_states,
+             num_item_states):
+        """Apply the modifications made since loading to the file
+
+        The file has been locked by the caller. item_states are the decoded item
+        states of the host, num_item_states is the number of all current item
+        states of the host (decoded and encoded ones)."""
+        raise NotImplementedError()
+
+
+class ReprItemStateStore(ItemStateStore):
+    """Stores the item states as Python literal (repr) of a single dictionary
+
+    Each modification rewrites the whole file."""
     def __init__(self):
+        super(ReprItemStateStore, self).__init__()
+        self._last_mtime = None  # timestamp of last modification
+
+    def load(self, path):
+        item_states = cmk.utils.store.load_data_from_file(path, default={}, lock=True)
+        self._last_mtime = os.stat(path).st_mtime
+        return item_states, {}
+
+    # TODO: self._last_mtime needs be updated accordingly after the save_data_to_file operation
+    #       right now, the current mechanism is sufficient enough, since the save() function is only
+    #       called as the final operation, just before the lifecycle of the CachedItemState ends
+    def save(self, path, updated_item_states, removed_item_state_keys, item_states,
+             num_item_states):
+        last_mtime = os.stat(path).st_mtime
+        if last_mtime != self._last_mtime:
+            item_states = cmk.utils.store.load_data_from_file(path, default={})
+
+            # Remove obsolete keys
+            for key in removed_item_state_keys:
+                try:
+                    del item_states[key]
+                except KeyError:
+                    pass
+
+            # Add updated keys
+            item_states.update(updated_item_states)
+
+        cmk.utils.store.save_data_to_file(path, item_states, pretty=False)
+
+
+class BinaryItemStateStore(ItemStateStore):
+    """Stores the item states in a compact binary file with partial updates
+
+    The file starts with a magic line followed by records. Each record is a
+    length prefixed marshaled dictionary from item state key to the marshaled
+    value or None for removed keys. The first record holds all item states, each
+    save appends a record with only the modified keys. The records are merged
+    when loading. Values are only unmarshaled when they are accessed.
+
+    The file is compacted to a single record once it contains more outdated
+    than current entries. Files of the ReprItemStateStore are read and replaced
+    by the binary format with the next save.
+    """
+    _MAGIC = "CMKITEMSTATES1\n"
+    _LENGTH = struct.Struct("<I")
+
+    def __init__(self):
+        super(BinaryItemStateStore, self).__init__()
+        self._num_entries = 0  # Number of entries of all records in the file
+        self._needs_compaction = False
+
+    def load(self, path):
+        cmk.utils.store.aquire_lock(path)
+        try:
+            encoded_item_states, self._num_entries, is_legacy_file, is_complete = self._read(path)
+        except MKTimeout:
+            cmk.utils.store.release_lock(path)
+            raise
+        except Exception as e:
+            cmk.utils.store.release_lock(path)
+            raise MKGeneralException("Cannot read file \"%s\": %s" % (path, e))
+
+        # Records can not be appended to legacy files or behind incomplete records
+        self._needs_compaction = is_legacy_file or not is_complete
+
+        if is_legacy_file:
+            return encoded_item_states, {}
+        return {}, encoded_item_states
+
+    def decode(self, encoded_value):
+        return marshal.loads(encoded_value)
+
+    def _read(self, path):
+        try:
+            content = open(path, "rb").read()
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return {}, 0, False, True
+
+        if not content.startswith(self._MAGIC):
+            if not content.strip():
+                return {}, 0, False, True  # May be created empty during locking
+            return ast.literal_eval(content.strip()), 0, True, True
+
+        encoded_item_states = {}
+        num_entries = 0
+        offset = len(self._MAGIC)
+        while offset < len(content):
+            if offset + self._LENGTH.size > len(content):
+                break  # Incomplete record of an interrupted write
+            length = self._LENGTH.unpack_from(content, offset)[0]
+            offset += self._LENGTH.size
+            if offset + length > len(content):
+                break
+            record = marshal.loads(content[offset:offset + length])
+            offset += length
+            num_entries += len(record)
+            encoded_item_states.update(record)
+
+        for key in [k for k, v in encoded_item_states.iteritems() if v is None]:
+            del encoded_item_states[key]
+
+        return encoded_item_states, num_entries, False, offset == len(content)
+
+    def _encode_record(self, record):
+        data = marshal.dumps(record)
+        return self._LENGTH.pack(len(data)) + data
+
+    def save(self, path, updated_item_states, removed_item_state_keys, item_states,
+             num_item_states):
+        encoded_updates = {k: marshal.dumps(v) for k, v in updated_item_states.iteritems()}
+        delta = dict.fromkeys(removed_item_state_keys)
+        delta.update(encoded_updates)
+
+        self._num_entries += len(delta)
+
+        if not self._needs_compaction and os.path.exists(path) and \
+           self._num_entries <= 2 * max(num_item_states, 1):
+            is_empty = os.stat(path).st_size == 0
+            with open(path, "ab") as f:
+                f.write((self._MAGIC if is_empty else "") + self._encode_record(delta))
+            return
+
+        # Compact: The file may have been changed since loading, read it again
+        encoded_item_states, _num_entries, is_legacy_file, _is_complete = self._read(path)
+        if is_legacy_file:
+            encoded_item_states = {k: marshal.dumps(v) for k, v in encoded_item_states.iteritems()}
+
+        for key in removed_item_state_keys:
+            encoded_item_states.pop(key, None)
+        encoded_item_states.update(encoded_updates)
+
+        cmk.utils.store.save_file(path, self._MAGIC + self._encode_record(encoded_item_states))
+        self._num_entries = len(encoded_item_states)
+        self._needs_compaction = False
+
+
+class CachedItemStates(object):
+    def __init__(self, store_class=BinaryItemStateStore):
         super(CachedItemStates, self).__init__()
+        self._store_class = store_class
         self.reset()
 
     def clear_all_item_states(self):
-        removed_item_state_keys = self._item_states.keys()
+        removed_item_state_keys = self._item_states.keys() + self._encoded_item_states.keys()
         self.reset()
         self._removed_item_state_keys = removed_item_state_keys
 
     def reset(self):
         # The actual cached data
         self._item_states = {}
+        # Item states loaded from disk which have not been accessed yet
+        self._encoded_item_states = {}
         self._item_state_prefix = ()
-        self._last_mtime = None  # timestamp of last modification
         self._removed_item_state_keys = []
         self._updated_item_states = {}
+        self._store = self._store_class()
 
     def load(self, hostname):
         filename = cmk.utils.paths.counters_dir + "/" + hostname
         try:
-            # TODO: refactoring. put these two values into a named tuple
-            self._item_states = cmk.utils.store.load_data_from_file(filename, default={}, lock=True)
-            self._last_mtime = os.stat(filename).st_mtime
+            self._item_states, self._encoded_item_states = self._store.load(filename)
         finally:
             cmk.utils.store.release_lock(filename)
 
-    # TODO: self._last_mtime needs be updated accordingly after the save_data_to_file operation
-    #       right now, the current mechanism is sufficient enough, since the save() function is only
-    #       called as the final operation, just before the lifecycle of the CachedItemState ends
     def save(self, hostname):
         """ The job of the save function is to update the item state on disk.
         It simply returns, if it detects that the data wasn't changed at all since the last loading
-        If the data on disk has been changed in the meantime, the cached data is updated from disk.
-        Afterwards only the actual modifications (update/remove) are applied to the updated cached
-        data before it is written back to disk.
+        If the data on disk has been changed in the meantime, the modifications (update/remove)
+        are applied to the data on disk, the modifications of others are kept.
         """
         filename = cmk.utils.paths.counters_dir + "/" + hostname
         if not self._removed_item_state_keys and not self._updated_item_states:
@@ -113,21 +287,9 @@ class CachedItemStates(object):
                 os.makedirs(cmk.utils.paths.counters_dir)
 
             cmk.utils.store.aquire_lock(filename)
-            last_mtime = os.stat(filename).st_mtime
-            if last_mtime != self._last_mtime:
-                self._item_states = cmk.utils.store.load_data_from_file(filename, default={})
-
-                # Remove obsolete keys
-                for key in self._removed_item_state_keys:
-                    try:
-                        del self._item_states[key]
-                    except KeyError:
-                        pass
-
-                # Add updated keys
-                self._item_states.update(self._updated_item_states)
-
-            cmk.utils.store.save_data_to_file(filename, self._item_states, pretty=False)
+            self._store.save(filename, self._updated_item_states, self._removed_item_state_keys,
+                             self._item_states,
+                             len(self._item_states) + len(self._encoded_item_states))
         except Exception:
             raise MKGeneralException("Cannot write to %s: %s" % (filename, traceback.format_exc()))
         finally:
@@ -142,22 +304,37 @@ class CachedItemStates(object):
             self.remove_full_key(key)
 
     def remove_full_key(self, full_key):
+        self._removed_item_state_keys.append(full_key)
+        self._item_states.pop(full_key, None)
+        self._encoded_item_states.pop(full_key, None)
+
+    def get_item_state(self, user_key, default=None):
+        key = self.get_unique_item_state_key(user_key)
+        return self._get_item_state(key, default)
+
+    def _get_item_state(self, key, default):
         try:
-            self._removed_item_state_keys.append(full_key)
-            del self._item_states[full_key]
+            return self._item_states[key]
         except KeyError:
             pass
 
-    def get_item_state(self, user_key, default=None):
-        key = self.get_unique_item_state_key(user_key)
-        return self._item_states.get(key, default)
+        try:
+            encoded_value = self._encoded_item_states.pop(key)
+        except KeyError:
+            return default
+
+        value = self._item_states[key] = self._store.decode(encoded_value)
+        return value
 
     def set_item_state(self, user_key, state):
         key = self.get_unique_item_state_key(user_key)
+        self._encoded_item_states.pop(key, None)
         self._item_states[key] = state
         self._updated_item_states[key] = state
 
     def get_all_item_states(self):
+        for key in self._encoded_item_states.keys():
+            self._get_item_state(key, None)
         return self._item_states
 
     def get_item_state_prefix(self):
@@ -38,6 +38,7 @@ from cmk.utils.exceptions import MKBailOut
 
 import cmk_base.data_sources as data_sources
 import cmk_base.console as console
+import cmk_base.cpu_tracking as cpu_tracking
 import cmk_base.config as config
 import cmk_base.discovery as discovery
 import cmk_base.autochecks as autochecks
@@ -182,6 +183,18 @@ modes.register_general_option(
     ))
 
 
+def option_sampling_profile():
+    profiling.enable_sampling()
+
+
+modes.register_general_option(
+    Option(
+        long_option="sampling-profile",
+        short_help="Enable sampling profiler (writes profile.folded)",
+        handler_function=option_sampling_profile,
+    ))
+
+
 def option_fake_dns(a):
     ip_lookup.enforce_fake_dns(a)
 
@@ -564,6 +577,60 @@ modes.register(
         short_help="List all pathnames and directories",
     ))
 
+#.
+#   .--cpu-tracking-report-------------------------------------------------.
+#   |                            ___ _ __  _   _                           |
+#   |                           / __| '_ \| | | |                          |
+#   |                          | (__| |_) | |_| |                          |
+#   |                           \___| .__/ \__,_|                          |
+#   |                               |_|                                    |
+#   |                                                                      |
+#   '----------------------------------------------------------------------'
+
+
+def mode_cpu_tracking_report(args):
+    try:
+        top = int(args[0]) if args else 10
+    except ValueError:
+        raise MKBailOut("Invalid number of entries: %s" % args[0])
+
+    top_hosts, top_plugins = cpu_tracking.rank_host_stats(cpu_tracking.load_host_stats(), top)
+    if not top_hosts:
+        console.output("No CPU tracking statistics found in %s\n" %
+                       cpu_tracking.stats_file_path())
+        return
+
+    console.output("%sTop %d hosts%s\n" % (tty.bold, top, tty.normal))
+    console.output("%-40s %8s %12s %12s\n" % ("Host", "Checks", "Wall (s)", "CPU (s)"))
+    for hostname, count, wall_time, cpu_time in top_hosts:
+        console.output("%-40s %8d %12.3f %12.3f\n" % (hostname, count, wall_time, cpu_time))
+
+    console.output("\n%sTop %d data sources and plugins%s\n" % (tty.bold, top, tty.normal))
+    console.output("%-8s %-31s %8s %12s %12s\n" % ("Kind", "Name", "Calls", "Wall (s)",
+                                                   "CPU (s)"))
+    for kind, name, count, wall_time, cpu_time in top_plugins:
+        console.output("%-8s %-31s %8d %12.3f %12.3f\n" %
+                       (kind, name, count, wall_time, cpu_time))
+
+
+modes.register(
+    Mode(
+        long_option="cpu-tracking-report",
+        handler_function=mode_cpu_tracking_report,
+        argument=True,
+        argument_descr="N",
+        argument_optional=True,
+        needs_config=False,
+        short_help="Show the hosts and plugins using most CPU time",
+        long_help=[
+            "Ranks the hosts, data sources, parse functions and check functions "
+            "of the site by the CPU time they used during the checks. The data is "
+            "read from the statistics written by the check helpers "
+            "(see option cpu_tracking_stats). Shows the top 10 entries of each "
+            "list by default."
+        ],
+    ))
+
 #.
 #   .--backup/restore------------------------------------------------------.
 #   |      _                _                  __             _            |
@@ -1557,6 +1624,9 @@ def mode_check(options, args):
         if "keepalive-fd" in options:
             keepalive.set_keepalive_fd(options["keepalive-fd"])
 
+        # SIGUSR2 toggles the sampling profiler of the running helper
+        profiling.install_sampling_toggle()
+
         keepalive.do_check_keepalive()
         return
 
@@ -27,6 +27,7 @@
 import errno
 import os
 import tempfile
+import time
 
 import cmk.utils.paths
 import cmk.utils.translations
@@ -64,21 +65,32 @@ def get_piggyback_raw_data(piggyback_max_cachefile_age, hostname):
 
 def get_source_and_piggyback_hosts():
     """Generates all piggyback pig/piggybacked host pairs that have up-to-date data"""
-    # Pylint bug (https://github.com/PyCQA/pylint/issues/1660). Fixed with pylint 2.x
-    for piggyback_dir in cmk.utils.paths.piggyback_dir.glob("*"):  # pylint: disable=no-member
-        piggybacked_host = piggyback_dir.name
+    index = _get_source_index()
+    piggybacked_hosts = set(index.piggybacked_hosts())
+    if index.has_legacy_sources():
+        # Pylint bug (https://github.com/PyCQA/pylint/issues/1660). Fixed with pylint 2.x
+        piggybacked_hosts.update(
+            d.name for d in cmk.utils.paths.piggyback_dir.glob("*"))  # pylint: disable=no-member
+
+    for piggybacked_host in piggybacked_hosts:
         for source_host, _piggyback_file_path in get_piggyback_files(
                 cmk_base.config.piggyback_max_cachefile_age, piggybacked_host):
             yield source_host, piggybacked_host
 
 
 def has_piggyback_raw_data(piggyback_max_cachefile_age, hostname):
-    return get_piggyback_files(piggyback_max_cachefile_age, hostname) != []
+    return any(
+        os.path.exists(piggyback_file_path) for _source_host, piggyback_file_path in
+        get_piggyback_files(piggyback_max_cachefile_age, hostname))
 
 
 def get_piggyback_files(piggyback_max_cachefile_age, hostname):
     """Gather a list of piggyback files to read for further processing.
 
+    The piggyback files are looked up in the index of the piggyback sources. The
+    files themselves are not accessed, so the returned files may have vanished
+    in the meantime.
+
     Please note that there may be multiple parallel calls executing the
     get_piggyback_files(), store_piggyback_raw_data() or cleanup_piggyback_files()
     functions. Therefor all these functions needs to deal with suddenly vanishing or
@@ -86,53 +98,154 @@ def get_piggyback_files(piggyback_max_cachefile_age, hostname):
     """
     files = []
     host_piggyback_dir = cmk.utils.paths.piggyback_dir / hostname
+    index = _get_source_index()
+    now = time.time()
 
-    # cleanup_piggyback_files() may remove stale piggyback files of one source
-    # host and also the directory "hostname" when the last piggyback file for the
-    # current host was removed. This may cause the os.listdir() to fail. We treat
-    # this as regular case: No piggyback files for the current host.
-    try:
-        source_host_names = [e.name for e in host_piggyback_dir.iterdir()]
-    except OSError as e:
-        if e.errno == errno.ENOENT:
-            return files
-        else:
-            raise
-
-    for source_host in source_host_names:
-        if source_host.startswith("."):
-            continue
-
+    for source_host, stored_at in index.sources_of(hostname):
         piggyback_file_path = host_piggyback_dir / source_host
 
-        try:
-            file_age = cmk_base.utils.cachefile_age(str(piggyback_file_path))
-        except MKGeneralException:
-            continue  # File might've been deleted. That's ok.
-
         # Skip piggyback files that are outdated at all
+        file_age = now - stored_at
         if file_age > piggyback_max_cachefile_age:
             console.verbose(
                 "Piggyback file %s is outdated (%d seconds too old). Skip processing.\n" %
                 (piggyback_file_path, file_age - piggyback_max_cachefile_age))
             continue
 
-        status_file_path = _piggyback_source_status_path(source_host)
-        if not os.path.exists(status_file_path):
-            console.verbose(
-                "Piggyback file %s is outdated (Source not sending piggyback). Skip processing.\n" %
-                piggyback_file_path)
-            continue
+        files.append((source_host, str(piggyback_file_path)))
 
-        if _is_piggyback_file_outdated(status_file_path, str(piggyback_file_path)):
-            console.verbose(
-                "Piggyback file %s is outdated (Not updated by source). Skip processing.\n" %
-                piggyback_file_path)
+    for source_host in index.legacy_sources():
+        piggyback_file_path = host_piggyback_dir / source_host
+        if _is_legacy_piggyback_file_usable(piggyback_max_cachefile_age, piggyback_file_path,
+                                            source_host):
+            files.append((source_host, str(piggyback_file_path)))
+
+    return files
+
+
+def _is_legacy_piggyback_file_usable(piggyback_max_cachefile_age, piggyback_file_path,
+                                     source_host):
+    """Check a piggyback file of a source having a status file without index
+
+    These status files have been written by previous versions. The mtime of the
+    files has to be compared."""
+    try:
+        file_age = cmk_base.utils.cachefile_age(str(piggyback_file_path))
+    except MKGeneralException:
+        return False  # File might've been deleted or never existed. That's ok.
+
+    # Skip piggyback files that are outdated at all
+    if file_age > piggyback_max_cachefile_age:
+        console.verbose("Piggyback file %s is outdated (%d seconds too old). Skip processing.\n" %
+                        (piggyback_file_path, file_age - piggyback_max_cachefile_age))
+        return False
+
+    status_file_path = _piggyback_source_status_path(source_host)
+    if not os.path.exists(status_file_path):
+        console.verbose(
+            "Piggyback file %s is outdated (Source not sending piggyback). Skip processing.\n" %
+            piggyback_file_path)
+        return False
+
+    if _is_piggyback_file_outdated(status_file_path, str(piggyback_file_path)):
+        console.verbose("Piggyback file %s is outdated (Not updated by source). Skip processing.\n"
+                        % piggyback_file_path)
+        return False
+
+    return True
+
+
+#.
+#   .--Source index--------------------------------------------------------.
+#   |      ____                                _           _               |
+#   |     / ___|  ___  _   _ _ __ ___ ___    (_)_ __   __| | _____  __    |
+#   |     \___ \ / _ \| | | | '__/ __/ _ \   | | '_ \ / _` |/ _ \ \/ /    |
+#   |      ___) | (_) | |_| | | | (_|  __/   | | | | | (_| |  __/>  <     |
+#   |     |____/ \___/ \__,_|_|  \___\___|   |_|_| |_|\__,_|\___/_/\_\    |
+#   |                                                                      |
+#   +----------------------------------------------------------------------+
+#   | The status file of each piggyback source lists the piggybacked hosts |
+#   | of the last data received from the source (one host per line). The  |
+#   | status files are replaced atomically, so the directory of the status |
+#   | files only changes when a source stores new data or stops sending.   |
+#   | The index built from all status files is kept until the directory    |
+#   | changes.                                                             |
+#   '----------------------------------------------------------------------'
+
+
+class _SourceIndex(object):
+    def __init__(self, dir_mtime):
+        super(_SourceIndex, self).__init__()
+        self.dir_mtime = dir_mtime
+        self.built_at = time.time()
+        # piggybacked host -> list of (source host, time the data was stored)
+        self._sources_of = {}
+        # Sources having an empty status file written by previous versions
+        self._legacy_sources = []
+
+    def add_source(self, source_host, stored_at, piggybacked_hosts):
+        if not piggybacked_hosts:
+            self._legacy_sources.append(source_host)
+            return
+
+        for piggybacked_host in piggybacked_hosts:
+            self._sources_of.setdefault(piggybacked_host, []).append((source_host, stored_at))
+
+    def sources_of(self, piggybacked_host):
+        return self._sources_of.get(piggybacked_host, [])
+
+    def piggybacked_hosts(self):
+        return self._sources_of.keys()
+
+    def legacy_sources(self):
+        return self._legacy_sources
+
+    def has_legacy_sources(self):
+        return bool(self._legacy_sources)
+
+    def is_up_to_date(self, dir_mtime):
+        # In case the directory was changed shortly before the index has been built,
+        # further changes in the same mtime granularity would not be detected
+        if dir_mtime is None:
+            return self.dir_mtime is None
+        return dir_mtime == self.dir_mtime and self.built_at - dir_mtime > 1.0
+
+
+_source_index = None
+
+
+def _get_source_index():
+    global _source_index
+
+    base_dir = str(cmk.utils.paths.piggyback_source_dir)
+    try:
+        dir_mtime = os.stat(base_dir).st_mtime
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        dir_mtime = None
+
+    if _source_index is not None and _source_index.is_up_to_date(dir_mtime):
+        return _source_index
+
+    index = _SourceIndex(dir_mtime)
+    for source_host in os.listdir(base_dir) if dir_mtime is not None else []:
+        if source_host[0] == ".":
             continue
 
-        files.append((source_host, str(piggyback_file_path)))
+        try:
+            with open(os.path.join(base_dir, source_host)) as f:
+                stored_at = os.fstat(f.fileno()).st_mtime
+                piggybacked_hosts = f.read().split()
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                continue  # Removed in the meantime. That's ok.
+            raise
 
-    return files
+        index.add_source(source_host, stored_at, piggybacked_hosts)
+
+    _source_index = index
+    return index
 
 
 def _is_piggyback_file_outdated(status_file_path, piggyback_file_path):
@@ -199,7 +312,10 @@ def _store_status_file_of(status_file_path, piggyback_file_paths):
                                      delete=False) as tmp:
         tmp_path = tmp.name
         os.chmod(tmp_path, 0o660)
-        tmp.write("")
+        # The index of the piggybacked hosts of this source (see _get_source_index())
+        tmp.write("".join("%s\n" % os.path.basename(os.path.dirname(p))
+                          for p in sorted(piggyback_file_paths)))
+        tmp.flush()
 
         tmp_stats = os.stat(tmp_path)
         status_file_times = (tmp_stats.st_atime, tmp_stats.st_mtime)
@@ -266,7 +382,7 @@ def _cleanup_old_piggybacked_files(piggyback_max_cachefile_age):
     """
     keep_sources = set(os.listdir(str(cmk.utils.paths.piggyback_source_dir)))
 
-    base_dir = os.path.join(cmk.utils.paths.tmp_dir, "piggyback")
+    base_dir = str(cmk.utils.paths.piggyback_dir)
     for backed_host_name in os.listdir(base_dir):
         if backed_host_name[0] == ".":
             continue
@@ -302,6 +418,17 @@ def _shall_cleanup_piggyback_file(piggyback_max_cachefile_age, piggyback_file_pa
     if source_host_name not in keep_sources:
         return "Source not sending piggyback data"
 
+    index = _get_source_index()
+    if source_host_name not in index.legacy_sources():
+        piggybacked_host = os.path.basename(os.path.dirname(piggyback_file_path))
+        for source_host, stored_at in index.sources_of(piggybacked_host):
+            if source_host == source_host_name:
+                file_age = time.time() - stored_at
+                if file_age > piggyback_max_cachefile_age:
+                    return "%d seconds too old" % (file_age - piggyback_max_cachefile_age)
+                return None
+        return "Not updated by source"
+
     try:
         file_age = cmk_base.utils.cachefile_age(piggyback_file_path)
     except MKGeneralException:
@@ -36,6 +36,11 @@ import cmk.utils.log
 import cmk.utils.defines as defines
 import cmk.utils.prediction
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 logger = cmk.utils.log.get_logger(__name__)
 
 
@@ -127,11 +132,15 @@ def time_slices(timestamp, horizon, period_info, timegroup):
     return slices
 
 
-def retrieve_grouped_data_from_rrd(rrd_column, time_windows):
-    "Collect all time slices and up-sample them to same resolution"
+def _fetch_slices(rrd_column, time_windows):
     from_time = time_windows[0][0]
+    return [(ts, from_time - start)
+            for ts, (start, _end) in zip(rrd_column(time_windows), time_windows)]
 
-    slices = [(rrd_column(start, end), from_time - start) for start, end in time_windows]
+
+def retrieve_grouped_data_from_rrd(rrd_column, time_windows):
+    "Collect all time slices and up-sample them to same resolution"
+    slices = _fetch_slices(rrd_column, time_windows)
 
     # The resolutions of the different time ranges differ. We upsample
     # to the best resolution. We assume that the youngest slice has the
@@ -140,6 +149,14 @@ def retrieve_grouped_data_from_rrd(rrd_column, time_windows):
     return twindow, [ts.bfill_upsample(twindow, shift) for ts, shift in slices]
 
 
+def retrieve_grouped_data_matrix_from_rrd(rrd_column, time_windows):
+    """Same as retrieve_grouped_data_from_rrd, but returns the up-sampled slices
+    as rows of a float array holding NaN for missing values"""
+    slices = _fetch_slices(rrd_column, time_windows)
+    twindow = slices[0][0].twindow
+    return twindow, np.vstack([ts.bfill_upsample_array(twindow, shift) for ts, shift in slices])
+
+
 def data_stats(slices):
     "Statistically summarize all the upsampled RRD data"
 
@@ -161,10 +178,46 @@ def data_stats(slices):
     return descriptors
 
 
+def data_stats_of_matrix(matrix):
+    """Statistically summarize the up-sampled RRD data of all slices at once
+
+    The rows of the matrix are the slices, NaN marks missing values. The
+    operations are the ones of data_stats and stdev, applied column wise in
+    the same order, so the results are the very same floats."""
+    present = ~np.isnan(matrix)
+    samples = present.sum(axis=0)
+
+    # Reducing along the first axis adds up the rows one after the other,
+    # just like sum() does with the points of a time column. Squares are
+    # computed with the ufunc, which uses pow() like p**2 in Python does;
+    # the array operator would multiply and may differ in the last digit.
+    total = np.where(present, matrix, 0.0).sum(axis=0)
+    squares = np.where(present, np.power(matrix, 2.0), 0.0).sum(axis=0)
+    minimum = np.where(present, matrix, np.inf).min(axis=0)
+    maximum = np.where(present, matrix, -np.inf).max(axis=0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        average = total / samples
+        deviation = np.sqrt(np.abs(squares - np.power(average, 2.0) * samples) / (samples - 1))
+    deviation = np.where(samples == 1, np.abs(average), deviation)
+
+    descriptors = np.column_stack((average, minimum, maximum, deviation)).tolist()
+    for index in np.flatnonzero(samples == 0):
+        descriptors[index] = [None, None, None, None]
+    return descriptors
+
+
 def calculate_data_for_prediction(time_windows, rrd_datacolumn):
-    twindow, slices = retrieve_grouped_data_from_rrd(rrd_datacolumn, time_windows)
+    """Compute the prediction data of the given time windows
 
-    descriptors = data_stats(slices)
+    rrd_datacolumn fetches the TimeSeries of a list of time windows, see
+    cmk.utils.prediction.rrd_datacolumn_of_windows."""
+    if np is None:
+        twindow, slices = retrieve_grouped_data_from_rrd(rrd_datacolumn, time_windows)
+        descriptors = data_stats(slices)
+    else:
+        twindow, matrix = retrieve_grouped_data_matrix_from_rrd(rrd_datacolumn, time_windows)
+        descriptors = data_stats_of_matrix(matrix)
 
     return {
         u"columns": [u"average", u"min", u"max", u"stdev"],
@@ -244,8 +297,8 @@ def get_levels(hostname, service_description, dsname, params, cf, levels_factor=
 
         time_windows = time_slices(now, int(params["horizon"] * 86400), period_info, timegroup)
 
-        rrd_datacolumn = cmk.utils.prediction.rrd_datacolum(hostname, service_description, dsname,
-                                                            cf)
+        rrd_datacolumn = cmk.utils.prediction.rrd_datacolumn_of_windows(
+            hostname, service_description, dsname, cf)
 
         data_for_pred = calculate_data_for_prediction(time_windows, rrd_datacolumn)
 
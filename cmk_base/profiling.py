@@ -24,14 +24,25 @@
 # to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
 # Boston, MA 02110-1301 USA.
 
+import errno
 import os
+import signal
 import sys
+import time
+from typing import Dict, Optional  # pylint: disable=unused-import
+
+import cmk.utils.paths
 
 import cmk_base.console as console
+import cmk_base.cpu_tracking as cpu_tracking
+import cmk_base.check_api_utils as check_api_utils
 
 _profile = None
 _profile_path = "profile.out"
 
+_sampler = None  # type: Optional[StackSampler]
+_samples_path = "profile.folded"
+
 
 def enable():
     global _profile
@@ -46,6 +57,9 @@ def enabled():
 
 
 def output_profile():
+    if _sampler:
+        _output_samples(_samples_path)
+
     if not _profile:
         return
 
@@ -65,3 +79,134 @@ def output_profile():
 
     console.output("Profile '%s' written. Please run %s.\n" % (_profile_path, show_profile),
                    stream=sys.stderr)
+
+
+class StackSampler(object):
+    """Low overhead sampling profiler
+
+    The stack of the main thread is sampled each time the process has used
+    up the given interval of CPU time (ITIMER_PROF / SIGPROF). The samples
+    are counted in the collapsed stack format used by flamegraph.pl, one
+    "frame;frame;... count" line per distinct stack. The stacks are prefixed
+    with the host currently being checked and the data source, parse or check
+    function currently tracked by cpu_tracking."""
+
+    # Stacks are cut off after this number of frames (counted from the leaf)
+    max_depth = 100
+
+    def __init__(self, interval=0.005):
+        # type: (float) -> None
+        self._interval = interval
+        self._samples = {}  # type: Dict[str, int]
+        self._labels = {}  # type: Dict[object, str]
+        self._running = False
+
+    def start(self):
+        # type: () -> None
+        signal.signal(signal.SIGPROF, self._sample)
+        # Sampling must not make blocking system calls fail with EINTR
+        signal.siginterrupt(signal.SIGPROF, False)
+        signal.setitimer(signal.ITIMER_PROF, self._interval, self._interval)
+        self._running = True
+
+    def stop(self):
+        # type: () -> None
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_IGN)
+        self._running = False
+
+    def is_running(self):
+        # type: () -> bool
+        return self._running
+
+    def samples(self):
+        # type: () -> Dict[str, int]
+        return self._samples
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = "%s:%s" % (os.path.basename(
+                    code.co_filename), code.co_name)
+            stack.append(label)
+            frame = frame.f_back
+
+        stack.extend(self._context_tags())
+        key = ";".join(reversed(stack))
+        self._samples[key] = self._samples.get(key, 0) + 1
+
+    def _context_tags(self):
+        tags = []
+        if cpu_tracking.current_record is not None:
+            tags.append("%s:%s" % cpu_tracking.current_record)
+        try:
+            tags.append("host:%s" % check_api_utils.host_name())
+        except RuntimeError:
+            pass
+        return tags
+
+    def write(self, path):
+        # type: (str) -> None
+        with open(path, "w") as f:
+            for stack, count in sorted(self._samples.iteritems()):
+                f.write("%s %d\n" % (stack, count))
+
+
+def enable_sampling(interval=0.005):
+    # type: (float) -> None
+    global _sampler
+    _sampler = StackSampler(interval)
+    _sampler.start()
+    console.verbose("Enabled sampling profiler.\n")
+
+
+def sampling_enabled():
+    # type: () -> bool
+    return _sampler is not None and _sampler.is_running()
+
+
+def _output_samples(path):
+    # type: (str) -> None
+    global _sampler
+    if _sampler is None:
+        return
+
+    _sampler.stop()
+    _sampler.write(path)
+    _sampler = None
+    console.output("Samples '%s' written. Render them with flamegraph.pl.\n" % path,
+                   stream=sys.stderr)
+
+
+def sampling_profile_path():
+    # type: () -> str
+    return os.path.join(cmk.utils.paths.var_dir, "profiling",
+                        "check_mk-%d-%d.folded" % (os.getpid(), time.time()))
+
+
+def install_sampling_toggle(signum=signal.SIGUSR2):
+    # type: (int) -> None
+    """Makes the given signal toggle the sampling profiler of this process
+
+    This is used by long running processes like the keepalive check helpers.
+    The first signal starts sampling, the next one writes the samples to
+    var/check_mk/profiling/ and stops sampling."""
+    signal.signal(signum, _toggle_sampling)
+    signal.siginterrupt(signum, False)
+
+
+def _toggle_sampling(signum, stack_frame):
+    if not sampling_enabled():
+        enable_sampling()
+        return
+
+    path = sampling_profile_path()
+    try:
+        os.makedirs(os.path.dirname(path))
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    _output_samples(path)
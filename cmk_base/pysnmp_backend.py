@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2014             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+
+"""SNMP backend that talks SNMP in the Check_MK process using PySNMP
+
+Other than the classic SNMP backend, which executes one net-snmp command per
+OID, this backend keeps one SNMP session per host and sends the requests
+itself. The columns of a table are walked together: Each GETBULK (or GETNEXT)
+request carries the next OIDs of all columns which are not completely walked
+yet.
+"""
+
+import socket
+from typing import Dict, List, Optional, Tuple  # pylint: disable=unused-import
+
+from pyasn1.type import univ
+from pysnmp.entity.engine import SnmpEngine
+from pysnmp.error import PySnmpError
+import pysnmp.proto.errind as errind
+import pysnmp.hlapi.asyncore as hlapi
+import pysnmp.proto.rfc1902 as rfc1902
+import pysnmp.proto.rfc1905 as rfc1905
+
+from cmk.utils.exceptions import MKGeneralException
+
+import cmk_base.console as console
+import cmk_base.snmp_utils as snmp_utils
+from cmk_base.exceptions import MKSNMPError
+
+# The SNMP engine is expensive to create. It is shared by all sessions.
+_snmp_engine = None  # type: Optional[SnmpEngine]
+# One session per host (and SNMP settings of this host)
+_sessions = {}  # type: Dict[Tuple, _SNMPSession]
+
+
+def cleanup_sessions():
+    # type: () -> None
+    _sessions.clear()
+
+
+def _get_snmp_engine():
+    # type: () -> SnmpEngine
+    global _snmp_engine
+    if _snmp_engine is None:
+        _snmp_engine = SnmpEngine()
+    return _snmp_engine
+
+
+def _get_session(snmp_config, context_name):
+    # type: (snmp_utils.SNMPHostConfig, Optional[str]) -> _SNMPSession
+    key = (snmp_config.hostname, snmp_config.ipaddress, snmp_config.port,
+           snmp_config.credentials, snmp_config.is_bulkwalk_host,
+           snmp_config.is_snmpv2or3_without_bulkwalk_host, snmp_config.bulk_walk_size_of,
+           tuple(sorted(snmp_config.timing.items())), context_name)
+    try:
+        return _sessions[key]
+    except KeyError:
+        session = _sessions[key] = _SNMPSession(_get_snmp_engine(), snmp_config, context_name)
+        return session
+
+
+class PySNMPBackend(snmp_utils.ABCSNMPBackend):
+    def get(self, snmp_config, oid, context_name=None):
+        # type: (snmp_utils.SNMPHostConfig, str, Optional[str]) -> Optional[str]
+        session = _get_session(snmp_config, context_name)
+
+        try:
+            if oid.endswith(".*"):
+                oid_prefix = oid[:-2]
+                name, value = session.get_next([oid_prefix])[0]
+
+                # In case of .*, check if prefix is the one we are looking for
+                if name is None or not name.startswith(oid_prefix + "."):
+                    return None
+            else:
+                value = session.get([oid])[0][1]
+
+        except _NoSuchName:
+            return None
+        except MKSNMPError as e:
+            console.verbose("%s\n" % e)
+            return None
+
+        console.vverbose("SNMP answer: ==> [%s]\n" % value)
+        return value
+
+    def walk(self, snmp_config, oid, check_plugin_name=None, table_base_oid=None,
+             context_name=None):
+        # type: (snmp_utils.SNMPHostConfig, str, Optional[str], Optional[str], Optional[str]) -> snmp_utils.SNMPRowInfo
+        return self.walk_many(snmp_config, [oid], check_plugin_name, table_base_oid,
+                              context_name)[oid]
+
+    def walk_many(self, snmp_config, oids, check_plugin_name=None, table_base_oid=None,
+                  context_name=None):
+        # type: (snmp_utils.SNMPHostConfig, List[str], Optional[str], Optional[str], Optional[str]) -> Dict[str, snmp_utils.SNMPRowInfo]
+        session = _get_session(snmp_config, context_name)
+        console.vverbose("Walking %s (%d OIDs per request)\n" %
+                         (", ".join(oids), session.max_repetitions))
+        return session.walk(oids)
+
+
+class _SNMPSession(object):
+    """The SNMP settings and transport of a single host"""
+    def __init__(self, snmp_engine, snmp_config, context_name):
+        # type: (SnmpEngine, snmp_utils.SNMPHostConfig, Optional[str]) -> None
+        super(_SNMPSession, self).__init__()
+        self._snmp_engine = snmp_engine
+        self._ipaddress = snmp_config.ipaddress
+        self._port = snmp_config.port
+        self._auth_data = self._get_auth_data(snmp_config)
+        self._transport_target = self._get_transport_target(snmp_config)
+        self._context_data = hlapi.ContextData(contextName=context_name or "")
+
+        # SNMPv1 and hosts not supporting bulk walks are walked with GETNEXT
+        if snmp_config.is_bulkwalk_host:
+            self.max_repetitions = snmp_config.bulk_walk_size_of
+        else:
+            self.max_repetitions = 1
+        self._use_bulk = snmp_config.is_bulkwalk_host
+
+    def _get_auth_data(self, snmp_config):
+        credentials = snmp_config.credentials
+        if not snmp_utils.is_snmpv3_host(snmp_config):
+            if snmp_config.is_bulkwalk_host or snmp_config.is_snmpv2or3_without_bulkwalk_host:
+                mp_model = 1
+            else:
+                mp_model = 0
+            return hlapi.CommunityData(credentials, mpModel=mp_model)
+
+        if len(credentials) == 6:
+            return hlapi.UsmUserData(credentials[2],
+                                     authKey=credentials[3],
+                                     authProtocol=_auth_protocol(credentials[1]),
+                                     privKey=credentials[5],
+                                     privProtocol=_priv_protocol(credentials[4]))
+        elif len(credentials) == 4:
+            return hlapi.UsmUserData(credentials[2],
+                                     authKey=credentials[3],
+                                     authProtocol=_auth_protocol(credentials[1]))
+        elif len(credentials) == 2:
+            return hlapi.UsmUserData(credentials[1])
+
+        raise MKGeneralException("Invalid SNMP credentials '%r' for host %s: must be "
+                                 "string, 2-tuple, 4-tuple or 6-tuple" %
+                                 (credentials, snmp_config.hostname))
+
+    def _get_transport_target(self, snmp_config):
+        # Use the defaults of the net-snmp command line tools
+        timeout = snmp_config.timing.get("timeout", 1)
+        retries = snmp_config.timing.get("retries", 5)
+        address = (snmp_config.ipaddress, snmp_config.port)
+        try:
+            if snmp_config.is_ipv6_primary:
+                return hlapi.Udp6TransportTarget(address, timeout=timeout, retries=retries)
+            return hlapi.UdpTransportTarget(address, timeout=timeout, retries=retries)
+        except PySnmpError as e:
+            raise MKSNMPError("SNMP Error on %s: Unknown host (%s)" % (snmp_config.ipaddress, e))
+
+    def get(self, oids):
+        # type: (List[str]) -> List[Tuple[Optional[str], Optional[str]]]
+        return self._request(hlapi.getCmd, oids)[0]
+
+    def get_next(self, oids):
+        # type: (List[str]) -> List[Tuple[Optional[str], Optional[str]]]
+        return self._request(hlapi.nextCmd, oids)[0]
+
+    def walk(self, oids):
+        # type: (List[str]) -> Dict[str, snmp_utils.SNMPRowInfo]
+        """Walk all given OIDs at the same time"""
+        rowinfos = {oid: [] for oid in oids}  # type: Dict[str, snmp_utils.SNMPRowInfo]
+        # The OID of each column to continue with
+        next_oids = {oid: oid for oid in oids}
+
+        while next_oids:
+            columns = sorted(next_oids)
+            try:
+                if self._use_bulk:
+                    table = self._request(hlapi.bulkCmd, [next_oids[c] for c in columns], 0,
+                                          self.max_repetitions)
+                else:
+                    table = self._request(hlapi.nextCmd, [next_oids[c] for c in columns])
+            except _NoSuchName as e:
+                # SNMPv1: One of the columns reached the end of the MIB
+                del next_oids[columns[e.index]]
+                continue
+
+            for column_index, column in enumerate(columns):
+                if not self._add_column_rows(column, column_index, table, rowinfos[column],
+                                             next_oids):
+                    del next_oids[column]
+
+        # Like snmpwalk: Get the requested OID itself in case there is no subtree
+        empty_columns = [oid for oid, rowinfo in rowinfos.iteritems() if not rowinfo]
+        if empty_columns:
+            for oid, value in self._get_values(empty_columns):
+                if value is not None:
+                    rowinfos[oid].append((oid, value))
+
+        return rowinfos
+
+    def _add_column_rows(self, column, column_index, table, rowinfo, next_oids):
+        """Add the values of a single column of the response table
+
+        Returns False in case the end of the column has been reached."""
+        prefix = column + "."
+        start_oid = next_oids[column]
+        last_oid = _oid_to_tuple(start_oid)
+        for row in table:
+            if column_index >= len(row):
+                break
+
+            oid, value = row[column_index]
+            if oid is None or not oid.startswith(prefix):
+                return False
+
+            # Stop in case the agent is responding in a loop
+            current_oid = _oid_to_tuple(oid)
+            if current_oid <= last_oid:
+                console.vverbose("OID not increasing: %s\n" % oid)
+                return False
+
+            last_oid = current_oid
+            next_oids[column] = oid
+            if value is not None:
+                rowinfo.append((oid, value))
+
+        # No progress: Don't ask again for this column
+        return next_oids[column] != start_oid
+
+    def _get_values(self, oids):
+        # type: (List[str]) -> List[Tuple[str, Optional[str]]]
+        values = []
+        while oids:
+            try:
+                values += zip(oids, [value for _name, value in self.get(oids)])
+                break
+            except _NoSuchName as e:
+                # SNMPv1: Retry without the missing OID
+                values.append((oids[e.index], None))
+                oids = oids[:e.index] + oids[e.index + 1:]
+        return values
+
+    def _request(self, command, oids, *args):
+        """Send a single request and wait for the response
+
+        Returns the table of (oid, value) pairs. GET and GETNEXT requests result in a
+        single row, GETBULK requests may result in multiple rows."""
+        result = {}
+
+        def callback(snmp_engine, send_request_handle, error_indication, error_status,
+                     error_index, var_binds, cb_ctx):
+            result["error_indication"] = error_indication
+            result["error_status"] = error_status
+            result["error_index"] = error_index
+            result["var_binds"] = var_binds
+
+        command(self._snmp_engine,
+                self._auth_data,
+                self._transport_target,
+                self._context_data,
+                *(args + tuple((rfc1902.ObjectName(oid.lstrip(".")), rfc1902.Null(""))
+                               for oid in oids)),
+                cbFun=callback,
+                lookupMib=False)
+        self._snmp_engine.transportDispatcher.runDispatcher()
+
+        error_indication = result["error_indication"]
+        if isinstance(error_indication, errind.RequestTimedOut):
+            # Same message as the net-snmp commands
+            raise MKSNMPError("SNMP Error on %s: Timeout: No Response from %s:%d" %
+                              (self._ipaddress, self._ipaddress, self._port))
+        elif error_indication:
+            raise MKSNMPError("SNMP Error on %s: %s" % (self._ipaddress, error_indication))
+
+        error_status = result["error_status"]
+        if error_status:
+            if int(error_status) == 2 and result["error_index"]:
+                raise _NoSuchName(int(result["error_index"]) - 1)
+            raise MKSNMPError("SNMP Error on %s: %s" % (self._ipaddress, error_status.prettyPrint()))
+
+        var_binds = result["var_binds"]
+        if command is hlapi.getCmd:
+            var_binds = [var_binds]
+
+        return [[_convert_var_bind(name, value) for name, value in row] for row in var_binds]
+
+
+class _NoSuchName(Exception):
+    """Raised for SNMPv1 noSuchName errors with the index of the affected OID"""
+    def __init__(self, index):
+        super(_NoSuchName, self).__init__(index)
+        self.index = index
+
+
+def _auth_protocol(proto_name):
+    if proto_name == "md5":
+        return hlapi.usmHMACMD5AuthProtocol
+    if proto_name == "sha":
+        return hlapi.usmHMACSHAAuthProtocol
+    raise MKGeneralException("Invalid SNMP auth protocol: %s" % proto_name)
+
+
+def _priv_protocol(proto_name):
+    if proto_name == "DES":
+        return hlapi.usmDESPrivProtocol
+    if proto_name == "AES":
+        return hlapi.usmAesCfb128Protocol
+    raise MKGeneralException("Invalid SNMP priv protocol: %s" % proto_name)
+
+
+def _oid_to_tuple(oid):
+    # type: (str) -> Tuple[int, ...]
+    return tuple(int(p) for p in oid.strip(".").split("."))
+
+
+#.
+#   .--Value conversion----------------------------------------------------.
+#   |    __     __    _                                                    |
+#   |    \ \   / /_ _| |_   _  ___    ___ ___  _ ____   __                 |
+#   |     \ \ / / _` | | | | |/ _ \  / __/ _ \| '_ \ \ / /                 |
+#   |      \ V / (_| | | |_| |  __/ | (_| (_) | | | \ V /                  |
+#   |       \_/ \__,_|_|\__,_|\___|  \___\___/|_| |_|\_/                   |
+#   |                                                                      |
+#   +----------------------------------------------------------------------+
+#   | The values are converted to the strings the classic SNMP backend     |
+#   | produces from the output of the net-snmp command line tools.         |
+#   '----------------------------------------------------------------------'
+
+_NO_VALUE_TYPES = (univ.Null, rfc1905.NoSuchObject, rfc1905.NoSuchInstance,
+                   rfc1905.EndOfMibView)
+
+# The characters net-snmp prints in octet strings without converting them to hex
+_PRINTABLE = set(chr(c) for c in range(32, 127)) | set("\t\n\r\x0b\x0c")
+
+
+def _convert_var_bind(name, value):
+    # type: (rfc1902.ObjectName, object) -> Tuple[Optional[str], Optional[str]]
+    if isinstance(value, rfc1905.EndOfMibView):
+        return None, None
+    return "." + str(name), _convert_value(value)
+
+
+def _convert_value(value):
+    # type: (object) -> Optional[str]
+    if isinstance(value, _NO_VALUE_TYPES):
+        return None
+
+    if isinstance(value, rfc1902.IpAddress):
+        return socket.inet_ntoa(value.asOctets())
+
+    if isinstance(value, univ.ObjectIdentifier):
+        return "." + str(value)
+
+    if isinstance(value, univ.OctetString):
+        octets = value.asOctets()
+        if all(c in _PRINTABLE for c in octets):
+            return octets.strip()
+        return octets
+
+    return str(int(value))
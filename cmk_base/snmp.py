@@ -24,9 +24,10 @@
 # to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
 # Boston, MA 02110-1301 USA.
 
+import collections
 import os
 import subprocess
-from typing import Tuple, Optional, Any, Dict, List  # pylint: disable=unused-import
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple  # pylint: disable=unused-import
 
 import cmk.utils.debug
 import cmk.utils.tty as tty
@@ -37,8 +38,10 @@ import cmk_base.utils
 import cmk_base.config as config
 import cmk_base.console as console
 import cmk_base.classic_snmp as classic_snmp
+import cmk_base.pysnmp_backend as pysnmp_backend
 import cmk_base.ip_lookup as ip_lookup
 import cmk_base.agent_simulator
+import cmk_base.snmp_cache as snmp_cache
 from cmk_base.exceptions import MKSNMPError
 import cmk_base.cleanup
 import cmk_base.snmp_utils as snmp_utils
@@ -96,13 +99,24 @@ def write_single_oid_cache(snmp_config):
     cache_path = "%s/%s.%s" % (cache_dir, snmp_config.hostname, snmp_config.ipaddress)
     store.save_data_to_file(cache_path, _g_single_oid_cache, pretty=False)
 
+    _shared_cache(snmp_config.hostname).save()
+
 
 def set_single_oid_cache(snmp_config, oid, value):
     _g_single_oid_cache[oid] = value
 
 
 def _is_in_single_oid_cache(snmp_config, oid):
-    return oid in _g_single_oid_cache
+    if oid in _g_single_oid_cache:
+        return True
+
+    # Use the values fetched by other processes in the last minutes
+    shared_cache = _shared_cache(snmp_config.hostname)
+    key = _single_oid_key(snmp_config, oid)
+    if key in shared_cache:
+        _g_single_oid_cache[oid] = shared_cache.get(key)
+        return True
+    return False
 
 
 def _get_oid_from_single_oid_cache(snmp_config, oid):
@@ -121,6 +135,8 @@ def cleanup_host_caches():
     global _g_walk_cache
     _g_walk_cache = {}
     _clear_other_hosts_oid_cache(None)
+    snmp_cache.cleanup_host_caches()
+    pysnmp_backend.cleanup_sessions()
     if inline_snmp:
         inline_snmp.cleanup_inline_snmp_globals()
 
@@ -161,13 +177,16 @@ def create_snmp_host_config(hostname):
 
 
 # TODO: OID_END_OCTET_STRING is not used at all. Drop it.
-def get_snmp_table(snmp_config, check_plugin_name, oid_info, use_snmpwalk_cache):
+def get_snmp_table(snmp_config, check_plugin_name, oid_info, use_snmpwalk_cache, walk_cache=None):
     # oid_info is either ( oid, columns ) or
     # ( oid, suboids, columns )
     # suboids is a list if OID-infixes that are put between baseoid
     # and the columns and also prefixed to the index column. This
     # allows to merge distinct SNMP subtrees with a similar structure
     # to one virtual new tree (look into cmctc_temp for an example)
+    #
+    # The walk_cache is an optional dictionary of already walked OIDs
+    # (see get_snmp_tables()).
     if len(oid_info) == 2:
         oid, targetcolumns = oid_info
         suboids = [None]
@@ -206,14 +225,25 @@ def get_snmp_table(snmp_config, check_plugin_name, oid_info, use_snmpwalk_cache)
                         "You can only use one of OID_END, OID_STRING, OID_BIN, OID_END_BIN and OID_END_OCTET_STRING."
                     )
                 index_column = colno
-                columns.append((fetchoid, [], "string"))
+                columns.append((fetchoid, column, "string"))
                 index_format = column
                 continue
 
-            rowinfo = _get_snmpwalk(snmp_config, check_plugin_name, oid, fetchoid, column,
-                                    use_snmpwalk_cache)
+            columns.append((fetchoid, column, value_encoding))
+
+        # Fetch all columns together (in case the backend supports this)
+        rowinfos = _get_snmpwalks(snmp_config, check_plugin_name, oid, [
+            (fetchoid, column) for colno, (fetchoid, column, value_encoding) in enumerate(columns)
+            if colno != index_column
+        ], use_snmpwalk_cache, walk_cache)
 
-            columns.append((fetchoid, rowinfo, value_encoding))
+        for colno, (fetchoid, column, value_encoding) in enumerate(columns):
+            if colno == index_column:
+                columns[colno] = (fetchoid, [], value_encoding)
+                continue
+
+            rowinfo = rowinfos[fetchoid]
+            columns[colno] = (fetchoid, rowinfo, value_encoding)
             number_of_rows = len(rowinfo)
             if number_of_rows > max_len:
                 max_len = number_of_rows
@@ -306,6 +336,8 @@ def get_single_oid(snmp_config, oid, check_plugin_name=None, do_snmp_scan=True):
 
     if value is not None:
         console.vverbose("%s%s%s%s\n" % (tty.bold, tty.green, value, tty.normal))
+        _shared_cache(snmp_config.hostname).set(_single_oid_key(snmp_config, oid), value,
+                                                config.snmp_cache_single_oid_ttl)
     else:
         console.vverbose("failed.\n")
 
@@ -323,6 +355,9 @@ class SNMPBackendFactory(object):
         if snmp_config.is_inline_snmp_host:
             return inline_snmp.InlineSNMPBackend()
 
+        if config.use_pysnmp_backend:
+            return pysnmp_backend.PySNMPBackend()
+
         return classic_snmp.ClassicSNMPBackend()
 
 
@@ -455,6 +490,205 @@ def enforce_use_stored_walks():
     _enforce_stored_walks = True
 
 
+#.
+#   .--Fetch planning------------------------------------------------------.
+#   |        _____    _       _               _                            |
+#   |       |  ___|__| |_ ___| |__    _ __ | | __ _ _ __  _ __           |
+#   |       | |_ / _ \ __/ __| '_ \  | '_ \| |/ _` | '_ \| '_ \          |
+#   |       |  _|  __/ || (__| | | | | |_) | | (_| | | | | | | |         |
+#   |       |_|  \___|\__\___|_| |_| | .__/|_|\__,_|_| |_|_| |_|         |
+#   |                                |_|                                   |
+#   +----------------------------------------------------------------------+
+#   | Fetch the tables of multiple check plugins of a host together. The   |
+#   | columns of all tables are collected and only the OIDs not being part |
+#   | of the subtree of another requested OID are walked.                  |
+#   '----------------------------------------------------------------------'
+
+SNMPWalkStats = NamedTuple("SNMPWalkStats", [
+    ("requested", int),
+    ("cached", int),
+    ("executed", int),
+])
+
+
+def get_snmp_tables(snmp_config, table_requests, use_snmpwalk_cache):
+    # type: (snmp_utils.SNMPHostConfig, List[Tuple[str, Any]], bool) -> Tuple[List[Any], SNMPWalkStats]
+    """Fetch the tables of multiple check plugins at once
+
+    The table_requests is a list of check plugin names together with one
+    table specification (see get_snmp_table()). Overlapping and identical
+    walks of the tables are only executed once.
+
+    Returns the tables in the order of the requests together with statistics
+    about the executed walks."""
+    plan = _SNMPFetchPlan(snmp_config, use_snmpwalk_cache)
+    for check_plugin_name, oid_info in table_requests:
+        plan.add_table(check_plugin_name, oid_info)
+
+    plan.execute()
+
+    tables = [
+        get_snmp_table(snmp_config, check_plugin_name, oid_info, use_snmpwalk_cache,
+                       plan.walk_cache_of(check_plugin_name))
+        for check_plugin_name, oid_info in table_requests
+    ]
+    return tables, plan.stats()
+
+
+class _SNMPFetchPlan(object):
+    def __init__(self, snmp_config, use_snmpwalk_cache):
+        # type: (snmp_utils.SNMPHostConfig, bool) -> None
+        super(_SNMPFetchPlan, self).__init__()
+        self._snmp_config = snmp_config
+        self._use_snmpwalk_cache = use_snmpwalk_cache
+        self._groups = {}  # type: Dict[Tuple, _SNMPWalkGroup]
+        self._num_requested = 0
+        self._num_cached = 0
+        self._num_executed = 0
+
+    def _group_key(self, check_plugin_name):
+        # type: (str) -> Tuple
+        """Walks can only be shared between check plugins using the same SNMP settings"""
+        if snmp_utils.is_snmpv3_host(self._snmp_config):
+            key = tuple(_snmpv3_contexts_of(self._snmp_config, check_plugin_name))  # type: Tuple
+        else:
+            key = (None,)
+
+        # The OID ranges to fetch may be limited per check plugin
+        if self._snmp_config.oid_range_limits:
+            key += (check_plugin_name,)
+
+        return key
+
+    def _group_of(self, check_plugin_name):
+        # type: (str) -> _SNMPWalkGroup
+        key = self._group_key(check_plugin_name)
+        try:
+            return self._groups[key]
+        except KeyError:
+            group = self._groups[key] = _SNMPWalkGroup(check_plugin_name)
+            return group
+
+    def add_table(self, check_plugin_name, oid_info):
+        # type: (str, Any) -> None
+        if len(oid_info) == 2:
+            oid, targetcolumns = oid_info
+            suboids = [None]  # type: List[Any]
+        else:
+            oid, suboids, targetcolumns = oid_info
+
+        group = self._group_of(check_plugin_name)
+        group.base_oids.add(oid)
+
+        for suboid in suboids:
+            for column in targetcolumns:
+                if column in [
+                        snmp_utils.OID_END, snmp_utils.OID_STRING, snmp_utils.OID_BIN,
+                        snmp_utils.OID_END_BIN, snmp_utils.OID_END_OCTET_STRING
+                ]:
+                    continue  # Index columns are not fetched
+
+                fetchoid = _compute_fetch_oid(oid, suboid, column)[0]
+                group.add_walk(fetchoid, _is_snmpwalk_cachable(column))
+                self._num_requested += 1
+
+    def execute(self):
+        # type: () -> None
+        for group in self._groups.itervalues():
+            num_cached, num_executed = group.execute(self._snmp_config, self._use_snmpwalk_cache)
+            self._num_cached += num_cached
+            self._num_executed += num_executed
+        _shared_cache(self._snmp_config.hostname).save()
+
+    def walk_cache_of(self, check_plugin_name):
+        # type: (str) -> Dict[str, snmp_utils.SNMPRowInfo]
+        return self._group_of(check_plugin_name).walk_cache
+
+    def stats(self):
+        # type: () -> SNMPWalkStats
+        return SNMPWalkStats(self._num_requested, self._num_cached, self._num_executed)
+
+
+class _SNMPWalkGroup(object):
+    """The walks that are executed with the same SNMP settings"""
+    def __init__(self, check_plugin_name):
+        # type: (str) -> None
+        super(_SNMPWalkGroup, self).__init__()
+        # Check plugin used to execute the walks of this group
+        self._check_plugin_name = check_plugin_name
+        self.base_oids = set()  # type: Set[str]
+        self.walk_cache = {}  # type: Dict[str, snmp_utils.SNMPRowInfo]
+        # Whether or not all and any of the requests of an OID are cachable. The
+        # walks are executed in the order of the requests.
+        self._walks = collections.OrderedDict()  # type: Dict[str, Tuple[bool, bool]]
+
+    def add_walk(self, fetchoid, is_cachable):
+        # type: (str, bool) -> None
+        all_cachable, any_cachable = self._walks.get(fetchoid, (True, False))
+        self._walks[fetchoid] = (all_cachable and is_cachable, any_cachable or is_cachable)
+
+    def execute(self, snmp_config, use_snmpwalk_cache):
+        # type: (snmp_utils.SNMPHostConfig, bool) -> Tuple[int, int]
+        """Walk the OIDs of this group
+
+        Returns the number of OIDs taken from the walk cache and the number
+        of executed walks."""
+        to_walk = collections.OrderedDict()  # type: Dict[str, bool]
+        for fetchoid, (all_cachable, any_cachable) in self._walks.iteritems():
+            # Only use the walk cache in case no one requested current data
+            if all_cachable and use_snmpwalk_cache:
+                rowinfo = _get_cached_snmpwalk(snmp_config.hostname, fetchoid)
+                if rowinfo is not None:
+                    self.walk_cache[fetchoid] = rowinfo
+                    continue
+            to_walk[fetchoid] = any_cachable
+
+        num_cached = len(self._walks) - len(to_walk)
+        if not to_walk:
+            return num_cached, 0
+
+        covering_oids = _covering_oids(to_walk)
+        table_base_oid = list(self.base_oids)[0] if len(self.base_oids) == 1 else None
+        walked = _perform_snmpwalks(snmp_config, self._check_plugin_name, table_base_oid,
+                                    _unique([covering_oids[oid] for oid in to_walk]))
+
+        for fetchoid, is_cachable in to_walk.iteritems():
+            covering_oid = covering_oids[fetchoid]
+            if covering_oid == fetchoid:
+                rowinfo = walked[fetchoid]
+            else:
+                rowinfo = _subtree_rows(walked[covering_oid], fetchoid)
+
+            self.walk_cache[fetchoid] = rowinfo
+            if is_cachable:
+                _save_snmpwalk_cache(snmp_config.hostname, fetchoid, rowinfo)
+
+        return num_cached, len(walked)
+
+
+def _covering_oids(oids):
+    # type: (Iterable[str]) -> Dict[str, str]
+    """Map each OID to the OID of the given OIDs whose subtree contains it"""
+    covering_oids = {}
+    covering_oid = None
+    for oid in sorted(oids, key=lambda o: _oid_to_intlist(o.lstrip("."))):
+        if covering_oid is None or not oid.startswith(covering_oid + "."):
+            covering_oid = oid
+        covering_oids[oid] = covering_oid
+    return covering_oids
+
+
+def _subtree_rows(rowinfo, oid):
+    # type: (snmp_utils.SNMPRowInfo, str) -> snmp_utils.SNMPRowInfo
+    """Extract the rows a walk of the given OID would result in"""
+    prefix = oid + "."
+    rows = [row for row in rowinfo if row[0].startswith(prefix)]
+    if rows:
+        return rows
+    # Like snmpwalk: Walking a leaf OID results in the leaf itself
+    return [row for row in rowinfo if row[0] == oid]
+
+
 #.
 #   .--SNMP helpers--------------------------------------------------------.
 #   |     ____  _   _ __  __ ____    _          _                          |
@@ -524,25 +758,47 @@ def _snmpv3_contexts_of(snmp_config, check_plugin_name):
     return [None]
 
 
-def _get_snmpwalk(snmp_config, check_plugin_name, oid, fetchoid, column, use_snmpwalk_cache):
-    is_cachable = _is_snmpwalk_cachable(column)
-    rowinfo = None
-    if is_cachable and use_snmpwalk_cache:
-        # Returns either the cached SNMP walk or None when nothing is cached
-        rowinfo = _get_cached_snmpwalk(snmp_config.hostname, fetchoid)
+def _get_snmpwalks(snmp_config,
+                   check_plugin_name,
+                   oid,
+                   fetch_columns,
+                   use_snmpwalk_cache,
+                   walk_cache=None):
+    """Returns the rows of the given columns
+
+    The fetch_columns is a list of the fetch OIDs of the columns together
+    with the column specification. Returns a dictionary from fetch OID to the
+    walked rows."""
+    rowinfos = {}
+    to_walk = []
+    for fetchoid, column in fetch_columns:
+        if walk_cache is not None and fetchoid in walk_cache:
+            rowinfos[fetchoid] = walk_cache[fetchoid]
+            continue
 
-    if rowinfo is None:
-        rowinfo = _perform_snmpwalk(snmp_config, check_plugin_name, oid, fetchoid)
+        if _is_snmpwalk_cachable(column) and use_snmpwalk_cache:
+            # Returns either the cached SNMP walk or None when nothing is cached
+            rowinfo = _get_cached_snmpwalk(snmp_config.hostname, fetchoid)
+            if rowinfo is not None:
+                rowinfos[fetchoid] = rowinfo
+                continue
+        to_walk.append((fetchoid, column))
 
-        if is_cachable:
-            _save_snmpwalk_cache(snmp_config.hostname, fetchoid, rowinfo)
+    if to_walk:
+        walked = _perform_snmpwalks(snmp_config, check_plugin_name, oid,
+                                    [fetchoid for fetchoid, _column in to_walk])
+        for fetchoid, column in to_walk:
+            rowinfos[fetchoid] = walked[fetchoid]
+            if _is_snmpwalk_cachable(column):
+                _save_snmpwalk_cache(snmp_config.hostname, fetchoid, walked[fetchoid])
+        _shared_cache(snmp_config.hostname).save()
 
-    return rowinfo
+    return rowinfos
 
 
-def _perform_snmpwalk(snmp_config, check_plugin_name, base_oid, fetchoid):
-    added_oids = set([])
-    rowinfo = []
+def _perform_snmpwalks(snmp_config, check_plugin_name, base_oid, fetchoids):
+    added_oids = {fetchoid: set([]) for fetchoid in fetchoids}
+    rowinfos = {fetchoid: [] for fetchoid in fetchoids}
     if snmp_utils.is_snmpv3_host(snmp_config):
         snmp_contexts = _snmpv3_contexts_of(snmp_config, check_plugin_name)
     else:
@@ -552,29 +808,41 @@ def _perform_snmpwalk(snmp_config, check_plugin_name, base_oid, fetchoid):
         snmp_backend = SNMPBackendFactory().factory(snmp_config,
                                                     enforce_stored_walks=_enforce_stored_walks)
 
-        rows = snmp_backend.walk(snmp_config,
-                                 fetchoid,
-                                 check_plugin_name=check_plugin_name,
-                                 table_base_oid=base_oid,
-                                 context_name=context_name)
-
-        # I've seen a broken device (Mikrotik Router), that broke after an
-        # update to RouterOS v6.22. It would return 9 time the same OID when
-        # .1.3.6.1.2.1.1.1.0 was being walked. We try to detect these situations
-        # by removing any duplicate OID information
-        if len(rows) > 1 and rows[0][0] == rows[1][0]:
-            console.vverbose("Detected broken SNMP agent. Ignoring duplicate OID %s.\n" %
-                             rows[0][0])
-            rows = rows[:1]
-
-        for row_oid, val in rows:
-            if row_oid in added_oids:
-                console.vverbose("Duplicate OID found: %s (%s)\n" % (row_oid, val))
-            else:
-                rowinfo.append((row_oid, val))
-                added_oids.add(row_oid)
+        walked = snmp_backend.walk_many(snmp_config,
+                                        _unique(fetchoids),
+                                        check_plugin_name=check_plugin_name,
+                                        table_base_oid=base_oid,
+                                        context_name=context_name)
+
+        for fetchoid, rows in walked.iteritems():
+            # I've seen a broken device (Mikrotik Router), that broke after an
+            # update to RouterOS v6.22. It would return 9 time the same OID when
+            # .1.3.6.1.2.1.1.1.0 was being walked. We try to detect these situations
+            # by removing any duplicate OID information
+            if len(rows) > 1 and rows[0][0] == rows[1][0]:
+                console.vverbose("Detected broken SNMP agent. Ignoring duplicate OID %s.\n" %
+                                 rows[0][0])
+                rows = rows[:1]
+
+            for row_oid, val in rows:
+                if row_oid in added_oids[fetchoid]:
+                    console.vverbose("Duplicate OID found: %s (%s)\n" % (row_oid, val))
+                else:
+                    rowinfos[fetchoid].append((row_oid, val))
+                    added_oids[fetchoid].add(row_oid)
+
+    return rowinfos
+
 
-    return rowinfo
+def _unique(oids):
+    # type: (List[str]) -> List[str]
+    seen = set()  # type: Set[str]
+    unique = []
+    for oid in oids:
+        if oid not in seen:
+            seen.add(oid)
+            unique.append(oid)
+    return unique
 
 
 def _compute_fetch_oid(oid, suboid, column):
@@ -695,26 +963,40 @@ def _is_snmpwalk_cachable(column):
     return isinstance(column, tuple) and column[0] == "cached"
 
 
+def _shared_cache(hostname):
+    # type: (str) -> snmp_cache.SNMPCache
+    return snmp_cache.host_cache(hostname, config.snmp_cache_max_size)
+
+
+def _single_oid_key(snmp_config, oid):
+    # type: (snmp_utils.SNMPHostConfig, str) -> Tuple[str, Optional[str], str]
+    return ("oid", snmp_config.ipaddress, oid)
+
+
 def _get_cached_snmpwalk(hostname, fetchoid):
-    path = _snmpwalk_cache_path(hostname, fetchoid)
     try:
-        console.vverbose("  Loading %s from walk cache %s\n" % (fetchoid, path))
-        return store.load_data_from_file(path)
+        rowinfo = _shared_cache(hostname).get(("walk", fetchoid))
+        if rowinfo is not None:
+            console.vverbose("  Loading %s from walk cache\n" % fetchoid)
+            return rowinfo
+
+        # Walk cache files of previous versions are taken over into the shared cache
+        path = _snmpwalk_cache_path(hostname, fetchoid)
+        rowinfo = store.load_data_from_file(path)
+        if rowinfo is not None:
+            console.vverbose("  Loading %s from walk cache %s\n" % (fetchoid, path))
+            _save_snmpwalk_cache(hostname, fetchoid, rowinfo)
+        return rowinfo
     except Exception:
         if cmk.utils.debug.enabled():
             raise
-        console.verbose("  Failed loading walk cache. Continue without it.\n" % path)
+        console.verbose("  Failed loading walk cache. Continue without it.\n")
         return None
 
 
 def _save_snmpwalk_cache(hostname, fetchoid, rowinfo):
-    path = _snmpwalk_cache_path(hostname, fetchoid)
-
-    if not os.path.exists(os.path.dirname(path)):
-        os.makedirs(os.path.dirname(path))
-
-    console.vverbose("  Saving walk of %s to walk cache %s\n" % (fetchoid, path))
-    store.save_data_to_file(path, rowinfo, pretty=False)
+    console.vverbose("  Saving walk of %s to walk cache\n" % fetchoid)
+    _shared_cache(hostname).set(("walk", fetchoid), rowinfo, config.snmp_cache_walk_ttl)
 
 
 def _snmpwalk_cache_path(hostname, fetchoid):
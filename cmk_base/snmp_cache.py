@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+# +------------------------------------------------------------------+
+# |             ____ _               _        __  __ _  __           |
+# |            / ___| |__   ___  ___| | __   |  \/  | |/ /           |
+# |           | |   | '_ \ / _ \/ __| |/ /   | |\/| | ' /            |
+# |           | |___| | | |  __/ (__|   <    | |  | | . \            |
+# |            \____|_| |_|\___|\___|_|\_\___|_|  |_|_|\_\           |
+# |                                                                  |
+# | Copyright Mathias Kettner 2014             mk@mathias-kettner.de |
+# +------------------------------------------------------------------+
+#
+# This file is part of Check_MK.
+# The official homepage is at http://mathias-kettner.de/check_mk.
+#
+# check_mk is free software;  you can redistribute it and/or modify it
+# under the  terms of the  GNU General Public License  as published by
+# the Free Software Foundation in version 2.  check_mk is  distributed
+# in the hope that it will be useful, but WITHOUT ANY WARRANTY;  with-
+# out even the implied warranty of  MERCHANTABILITY  or  FITNESS FOR A
+# PARTICULAR PURPOSE. See the  GNU General Public License for more de-
+# tails. You should have  received  a copy of the  GNU  General Public
+# License along with GNU Make; see the file  COPYING.  If  not,  write
+# to the Free Software Foundation, Inc., 51 Franklin St,  Fifth Floor,
+# Boston, MA 02110-1301 USA.
+"""Cache of SNMP data shared by all processes of a site
+
+The results of single OID requests (mostly done by the SNMP scan) and the
+walks of cachable OIDs are stored per host in one marshal file below
+var/check_mk/snmp_shared_cache. Discovery, inventory and checking of a device
+in different processes reuse these values instead of fetching them again.
+
+Each entry has an optional time to live. The size of the cache of a host is
+limited: When it is exceeded, the least recently used entries are dropped.
+Reading needs no lock, because the files are replaced atomically. Writing
+locks the file, merges the changes of this process into the current file
+content and replaces the file.
+"""
+
+import errno
+import marshal
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple  # pylint: disable=unused-import
+
+import cmk.utils.paths
+import cmk.utils.store as store
+
+_CACHE_VERSION = 1
+
+# Entries: key -> [stored at, expires at (or None), last used, size, value]
+_Entries = Dict[Any, List]  # pylint: disable=invalid-name
+
+_host_caches = {}  # type: Dict[str, SNMPCache]
+
+
+def host_cache(hostname, max_size):
+    # type: (str, int) -> SNMPCache
+    """Returns the shared SNMP cache of the given host
+
+    The cache objects are kept until cleanup_host_caches() is called."""
+    cache = _host_caches.get(hostname)
+    if cache is None:
+        cache = _host_caches[hostname] = SNMPCache(hostname, max_size)
+    return cache
+
+
+def cleanup_host_caches():
+    # type: () -> None
+    _host_caches.clear()
+
+
+def _cache_path(hostname):
+    # type: (str) -> str
+    return os.path.join(cmk.utils.paths.var_dir, "snmp_shared_cache", hostname)
+
+
+class SNMPCache(object):
+    """The shared SNMP cache of a single host
+
+    The file is read once when the cache is accessed first. Changes are kept
+    in memory until save() is called."""
+    def __init__(self, hostname, max_size):
+        # type: (str, int) -> None
+        super(SNMPCache, self).__init__()
+        self._path = _cache_path(hostname)
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = None  # type: Optional[_Entries]
+        self._changed = {}  # type: _Entries
+        self._used = {}  # type: Dict[Any, float]
+
+    def get(self, key, default=None):
+        # type: (Any, Any) -> Any
+        now = time.time()
+        with self._lock:
+            entry = self._get_entries().get(key)
+            if entry is None or _is_expired(entry, now):
+                return default
+            self._used[key] = now
+            return entry[4]
+
+    def __contains__(self, key):
+        # type: (Any) -> bool
+        with self._lock:
+            entry = self._get_entries().get(key)
+            return entry is not None and not _is_expired(entry, time.time())
+
+    def set(self, key, value, ttl=None):
+        # type: (Any, Any, Optional[int]) -> None
+        """Add or update an entry which is valid for ttl seconds (None: forever)"""
+        try:
+            size = len(marshal.dumps(value))
+        except ValueError:
+            return  # Not marshalable. Simply don't cache it.
+
+        now = time.time()
+        entry = [now, None if ttl is None else now + ttl, now, size, value]
+        with self._lock:
+            self._get_entries()[key] = entry
+            self._changed[key] = entry
+
+    def save(self):
+        # type: () -> None
+        """Merge the changes of this process into the cache file"""
+        with self._lock:
+            if not self._changed:
+                return
+
+            store.makedirs(os.path.dirname(self._path))
+            store.aquire_lock(self._path)
+            try:
+                entries = _read_entries(self._path)
+                entries.update(self._changed)
+                for key, last_used in self._used.iteritems():
+                    entry = entries.get(key)
+                    if entry is not None and entry[2] < last_used:
+                        entry[2] = last_used
+                _evict(entries, self._max_size, time.time())
+                store.save_file(self._path, marshal.dumps((_CACHE_VERSION, entries)))
+            finally:
+                store.release_lock(self._path)
+
+            self._entries = entries
+            self._changed.clear()
+            self._used.clear()
+
+    def _get_entries(self):
+        # type: () -> _Entries
+        if self._entries is None:
+            self._entries = _read_entries(self._path)
+        return self._entries
+
+
+def _read_entries(path):
+    # type: (str) -> _Entries
+    try:
+        with open(path, "rb") as f:
+            version, entries = marshal.load(f)
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return {}
+    except (EOFError, ValueError, TypeError):
+        return {}  # Empty (e.g. just created by locking) or broken file
+
+    if version != _CACHE_VERSION:
+        return {}
+    return entries
+
+
+def _is_expired(entry, now):
+    # type: (List, float) -> bool
+    return entry[1] is not None and entry[1] < now
+
+
+def _evict(entries, max_size, now):
+    # type: (_Entries, int, float) -> None
+    """Drop the expired entries and the least recently used entries exceeding max_size"""
+    for key, entry in entries.items():
+        if _is_expired(entry, now):
+            del entries[key]
+
+    size = sum(entry[3] for entry in entries.itervalues())
+    if size <= max_size:
+        return
+
+    for key, entry in sorted(entries.iteritems(), key=lambda e: e[1][2]):
+        del entries[key]
+        size -= entry[3]
+        if size <= max_size:
+            break
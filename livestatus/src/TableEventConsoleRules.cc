@@ -33,6 +33,10 @@ TableEventConsoleRules::TableEventConsoleRules(MonitoringCore *mc)
 
     addColumn(std::make_unique<IntEventConsoleColumn>(
         "rule_hits", "The times rule matched an incoming message"));
+
+    addColumn(std::make_unique<IntEventConsoleColumn>(
+        "rule_evaluations",
+        "The times the conditions of the rule were evaluated for an incoming message"));
 }
 
 std::string TableEventConsoleRules::name() const { return "eventconsolerules"; }
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+"""Compare the agent output parser with the previous line based implementation
+
+Usage:
+
+    python tests/benchmarks/bench_agent_parser.py [-n ROUNDS] [AGENT_OUTPUT_FILE...]
+
+The script needs to be executed in a site context (as site user).
+Without files a synthetic agent output is generated. In a site the recorded
+agent outputs can be found in var/check_mk/cache (e.g. var/check_mk/cache/*).
+
+For each file the time needed to parse the output and the time needed to parse
+and access all sections is reported for both parsers. Both results are compared
+to ensure the new parser produces the same sections.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+# pylint: disable=wrong-import-position
+import cmk_base.config as config
+from cmk_base.data_sources.agent_parser import parse_agent_data
+
+
+def legacy_parse_info(hostname, lines):
+    """The line based parser implementation of CheckMKAgentDataSource._parse_info()
+    as it was before the introduction of cmk_base.data_sources.agent_parser"""
+    sections = {}
+    piggybacked_raw_data = {}
+    persisted_sections = {}
+    host = None
+    section_content = []
+    section_options = {}
+    agent_cache_info = {}
+    separator = None
+    encoding = None
+    for line in lines:
+        line = line.rstrip("\r")
+        stripped_line = line.strip()
+        if stripped_line[:4] == '<<<<' and stripped_line[-4:] == '>>>>':
+            host = stripped_line[4:-4]
+            if not host:
+                host = None
+            else:
+                host = config.translate_piggyback_host(hostname, host)
+                if host == hostname:
+                    host = None
+                if host:
+                    host = host.replace(" ", "_")
+
+        elif host:
+            piggybacked_raw_data.setdefault(host, []).append(line)
+
+        elif stripped_line[:3] == '<<<' and stripped_line[-3:] == '>>>':
+            section_header = stripped_line[3:-3]
+            headerparts = section_header.split(":")
+            section_name = headerparts[0]
+            section_options = {}
+            for o in headerparts[1:]:
+                opt_parts = o.split("(")
+                opt_name = opt_parts[0]
+                if len(opt_parts) > 1:
+                    opt_args = opt_parts[1][:-1]
+                else:
+                    opt_args = None
+                section_options[opt_name] = opt_args
+
+            section_content = sections.get(section_name, None)
+            if section_content is None:
+                section_content = []
+                sections[section_name] = section_content
+            try:
+                separator = chr(int(section_options["sep"]))
+            except Exception:
+                separator = None
+
+            if "persist" in section_options:
+                until = int(section_options["persist"])
+                cached_at = int(time.time())
+                cache_interval = int(until - cached_at)
+                agent_cache_info[section_name] = (cached_at, cache_interval)
+                persisted_sections[section_name] = (cached_at, until, section_content)
+
+            if "cached" in section_options:
+                agent_cache_info[section_name] = tuple(
+                    map(int, section_options["cached"].split(",")))
+
+            encoding = section_options.get("encoding")
+
+        elif stripped_line != '':
+            if "nostrip" not in section_options:
+                line = stripped_line
+
+            if encoding:
+                line = config.decode_incoming_string(line, encoding)
+            else:
+                line = config.decode_incoming_string(line)
+
+            section_content.append(line.split(separator))
+
+    return sections, agent_cache_info, piggybacked_raw_data, persisted_sections
+
+
+def synthetic_agent_output():
+    lines = ["<<<check_mk>>>", "Version: 1.7.0i1", "AgentOS: linux"]
+    lines += ["<<<df>>>"]
+    lines += ["/dev/sda%d ext4 100 50 50 50%% /mnt/%d" % (i, i) for i in range(2000)]
+    lines += ["<<<lnx_if:sep(58)>>>"]
+    lines += ["eth%d: 1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 16" % i for i in range(2000)]
+    lines += ["<<<ps>>>"]
+    lines += ["(root,1,2,0.0) /usr/bin/some/process --with --many args %d" % i for i in range(20000)]
+    lines += ["<<<logwatch:nostrip>>>"]
+    lines += ["W  some log message number %d \r" % i for i in range(10000)]
+    for vm in range(200):
+        lines += ["<<<<vm%d>>>>" % vm, "<<<esx_vsphere_vm>>>"]
+        lines += ["key%d value" % i for i in range(50)]
+    lines += ["<<<<>>>>"]
+    return "\n".join(lines) + "\n"
+
+
+def _access_all(sections):
+    for section_name in sections.keys():
+        sections[section_name]  # pylint: disable=pointless-statement
+
+
+def benchmark(title, raw_data, rounds):
+    hostname = "benchhost"
+
+    legacy = legacy_parse_info(hostname, raw_data.split("\n"))
+    current = parse_agent_data(hostname, raw_data)
+    if (legacy[0] != current.sections or legacy[1] != current.cache_info or
+            legacy[2] != current.piggybacked_raw_data):
+        raise SystemExit("%s: The parsers produced different results" % title)
+
+    timings = [
+        ("legacy parse", lambda: legacy_parse_info(hostname, raw_data.split("\n"))),
+        ("parse", lambda: parse_agent_data(hostname, raw_data)),
+        ("parse + access all", lambda: _access_all(parse_agent_data(hostname, raw_data).sections)),
+        ("parse + access check_mk",
+         lambda: parse_agent_data(hostname, raw_data).sections.get("check_mk")),
+    ]
+
+    print("%s (%.2f MB)" % (title, len(raw_data) / 1024.0 / 1024.0))
+    for name, func in timings:
+        duration = min(timeit.repeat(func, number=1, repeat=rounds))
+        print("  %-26s %8.2f ms" % (name, duration * 1000))
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-n", "--rounds", type=int, default=5)
+    parser.add_argument("files", nargs="*", metavar="AGENT_OUTPUT_FILE")
+    options = parser.parse_args(args)
+
+    # Piggyback host translation depends on the site configuration, which is
+    # not loaded here. Both parsers are measured with the same translation.
+    config.translate_piggyback_host = lambda sourcehost, backedhost: backedhost
+
+    if not options.files:
+        benchmark("synthetic", synthetic_agent_output(), options.rounds)
+
+    for path in options.files:
+        with open(path) as f:
+            benchmark(path, f.read(), options.rounds)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+"""Measure the stages of the check pipeline by replaying recorded host data
+
+Usage:
+
+    python tests/benchmarks/bench_check_pipeline.py [-n ROUNDS] [--agent-simulator]
+        [--save-baseline FILE] [--baseline FILE] [--max-regression PERCENT] [HOST...]
+
+The script needs to be executed in a site context (as site user). It loads the
+site configuration and checks the given hosts (default: all active non cluster
+hosts) without contacting them: the agent outputs are read from the cache files
+in tmp/check_mk/cache (see "cmk --cache") and the SNMP data is read from the
+stored walks in var/check_mk/snmpwalks (see "cmk --snmpwalk"). Counters are
+loaded but never saved and no piggyback data is written. The check results are
+written to check result files in a temporary directory.
+
+The time of these stages is reported:
+
+    load checks       loading the check plugins
+    load config       loading the configuration
+    fetch             reading the raw data of the data sources
+    parse info        splitting agent outputs into sections (_parse_info)
+    parse functions   the parse functions of the check plugins
+    check functions   the check functions of the check plugins
+    submission        formatting and writing the check results
+
+Together with the throughput in hosts per second and the peak RSS of the process
+the results can be saved as a baseline. When a baseline is given, the results
+are compared with it and the script exits with 1 if a stage got slower by more
+than the given percentage.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+# pylint: disable=wrong-import-position
+import cmk.utils.paths
+import cmk_base.check_api as check_api
+import cmk_base.check_api_utils as check_api_utils
+import cmk_base.check_table as check_table
+import cmk_base.checking as checking
+import cmk_base.config as config
+import cmk_base.cpu_tracking as cpu_tracking
+import cmk_base.data_sources as data_sources
+import cmk_base.ip_lookup as ip_lookup
+import cmk_base.item_state as item_state
+import cmk_base.piggyback as piggyback
+import cmk_base.snmp as snmp
+
+STAGES = [
+    "fetch",
+    "parse info",
+    "parse functions",
+    "check functions",
+    "submission",
+]
+
+# Stages below this time per host are too short to be compared with a baseline
+MIN_COMPARABLE_MS = 0.05
+
+
+class StageTimer(object):
+    """Sums up the wall time spent in wrapped functions per stage"""
+    def __init__(self):
+        self.times = dict.fromkeys(STAGES, 0.0)
+        self._wrapped = []
+
+    def wrap(self, owner, attr, stage):
+        orig = owner.__dict__[attr]
+        times = self.times
+
+        def timed(*args, **kwargs):
+            start = time.time()
+            try:
+                return orig(*args, **kwargs)
+            finally:
+                times[stage] += time.time() - start
+
+        setattr(owner, attr, timed)
+        self._wrapped.append((owner, attr, orig))
+
+    def add_tracked_records(self):
+        for kind, _name, _count, wall_time, _cpu_time in cpu_tracking.aggregated_records():
+            if kind == "parse":
+                self.times["parse functions"] += wall_time
+            elif kind == "check":
+                self.times["check functions"] += wall_time
+        cpu_tracking.clear_records()
+
+    def reset(self):
+        # The wrappers hold a reference to the dict, so it has to be reset in place
+        for stage in self.times:
+            self.times[stage] = 0.0
+
+    def restore(self):
+        for owner, attr, orig in reversed(self._wrapped):
+            setattr(owner, attr, orig)
+        del self._wrapped[:]
+
+
+def _load_config():
+    timings = {}
+    start = time.time()
+    config.load_all_checks(check_api.get_check_api_context)
+    timings["load checks"] = time.time() - start
+
+    start = time.time()
+    config.load()
+    timings["load config"] = time.time() - start
+    return timings
+
+
+def _prepare_replay(agent_simulator, check_result_path):
+    data_sources.abstract.DataSource.set_may_use_cache_file()
+    data_sources.abstract.DataSource.set_use_outdated_cache_file()
+    data_sources.tcp.TCPDataSource.use_only_cache()
+    snmp.enforce_use_stored_walks()
+    ip_lookup.enforce_localhost()
+    piggyback.store_piggyback_raw_data = lambda source_hostname, piggybacked_raw_data: None
+
+    config.agent_simulator = agent_simulator
+    config.monitoring_core = "nagios"
+    config.check_submission = "file"
+    cmk.utils.paths.check_result_path = check_result_path
+
+
+def _check_host(config_cache, hostname):
+    ipaddress = ip_lookup.lookup_ip_address(hostname)
+    item_state.load(hostname)
+    check_api_utils.set_hostname(hostname)
+
+    services = check_table.get_precompiled_check_table(hostname, remove_duplicates=True)
+
+    sources = data_sources.DataSources(hostname, ipaddress)
+    sources.enforce_check_plugin_names({service.check_plugin_name for service in services})
+    multi_host_sections = sources.get_host_sections()
+
+    for service in services:
+        checking.execute_check(config_cache, multi_host_sections, hostname, ipaddress,
+                               service.check_plugin_name, service.item, service.parameters,
+                               service.description)
+
+    checking._close_checkresult_file()  # pylint: disable=protected-access
+
+
+def benchmark(hostnames, rounds):
+    config_cache = config.get_config_cache()
+    timer = StageTimer()
+    timer.wrap(data_sources.abstract.DataSource, "_get_raw_data", "fetch")
+    timer.wrap(data_sources.PiggyBackDataSource, "_get_raw_data", "fetch")
+    timer.wrap(data_sources.abstract.CheckMKAgentDataSource, "_parse_info", "parse info")
+    timer.wrap(checking, "_submit_check_result", "submission")
+
+    best_round = None
+    try:
+        for _ in range(rounds):
+            timer.reset()
+            start = time.time()
+            for hostname in hostnames:
+                _check_host(config_cache, hostname)
+                timer.add_tracked_records()
+            duration = time.time() - start
+
+            if best_round is None or duration < best_round[0]:
+                best_round = duration, dict(timer.times)
+    finally:
+        timer.restore()
+
+    return best_round
+
+
+def _results(hostnames, config_timings, best_round):
+    duration, stage_times = best_round
+    num_hosts = len(hostnames)
+    stages = dict((stage, seconds * 1000) for stage, seconds in config_timings.items())
+    stages.update((stage, seconds * 1000 / num_hosts) for stage, seconds in stage_times.items())
+    return {
+        "hosts": num_hosts,
+        "hosts_per_sec": num_hosts / duration if duration else 0.0,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        # Config loading in ms, the other stages in ms per host
+        "stages": stages,
+    }
+
+
+def _print_results(results, baseline):
+    regressions = []
+    print("%-18s %12s %12s %8s" % ("Stage", "ms", "baseline", "change"))
+    for stage in ["load checks", "load config"] + STAGES:
+        value = results["stages"][stage]
+        unit = "" if stage.startswith("load") else "/host"
+        if baseline is None or stage not in baseline["stages"]:
+            print("%-18s %12.2f %s" % (stage, value, unit))
+            continue
+
+        base_value = baseline["stages"][stage]
+        change = (value - base_value) * 100.0 / base_value if base_value else 0.0
+        print("%-18s %12.2f %12.2f %+7.1f%% %s" % (stage, value, base_value, change, unit))
+        if base_value >= MIN_COMPARABLE_MS:
+            regressions.append((stage, change))
+
+    if baseline is None:
+        print("%-18s %12.2f" % ("hosts/sec", results["hosts_per_sec"]))
+        print("%-18s %12d" % ("peak RSS (KB)", results["peak_rss_kb"]))
+    else:
+        print("%-18s %12.2f %12.2f" %
+              ("hosts/sec", results["hosts_per_sec"], baseline["hosts_per_sec"]))
+        print("%-18s %12d %12d" %
+              ("peak RSS (KB)", results["peak_rss_kb"], baseline["peak_rss_kb"]))
+    return regressions
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-n", "--rounds", type=int, default=3)
+    parser.add_argument("--agent-simulator",
+                        action="store_true",
+                        help="Process the agent outputs with the agent simulator")
+    parser.add_argument("--save-baseline", metavar="FILE", help="Save the results to FILE")
+    parser.add_argument("--baseline", metavar="FILE", help="Compare the results with FILE")
+    parser.add_argument("--max-regression",
+                        type=float,
+                        default=10.0,
+                        metavar="PERCENT",
+                        help="Maximum slowdown of a stage compared to the baseline")
+    parser.add_argument("hosts", nargs="*", metavar="HOST")
+    options = parser.parse_args(args)
+
+    config_timings = _load_config()
+
+    config_cache = config.get_config_cache()
+    hostnames = options.hosts or sorted(config_cache.all_active_realhosts())
+    if not hostnames:
+        raise SystemExit("No hosts to check")
+
+    check_result_path = tempfile.mkdtemp(prefix="bench_check_pipeline")
+    try:
+        _prepare_replay(options.agent_simulator, check_result_path)
+        best_round = benchmark(hostnames, options.rounds)
+    finally:
+        shutil.rmtree(check_result_path)
+
+    results = _results(hostnames, config_timings, best_round)
+
+    baseline = None
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+
+    print("%d hosts, best of %d rounds" % (len(hostnames), options.rounds))
+    regressions = _print_results(results, baseline)
+
+    if options.save_baseline:
+        with open(options.save_baseline, "w") as f:
+            json.dump(results, f, indent=4, separators=(",", ": "), sort_keys=True)
+
+    slower = [(stage, change) for stage, change in regressions if change > options.max_regression]
+    for stage, change in slower:
+        print("REGRESSION: %s is %.1f%% slower than the baseline" % (stage, change))
+    return 1 if slower else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
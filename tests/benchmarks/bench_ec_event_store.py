@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+"""Compare the event list of the Event Console with the indexed event store
+
+Usage:
+
+    python tests/benchmarks/bench_ec_event_store.py [-n ROUNDS] [-e EVENTS] [-m MESSAGES]
+        [--hosts HOSTS] [--rules RULES]
+
+Replays a syslog storm of MESSAGES messages against a status with EVENTS open
+events spread over HOSTS hosts and RULES rules. Each message does what the
+counting rules and the event limit of the Event Console do: look up the event
+of the same rule, host and application to count it up or create a new one and
+remove the oldest event of the host when it has too many events.
+
+"list" is the lookup by scanning the list of all events the Event Console used
+before, "indexed" is cmk.ec.event_store.EventStore.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+# pylint: disable=wrong-import-position
+from cmk.ec.event_store import EventStore
+
+
+class ListStore(object):
+    """The former event list of EventStatus"""
+    def __init__(self):
+        self._events = []
+
+    def events(self):
+        return self._events
+
+    def add(self, event):
+        self._events.append(event)
+
+    def remove(self, event):
+        self._events.remove(event)
+
+    def of_rule_host_application(self, rule_id, host, application):
+        return [
+            e for e in self._events
+            if e["rule_id"] == rule_id and e["host"] == host and e["application"] == application
+        ]
+
+    def oldest_of_host(self, host):
+        for event in self._events:
+            if event["host"] == host:
+                return event
+        return None
+
+    def reindex(self, event):
+        pass
+
+
+def _messages(num_messages, num_hosts, num_rules):
+    rand = random.Random(42)
+    return [("rule%d" % rand.randrange(num_rules), "host%d" % rand.randrange(num_hosts),
+             "app%d" % rand.randrange(5)) for _ in xrange(num_messages)]
+
+
+def _fill(store, num_events, num_hosts, num_rules):
+    for event_id, (rule_id, host, application) in enumerate(
+            _messages(num_events, num_hosts, num_rules), 1):
+        store.add({
+            "id": event_id,
+            "rule_id": rule_id,
+            "host": host,
+            "application": application,
+            "phase": "open",
+            "count": 1,
+        })
+    return num_events + 1
+
+
+def _storm(store, next_id, messages, host_limit):
+    per_host = {}
+    for event in store.events():
+        per_host[event["host"]] = per_host.get(event["host"], 0) + 1
+
+    for rule_id, host, application in messages:
+        found = store.of_rule_host_application(rule_id, host, application)
+        if found:
+            found[0]["count"] += 1
+            store.reindex(found[0])
+            continue
+
+        store.add({
+            "id": next_id,
+            "rule_id": rule_id,
+            "host": host,
+            "application": application,
+            "phase": "open",
+            "count": 1,
+        })
+        next_id += 1
+        per_host[host] = per_host.get(host, 0) + 1
+        if per_host[host] > host_limit:
+            store.remove(store.oldest_of_host(host))
+            per_host[host] -= 1
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-n", "--rounds", type=int, default=3)
+    parser.add_argument("-e", "--events", type=int, default=5000)
+    parser.add_argument("-m", "--messages", type=int, default=20000)
+    parser.add_argument("--hosts", type=int, default=500)
+    parser.add_argument("--rules", type=int, default=50)
+    options = parser.parse_args(args)
+
+    messages = _messages(options.messages, options.hosts, options.rules)
+    # Allow about twice the average number of events per host before evicting
+    host_limit = max(1, 2 * options.events // options.hosts)
+
+    print("%d events, %d messages, %d hosts, %d rules, best of %d rounds" %
+          (options.events, options.messages, options.hosts, options.rules, options.rounds))
+    for name, factory in [("list", ListStore), ("indexed", EventStore)]:
+
+        def run(factory=factory):
+            store = factory()
+            next_id = _fill(store, options.events, options.hosts, options.rules)
+            _storm(store, next_id, messages, host_limit)
+
+        best = min(timeit.repeat(run, number=1, repeat=options.rounds))
+        print("%-8s %10.3f s %12.0f messages/s" % (name, best, options.messages / best))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+"""Compare history queries of the Event Console on log files and indexed segments
+
+Usage:
+
+    python tests/benchmarks/bench_ec_history.py [-n ROUNDS] [-d DAYS] [-e ENTRIES]
+        [--hosts HOSTS] [--rules RULES]
+
+Writes a history of ENTRIES entries per day over DAYS days into a temporary
+site, once as the daily log files of the archive mode "file" and once as the
+segments of the archive mode "indexed". Then runs queries like the ones of
+the history views of the GUI against both. The number of entries found must
+be the same for both.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+# pylint: disable=wrong-import-position,protected-access
+import pathlib2 as pathlib
+
+import cmk.utils.log
+import cmk.ec.defaults
+import cmk.ec.history
+import cmk.ec.settings
+from cmk.ec.main import QueryGET, StatusTableEvents, StatusTableHistory
+
+DAY = 86400
+START = 1546300800  # 2019-01-01 00:00:00 UTC
+
+
+class Query(object):
+    def __init__(self, table, filters, limit):
+        self.table = table
+        self.filters = filters
+        self.limit = limit
+
+    filter_row = QueryGET.__dict__["filter_row"]
+
+
+def _filter(column_name, operator_name, argument):
+    operator_function = QueryGET._filter_operators[operator_name]
+    return (column_name, operator_name, lambda x: operator_function(x, argument), argument)
+
+
+def _history(root, archive_mode):
+    settings = cmk.ec.settings.settings("bench", root, root / "etc", ["mkeventd"])
+    config = cmk.ec.defaults.default_config()
+    config["archive_mode"] = archive_mode
+    return cmk.ec.history.History(settings, config, cmk.utils.log.get_logger("mkeventd"),
+                                  StatusTableEvents.columns, StatusTableHistory.columns)
+
+
+def _write(histories, num_days, num_entries, num_hosts, num_rules):
+    rand = random.Random(42)
+    file_history, indexed_history = histories
+    log_dir = file_history._settings.paths.history_dir.value
+    log_dir.mkdir(parents=True)
+    event_id = 0
+    for day in xrange(num_days):
+        period = START + day * DAY
+        log_path = log_dir / ("%d.log" % period)
+        with log_path.open(mode="wb") as f:
+            for nr in xrange(num_entries):
+                event_id += 1
+                event = {
+                    "id": event_id,
+                    "host": "host%d" % rand.randrange(num_hosts),
+                    "rule_id": "rule%d" % rand.randrange(num_rules),
+                    "application": "app%d" % rand.randrange(20),
+                    "text": "Something happened on device %d" % rand.randrange(100),
+                    "first": period,
+                    "last": period,
+                }
+                columns = cmk.ec.history._history_line_columns(file_history, event, "NEW", "",
+                                                                "")
+                columns[0] = repr(period + nr * float(DAY) / num_entries)
+                f.write("\t".join(columns) + "\n")
+                indexed_history._segments.add(period, columns)
+        os.utime(str(log_path), (period + DAY - 1, period + DAY - 1))
+    return event_id
+
+
+def _queries(table, num_days, num_events):
+    last_day = START + (num_days - 1) * DAY
+    return [
+        ("host, limit 1000", [_filter("event_host", "=", "host7")], 1000),
+        ("host, last day", [
+            _filter("event_host", "=", "host7"),
+            _filter("history_time", ">=", float(last_day)),
+        ], None),
+        ("rule, limit 1000", [_filter("event_rule_id", "=", "rule3")], 1000),
+        ("event id", [_filter("event_id", "=", num_events // 3)], None),
+        ("application, host", [
+            _filter("event_application", "=", "app3"),
+            _filter("event_host", "in", ["host1", "host2"]),
+        ], None),
+        ("one hour", [
+            _filter("history_time", ">=", float(last_day - DAY)),
+            _filter("history_time", "<", float(last_day - DAY + 3600)),
+        ], None),
+        ("text, limit 100", [_filter("event_text", "~~", "device 42")], 100),
+    ]
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-n", "--rounds", type=int, default=3)
+    parser.add_argument("-d", "--days", type=int, default=10)
+    parser.add_argument("-e", "--entries", type=int, default=20000)
+    parser.add_argument("--hosts", type=int, default=500)
+    parser.add_argument("--rules", type=int, default=50)
+    options = parser.parse_args(args)
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_ec_history")
+    try:
+        histories = [
+            _history(pathlib.Path(tmp_dir) / archive_mode, archive_mode)
+            for archive_mode in ["file", "indexed"]
+        ]
+        num_events = _write(histories, options.days, options.entries, options.hosts,
+                            options.rules)
+
+        print("%d days with %d entries, %d hosts, %d rules, best of %d rounds" %
+              (options.days, options.entries, options.hosts, options.rules, options.rounds))
+        print("%-20s %8s %12s %12s %8s" % ("query", "entries", "file", "indexed", "speedup"))
+        table = StatusTableHistory(cmk.utils.log.get_logger("mkeventd"), histories[0])
+        for name, filters, limit in _queries(table, options.days, num_events):
+            query = Query(table, filters, limit)
+            results = [history.get(query)[:limit] for history in histories]
+            if len(results[0]) != len(results[1]):
+                raise SystemExit("%s: different number of entries (%d, %d)" %
+                                 (name, len(results[0]), len(results[1])))
+
+            durations = [
+                min(timeit.repeat(lambda history=history: history.get(query),
+                                  number=1,
+                                  repeat=options.rounds)) for history in histories
+            ]
+            print("%-20s %8d %10.3f s %10.3f s %7.1fx" %
+                  (name, len(results[0]), durations[0], durations[1],
+                   durations[0] / durations[1]))
+    finally:
+        shutil.rmtree(tmp_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+"""Replay a syslog storm through the Event Console with and without worker processes
+
+Usage:
+
+    python tests/benchmarks/bench_ec_ingestion.py [-n ROUNDS] [-m MESSAGES] [-r RULES]
+        [--hosts HOSTS] [-w WORKERS [WORKERS ...]]
+
+Generates MESSAGES syslog messages from HOSTS hosts, of which about every
+tenth one matches one of RULES counting rules, and feeds them through the
+event server the way the syslog UDP socket does: in reads of up to
+EventServer.max_datagrams_per_read datagrams. The replay is done once per
+given number of event processing workers (0: everything is processed by the
+event server thread) in a fresh temporary site directory. The resulting
+events must be the same for all numbers of workers.
+
+The monitoring core is not asked for the hosts of the events.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+# pylint: disable=wrong-import-position
+import pathlib2 as pathlib
+
+import cmk.utils.log
+import cmk.ec.defaults
+import cmk.ec.history
+import cmk.ec.settings
+from cmk.ec.main import (ECLock, EventServer, EventStatus, Perfcounters, StatusTableEvents,
+                         StatusTableHistory, default_slave_status_master)
+
+WORDS = ["kernel", "sshd", "postfix", "cron", "disk", "link", "fan", "raid", "backup", "queue"]
+
+
+class NoCoreHosts(object):
+    def get(self, host_name, deflt=None):
+        return deflt
+
+    def get_by_event_host_name(self, event_host_name, deflt=None):
+        return deflt
+
+
+def _rules(num_rules):
+    return [{
+        "id": "rule%d" % nr,
+        "match": "%s%d: .* (failed|error) on (\\S+)" % (WORDS[nr % len(WORDS)], nr),
+        "state": 2,
+        "sl": {
+            "value": 0,
+            "precedence": "message"
+        },
+        "count": {
+            "count": 10,
+            "period": 3600,
+            "algorithm": "interval",
+            "count_ack": False,
+            "separate_host": True,
+            "separate_application": True,
+            "separate_match_groups": False,
+        },
+    } for nr in xrange(num_rules)]
+
+
+def _datagrams(num_messages, num_hosts, num_rules):
+    rand = random.Random(42)
+    datagrams = []
+    for nr in xrange(num_messages):
+        rule_nr = rand.randrange(num_rules * 10)
+        datagrams.append(("<%d>Jan  1 10:%02d:%02d host%d %s[%d]: %s%d: job %d failed on dev%d\n" %
+                          (rand.choice([11, 13, 14]), nr // 60 % 60, nr % 60,
+                           rand.randrange(num_hosts), WORDS[rule_nr % len(WORDS)],
+                           rand.randrange(30000), WORDS[rule_nr % len(WORDS)], rule_nr, nr,
+                           rand.randrange(8)), ("10.0.0.%d" % rand.randrange(250), 514)))
+    return datagrams
+
+
+def _event_server(root, num_workers, num_rules):
+    logger = cmk.utils.log.get_logger("mkeventd")
+    settings = cmk.ec.settings.settings("bench", root, root / "etc", ["mkeventd"])
+    settings.paths.event_pipe.value.parent.mkdir(parents=True)
+
+    config = cmk.ec.defaults.default_config()
+    config["event_processing_workers"] = num_workers
+    config["rule_packs"] = [cmk.ec.defaults.default_rule_pack(_rules(num_rules))]
+
+    perfcounters = Perfcounters(logger)
+    history = cmk.ec.history.History(settings, config, logger, StatusTableEvents.columns,
+                                     StatusTableHistory.columns)
+    event_status = EventStatus(settings, config, perfcounters, history, logger)
+    server = EventServer(logger, settings, config, default_slave_status_master(), perfcounters,
+                         ECLock(logger), history, event_status, StatusTableEvents.columns)
+    server.host_config = NoCoreHosts()
+    server.compile_rules([], config["rule_packs"])
+    return server, event_status
+
+
+def _replay(server, datagrams):
+    # pylint: disable=protected-access
+    server._update_workers()
+    try:
+        step = server.max_datagrams_per_read
+        for index in xrange(0, len(datagrams), step):
+            for data, address in datagrams[index:index + step]:
+                server.ingest_raw_lines(data, address)
+            if server._worker_pool is not None:
+                server._dispatch_unprepared_chunks()
+                server._process_pending_batches()
+    finally:
+        server._stop_workers()
+
+
+def _run(num_workers, num_rules, datagrams):
+    tmp_dir = tempfile.mkdtemp(prefix="bench_ec_ingestion")
+    try:
+        server, event_status = _event_server(pathlib.Path(tmp_dir), num_workers, num_rules)
+        duration = timeit.timeit(lambda: _replay(server, datagrams), number=1)
+        events = [(e["rule_id"], e["host"], e["count"], e["phase"]) for e in event_status.events()]
+        return duration, events
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-n", "--rounds", type=int, default=3)
+    parser.add_argument("-m", "--messages", type=int, default=50000)
+    parser.add_argument("-r", "--rules", type=int, default=500)
+    parser.add_argument("--hosts", type=int, default=200)
+    parser.add_argument("-w", "--workers", type=int, nargs="+", default=[0, 2, 4])
+    options = parser.parse_args(args)
+
+    datagrams = _datagrams(options.messages, options.hosts, options.rules)
+    print("%d messages, %d rules, %d hosts, best of %d rounds" %
+          (options.messages, options.rules, options.hosts, options.rounds))
+
+    reference_events = None
+    reference_duration = None
+    for num_workers in options.workers:
+        best = None
+        for _ in xrange(options.rounds):
+            duration, events = _run(num_workers, options.rules, datagrams)
+            if reference_events is None:
+                reference_events = events
+            elif events != reference_events:
+                raise SystemExit("%d workers: different resulting events" % num_workers)
+            best = duration if best is None else min(best, duration)
+
+        if reference_duration is None:
+            reference_duration = best
+        print("%2d workers %10.3f s %12.0f messages/s %8.2fx" %
+              (num_workers, best, options.messages / best, reference_duration / best))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
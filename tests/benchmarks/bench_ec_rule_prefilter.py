@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+"""Measure the rule matching of the Event Console with and without the prefilter
+
+Usage:
+
+    python tests/benchmarks/bench_ec_rule_prefilter.py [-n ROUNDS] [-r RULES] [-m MESSAGES]
+
+Generates RULES rules with message patterns of the usual shape (a literal
+program or keyword followed by regex parts) and matches MESSAGES syslog like
+messages against all of them, once by evaluating every rule and once by
+evaluating only the possible rules selected by cmk.ec.rule_prefilter.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+# pylint: disable=wrong-import-position
+import cmk.utils.log
+from cmk.ec.main import EventServer, RuleMatcher
+from cmk.ec.rule_prefilter import RulePrefilter
+
+WORDS = [
+    "kernel", "sshd", "postfix", "cron", "disk", "link", "interface", "power", "fan", "temperature",
+    "login", "session", "backup", "raid", "memory", "queue", "timeout", "certificate", "license",
+    "database"
+]
+
+
+def _rules(num_rules):
+    rand = random.Random(42)
+    rules = []
+    for nr in xrange(num_rules):
+        pattern = "%s%d: .* (failed|error) on (\\S+)" % (rand.choice(WORDS), nr)
+        rules.append({
+            "id": "rule%d" % nr,
+            "pack": "default",
+            "match": EventServer._compile_matching_value("match", pattern),  # pylint: disable=protected-access
+        })
+    return rules
+
+
+def _events(num_messages, num_rules):
+    rand = random.Random(23)
+    events = []
+    for _ in xrange(num_messages):
+        events.append({
+            "text": "%s%d: operation %d failed on device%d" % (rand.choice(WORDS),
+                                                               rand.randrange(num_rules * 2),
+                                                               rand.randrange(1000),
+                                                               rand.randrange(10)),
+            "host": "host%d" % rand.randrange(100),
+            "application": "",
+            "ipaddress": "",
+            "facility": 1,
+            "priority": 3,
+        })
+    return events
+
+
+def _match_all(matcher, rules, events):
+    hits = 0
+    for event in events:
+        for rule in rules:
+            if matcher.event_rule_matches_non_inverted(rule, event) is not False:
+                hits += 1
+    return hits
+
+
+def _match_prefiltered(matcher, prefilter, rules, events):
+    hits = 0
+    for event in events:
+        for position in prefilter.possible_rules(event):
+            rule = rules[position]
+            if matcher.event_rule_matches_non_inverted(rule, event) is not False:
+                hits += 1
+    return hits
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-n", "--rounds", type=int, default=3)
+    parser.add_argument("-r", "--rules", type=int, default=2000)
+    parser.add_argument("-m", "--messages", type=int, default=500)
+    options = parser.parse_args(args)
+
+    rules = _rules(options.rules)
+    events = _events(options.messages, options.rules)
+    matcher = RuleMatcher(cmk.utils.log.get_logger("mkeventd"), {"debug_rules": False})
+
+    start = timeit.default_timer()
+    prefilter = RulePrefilter(rules)
+    print("%d rules (%d with required literals), %d messages, best of %d rounds" %
+          (options.rules, prefilter.num_filtered_rules, options.messages, options.rounds))
+    print("%-12s %10.3f s" % ("compile", timeit.default_timer() - start))
+
+    expected_hits = _match_all(matcher, rules, events)
+    for name, func in [
+        ("all rules", lambda: _match_all(matcher, rules, events)),
+        ("prefiltered", lambda: _match_prefiltered(matcher, prefilter, rules, events)),
+    ]:
+        if func() != expected_hits:
+            raise SystemExit("%s: different number of rule hits" % name)
+        best = min(timeit.repeat(func, number=1, repeat=options.rounds))
+        print("%-12s %10.3f s %12.0f messages/s" % (name, best, options.messages / best))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
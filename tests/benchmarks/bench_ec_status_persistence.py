@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+"""Measure saving and loading the Event Console status with and without the journal
+
+Usage:
+
+    python tests/benchmarks/bench_ec_status_persistence.py [-n ROUNDS] [-e EVENTS]
+        [-c CHANGES] [-s SAVES]
+
+Creates a status with EVENTS events in a temporary site and saves it SAVES
+times, each time after changing CHANGES events, deleting CHANGES / 10 events
+and creating as many new ones. "snapshot" writes the whole status on each
+save like the Event Console did before, "journal" appends the changes to the
+status journal. Afterwards the status is loaded again, for the journal by
+replaying the journal on top of the first snapshot. Both must result in the
+same status.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+# pylint: disable=wrong-import-position,protected-access
+import pathlib2 as pathlib
+
+import cmk.utils.log
+import cmk.ec.settings
+from cmk.ec.main import EventStatus, Perfcounters
+
+
+class NoHistory(object):
+    def add(self, event, what, who=""):
+        pass
+
+
+class NoEventServer(object):
+    def add_core_host_to_event(self, event):
+        event["core_host"] = ""
+
+
+def _event_status(root):
+    settings = cmk.ec.settings.settings("bench", root, root / "etc", ["mkeventd"])
+    settings.paths.status_file.value.parent.mkdir(parents=True, exist_ok=True)
+    logger = cmk.utils.log.get_logger("mkeventd")
+    return EventStatus(settings, {"debug_rules": False}, Perfcounters(logger), NoHistory(),
+                       logger)
+
+
+def _new_event(rand):
+    return {
+        "rule_id": "rule%d" % rand.randrange(100),
+        "host": "host%d" % rand.randrange(1000),
+        "application": "app%d" % rand.randrange(10),
+        "phase": "open",
+        "text": "Something happened on device %d" % rand.randrange(1000),
+        "comment": "",
+        "state": 2,
+        "count": 1,
+        "first": 1546300800.0,
+        "last": 1546300800.0,
+        "match_groups": ("device", "%d" % rand.randrange(1000)),
+        "ipaddress": "",
+        "core_host": "",
+    }
+
+
+def _change(event_status, rand, num_changes):
+    events = event_status.events()
+    for event in rand.sample(events, num_changes):
+        event["count"] += 1
+        event["phase"] = rand.choice(["open", "ack"])
+        event_status.event_changed(event)
+    for event in rand.sample(events, num_changes // 10):
+        event_status.remove_event(event)
+        event_status.new_event(_new_event(rand))
+
+
+def _run(root, options, snapshot):
+    rand = random.Random(42)
+    event_status = _event_status(root)
+    for _ in xrange(options.events):
+        event_status.new_event(_new_event(rand))
+    event_status.save_status(snapshot=True)
+
+    save_time = 0.0
+    for _ in xrange(options.saves):
+        _change(event_status, rand, options.changes)
+        save_time += timeit.timeit(lambda: event_status.save_status(snapshot=snapshot), number=1)
+
+    loaded = _event_status(root)
+    load_time = timeit.timeit(lambda: loaded.load_status(NoEventServer()), number=1)
+    if loaded.pack_status() != event_status.pack_status():
+        raise SystemExit("Loaded status differs from the saved one")
+    return save_time / options.saves, load_time
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-n", "--rounds", type=int, default=3)
+    parser.add_argument("-e", "--events", type=int, default=100000)
+    parser.add_argument("-c", "--changes", type=int, default=1000)
+    parser.add_argument("-s", "--saves", type=int, default=5)
+    options = parser.parse_args(args)
+
+    print("%d events, %d changed events per save, %d saves, best of %d rounds" %
+          (options.events, options.changes, options.saves, options.rounds))
+    print("%-10s %12s %12s" % ("", "save", "load"))
+    for name, snapshot in [("snapshot", True), ("journal", False)]:
+        best_save, best_load = None, None
+        for _ in xrange(options.rounds):
+            tmp_dir = tempfile.mkdtemp(prefix="bench_ec_status_persistence")
+            try:
+                save_time, load_time = _run(pathlib.Path(tmp_dir), options, snapshot)
+            finally:
+                shutil.rmtree(tmp_dir)
+            best_save = save_time if best_save is None else min(best_save, save_time)
+            best_load = load_time if best_load is None else min(best_load, load_time)
+        print("%-10s %10.3f s %10.3f s" % (name, best_save, best_load))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+"""Compare the storage backends of the item states (counters)
+
+Usage:
+
+    python tests/benchmarks/bench_item_state.py [-n ROUNDS] [-k KEYS] [-t TOUCHED_PERCENT]
+
+Simulates check cycles of a host with KEYS item states. Each cycle loads the
+item states, reads and updates TOUCHED_PERCENT of them (like the rate
+computations of checks do) and saves them again.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+# pylint: disable=wrong-import-position
+import cmk.utils.paths
+import cmk_base.item_state as item_state
+
+
+def _keys(num_keys):
+    return [("if64", u"%d" % (i // 20), "counter_%d" % (i % 20)) for i in range(num_keys)]
+
+
+def _initialize(store_class, keys):
+    states = item_state.CachedItemStates(store_class)
+    states.load("host")
+    for key in keys:
+        states._item_states[key] = (1565000000.0, 123456789012)
+        states._updated_item_states[key] = (1565000000.0, 123456789012)
+    states.save("host")
+
+
+def _check_cycle(store_class, touched_keys, timestamp):
+    states = item_state.CachedItemStates(store_class)
+    states.load("host")
+    for key in touched_keys:
+        states.set_item_state_prefix(key[:-1])
+        states.get_item_state(key[-1])
+        states.set_item_state(key[-1], (timestamp, 123456789012))
+    states.save("host")
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-n", "--rounds", type=int, default=20)
+    parser.add_argument("-k", "--keys", type=int, default=20000)
+    parser.add_argument("-t", "--touched-percent", type=int, default=10)
+    options = parser.parse_args(args)
+
+    keys = _keys(options.keys)
+    touched_keys = keys[::max(1, 100 // options.touched_percent)]
+
+    print("%d item states, %d touched per check cycle" % (len(keys), len(touched_keys)))
+    for store_class in [item_state.ReprItemStateStore, item_state.BinaryItemStateStore]:
+        cmk.utils.paths.counters_dir = tempfile.mkdtemp()
+        try:
+            _initialize(store_class, keys)
+            timestamps = iter(range(options.rounds * 3))
+            durations = timeit.repeat(
+                lambda: _check_cycle(store_class, touched_keys, float(next(timestamps))),
+                number=1,
+                repeat=options.rounds)
+            size = os.stat(os.path.join(cmk.utils.paths.counters_dir, "host")).st_size
+        finally:
+            shutil.rmtree(cmk.utils.paths.counters_dir)
+
+        print("  %-22s min %7.2f ms  avg %7.2f ms  file size %6d kB" %
+              (store_class.__name__, min(durations) * 1000,
+               sum(durations) / len(durations) * 1000, size // 1024))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
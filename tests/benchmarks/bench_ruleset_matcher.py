@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+"""Measure the host and service rule matching on a synthetic large configuration
+
+Usage:
+
+    python tests/benchmarks/bench_ruleset_matcher.py [-H HOSTS] [-r RULES] [-s SERVICES] [--seed SEED]
+
+Generates HOSTS hosts spread over a folder hierarchy, with host tags and
+labels, and RULES rules with the kind of conditions WATO creates: folders,
+tags (including negations and tag groups with "$or"), labels, explicit
+host lists and host name regexes. The rules are split into host rulesets
+and service rulesets. Then all rulesets are evaluated for all hosts and
+SERVICES services per host, like the config generation does.
+
+The matched values are summarized in a checksum, which must not change
+between implementations.
+"""
+
+from __future__ import print_function
+
+import argparse
+import hashlib
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+# pylint: disable=wrong-import-position
+from cmk.utils.rulesets.ruleset_matcher import RulesetMatcher, RulesetMatchObject
+
+TAG_GROUPS = {
+    "criticality": ["prod", "critical", "test", "offline"],
+    "networking": ["lan", "wan", "dmz"],
+    "agent": ["cmk-agent", "snmp-only", "no-agent"],
+    "os": ["linux", "windows", "aix", "solaris"],
+    "location": ["loc%d" % i for i in range(20)],
+}
+
+SERVICES = [
+    u"CPU load", u"CPU utilization", u"Memory", u"Uptime", u"Check_MK", u"Disk IO SUMMARY",
+    u"Kernel Performance", u"Mount options of /", u"NTP Time", u"TCP Connections"
+] + [u"Filesystem /data%d" % i for i in range(10)] + [u"Interface %d" % i for i in range(40)]
+
+
+class _Labels(object):
+    def __init__(self, host_labels):
+        self._host_labels = host_labels
+
+    def labels_of_host(self, ruleset_matcher, hostname):
+        return self._host_labels.get(hostname, {})
+
+
+def _folders(rand, num_folders):
+    folders = ["/"]
+    while len(folders) < num_folders:
+        folders.append("%s%s/" % (rand.choice(folders), "f%d" % len(folders)))
+    return folders
+
+
+def _config(rand, num_hosts):
+    folders = _folders(rand, max(2, num_hosts // 100))
+    host_tags, host_paths, host_labels = {}, {}, {}
+    for i in range(num_hosts):
+        hostname = "host%06d" % i
+        path = rand.choice(folders)
+        tags = set(rand.choice(choices) for choices in TAG_GROUPS.values())
+        tags.update([hostname, path])
+        host_tags[hostname] = tags
+        host_paths[hostname] = path
+        host_labels[hostname] = {
+            u"cmk/os_family": rand.choice([u"linux", u"windows"]),
+            u"team": u"team%d" % rand.randint(0, 9),
+        }
+    return folders, host_tags, host_paths, host_labels
+
+
+def _tag_spec(rand):
+    group = rand.choice(sorted(TAG_GROUPS))
+    kind = rand.random()
+    if kind < 0.6:
+        return group, rand.choice(TAG_GROUPS[group])
+    if kind < 0.8:
+        return group, {"$ne": rand.choice(TAG_GROUPS[group])}
+    if kind < 0.9:
+        return group, {"$or": rand.sample(TAG_GROUPS[group], 2)}
+    return group, {"$nor": rand.sample(TAG_GROUPS[group], 2)}
+
+
+def _host_condition(rand, folders, num_hosts):
+    condition = {}
+    if rand.random() < 0.5:
+        condition["host_folder"] = rand.choice(folders)
+    if rand.random() < 0.6:
+        condition["host_tags"] = dict(_tag_spec(rand) for _ in range(rand.randint(1, 3)))
+    if rand.random() < 0.15:
+        condition["host_labels"] = {
+            u"team": u"team%d" % rand.randint(0, 9) if rand.random() < 0.7 else {
+                "$ne": u"team%d" % rand.randint(0, 9)
+            }
+        }
+    kind = rand.random()
+    if kind < 0.15:
+        hosts = ["host%06d" % rand.randint(0, num_hosts - 1) for _ in range(rand.randint(1, 20))]
+        condition["host_name"] = hosts if rand.random() < 0.8 else {"$nor": hosts}
+    elif kind < 0.2:
+        condition["host_name"] = [{"$regex": "host%d" % rand.randint(0, 9)}]
+    return condition
+
+
+def _service_condition(rand):
+    kind = rand.random()
+    if kind < 0.1:
+        return {}
+    patterns = rand.sample(
+        [u"CPU", u"Memory$", u"Filesystem /data[0-4]", u"Interface 1", u"Interface [23]",
+         u"NTP", u"Check_MK", u"Mount", u"Disk IO", u"Kernel", u"Uptime"], rand.randint(1, 3))
+    if kind < 0.2:
+        return {"service_description": {"$nor": [{"$regex": p} for p in patterns]}}
+    return {"service_description": [{"$regex": p} for p in patterns]}
+
+
+def _rulesets(rand, folders, num_hosts, num_rules):
+    host_rulesets, service_rulesets = [], []
+    rules_left = num_rules
+    while rules_left > 0:
+        size = min(rules_left, rand.randint(1, 40))
+        rules_left -= size
+        is_service = rand.random() < 0.6
+        ruleset = []
+        for nr in range(size):
+            condition = _host_condition(rand, folders, num_hosts)
+            if is_service:
+                condition.update(_service_condition(rand))
+            ruleset.append({"value": nr, "condition": condition, "options": {}})
+        (service_rulesets if is_service else host_rulesets).append(ruleset)
+    return host_rulesets, service_rulesets
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-H", "--hosts", type=int, default=20000)
+    parser.add_argument("-r", "--rules", type=int, default=2000)
+    parser.add_argument("-s", "--services", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args(args)
+
+    rand = random.Random(options.seed)
+    folders, host_tags, host_paths, host_labels = _config(rand, options.hosts)
+    host_rulesets, service_rulesets = _rulesets(rand, folders, options.hosts, options.rules)
+    hostnames = sorted(host_tags)
+    services = SERVICES[:options.services]
+
+    print("%d hosts in %d folders, %d host rulesets, %d service rulesets, %d rules" %
+          (len(hostnames), len(folders), len(host_rulesets), len(service_rulesets),
+           options.rules))
+
+    start = time.time()
+    matcher = RulesetMatcher(
+        tag_to_group_map={},
+        host_tag_lists=host_tags,
+        host_paths=host_paths,
+        labels=_Labels(host_labels),
+        all_configured_hosts=set(hostnames),
+        clusters_of={},
+        nodes_of={},
+    )
+    initialized = time.time()
+
+    checksum = hashlib.md5()
+    for ruleset in host_rulesets:
+        for hostname in hostnames:
+            match_object = RulesetMatchObject(host_name=hostname)
+            checksum.update(repr(list(matcher.get_host_ruleset_values(match_object, ruleset,
+                                                                        False))))
+    host_rules_done = time.time()
+
+    for ruleset in service_rulesets:
+        for hostname in hostnames:
+            for service in services:
+                match_object = RulesetMatchObject(host_name=hostname, service_description=service)
+                checksum.update(
+                    repr(list(matcher.get_service_ruleset_values(match_object, ruleset, False))))
+    service_rules_done = time.time()
+
+    print("  initialization   %8.2f s" % (initialized - start))
+    print("  host rulesets    %8.2f s" % (host_rules_done - initialized))
+    print("  service rulesets %8.2f s" % (service_rules_done - host_rules_done))
+    print("  checksum         %s" % checksum.hexdigest())
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+"""Compare loading .mk files with and without the load cache of the store
+
+Usage:
+
+    python tests/benchmarks/bench_store.py [-n ROUNDS] [-H HOSTS]
+
+Writes a hosts.mk like WATO does for a folder with HOSTS hosts and a data file
+with the same host attributes and loads them with load_mk_file() and
+load_data_from_file().
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import pprint
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+# pylint: disable=wrong-import-position
+import cmk.utils.paths
+import cmk.utils.store as store
+
+
+def _host_attributes(num_hosts):
+    return dict(("host%05d" % i, {
+        "ipaddress": "10.%d.%d.%d" % (i // 65536, i // 256 % 256, i % 256),
+        "alias": u"Host number %d" % i,
+        "tag_agent": "cmk-agent",
+        "labels": {
+            u"os": u"linux",
+            u"rack": u"r%d" % (i % 40)
+        },
+    }) for i in range(num_hosts))
+
+
+def _write_files(base_dir, num_hosts):
+    attributes = _host_attributes(num_hosts)
+    hosts_mk = os.path.join(base_dir, "hosts.mk")
+    store.save_mk_file(
+        hosts_mk, "all_hosts += %s\n\nhost_attributes.update(%s)\n" %
+        (pprint.pformat(sorted(attributes)), pprint.pformat(attributes)))
+
+    data_file = os.path.join(base_dir, "attributes.mk")
+    store.save_data_to_file(data_file, attributes)
+    return hosts_mk, data_file
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-n", "--rounds", type=int, default=5)
+    parser.add_argument("-H", "--hosts", type=int, default=50000)
+    options = parser.parse_args(args)
+
+    base_dir = tempfile.mkdtemp()
+    cmk.utils.paths.tmp_dir = os.path.join(base_dir, "tmp")
+    try:
+        hosts_mk, data_file = _write_files(base_dir, options.hosts)
+        print("%d hosts, hosts.mk %d kB, data file %d kB" %
+              (options.hosts, os.stat(hosts_mk).st_size // 1024,
+               os.stat(data_file).st_size // 1024))
+
+        loaders = [
+            ("load_mk_file", lambda: store.load_mk_file(hosts_mk, {
+                "all_hosts": [],
+                "host_attributes": {}
+            })),
+            ("load_data_from_file", lambda: store.load_data_from_file(data_file)),
+        ]
+
+        for name, load in loaders:
+            for enabled in [False, True]:
+                store.load_cache_enabled = enabled
+                load()  # Fill the cache
+                durations = timeit.repeat(load, number=1, repeat=options.rounds)
+                print("  %-20s %-9s min %8.2f ms  avg %8.2f ms" %
+                      (name, "cached" if enabled else "uncached", min(durations) * 1000,
+                       sum(durations) / len(durations) * 1000))
+    finally:
+        shutil.rmtree(base_dir)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
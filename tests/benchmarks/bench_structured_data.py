@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8; py-indent-offset: 4 -*-
+"""Measure the comparison of HW/SW inventory trees
+
+Usage:
+
+    python tests/benchmarks/bench_structured_data.py [-n ROUNDS] [-p PACKAGES] [-c CHANGED]
+
+Compares two inventory trees with PACKAGES installed packages, of which
+CHANGED packages have been updated, like the inventory history does. The
+comparison is done with the content indexed row matching and with the
+previous row by row matching.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+# pylint: disable=wrong-import-position
+from cmk.utils.structured_data import StructuredDataTree, Numeration
+
+
+def _tree(num_packages, num_changed):
+    tree = StructuredDataTree()
+    tree.get_dict("hardware.cpu.")["cores"] = 8
+    packages = tree.get_list("software.packages:")
+    for i in range(num_packages):
+        packages.append({
+            "name": "package-%05d" % i,
+            "version": "2.%d" % (1 if i < num_changed else 0),
+            "arch": "x86_64",
+            "package_type": "deb",
+            "summary": "Summary of package %d" % i,
+        })
+    return tree
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("-n", "--rounds", type=int, default=3)
+    parser.add_argument("-p", "--packages", type=int, default=10000)
+    parser.add_argument("-c", "--changed", type=int, default=10)
+    options = parser.parse_args(args)
+
+    old_tree = _tree(options.packages, 0)
+    new_tree = _tree(options.packages, options.changed)
+
+    print("%d packages, %d changed" % (options.packages, options.changed))
+    indexed = Numeration._get_categorized_rows
+    for name, categorize in [
+        ("indexed", indexed),
+        ("row by row", Numeration._get_categorized_rows_by_equality),
+    ]:
+        Numeration._get_categorized_rows = categorize
+        try:
+            result = new_tree.compare_with(old_tree)[:3]
+            durations = timeit.repeat(lambda: new_tree.compare_with(old_tree),
+                                      number=1,
+                                      repeat=options.rounds)
+        finally:
+            Numeration._get_categorized_rows = indexed
+        print("  %-12s min %9.2f ms  avg %9.2f ms  (new, changed, removed) = %r" %
+              (name, min(durations) * 1000, sum(durations) / len(durations) * 1000, result))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -13,6 +13,7 @@ import cmk.utils.log as log
 import cmk.utils.debug as debug
 
 from cmk_base.exceptions import MKSNMPError
+import cmk_base.config as config
 import cmk_base.snmp as snmp
 import cmk_base.snmp_utils as snmp_utils
 
@@ -111,7 +112,7 @@ def snmpsim(site, request, tmp_path_factory):
 
 
 # Execute all tests for all SNMP backends
-@pytest.fixture(params=["inline_snmp", "classic_snmp", "stored_snmp"])
+@pytest.fixture(params=["inline_snmp", "classic_snmp", "stored_snmp", "pysnmp"])
 def snmp_config(request, snmpsim, monkeypatch):
     backend_name = request.param
 
@@ -119,6 +120,9 @@ def snmp_config(request, snmpsim, monkeypatch):
         source_data_dir = Path(request.fspath.dirname) / "snmp_data" / "cmk-walk"
         monkeypatch.setattr(cmk.utils.paths, "snmpwalks_dir", str(source_data_dir))
 
+    if backend_name == "pysnmp":
+        monkeypatch.setattr(config, "use_pysnmp_backend", True)
+
     return snmp_utils.SNMPHostConfig(
         is_ipv6_primary=False,
         ipaddress="127.0.0.1",
@@ -147,8 +147,8 @@ def test_retieve_grouped_data_from_rrd(cfg_setup, utcdate, timezone, params, ref
                                               timegroup)
 
     hostname, service_description, dsname = 'test-prediction', "CPU load", 'load15'
-    rrd_datacolumn = cmk.utils.prediction.rrd_datacolum(hostname, service_description, dsname,
-                                                        "MAX")
+    rrd_datacolumn = cmk.utils.prediction.rrd_datacolumn_of_windows(
+        hostname, service_description, dsname, "MAX")
     result = prediction.retrieve_grouped_data_from_rrd(rrd_datacolumn, time_windows)
 
     assert result == reference
@@ -187,8 +187,8 @@ def test_calculate_data_for_prediction(cfg_setup, utcdate, timezone, params):
                                               timegroup)
 
     hostname, service_description, dsname = 'test-prediction', "CPU load", 'load15'
-    rrd_datacolumn = cmk.utils.prediction.rrd_datacolum(hostname, service_description, dsname,
-                                                        "MAX")
+    rrd_datacolumn = cmk.utils.prediction.rrd_datacolumn_of_windows(
+        hostname, service_description, dsname, "MAX")
     data_for_pred = prediction.calculate_data_for_prediction(time_windows, rrd_datacolumn)
 
     path = "%s/tests/integration/cmk_base/test-files/%s/%s" % (repo_path(), timezone, timegroup)
@@ -0,0 +1,188 @@
+import logging
+import threading
+import time
+from StringIO import StringIO
+
+import pathlib2 as pathlib
+import pytest
+
+import cmk.utils.log
+import cmk.ec.defaults
+import cmk.ec.history
+import cmk.ec.settings
+from cmk.ec.main import (ECLock, EventServer, EventStatus, Perfcounters, StatusTableEvents,
+                         StatusTableHistory, default_slave_status_master)
+
+logger = cmk.utils.log.get_logger("mkeventd")
+
+LINES = "".join("<%d>Jan  1 10:00:%02d host%d app: %s\n" % (prio, nr, nr % 3, text)
+                for nr, (prio, text) in enumerate([
+                    (11, "disk full"),
+                    (11, "disk full"),
+                    (14, "link down"),
+                    (11, "disk full"),
+                    (14, "nothing to see"),
+                    (14, "link up"),
+                ]))
+
+
+def _rule(rule_id, **kwargs):
+    rule = {"id": rule_id, "state": 2, "sl": {"value": 0, "precedence": "message"}}
+    rule.update(kwargs)
+    return rule
+
+
+@pytest.fixture()
+def event_server_factory(tmpdir):
+    servers = []
+
+    def factory(num_workers):
+        root = pathlib.Path(str(tmpdir)) / ("site%d" % len(servers))
+        settings = cmk.ec.settings.settings("1.6.0", root, root / "etc", ["mkeventd"])
+        settings.paths.event_pipe.value.parent.mkdir(parents=True)
+
+        config = cmk.ec.defaults.default_config()
+        config["event_processing_workers"] = num_workers
+        config["rule_packs"] = [
+            cmk.ec.defaults.default_rule_pack([
+                _rule("disk", match="disk full", count={
+                    "count": 2,
+                    "period": 3600,
+                    "algorithm": "interval",
+                    "count_ack": False,
+                    "separate_host": True,
+                    "separate_application": True,
+                    "separate_match_groups": True,
+                }),
+                _rule("link", match="link down", match_ok="link up"),
+            ])
+        ]
+
+        perfcounters = Perfcounters(logger)
+        history = cmk.ec.history.History(settings, config, logger, StatusTableEvents.columns,
+                                         StatusTableHistory.columns)
+        event_status = EventStatus(settings, config, perfcounters, history, logger)
+        server = EventServer(logger, settings, config, default_slave_status_master(), perfcounters,
+                             ECLock(logger), history, event_status, StatusTableEvents.columns)
+        server.compile_rules([], config["rule_packs"])
+        servers.append(server)
+        return server, event_status, perfcounters
+
+    yield factory
+
+    for server in servers:
+        server._stop_workers()
+
+
+def _events(event_status):
+    return [(e["rule_id"], e["host"], e["text"], e["phase"], e["count"])
+            for e in event_status.events()]
+
+
+def test_event_server_process_raw_lines(event_server_factory):
+    server, event_status, perfcounters = event_server_factory(0)
+    server.ingest_raw_lines(LINES)
+
+    assert _events(event_status) == [
+        ("disk", "host0", "disk full", "open", 2),
+        ("disk", "host1", "disk full", "counting", 1),
+    ]
+    assert perfcounters._counters["messages"] == 6
+
+
+def test_event_server_workers_keep_order(event_server_factory):
+    server, event_status, perfcounters = event_server_factory(2)
+    server._update_workers()
+    for line in LINES.splitlines(True):
+        server.ingest_raw_lines(line)
+    server._dispatch_unprepared_chunks()
+    server._process_pending_batches(wait=True)
+
+    reference_server, reference_status, _perfcounters = event_server_factory(0)
+    reference_server.ingest_raw_lines(LINES)
+
+    assert _events(event_status) == _events(reference_status)
+    assert perfcounters._counters["messages"] == 6
+
+
+def test_event_server_workers_restart_on_rule_change(event_server_factory):
+    server, _event_status, _perfcounters = event_server_factory(1)
+    server._update_workers()
+    pool = server._worker_pool
+    assert pool is not None
+
+    server.compile_rules([], server._config["rule_packs"])
+    server._update_workers()
+    assert server._worker_pool is not None
+    assert server._worker_pool is not pool
+
+
+def _prepare_lines_failing(self, chunks):
+    raise Exception("Worker failed")
+
+
+def _prepare_lines_hanging(self, chunks):
+    time.sleep(60)
+
+
+@pytest.mark.parametrize("prepare_lines,workers_restarted", [
+    (_prepare_lines_failing, False),
+    (_prepare_lines_hanging, True),
+])
+def test_event_server_worker_failure_processes_lines_inline(event_server_factory, monkeypatch,
+                                                             prepare_lines, workers_restarted):
+    monkeypatch.setattr(EventServer, "prepare_lines", prepare_lines)
+    monkeypatch.setattr(EventServer, "worker_batch_timeout", 0.2)
+    server, event_status, perfcounters = event_server_factory(2)
+    server._update_workers()
+    for line in LINES.splitlines(True):
+        server.ingest_raw_lines(line)
+    server._dispatch_unprepared_chunks()
+    server._process_pending_batches(wait=True)
+
+    assert _events(event_status) == [
+        ("disk", "host0", "disk full", "open", 2),
+        ("disk", "host1", "disk full", "counting", 1),
+    ]
+    assert perfcounters._counters["messages"] == 6
+    assert (server._worker_pool is None) == workers_restarted
+
+
+def test_event_server_workers_forked_while_logging_locked(event_server_factory, monkeypatch,
+                                                          request):
+    prepare_lines = EventServer.prepare_lines
+
+    def prepare_lines_logging(self, chunks):
+        self._logger.warning("Preparing %d chunks", len(chunks))
+        return prepare_lines(self, chunks)
+
+    monkeypatch.setattr(EventServer, "prepare_lines", prepare_lines_logging)
+    monkeypatch.setattr(EventServer, "worker_batch_timeout", 5)
+    server, event_status, _perfcounters = event_server_factory(1)
+    handler = logging.StreamHandler(StringIO())
+    logger.addHandler(handler)
+    request.addfinalizer(lambda: logger.removeHandler(handler))
+
+    # Another thread of the event daemon logs while the workers are forked
+    locked, release = threading.Event(), threading.Event()
+
+    def hold_logging_lock():
+        with handler.lock:
+            locked.set()
+            release.wait()
+
+    thread = threading.Thread(target=hold_logging_lock)
+    thread.start()
+    locked.wait()
+    try:
+        server._update_workers()
+    finally:
+        release.set()
+        thread.join()
+
+    server.ingest_raw_lines(LINES)
+    server._dispatch_unprepared_chunks()
+    server._process_pending_batches(wait=True)
+
+    assert server._worker_pool is not None
+    assert len(_events(event_status)) == 2
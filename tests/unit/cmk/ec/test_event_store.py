@@ -0,0 +1,190 @@
+import pathlib2 as pathlib
+import pytest
+
+import cmk.utils.log
+import cmk.ec.settings
+from cmk.ec.event_store import EventStore
+from cmk.ec.main import EventStatus, Perfcounters
+
+logger = cmk.utils.log.get_logger("mkeventd")
+
+
+def _event(event_id, rule_id="r1", host="h1", application="app", phase="open"):
+    return {
+        "id": event_id,
+        "rule_id": rule_id,
+        "host": host,
+        "application": application,
+        "phase": phase,
+    }
+
+
+@pytest.fixture()
+def store():
+    return EventStore([
+        _event(1),
+        _event(2, host="h2"),
+        _event(3, rule_id="r2", phase="counting"),
+        _event(4, application="other"),
+    ])
+
+
+def test_event_store_events_oldest_first(store):
+    assert [e["id"] for e in store.events()] == [1, 2, 3, 4]
+    assert len(store) == 4
+
+
+def test_event_store_add_out_of_order():
+    s = EventStore()
+    s.add(_event(5))
+    s.add(_event(2))
+    assert [e["id"] for e in s.events()] == [2, 5]
+    assert s.oldest()["id"] == 2
+
+
+def test_event_store_add_duplicate(store):
+    with pytest.raises(KeyError):
+        store.add(_event(1))
+
+
+def test_event_store_get(store):
+    assert store.get(3)["rule_id"] == "r2"
+    assert store.get(10) is None
+
+
+def test_event_store_remove(store):
+    event = store.get(1)
+    store.remove(event)
+    assert event not in store
+    assert [e["id"] for e in store.events()] == [2, 3, 4]
+    assert store.oldest()["id"] == 2
+    assert [e["id"] for e in store.of_rule("r1")] == [2, 4]
+
+    with pytest.raises(KeyError):
+        store.remove(event)
+
+
+def test_event_store_remove_modified_event(store):
+    event = store.get(1)
+    event["host"] = "changed"
+    store.remove(event)
+    assert store.oldest_of_host("h1")["id"] == 3
+    assert store.oldest_of_host("changed") is None
+
+
+def test_event_store_lookups(store):
+    assert [e["id"] for e in store.of_rule("r1")] == [1, 2, 4]
+    assert [e["id"] for e in store.of_rule_host("r1", "h1")] == [1, 4]
+    assert [e["id"] for e in store.of_rule_host_application("r1", "h1", "app")] == [1]
+    assert [e["id"] for e in store.of_phase("counting")] == [3]
+    assert store.of_rule("unknown") == []
+    assert store.oldest_of_rule("r2")["id"] == 3
+    assert store.oldest_of_host("h2")["id"] == 2
+
+
+def test_event_store_reindex(store):
+    event = store.get(1)
+    event["phase"] = "ack"
+    event["host"] = "h2"
+    assert [e["id"] for e in store.of_phase("open")] == [1, 2, 4]
+
+    store.reindex(event)
+    assert [e["id"] for e in store.of_phase("open")] == [2, 4]
+    assert [e["id"] for e in store.of_phase("ack")] == [1]
+    assert [e["id"] for e in store.of_rule_host("r1", "h2")] == [1, 2]
+
+
+def test_event_store_take_changes(store):
+    assert store.take_changes() == ([], [])
+
+    store.add(_event(5))
+    store.reindex(store.get(2))
+    store.add(_event(6))
+    store.remove(store.get(6))
+    store.remove(store.get(3))
+    changed, removed = store.take_changes()
+    assert [e["id"] for e in changed] == [2, 5]
+    assert removed == [3, 6]
+    assert store.take_changes() == ([], [])
+
+
+class _FakeHistory(object):
+    def add(self, event, what, who=""):
+        pass
+
+
+@pytest.fixture()
+def event_status(tmpdir):
+    root = pathlib.Path(str(tmpdir))
+    settings = cmk.ec.settings.settings("1.6.0", root, root / "etc", ["mkeventd"])
+    return EventStatus(settings, {"debug_rules": False}, Perfcounters(logger), _FakeHistory(),
+                       logger)
+
+
+def _count(**kwargs):
+    count = {
+        "count": 3,
+        "count_ack": False,
+        "separate_host": True,
+        "separate_application": True,
+        "separate_match_groups": False,
+    }
+    count.update(kwargs)
+    return count
+
+
+class _FakeEventServer(object):
+    def __init__(self, event_status):
+        self._event_status = event_status
+
+    def new_event_respecting_limits(self, event):
+        self._event_status.new_event(event)
+
+
+def _new_event(host, application="app"):
+    return {
+        "rule_id": "r1",
+        "host": host,
+        "application": application,
+        "match_groups": (),
+        "host_in_downtime": False,
+        "time": 1.0,
+        "first": 1.0,
+    }
+
+
+def test_event_status_count_event(event_status):
+    server = _FakeEventServer(event_status)
+    count = _count()
+
+    assert event_status.count_event(server, _new_event("h1"), {}, count) is False
+    assert event_status.count_event(server, _new_event("h2"), {}, count) is False
+    assert event_status.count_event(server, _new_event("h1", "other"), {}, count) is False
+    assert event_status.count_event(server, _new_event("h1"), {}, count) is False
+    assert len(event_status.events()) == 3
+
+    found = event_status.count_event(server, _new_event("h1"), {}, count)
+    assert found["id"] == 1
+    assert found["count"] == 3
+    assert found["phase"] == "open"
+    assert [e["id"] for e in event_status.events_in_phase("open")] == [1]
+    assert [e["id"] for e in event_status.events_in_phase("counting")] == [2, 3]
+
+
+def test_event_status_remove_oldest_event(event_status):
+    for host in ["h1", "h2", "h1", "h2"]:
+        event_status.new_event(_new_event(host))
+
+    event_status.remove_oldest_event("by_host", {"host": "h2"})
+    assert [e["id"] for e in event_status.events()] == [1, 3, 4]
+    event_status.remove_oldest_event("overall", None)
+    assert [e["id"] for e in event_status.events()] == [3, 4]
+    assert event_status.num_existing_events == 2
+    assert event_status.num_existing_events_by_host == {"h1": 1, "h2": 1}
+
+
+def test_event_status_delete_event(event_status):
+    event_status.new_event(_new_event("h1"))
+    event_status.delete_event(1, "user")
+    assert event_status.events() == []
+    assert event_status.event(1) is None
@@ -0,0 +1,175 @@
+import json
+
+import pathlib2 as pathlib
+import pytest
+
+import cmk.utils.log
+import cmk.ec.defaults
+import cmk.ec.history
+import cmk.ec.history_segments as history_segments
+import cmk.ec.settings
+from cmk.ec.main import QueryGET, StatusTableEvents, StatusTableHistory
+
+logger = cmk.utils.log.get_logger("mkeventd")
+
+# Position of the columns in the lines: time, what, who, addinfo, id, host, rule_id
+INDEXED_COLUMNS = {"event_id": 4, "event_host": 5, "event_rule_id": 6}
+
+
+@pytest.fixture(autouse=True)
+def small_segments(monkeypatch):
+    monkeypatch.setattr(history_segments, "BLOCK_ENTRIES", 4)
+    monkeypatch.setattr(history_segments, "SEGMENT_MAX_ENTRIES", 10)
+
+
+def _segments(tmpdir):
+    return history_segments.HistorySegments(pathlib.Path(str(tmpdir)), INDEXED_COLUMNS, logger)
+
+
+def _fill(segments, num_entries, period=1000):
+    for nr in xrange(num_entries):
+        segments.add(period, [
+            "%d.0" % (100 + nr), "NEW", "", "", "%d" % nr,
+            "Host%d" % (nr % 3), "rule%d" % (nr % 2)
+        ])
+
+
+def _filter(column_name, operator_name, argument):
+    operator_function = QueryGET._filter_operators[operator_name]
+    return (column_name, operator_name, lambda x: operator_function(x, argument), argument)
+
+
+def _ids(segments, filters):
+    return [int(line.split("\t")[4]) for _line_no, line in segments.entries(filters)]
+
+
+def test_history_segments_entries_newest_first(tmpdir):
+    segments = _segments(tmpdir)
+    _fill(segments, 25)
+
+    assert sorted(p.name for p in pathlib.Path(str(tmpdir)).iterdir()) == [
+        "1000-0.idx", "1000-0.seg", "1000-1.idx", "1000-1.seg", "1000-2.seg"
+    ]
+    assert _ids(segments, []) == range(24, -1, -1)
+    assert [line_no for line_no, _line in segments.entries([])][:6] == [5, 4, 3, 2, 1, 10]
+
+
+# Blocks: [0-3] [4-7] [8-9] | [10-13] [14-17] [18-19] | [20-23] [24]
+@pytest.mark.parametrize("filters,matching_ids", [
+    ([_filter("event_host", "=", "host1")], [1, 4, 7, 10, 13, 16, 19, 22]),
+    ([_filter("event_host", "in", ["Host1", "Host2"])], [n for n in range(25) if n % 3]),
+    ([_filter("event_id", "=", 17)], [17]),
+    ([_filter("event_rule_id", "=~", "RULE1"),
+      _filter("event_host", "=", "Host0")], [3, 9, 15, 21]),
+    ([_filter("history_time", ">=", 118.0)], range(18, 25)),
+    ([_filter("history_time", "<", 103.0)], range(3)),
+    ([_filter("history_time", "=", 105.0)], [5]),
+    ([_filter("event_text", "=", "foo")], range(25)),
+])
+def test_history_segments_candidates(tmpdir, filters, matching_ids):
+    segments = _segments(tmpdir)
+    _fill(segments, 25)
+
+    ids = _ids(segments, filters)
+    if filters[0][0] == "history_time":
+        # Whole blocks are returned, the matching entries are filtered later
+        assert set(matching_ids) <= set(ids) < set(range(25))
+        assert ids == sorted(ids, reverse=True)
+    else:
+        assert ids == sorted(matching_ids, reverse=True)
+
+
+def test_history_segments_resume_after_restart(tmpdir):
+    _fill(_segments(tmpdir), 13)
+    path = pathlib.Path(str(tmpdir)) / "1000-1.seg"
+    with path.open(mode="ab") as f:
+        f.write("partial")
+
+    segments = _segments(tmpdir)
+    assert _ids(segments, [_filter("event_id", "=", 11)]) == [11]
+
+    for nr in xrange(13, 16):
+        segments.add(1000, ["%d.0" % nr, "NEW", "", "", "%d" % nr, "Host%d" % (nr % 3), ""])
+    assert _ids(segments, []) == range(15, -1, -1)
+    assert "partial" not in path.read_bytes()
+
+
+def test_history_segments_index_of_crashed_segment(tmpdir):
+    _fill(_segments(tmpdir), 25)
+    index_path = pathlib.Path(str(tmpdir)) / "1000-1.idx"
+    index = json.loads(index_path.read_bytes())
+    index_path.unlink()
+
+    assert _ids(_segments(tmpdir), []) == range(24, -1, -1)
+    assert json.loads(index_path.read_bytes()) == index
+
+
+def test_history_segments_new_period(tmpdir):
+    segments = _segments(tmpdir)
+    _fill(segments, 3, period=1000)
+    _fill(segments, 2, period=2000)
+    # Entries of older periods are added to the newest segment
+    _fill(segments, 1, period=1000)
+
+    assert sorted(p.name for p in pathlib.Path(str(tmpdir)).iterdir()) == [
+        "1000-0.idx", "1000-0.seg", "2000-0.seg"
+    ]
+    assert _ids(segments, []) == [0, 1, 0, 2, 1, 0]
+
+
+def test_history_segments_expire(tmpdir):
+    segments = _segments(tmpdir)
+    _fill(segments, 15)
+    segments.expire()
+
+    assert list(pathlib.Path(str(tmpdir)).iterdir()) == []
+    assert _ids(segments, []) == []
+    _fill(segments, 2)
+    assert _ids(segments, []) == [1, 0]
+
+
+class _Query(object):
+    def __init__(self, table, filters, limit):
+        self.table = table
+        self.filters = filters
+        self.limit = limit
+
+    filter_row = QueryGET.__dict__["filter_row"]
+
+
+def _history(tmpdir, archive_mode):
+    root = pathlib.Path(str(tmpdir)) / archive_mode
+    settings = cmk.ec.settings.settings("1.6.0", root, root / "etc", ["mkeventd"])
+    config = cmk.ec.defaults.default_config()
+    config["archive_mode"] = archive_mode
+    return cmk.ec.history.History(settings, config, logger, StatusTableEvents.columns,
+                                  StatusTableHistory.columns)
+
+
+def test_history_indexed_same_entries_as_files(tmpdir, monkeypatch):
+    histories = [_history(tmpdir, "file"), _history(tmpdir, "indexed")]
+    monkeypatch.setattr(cmk.ec.history.time, "time", lambda: 1234.5)
+    for nr in xrange(30):
+        event = {
+            "id": nr,
+            "host": "host%d" % (nr % 4),
+            "rule_id": "rule%d" % (nr % 3),
+            "text": u"t\xe4xt %d" % nr,
+            "match_groups": ("a", "b"),
+        }
+        for history in histories:
+            history.add(event, "NEW")
+
+    table = StatusTableHistory(logger, histories[0])
+    for filters, limit in [
+        ([], None),
+        ([_filter("event_host", "=", "host1")], None),
+        ([_filter("event_host", "in", ["host1", "host2"]),
+          _filter("event_rule_id", "=", "rule0")], 3),
+        ([_filter("event_id", "=", 7)], None),
+    ]:
+        query = _Query(table, filters, limit)
+        file_entries, indexed_entries = [history.get(query) for history in histories]
+        # Without line numbers
+        assert [e[1:] for e in indexed_entries] == [e[1:] for e in file_entries][:limit]
+        assert indexed_entries
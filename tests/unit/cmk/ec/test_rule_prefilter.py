@@ -0,0 +1,105 @@
+import pytest
+
+import cmk.utils.log
+from cmk.ec.main import EventServer, RuleMatcher
+from cmk.ec.rule_prefilter import MultiStringMatcher, RulePrefilter, required_literals
+
+
+def _compile(key, value):
+    return EventServer._compile_matching_value(key, value)
+
+
+@pytest.mark.parametrize("pattern,literals", [
+    ("kernel", {"kernel"}),
+    ("Kernel: .* error (\\d+)", {"kernel: "}),
+    ("^sshd\\[\\d+\\]: Failed password", {"]: failed password"}),
+    ("(foo|barbaz) failed", {" failed"}),
+    ("(foobar|bazbaz)", {"foobar", "bazbaz"}),
+    ("(foo|.*)bar", {"bar"}),
+    ("(foo|.*)", None),
+    ("x?.*", None),
+    ("(?:disk )+full", {"disk "}),
+    ("a(?:bc)*d", {"a"}),
+    ("[0-9]+ items", {" items"}),
+    ("(?u)kernel", None),
+])
+def test_required_literals(pattern, literals):
+    assert required_literals(_compile("match", pattern)) == literals
+
+
+def test_multi_string_matcher():
+    matcher = MultiStringMatcher()
+    for value, string in enumerate(["he", "she", "his", "hers", "usher"]):
+        matcher.add(string, value)
+    matcher.compile()
+
+    assert matcher.search("ushers") == {0, 1, 3, 4}
+    assert matcher.search("this") == {2}
+    assert matcher.search("nothing") == set()
+    assert matcher.search(u"sh\xe9 she") == {0, 1}
+
+
+def _rule(rule_id, invert_matching=False, **conditions):
+    rule = {"id": rule_id, "pack": "default", "invert_matching": invert_matching}
+    for key, value in conditions.items():
+        rule[key] = _compile(key, value)
+    return rule
+
+
+def _event(text, host="myhost", application="myapp"):
+    return {
+        "text": text,
+        "host": host,
+        "application": application,
+        "ipaddress": "",
+        "facility": 1,
+        "priority": 0,
+    }
+
+
+RULES = [
+    _rule("plain", match="link down"),
+    _rule("regex", match="Interface (\\S+) changed state to down"),
+    _rule("cancel", match="disk .* full", match_ok="disk .* ok"),
+    _rule("host", match_host="^db\\d+"),
+    _rule("application", match="error", match_application="postfix", cancel_application="smtpd"),
+    _rule("only_cancel", match_ok="recovered"),
+    _rule("any", match=".*"),
+    _rule("inverted", match="never", invert_matching=True),
+]
+
+
+@pytest.mark.parametrize("event", [
+    _event("Interface Eth1 changed state to down"),
+    _event("LINK DOWN on port 3"),
+    _event("disk /var ok"),
+    _event("disk /var full", host="db12"),
+    _event("fatal error", application="smtpd"),
+    _event("fatal error", application="cron"),
+    _event("service recovered"),
+    _event(u"unicode \xe4rror"),
+])
+def test_rule_prefilter_never_excludes_matching_rules(event):
+    matcher = RuleMatcher(cmk.utils.log.get_logger("mkeventd"), {"debug_rules": False})
+    possible = RulePrefilter(RULES).possible_rules(event)
+
+    for position, rule in enumerate(RULES):
+        if matcher.event_rule_matches_non_inverted(rule, event) is not False:
+            assert position in possible
+
+
+def _possible_rule_ids(prefilter, event):
+    return [RULES[position]["id"] for position in prefilter.possible_rules(event)]
+
+
+def test_rule_prefilter_possible_rules():
+    prefilter = RulePrefilter(RULES)
+    assert prefilter.num_rules == len(RULES)
+    assert prefilter.num_filtered_rules == 5
+
+    assert _possible_rule_ids(prefilter, _event("disk /var full", host="db12")) == [
+        "cancel", "host", "only_cancel", "any", "inverted"
+    ]
+    assert _possible_rule_ids(prefilter, _event("fatal error", application="postfix/smtpd")) == [
+        "application", "only_cancel", "any", "inverted"
+    ]
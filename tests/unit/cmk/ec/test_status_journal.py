@@ -0,0 +1,171 @@
+import pathlib2 as pathlib
+import pytest
+
+import cmk.utils.log
+import cmk.ec.settings
+from cmk.ec.main import EventStatus, Perfcounters
+from cmk.ec.status_journal import StatusJournal, decode_snapshot, encode_snapshot
+
+logger = cmk.utils.log.get_logger("mkeventd")
+
+
+def test_status_journal(tmpdir):
+    path = pathlib.Path(str(tmpdir)) / "journal"
+    journal = StatusJournal(path)
+    assert list(journal.records()) == []
+    assert journal.size() == 0
+
+    journal.append({"seq": 1, "events": [{"text": u"\xe4", "match_groups": ("a",)}]})
+    journal.append({"seq": 2})
+    journal.append({"seq": 3, "events": [{"text": "cut off"}]})
+    # Incomplete last record of an interrupted write
+    path.write_bytes(path.read_bytes()[:-5])
+    assert list(journal.records()) == [
+        {
+            "seq": 1,
+            "events": [{
+                "text": u"\xe4",
+                "match_groups": ("a",)
+            }]
+        },
+        {
+            "seq": 2
+        },
+    ]
+    assert journal.size() > 0
+
+    journal.clear()
+    assert not path.exists()
+    journal.clear()
+
+
+def test_status_snapshot_encoding():
+    status = {"next_event_id": 3, "events": [{"text": u"\xe4", "match_groups": ("a",)}]}
+    assert decode_snapshot(encode_snapshot(status)) == status
+    # Status files of older versions contain a Python literal
+    assert decode_snapshot(repr(status) + "\n") == status
+
+
+class _FakeHistory(object):
+    def add(self, event, what, who=""):
+        pass
+
+
+class _FakeEventServer(object):
+    def add_core_host_to_event(self, event):
+        event["core_host"] = ""
+
+
+@pytest.fixture()
+def settings(tmpdir):
+    root = pathlib.Path(str(tmpdir))
+    settings = cmk.ec.settings.settings("1.6.0", root, root / "etc", ["mkeventd"])
+    settings.paths.status_file.value.parent.mkdir(parents=True)
+    return settings
+
+
+def _event_status(settings):
+    return EventStatus(settings, {"debug_rules": False}, Perfcounters(logger), _FakeHistory(),
+                       logger)
+
+
+def _event(host):
+    return {
+        "rule_id": "r1",
+        "host": host,
+        "application": "app",
+        "phase": "open",
+        "text": "text",
+        "ipaddress": "",
+        "core_host": "",
+    }
+
+
+def _loaded(settings):
+    event_status = _event_status(settings)
+    event_status.load_status(_FakeEventServer())
+    return event_status
+
+
+def test_event_status_save_changes_to_journal(settings):
+    event_status = _event_status(settings)
+    for host in ["h1", "h2", "h3"]:
+        event_status.new_event(_event(host))
+    event_status.count_rule_match("r1")
+    event_status.save_status()
+    snapshot = settings.paths.status_file.value.read_bytes()
+    assert event_status._journal.size() == 0
+
+    event = event_status.event(2)
+    event["phase"] = "ack"
+    event_status.event_changed(event)
+    event_status.delete_event(3, "user")
+    event_status.new_event(_event("h4"))
+    event_status.count_rule_match("r1")
+    event_status.count_rule_match("r2")
+    event_status.save_status()
+
+    assert settings.paths.status_file.value.read_bytes() == snapshot
+    records = list(event_status._journal.records())
+    assert len(records) == 1
+    assert [e["id"] for e in records[0]["events"]] == [2, 4]
+    assert records[0]["removed_events"] == [3]
+    assert records[0]["rule_stats"] == {"r1": 2, "r2": 1}
+
+    loaded = _loaded(settings)
+    assert loaded.pack_status() == event_status.pack_status()
+    assert loaded.num_existing_events_by_host == {"h1": 1, "h2": 1, "h4": 1}
+
+
+def test_event_status_snapshot_replaces_journal(settings):
+    event_status = _event_status(settings)
+    event_status.new_event(_event("h1"))
+    event_status.save_status()
+    event_status.new_event(_event("h2"))
+    event_status.save_status()
+    assert event_status._journal.size() > 0
+
+    event_status.save_status(snapshot=True)
+    assert event_status._journal.size() == 0
+    assert _loaded(settings).pack_status() == event_status.pack_status()
+
+
+def test_event_status_journal_compaction(settings, monkeypatch):
+    monkeypatch.setattr(EventStatus, "min_journal_size", 0)
+    event_status = _event_status(settings)
+    event_status.save_status()
+    event_status.new_event(_event("h1"))
+    event_status.save_status()
+    assert event_status._journal.size() > settings.paths.status_file.value.stat().st_size
+
+    event_status.save_status()
+    assert event_status._journal.size() == 0
+
+
+def test_event_status_skip_journal_records_in_snapshot(settings):
+    event_status = _event_status(settings)
+    event_status.new_event(_event("h1"))
+    event_status.save_status()
+    event_status.new_event(_event("h2"))
+    event_status.save_status()
+    journal = settings.paths.status_journal_file.value.read_bytes()
+
+    # Crash after writing the snapshot, before removing the journal
+    event_status.event(1)["phase"] = "ack"
+    event_status.event_changed(event_status.event(1))
+    event_status.save_status(snapshot=True)
+    settings.paths.status_journal_file.value.write_bytes(journal)
+
+    assert _loaded(settings).event(1)["phase"] == "ack"
+
+
+def test_event_status_load_without_snapshot(settings):
+    event_status = _event_status(settings)
+    event_status.save_status()
+    event_status.new_event(_event("h1"))
+    event_status.save_status()
+    settings.paths.status_file.value.unlink()
+
+    loaded = _loaded(settings)
+    assert [e["host"] for e in loaded.events()] == ["h1"]
+    assert loaded.pack_status()["next_event_id"] == 2
@@ -118,6 +118,7 @@ def test_registered_configvars():
         'enable_sounds',
         'escape_plugin_output',
         'event_limit',
+        'event_processing_workers',
         'eventsocket_queue_len',
         'failed_notification_horizon',
         'graph_timeranges',
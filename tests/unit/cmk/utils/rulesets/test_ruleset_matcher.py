@@ -4,7 +4,11 @@ import pytest  # type: ignore
 from testlib.base import Scenario
 from cmk_base.check_utils import Service
 from cmk_base.discovered_labels import DiscoveredServiceLabels, ServiceLabel
-from cmk.utils.rulesets.ruleset_matcher import RulesetMatchObject
+from cmk.utils.rulesets.ruleset_matcher import (
+    RulesetMatchObject,
+    RulesetMatcher,
+    ServiceDescriptionConditions,
+)
 
 
 def test_ruleset_match_object_invalid_attribute_in_init():
@@ -506,3 +510,148 @@ def test_ruleset_matcher_get_service_ruleset_values_labels(monkeypatch, hostname
             hostname, service_description),
                                            ruleset=service_label_ruleset,
                                            is_binary=False)) == expected_result
+
+
+class _FakeLabels(object):
+    def __init__(self, host_labels):
+        self._host_labels = host_labels
+
+    def labels_of_host(self, ruleset_matcher, hostname):
+        return self._host_labels.get(hostname, {})
+
+
+def test_all_matching_hosts_by_index():
+    host_tags = {
+        "host1": {"host1", "/", "prod", "lan", "linux"},
+        "host2": {"host2", "/sub/", "test", "lan", "windows"},
+        "host3": {"host3", "/sub/sub2/", "prod", "wan", "linux"},
+        "xyz": {"xyz", "/other/", "prod", "dmz", "aix"},
+    }
+    host_paths = {h: [t for t in tags if t.startswith("/")][0] for h, tags in host_tags.items()}
+    host_labels = {
+        "host1": {
+            u"os": u"linux"
+        },
+        "host2": {
+            u"os": u"windows"
+        },
+        "xyz": {
+            u"os": u"linux",
+            u"team": u"a"
+        },
+    }
+    matcher = RulesetMatcher(
+        tag_to_group_map={},
+        host_tag_lists=host_tags,
+        host_paths=host_paths,
+        labels=_FakeLabels(host_labels),
+        all_configured_hosts=set(host_tags),
+        clusters_of={},
+        nodes_of={},
+    )
+    optimizer = matcher.ruleset_optimizer
+    optimizer.set_all_processed_hosts(["host1", "host2", "host3"])
+
+    conditions = [
+        {},
+        {
+            "host_name": []
+        },
+        {
+            "host_folder": "/sub/"
+        },
+        {
+            "host_tags": {
+                "crit": "prod"
+            }
+        },
+        {
+            "host_tags": {
+                "crit": {
+                    "$ne": "prod"
+                },
+                "net": "lan"
+            }
+        },
+        {
+            "host_tags": {
+                "os": {
+                    "$or": ["linux", "aix"]
+                }
+            }
+        },
+        {
+            "host_tags": {
+                "os": {
+                    "$nor": ["linux", "aix"]
+                }
+            }
+        },
+        {
+            "host_labels": {
+                u"os": u"linux"
+            }
+        },
+        {
+            "host_labels": {
+                u"os": {
+                    "$ne": u"linux"
+                }
+            },
+            "host_tags": {
+                "net": "lan"
+            }
+        },
+        {
+            "host_name": ["host1", "xyz", "unknown"]
+        },
+        {
+            "host_name": {
+                "$nor": ["host1", {
+                    "$regex": "x"
+                }]
+            }
+        },
+        {
+            "host_name": [{
+                "$regex": "host[23]"
+            }, "xyz"],
+            "host_tags": {
+                "crit": "prod"
+            }
+        },
+    ]
+
+    for condition in conditions:
+        for with_foreign_hosts in [False, True]:
+            hosts = set(host_tags) if with_foreign_hosts else optimizer.all_processed_hosts()
+            expected = set(
+                h for h in hosts if host_paths[h].startswith(condition.get("host_folder", "/"))
+                and condition.get("host_name") != [] and optimizer.matches_host_tags(
+                    host_tags[h], condition.get("host_tags", {})) and all(
+                        host_labels.get(h, {}).get(k) == v if not isinstance(v, dict) else
+                        host_labels.get(h, {}).get(k) != v["$ne"]
+                        for k, v in condition.get("host_labels", {}).items()) and
+                optimizer.matches_host_name(condition.get("host_name"), h))
+            assert optimizer._all_matching_hosts(condition, with_foreign_hosts) == expected, \
+                (condition, with_foreign_hosts)
+
+
+@pytest.mark.parametrize("patterns, service_description, result", [
+    ([[u"CPU"], [u"Mem"], None], u"CPU load", (True, False, True)),
+    ([[u"CPU"], {
+        "$nor": [u"CPU"]
+    }], u"Memory", (False, True)),
+    ([[u"Interface 1$"], [{
+        "$regex": u"Interface [0-9]$"
+    }]], u"Interface 1", (True, True)),
+    ([[u"(a)\\1"], [u"(b)\\1"]], u"bb", (False, True)),
+    ([[u"(?i)cpu"], [u"Mem"]], u"CPU", (True, False)),
+])
+def test_service_description_conditions(patterns, service_description, result):
+    matcher = RulesetMatcher({}, {}, {}, _FakeLabels({}), set(), {}, {})
+    conditions = ServiceDescriptionConditions()
+    for pattern in patterns:
+        conditions.add(matcher.ruleset_optimizer._convert_pattern_list(pattern))
+    assert conditions.matching_conditions(service_description) == result
+    assert conditions.matching_conditions(service_description) == result
@@ -330,6 +330,62 @@ def test_structured_data_Numeration_compare_with(old_numeration_data, new_numera
     assert (n, c, r) == result
 
 
+@pytest.mark.parametrize("old_numeration_data, new_numeration_data", [
+    ([{
+        "id": "1",
+        "val": 1
+    }, {
+        "id": "2",
+        "val": 2
+    }, {
+        "id": "1",
+        "val": 1
+    }, {
+        "id": "3",
+        "val": 3.0
+    }], [{
+        "id": "2",
+        "val": 2
+    }, {
+        "id": "3",
+        "val": 3
+    }, {
+        "id": "4",
+        "val": 4
+    }, {
+        "id": "4",
+        "val": 4
+    }]),
+    ([{
+        "id": "1",
+        "val": [1, 2]
+    }, {
+        "id": "2",
+        "val": 2
+    }], [{
+        "id": "2",
+        "val": 2
+    }, {
+        "id": "1",
+        "val": [1, 3]
+    }]),
+    ([{
+        "name": "pkg%d" % i,
+        "version": "1.%d" % (i % 7)
+    } for i in range(300)], [{
+        "name": "pkg%d" % i,
+        "version": "1.%d" % (i % 5)
+    } for i in range(20, 320)]),
+])
+def test_structured_data_Numeration_categorized_rows(old_numeration_data, new_numeration_data):
+    old_numeration = Numeration()
+    old_numeration.set_child_data(old_numeration_data)
+    new_numeration = Numeration()
+    new_numeration.set_child_data(new_numeration_data)
+    assert new_numeration._get_categorized_rows(old_numeration) == \
+        new_numeration._get_categorized_rows_by_equality(old_numeration)
+
+
 @pytest.mark.parametrize("node_attribute,edge", [
     (mk_root(), "0_cna"),
 ])
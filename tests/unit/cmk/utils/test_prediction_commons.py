@@ -18,7 +18,10 @@ def test_rrdtimestamps(twindow, result):
      (300, 400, 10), 300, [25, 25, 25, 25, None, None, None, None, 105, 105]),
     ([0, 120, 40, 25, 65, 105], (330, 410, 10), 300, [25, 65, 65, 65, 65, 105, 105, 105]),
 ])
-def test_time_series_upsampling(rrddata, twindow, shift, upsampled):
+@pytest.mark.parametrize("with_numpy", [True, False])
+def test_time_series_upsampling(monkeypatch, with_numpy, rrddata, twindow, shift, upsampled):
+    if not with_numpy:
+        monkeypatch.setattr(prediction, "np", None)
     ts = prediction.TimeSeries(rrddata)
     assert ts.bfill_upsample(twindow, shift) == upsampled
 
@@ -107,6 +107,86 @@ def test_save_data_to_file_not_pretty(tmpdir):
     assert store.load_data_from_file(path) == data
 
 
+def test_load_data_from_file_uses_load_cache(tmpdir, monkeypatch):
+    path = "%s" % tmpdir.join("test")
+    store.save_data_to_file(path, {"a": [1, 2.5, None], u"b": (True, {3: u"\xe4"})})
+
+    data = store.load_data_from_file(path)
+    assert os.path.exists(store._load_cache_path(path, "data"))
+
+    monkeypatch.setattr(store.ast, "literal_eval", lambda content: 1 / 0)
+    cached = store.load_data_from_file(path)
+    assert cached == data
+    assert cached is not data
+    assert isinstance(cached.keys()[0], type(data.keys()[0]))
+
+
+def test_load_data_from_file_load_cache_outdated(tmpdir):
+    path = "%s" % tmpdir.join("test")
+    store.save_data_to_file(path, [1])
+    assert store.load_data_from_file(path) == [1]
+
+    store.save_data_to_file(path, [2])
+    assert store.load_data_from_file(path) == [2]
+
+    with open(path, "w") as f:
+        f.write("")
+    assert store.load_data_from_file(path, "DEF") == "DEF"
+
+
+def test_load_data_from_file_broken_load_cache(tmpdir):
+    path = "%s" % tmpdir.join("test")
+    store.save_data_to_file(path, [1])
+    assert store.load_data_from_file(path) == [1]
+
+    with open(store._load_cache_path(path, "data"), "w") as f:
+        f.write("garbage")
+    assert store.load_data_from_file(path) == [1]
+
+
+def test_prune_load_cache(tmpdir):
+    kept_path = "%s" % tmpdir.join("kept.mk")
+    removed_path = "%s" % tmpdir.join("removed.mk")
+    for path in [kept_path, removed_path]:
+        store.save_data_to_file(path, [1])
+        assert store.load_data_from_file(path) == [1]
+        store.save_mk_file(path, "x = 1")
+        store.load_mk_file(path, {})
+    os.unlink(removed_path)
+
+    broken_path = os.path.join(os.path.dirname(store._load_cache_path(kept_path, "data")), "broken")
+    with open(broken_path, "w") as f:
+        f.write("garbage")
+
+    store.prune_load_cache()
+    assert os.path.exists(store._load_cache_path(kept_path, "data"))
+    assert os.path.exists(store._load_cache_path(kept_path, "code"))
+    assert not os.path.exists(store._load_cache_path(removed_path, "data"))
+    assert not os.path.exists(store._load_cache_path(removed_path, "code"))
+    assert not os.path.exists(broken_path)
+
+
+def test_load_data_from_file_load_cache_disabled(tmpdir, monkeypatch):
+    monkeypatch.setattr(store, "load_cache_enabled", False)
+    path = "%s" % tmpdir.join("test")
+    store.save_data_to_file(path, [1])
+    assert store.load_data_from_file(path) == [1]
+    assert not os.path.exists(store._load_cache_path(path, "data"))
+
+
+def test_load_mk_file_uses_load_cache(tmpdir, monkeypatch):
+    path = "%s" % tmpdir.join("test.mk")
+    store.save_mk_file(path, "hosts += ['abc']\nsettings.update({'x': 1})")
+
+    result = store.load_mk_file(path, {"hosts": [], "settings": {}})
+    assert result == {"hosts": ["abc"], "settings": {"x": 1}}
+    assert os.path.exists(store._load_cache_path(path, "code"))
+
+    monkeypatch.setattr(store, "compile", lambda *args: 1 / 0, raising=False)
+    result = store.load_mk_file(path, {"hosts": ["def"], "settings": {"y": 2}})
+    assert result == {"hosts": ["def", "abc"], "settings": {"x": 1, "y": 2}}
+
+
 def test_acquire_lock_not_existing(tmpdir):
     store.aquire_lock("%s/asd" % tmpdir)
 
@@ -0,0 +1,96 @@
+# encoding: utf-8
+# pylint: disable=redefined-outer-name
+
+import os
+
+import pytest  # type: ignore
+from testlib.base import Scenario
+
+import cmk.utils.store as store
+
+import cmk_base.data_sources.tcp as tcp
+from cmk_base.data_sources.agent_cache import (
+    MappedAgentData,
+    read_mapped_cache_file,
+    section_index_path,
+    write_section_index,
+)
+from cmk_base.data_sources.agent_parser import parse_agent_data
+
+RAW_DATA = ("<<<check_mk>>>\nVersion: 1.7.0i1\n"
+            "<<<df:sep(59)>>>\n/;123\n"
+            "<<<<piggy>>>>\n<<<uptime>>>\n1\n<<<<>>>>\n"
+            "<<<local:encoding(cp1252)>>>\n0 \xe4 - ok\n")
+
+
+@pytest.fixture(autouse=True)
+def scenario(monkeypatch):
+    Scenario().add_host("hostname").apply(monkeypatch)
+
+
+@pytest.fixture
+def cachefile(tmp_path):
+    path = str(tmp_path / "hostname")
+    store.save_file(path, RAW_DATA)
+    return path
+
+
+def test_read_mapped_cache_file_without_index(cachefile):
+    assert read_mapped_cache_file(cachefile) is None
+
+
+def test_read_mapped_cache_file(cachefile):
+    write_section_index(cachefile, RAW_DATA)
+
+    mapped_data = read_mapped_cache_file(cachefile)
+    assert isinstance(mapped_data, MappedAgentData)
+    assert str(mapped_data) == RAW_DATA
+
+    host_sections = parse_agent_data("hostname", mapped_data.data, mapped_data.header_lines)
+    expected = parse_agent_data("hostname", RAW_DATA)
+    assert host_sections.sections == expected.sections
+    assert host_sections.piggybacked_raw_data == expected.piggybacked_raw_data
+
+
+@pytest.mark.parametrize("new_data", [
+    RAW_DATA + "<<<mem>>>\n",
+    RAW_DATA.replace("<<<df", "<<<xy"),
+])
+def test_read_mapped_cache_file_changed(cachefile, new_data):
+    write_section_index(cachefile, RAW_DATA)
+    store.save_file(cachefile, new_data)
+    st = os.stat(cachefile)
+    with open(section_index_path(cachefile)) as f:
+        index = f.read()
+
+    # Even with a matching mtime the outdated index must not be used
+    os.utime(cachefile, (st.st_atime, os.stat(section_index_path(cachefile)).st_mtime))
+    with open(section_index_path(cachefile), "w") as f:
+        f.write(index)
+
+    assert read_mapped_cache_file(cachefile) is None
+
+
+def test_read_mapped_cache_file_broken_index(cachefile):
+    store.save_file(section_index_path(cachefile), "garbage")
+    assert read_mapped_cache_file(cachefile) is None
+
+
+def test_data_source_uses_mapped_cache_file(monkeypatch, tmp_path):
+    source = tcp.TCPDataSource("hostname", "127.0.0.1")
+    monkeypatch.setattr(source, "_cache_dir", lambda: str(tmp_path))
+    monkeypatch.setattr(source, "_execute", lambda: RAW_DATA)
+    source.set_max_cachefile_age(0)
+
+    host_sections = source.run()
+    assert os.path.exists(section_index_path(str(tmp_path / "hostname")))
+
+    source.set_max_cachefile_age(3600)
+    monkeypatch.setattr(source, "_may_use_cache_file", True)
+    monkeypatch.setattr(source, "_execute", lambda: pytest.fail("Agent must not be contacted"))
+    raw_data, is_cached_data = source._get_raw_data()
+    assert is_cached_data
+    assert isinstance(raw_data, MappedAgentData)
+
+    assert source.run().sections == host_sections.sections
+    assert source.run_raw() == RAW_DATA
@@ -0,0 +1,133 @@
+# encoding: utf-8
+# pylint: disable=redefined-outer-name
+
+import pytest  # type: ignore
+from testlib.base import Scenario
+
+from cmk_base.data_sources.agent_parser import parse_agent_data, parse_section_header
+from cmk_base.data_sources.host_sections import HostSections, LazySections, RawSection
+
+
+@pytest.fixture(autouse=True)
+def scenario(monkeypatch):
+    Scenario().add_host("hostname").apply(monkeypatch)
+
+
+@pytest.mark.parametrize("header,expected", [
+    ("name", ("name", {})),
+    ("name:sep(59)", ("name", {"sep": "59"})),
+    ("name:cached(1,2):nostrip", ("name", {"cached": "1,2", "nostrip": None})),
+    ("name:encoding(cp1252):persist(123)", ("name", {
+        "encoding": "cp1252",
+        "persist": "123"
+    })),
+])
+def test_parse_section_header(header, expected):
+    assert parse_section_header(header) == expected
+
+
+@pytest.mark.parametrize("raw_data,expected", [
+    ("", {}),
+    ("no header\n", {}),
+    ("<<<a>>>", {
+        "a": []
+    }),
+    ("<<<a>>>\n", {
+        "a": []
+    }),
+    ("<<<a>>>\n1 2\n\n  3   4  \n<<<b>>>\n<<<c>>>\r\n5\r\n", {
+        "a": [[u"1", u"2"], [u"3", u"4"]],
+        "b": [],
+        "c": [[u"5"]],
+    }),
+    (" <<<a>>> \nx\n<<<b>>>\ny\n<<<a>>>\nz", {
+        "a": [[u"x"], [u"z"]],
+        "b": [[u"y"]],
+    }),
+    ("<<<a:sep(59)>>>\nx y;z\n<<<b:nostrip>>>\n  x y \r\n", {
+        "a": [[u"x y", u"z"]],
+        "b": [[u"x", u"y"]],
+    }),
+    ("<<<a:nostrip:sep(124)>>>\n  x|y \n", {
+        "a": [[u"  x", u"y "]],
+    }),
+    ("<<<a>>>\n\xc3\xa4\n<<<b:encoding(cp1252)>>>\n\xe4\n", {
+        "a": [[u"ä"]],
+        "b": [[u"ä"]],
+    }),
+    ("<<<a>>>\n\xc3\xa4\n\xe4\n", {
+        "a": [[u"ä"], [u"ä"]],
+    }),
+])
+def test_parse_agent_data_sections(raw_data, expected):
+    host_sections = parse_agent_data("hostname", raw_data)
+    assert isinstance(host_sections, HostSections)
+    assert isinstance(host_sections.sections, LazySections)
+    assert host_sections.sections == expected
+    assert host_sections.piggybacked_raw_data == {}
+
+
+def test_parse_agent_data_piggyback():
+    raw_data = "\n".join([
+        "<<<a>>>",
+        "1",
+        "<<<<pig host>>>>",
+        "<<<b>>>",
+        "2\r",
+        "",
+        "<<<<other>>>>",
+        "3",
+        "<<<<>>>>",
+        "4",
+        "<<<<hostname>>>>",
+        "5",
+        "<<<<>>>>",
+        "<<<c>>>",
+        "6",
+    ])
+    host_sections = parse_agent_data("hostname", raw_data)
+    assert host_sections.sections == {
+        "a": [[u"1"], [u"4"], [u"5"]],
+        "c": [[u"6"]],
+    }
+    assert host_sections.piggybacked_raw_data == {
+        "pig_host": ["<<<b>>>", "2", ""],
+        "other": ["3"],
+    }
+
+
+def test_parse_agent_data_cache_info(monkeypatch):
+    import cmk_base.data_sources.agent_parser as agent_parser
+    monkeypatch.setattr(agent_parser.time, "time", lambda: 1000)
+
+    host_sections = parse_agent_data(
+        "hostname", "<<<a:cached(10,20)>>>\n1\n<<<b:persist(1100)>>>\n2\n<<<b>>>\n3\n")
+    assert host_sections.cache_info == {"a": (10, 20), "b": (1000, 100)}
+    assert host_sections.persisted_sections == {"b": (1000, 1100, [[u"2"], [u"3"]])}
+    assert host_sections.persisted_sections["b"][2] is host_sections.sections["b"]
+
+
+def test_parse_agent_data_unknown_encoding():
+    with pytest.raises(LookupError):
+        parse_agent_data("hostname", "<<<a:encoding(not-existing)>>>\n1\n")
+
+
+def test_lazy_sections_parse_on_access():
+    sections = LazySections({"a": RawSection([("1 2\n3", None, False, None)])})
+    assert isinstance(dict.__getitem__(sections, "a"), RawSection)
+    assert sections.get("a") == [[u"1", u"2"], [u"3"]]
+    assert isinstance(dict.__getitem__(sections, "a"), list)
+    assert sections.get("b") is None
+
+
+def test_host_sections_update_keeps_sections_unparsed():
+    host_sections = HostSections()
+    host_sections.update(parse_agent_data("hostname", "<<<a>>>\n1\n<<<b>>>\n2\n"))
+    host_sections.update(parse_agent_data("hostname", "<<<a>>>\n3\n"))
+    host_sections.update(HostSections({"b": [[u"4"]]}))
+
+    assert isinstance(dict.__getitem__(host_sections.sections, "a"), RawSection)
+    assert host_sections.sections == {
+        "a": [[u"1"], [u"3"]],
+        "b": [[u"2"], [u"4"]],
+    }
@@ -0,0 +1,97 @@
+# pylint: disable=redefined-outer-name
+
+import socket
+import threading
+
+import pytest  # type: ignore
+from testlib.base import Scenario
+
+import cmk_base.data_sources.tcp as tcp
+from cmk_base.exceptions import MKAgentError
+
+
+@pytest.fixture
+def agent_server():
+    """A local TCP server that answers each connection with the agent output"""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen(16)
+    output = "<<<check_mk>>>\nVersion: 1.7.0i1\n" * 10000
+
+    def serve():
+        while True:
+            try:
+                conn, _addr = server.accept()
+            except socket.error:
+                return
+            conn.sendall(output)
+            conn.close()
+
+    thread = threading.Thread(target=serve)
+    thread.daemon = True
+    thread.start()
+    try:
+        yield server.getsockname()[1], output
+    finally:
+        server.close()
+
+
+def _unused_port():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def test_fetch_in_parallel(agent_server):
+    port, output = agent_server
+    closed_port = _unused_port()
+
+    connections = [
+        tcp._AgentConnection(("host%d" % i, "127.0.0.1", port), socket.AF_INET, 5.0)
+        for i in range(5)
+    ]
+    connections.append(
+        tcp._AgentConnection(("closed", "127.0.0.1", closed_port), socket.AF_INET, 5.0))
+
+    result = dict(tcp._fetch_in_parallel(connections, max_connections=2))
+
+    assert len(result) == 6
+    for i in range(5):
+        assert result[("host%d" % i, "127.0.0.1", port)] == output
+
+    error = result[("closed", "127.0.0.1", closed_port)]
+    assert isinstance(error, MKAgentError)
+    assert "Communication failed" in str(error)
+
+
+def test_tcp_data_source_uses_prefetched_output(monkeypatch, agent_server):
+    port, output = agent_server
+    Scenario().add_host("hostname").apply(monkeypatch)
+
+    source = tcp.TCPDataSource("hostname", "127.0.0.1")
+    source.set_port(port)
+    tcp.TCPDataSource.prefetch_agent_outputs([source], max_connections=10)
+    try:
+        assert tcp.TCPDataSource._prefetched_outputs == {("hostname", "127.0.0.1", port): output}
+
+        monkeypatch.setattr(source, "_fetch_agent_output",
+                            lambda port: pytest.fail("Agent must not be contacted"))
+        assert source._execute() == output
+        assert tcp.TCPDataSource._prefetched_outputs == {}
+    finally:
+        tcp.TCPDataSource.drop_prefetched_agent_outputs()
+
+
+def test_tcp_data_source_raises_prefetch_error(monkeypatch):
+    Scenario().add_host("hostname").apply(monkeypatch)
+
+    source = tcp.TCPDataSource("hostname", "127.0.0.1")
+    source.set_port(_unused_port())
+    tcp.TCPDataSource.prefetch_agent_outputs([source], max_connections=10)
+    try:
+        with pytest.raises(MKAgentError, match="Communication failed"):
+            source._execute()
+    finally:
+        tcp.TCPDataSource.drop_prefetched_agent_outputs()
@@ -0,0 +1,247 @@
+# encoding: utf-8
+# pylint: disable=redefined-outer-name
+
+import bisect
+import socket
+import threading
+
+import pytest  # type: ignore
+from pyasn1.codec.ber import decoder, encoder  # type: ignore
+from pysnmp.proto import api  # type: ignore
+
+import cmk_base.config as config
+import cmk_base.pysnmp_backend as pysnmp_backend
+import cmk_base.snmp as snmp
+import cmk_base.snmp_utils as snmp_utils
+
+
+def _oid(oid):
+    return tuple(int(p) for p in oid.strip(".").split("."))
+
+
+class SNMPResponder(object):
+    """A minimal SNMPv1/v2c agent answering from a static OID table"""
+    def __init__(self, table):
+        super(SNMPResponder, self).__init__()
+        self._table = sorted((_oid(oid), value) for oid, value in table.iteritems())
+        self._oids = [oid for oid, _value in self._table]
+        self.requests = []
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.bind(("127.0.0.1", 0))
+        self.port = self._sock.getsockname()[1]
+
+    def start(self):
+        thread = threading.Thread(target=self._serve)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self._sock.close()
+
+    def _serve(self):
+        while True:
+            try:
+                msg, address = self._sock.recvfrom(65535)
+            except socket.error:
+                return
+            self._sock.sendto(self._handle(msg), address)
+
+    def _handle(self, msg):
+        p_mod = api.protoModules[int(api.decodeMessageVersion(msg))]
+        req_msg, _rest = decoder.decode(msg, asn1Spec=p_mod.Message())
+        req_pdu = p_mod.apiMessage.getPDU(req_msg)
+        rsp_msg = p_mod.apiMessage.getResponse(req_msg)
+        rsp_pdu = p_mod.apiMessage.getPDU(rsp_msg)
+
+        oids = [tuple(oid) for oid, _value in p_mod.apiPDU.getVarBinds(req_pdu)]
+        if req_pdu.isSameTypeWith(p_mod.GetRequestPDU()):
+            self.requests.append(("get", oids))
+            var_binds = [self._get(oid, p_mod) for oid in oids]
+        elif req_pdu.isSameTypeWith(p_mod.GetNextRequestPDU()):
+            self.requests.append(("getnext", oids))
+            var_binds = [self._get_next(oid, p_mod) for oid in oids]
+        else:
+            max_repetitions = int(p_mod.apiBulkPDU.getMaxRepetitions(req_pdu))
+            self.requests.append(("getbulk", oids))
+            var_binds = []
+            current = oids
+            for _repetition in range(max_repetitions):
+                row = [self._get_next(oid, p_mod) for oid in current]
+                var_binds += row
+                current = [tuple(oid) for oid, _value in row]
+
+        for index, (_oid_value, value) in enumerate(var_binds):
+            if value is None:  # SNMPv1 noSuchName
+                p_mod.apiPDU.setErrorStatus(rsp_pdu, 2)
+                p_mod.apiPDU.setErrorIndex(rsp_pdu, index + 1)
+                var_binds = [(oid, p_mod.Null("")) for oid in oids]
+                break
+
+        p_mod.apiPDU.setVarBinds(rsp_pdu, var_binds)
+        return encoder.encode(rsp_msg)
+
+    def _get(self, oid, p_mod):
+        index = bisect.bisect_left(self._oids, oid)
+        if index < len(self._oids) and self._oids[index] == oid:
+            return oid, self._table[index][1]
+        if p_mod is api.protoModules[api.protoVersion1]:
+            return oid, None
+        return oid, api.v2c.NoSuchObject("")
+
+    def _get_next(self, oid, p_mod):
+        is_v1 = p_mod is api.protoModules[api.protoVersion1]
+        index = bisect.bisect_right(self._oids, oid)
+        while index < len(self._oids):
+            next_oid, value = self._table[index]
+            # Counter64 values can not be transported with SNMPv1
+            if not is_v1 or not isinstance(value, api.v2c.Counter64):
+                return next_oid, value
+            index += 1
+        if is_v1:
+            return oid, None
+        return oid, api.v2c.EndOfMibView("")
+
+
+TABLE = {
+    ".1.3.6.1.2.1.1.1.0": api.v2c.OctetString("Linux zeus"),
+    ".1.3.6.1.2.1.1.2.0": api.v2c.ObjectIdentifier("1.3.6.1.4.1.8072.3.2.10"),
+    ".1.3.6.1.2.1.1.3.0": api.v2c.TimeTicks(449613886),
+    ".1.3.6.1.2.1.4.20.1.1.10.1.1.1": api.v2c.IpAddress("10.1.1.1"),
+}
+for _i in range(1, 26):
+    TABLE[".1.3.6.1.2.1.2.2.1.1.%d" % _i] = api.v2c.Integer(_i)
+    TABLE[".1.3.6.1.2.1.2.2.1.2.%d" % _i] = api.v2c.OctetString("eth%d " % _i)
+    TABLE[".1.3.6.1.2.1.2.2.1.6.%d" % _i] = api.v2c.OctetString("\x00\x1a\x2b\x3c\x4d%c" % _i)
+    if _i % 2:
+        TABLE[".1.3.6.1.2.1.31.1.1.1.6.%d" % _i] = api.v2c.Counter64(2**40 + _i)
+
+
+@pytest.fixture
+def responder():
+    responder = SNMPResponder(TABLE)
+    responder.start()
+    try:
+        yield responder
+    finally:
+        responder.stop()
+        pysnmp_backend.cleanup_sessions()
+
+
+def _snmp_config(port, **kwargs):
+    settings = {
+        "is_ipv6_primary": False,
+        "hostname": "localhost",
+        "ipaddress": "127.0.0.1",
+        "credentials": "public",
+        "port": port,
+        "is_bulkwalk_host": True,
+        "is_snmpv2or3_without_bulkwalk_host": False,
+        "bulk_walk_size_of": 10,
+        "timing": {
+            "timeout": 1,
+            "retries": 0
+        },
+        "oid_range_limits": [],
+        "snmpv3_contexts": [],
+        "character_encoding": None,
+        "is_usewalk_host": False,
+        "is_inline_snmp_host": False,
+    }
+    settings.update(kwargs)
+    return snmp_utils.SNMPHostConfig(**settings)
+
+
+@pytest.mark.parametrize("oid,expected", [
+    (".1.3.6.1.2.1.1.1.0", "Linux zeus"),
+    (".1.3.6.1.2.1.1.2.0", ".1.3.6.1.4.1.8072.3.2.10"),
+    (".1.3.6.1.2.1.1.3.0", "449613886"),
+    (".1.3.6.1.2.1.1.4.0", None),
+    (".1.3.6.1.2.1.1.*", "Linux zeus"),
+    (".1.3.6.1.2.1.3.*", None),
+])
+def test_get(responder, oid, expected):
+    backend = pysnmp_backend.PySNMPBackend()
+    assert backend.get(_snmp_config(responder.port), oid) == expected
+
+
+@pytest.mark.parametrize("settings", [
+    {},
+    {
+        "bulk_walk_size_of": 3
+    },
+    {
+        "is_bulkwalk_host": False,
+        "is_snmpv2or3_without_bulkwalk_host": True
+    },
+    {
+        "is_bulkwalk_host": False
+    },
+])
+def test_walk_many(responder, settings):
+    backend = pysnmp_backend.PySNMPBackend()
+    result = backend.walk_many(_snmp_config(responder.port, **settings), [
+        ".1.3.6.1.2.1.2.2.1.2",
+        ".1.3.6.1.2.1.2.2.1.6",
+        ".1.3.6.1.2.1.31.1.1.1.6",
+        ".1.3.6.1.2.1.4.20.1.1",
+        ".1.3.6.1.2.1.1.1.0",
+        ".1.3.6.1.2.1.99",
+    ])
+
+    assert result[".1.3.6.1.2.1.2.2.1.2"] == [
+        (".1.3.6.1.2.1.2.2.1.2.%d" % i, "eth%d" % i) for i in range(1, 26)
+    ]
+    assert result[".1.3.6.1.2.1.2.2.1.6"] == [
+        (".1.3.6.1.2.1.2.2.1.6.%d" % i, "\x00\x1a\x2b\x3c\x4d%c" % i) for i in range(1, 26)
+    ]
+    if settings.get("is_bulkwalk_host") is False and not settings.get(
+            "is_snmpv2or3_without_bulkwalk_host"):
+        # There are no 64 bit counters with SNMPv1
+        assert result[".1.3.6.1.2.1.31.1.1.1.6"] == []
+    else:
+        assert result[".1.3.6.1.2.1.31.1.1.1.6"] == [
+            (".1.3.6.1.2.1.31.1.1.1.6.%d" % i, str(2**40 + i)) for i in range(1, 26, 2)
+        ]
+    assert result[".1.3.6.1.2.1.4.20.1.1"] == [(".1.3.6.1.2.1.4.20.1.1.10.1.1.1", "10.1.1.1")]
+    # Like snmpwalk, a leaf OID is fetched with GET
+    assert result[".1.3.6.1.2.1.1.1.0"] == [(".1.3.6.1.2.1.1.1.0", "Linux zeus")]
+    assert result[".1.3.6.1.2.1.99"] == []
+
+
+def test_walk_many_batches_columns(responder):
+    backend = pysnmp_backend.PySNMPBackend()
+    backend.walk_many(_snmp_config(responder.port, bulk_walk_size_of=10), [
+        ".1.3.6.1.2.1.2.2.1.1",
+        ".1.3.6.1.2.1.2.2.1.2",
+        ".1.3.6.1.2.1.2.2.1.6",
+    ])
+    assert [(ty, len(oids)) for ty, oids in responder.requests] == [("getbulk", 3)] * 3
+
+
+def test_walk_timeout():
+    responder = SNMPResponder({})
+    try:
+        # Don't start the responder: The requests are not answered
+        backend = pysnmp_backend.PySNMPBackend()
+        with pytest.raises(snmp.MKSNMPError, match="Timeout: No Response from 127.0.0.1"):
+            backend.walk(_snmp_config(responder.port, timing={"timeout": 0.1, "retries": 0}),
+                         ".1.3.6.1.2.1.2.2.1.2")
+    finally:
+        responder.stop()
+        pysnmp_backend.cleanup_sessions()
+
+
+def test_get_snmp_table(monkeypatch, responder):
+    monkeypatch.setattr(config, "use_pysnmp_backend", True)
+    table = snmp.get_snmp_table(_snmp_config(responder.port),
+                                check_plugin_name=None,
+                                oid_info=(".1.3.6.1.2.1.2.2.1", [snmp_utils.OID_END, "2", "1"]),
+                                use_snmpwalk_cache=False)
+    assert table == [[u"%d" % i, u"eth%d" % i, u"%d" % i] for i in range(1, 26)]
+    assert [ty for ty, _oids in responder.requests] == ["getbulk"] * 3
+
+
+def test_unknown_host():
+    backend = pysnmp_backend.PySNMPBackend()
+    with pytest.raises(snmp.MKSNMPError, match="Unknown host"):
+        backend.walk(_snmp_config(161, ipaddress="bla.local"), ".1.3.6.1.2.1.2.2.1.2")
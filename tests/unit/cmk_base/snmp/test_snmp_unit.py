@@ -5,6 +5,7 @@ from testlib.base import Scenario
 
 import cmk_base.config as config
 import cmk_base.snmp as snmp
+import cmk_base.snmp_utils as snmp_utils
 
 
 @pytest.mark.parametrize(
@@ -38,3 +39,70 @@ def test_is_bulkwalk_host(monkeypatch):
     config_cache = ts.apply(monkeypatch)
     assert config_cache.get_host_config("abc").snmp_config("").is_bulkwalk_host is False
     assert config_cache.get_host_config("localhost").snmp_config("").is_bulkwalk_host is True
+
+
+@pytest.mark.parametrize("oids,expected", [
+    ([], {}),
+    ([".1.2", ".1.2.3", ".1.20", ".1.2.3.4"], {
+        ".1.2": ".1.2",
+        ".1.2.3": ".1.2",
+        ".1.2.3.4": ".1.2",
+        ".1.20": ".1.20",
+    }),
+    ([".1.10.1", ".1.9", ".1.9.1"], {
+        ".1.9": ".1.9",
+        ".1.9.1": ".1.9",
+        ".1.10.1": ".1.10.1",
+    }),
+])
+def test_covering_oids(oids, expected):
+    assert snmp._covering_oids(oids) == expected
+
+
+class _FakeBackend(snmp_utils.ABCSNMPBackend):
+    def __init__(self, walks):
+        super(_FakeBackend, self).__init__()
+        self._rows = sorted(
+            ((oid, value) for oid, value in {
+                ".1.3.6.1.2.1.2.2.1.1.1": "1",
+                ".1.3.6.1.2.1.2.2.1.1.2": "2",
+                ".1.3.6.1.2.1.2.2.1.2.1": "lo",
+                ".1.3.6.1.2.1.2.2.1.2.2": "eth0",
+                ".1.3.6.1.2.1.2.2.1.10.1": "100",
+                ".1.3.6.1.2.1.2.2.1.10.2": "200",
+                ".1.3.6.1.2.1.1.1.0": "Linux",
+            }.items()),
+            key=lambda r: map(int, r[0].strip(".").split(".")))
+        self.walks = walks
+
+    def get(self, snmp_config, oid, context_name=None):
+        return None
+
+    def walk(self, snmp_config, oid, check_plugin_name=None, table_base_oid=None,
+             context_name=None):
+        self.walks.append(oid)
+        return [r for r in self._rows if r[0].startswith(oid + ".") or r[0] == oid]
+
+
+def test_get_snmp_tables(monkeypatch):
+    Scenario().add_host("localhost").apply(monkeypatch)
+    snmp_config = config.get_config_cache().get_host_config("localhost").snmp_config("")
+
+    walks = []
+    monkeypatch.setattr(snmp.SNMPBackendFactory, "factory",
+                        staticmethod(lambda snmp_config, enforce_stored_walks: _FakeBackend(walks)))
+
+    table_requests = [
+        ("if", (".1.3.6.1.2.1.2.2.1", ["1", "2", "10"])),
+        ("if_brief", (".1.3.6.1.2.1.2.2.1", [snmp_utils.OID_END, "2"])),
+        ("if_all", (".1.3.6.1.2.1.2", ["2.1.2", "2"])),
+        ("sys", (".1.3.6.1.2.1.1", ["1.0"])),
+    ]
+
+    tables, stats = snmp.get_snmp_tables(snmp_config, table_requests, use_snmpwalk_cache=False)
+
+    assert walks == [".1.3.6.1.2.1.2.2", ".1.3.6.1.2.1.1.1.0"]
+    assert stats == snmp.SNMPWalkStats(requested=7, cached=0, executed=2)
+
+    for (check_plugin_name, oid_info), table in zip(table_requests, tables):
+        assert table == snmp.get_snmp_table(snmp_config, check_plugin_name, oid_info, False)
@@ -271,3 +271,58 @@ def test_save_autochecks_file(items, expected_content):
         content = f.read()
 
     assert expected_content == content
+
+
+@pytest.fixture()
+def snapshot_config(monkeypatch):
+    config.load_checks(check_api.get_check_api_context, [
+        "%s/%s" % (cmk.utils.paths.checks_dir, f) for f in ["df", "cpu"]
+    ])
+    return Scenario().add_host("host").apply(monkeypatch)
+
+
+@pytest.fixture()
+def packed_config(monkeypatch, tmp_path):
+    monkeypatch.setattr(cmk.utils.paths, "var_dir", str(tmp_path / "var"))
+    packed_config_path = Path(config.PackedConfig().path)
+    packed_config_path.parent.mkdir(parents=True)  # pylint: disable=no-member
+    packed_config_path.write_bytes(b"")  # pylint: disable=no-member
+    monkeypatch.setattr(config, "_packed_config_loaded", True)
+    return packed_config_path
+
+
+def test_autochecks_snapshot(snapshot_config, packed_config):
+    autochecks_file = Path(cmk.utils.paths.autochecks_dir).joinpath("host.mk")
+    autochecks_file.write_text(  # pylint: disable=no-member
+        u"""[
+  {'check_plugin_name': 'df', 'item': u'/', 'parameters': {}, 'service_labels': {u'x': u'y'}},
+  {'check_plugin_name': 'cpu.loads', 'item': None, 'parameters': cpuload_default_levels, 'service_labels': {}},
+]""")
+    assert autochecks.load_autochecks_snapshot("host") is None
+
+    services = snapshot_config.get_autochecks_of("host")
+    autochecks.save_autochecks_snapshot("host", services)
+
+    snapshot = autochecks.load_autochecks_snapshot("host")
+    assert snapshot == services
+    assert [s.parameters for s in snapshot] == [s.parameters for s in services]
+    assert [s.description for s in snapshot] == [s.description for s in services]
+    assert snapshot[0].service_labels.to_dict() == {u"x": u"y"}
+
+    # The check helpers use the snapshot instead of reading the autochecks
+    assert autochecks.AutochecksManager().get_autochecks_of("host") == snapshot
+
+    # Changed autochecks invalidate the snapshot
+    autochecks_file.write_text(u"[]")  # pylint: disable=no-member
+    assert autochecks.load_autochecks_snapshot("host") is None
+    assert autochecks.AutochecksManager().get_autochecks_of("host") == []
+
+
+def test_autochecks_snapshot_invalidated_by_packed_config(snapshot_config, packed_config):
+    Path(cmk.utils.paths.autochecks_dir).joinpath("host.mk").write_text(  # pylint: disable=no-member
+        u"[{'check_plugin_name': 'df', 'item': u'/', 'parameters': {}, 'service_labels': {}}]")
+    autochecks.save_autochecks_snapshot("host", snapshot_config.get_autochecks_of("host"))
+    assert autochecks.load_autochecks_snapshot("host") is not None
+
+    packed_config.write_bytes(b"changed = True\n")  # pylint: disable=no-member
+    assert autochecks.load_autochecks_snapshot("host") is None
@@ -1,6 +1,7 @@
 # encoding: utf-8
 # pylint: disable=redefined-outer-name
 
+import os
 from pathlib2 import Path
 import pytest  # type: ignore
 from testlib.base import Scenario
@@ -1602,3 +1603,83 @@ def test_host_config_service_level(monkeypatch, hostname, result):
     )
     config_cache = ts.apply(monkeypatch)
     assert config_cache.get_host_config(hostname).service_level == result
+
+
+@pytest.fixture()
+def check_manifest(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "_check_plugin_manifest", None)
+    monkeypatch.setattr(cmk.utils.paths, "local_checks_dir", str(tmp_path / "local_checks"))
+
+
+def test_manifest_of_plugin(tmp_path):
+    check_file = tmp_path / "foo"
+    check_file.write_bytes(b"""
+factory_settings["foo_default_levels"] = {"levels": (80.0, 90.0)}
+
+def check_foo(item, params, info):
+    return 0, "OK"
+
+check_info["foo"] = {
+    "check_function": check_foo,
+    "service_description": "Foo %s",
+    "group": "foo",
+    "default_levels_variable": "foo_default_levels",
+    "includes": ["foo.include"],
+    "snmp_info": (".1.3.6.1.2.1.1", ["1"]),
+    "snmp_scan_function": lambda oid: True,
+}
+
+check_info["foo.bar"] = {
+    "check_function": check_foo,
+    "service_description": "Bar",
+    "has_perfdata": True,
+}
+""")
+
+    entry = config._manifest_of_plugin(str(check_file))
+    assert entry["complete"] is True
+    assert entry["includes"] == ["foo.include"]
+    assert entry["snmp_sections"] == ["foo"]
+    assert entry["scan_functions"] == ["foo"]
+    assert sorted(entry["checks"]) == ["foo", "foo.bar"]
+    assert entry["checks"]["foo"]["group"] == "foo"
+    assert entry["checks"]["foo"]["default_levels_variable"] == "foo_default_levels"
+    assert entry["checks"]["foo.bar"]["has_perfdata"] is True
+    assert entry["checks"]["foo.bar"]["snmp_info"] is False
+
+
+def test_manifest_of_plugin_incomplete(tmp_path):
+    check_file = tmp_path / "foo"
+    check_file.write_bytes(b"""
+for name in ["foo", "bar"]:
+    check_info[name] = {"service_description": name}
+""")
+    entry = config._manifest_of_plugin(str(check_file))
+    assert entry["complete"] is False
+    assert entry["checks"] == {}
+
+
+def test_check_plugin_files(check_manifest):
+    paths = config.check_plugin_files(["df", "df.inodes", "mem.used", "agent_ipmi_sensors"])
+    assert [os.path.basename(p) for p in paths] == ["df", "mem", "agent_ipmi_sensors"]
+
+
+def test_check_plugin_files_local_shadows_builtin(check_manifest):
+    local_checks_dir = Path(cmk.utils.paths.local_checks_dir)
+    local_checks_dir.mkdir(parents=True)
+    (local_checks_dir / "uptime").write_bytes(
+        b'check_info["uptime"] = {"service_description": "Local uptime"}\n')
+
+    assert config.check_plugin_files(["uptime"]) == [str(local_checks_dir / "uptime")]
+
+
+def test_check_plugin_infos(check_manifest):
+    infos = config.check_plugin_infos(check_api.get_check_api_context)
+
+    config.load_checks(check_api.get_check_api_context, config.check_plugin_files(["df", "uptime"]))
+    for check_plugin_name in ["df", "uptime"]:
+        info = config.check_info[check_plugin_name]
+        assert infos[check_plugin_name]["group"] == info["group"]
+        assert infos[check_plugin_name]["service_description"] == info["service_description"]
+        assert infos[check_plugin_name]["snmp"] is False
+    assert infos["snmp_uptime"]["snmp"] is True
@@ -2,6 +2,7 @@
 import pytest  # type: ignore
 from testlib.base import Scenario
 
+import cmk.utils.paths
 from cmk.utils.exceptions import MKGeneralException
 import cmk_base.config as config
 import cmk_base.core_config as core_config
@@ -105,3 +106,52 @@ def test_get_tag_attributes(tag_groups, result):
     for k, v in attributes.items():
         assert isinstance(k, unicode)
         assert isinstance(v, unicode)
+
+
+@pytest.fixture()
+def fingerprint_dirs(monkeypatch, tmp_path):
+    monkeypatch.setattr(cmk.utils.paths, "autochecks_dir", str(tmp_path / "autochecks"))
+    monkeypatch.setattr(cmk.utils.paths, "core_fingerprints_dir", str(tmp_path / "fingerprints"))
+    (tmp_path / "autochecks").mkdir()
+
+
+def test_host_fingerprints(fingerprint_dirs, monkeypatch):
+    ts = Scenario().add_host("host1").add_host("host2")
+    ts.add_cluster("cluster", nodes=["host1"])
+    config_cache = ts.apply(monkeypatch)
+
+    fingerprints = core_config.HostFingerprints(config_cache, "test")
+    assert not fingerprints.is_unchanged("host1")
+    for hostname in ["host1", "host2", "cluster"]:
+        fingerprints.update(hostname, hostname.upper())
+    fingerprints.save()
+
+    fingerprints = core_config.HostFingerprints(config_cache, "test")
+    assert fingerprints.is_unchanged("host1")
+    assert fingerprints.get_data("host1") == "HOST1"
+
+    with open("%s/host1.mk" % cmk.utils.paths.autochecks_dir, "w") as f:
+        f.write("[\n]\n")
+
+    fingerprints = core_config.HostFingerprints(config_cache, "test")
+    assert not fingerprints.is_unchanged("host1")
+    assert fingerprints.is_unchanged("host2")
+
+    with open("%s/test.marshal" % cmk.utils.paths.core_fingerprints_dir, "w") as f:
+        f.write("")
+    fingerprints = core_config.HostFingerprints(config_cache, "test")
+    assert not fingerprints.is_unchanged("host2")
+    # The services of the cluster are discovered on its nodes
+    assert not fingerprints.is_unchanged("cluster")
+
+    # Only the updated hosts are saved
+    fingerprints.update("host2", "HOST2")
+    fingerprints.save()
+    fingerprints = core_config.HostFingerprints(config_cache, "test")
+    assert not fingerprints.is_unchanged("host1")
+    assert fingerprints.is_unchanged("host2")
+
+    with open("%s/test.marshal" % cmk.utils.paths.core_fingerprints_dir, "w") as f:
+        f.write("")
+    fingerprints = core_config.HostFingerprints(config_cache, "test")
+    assert not fingerprints.is_unchanged("host2")
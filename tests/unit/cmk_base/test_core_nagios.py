@@ -6,6 +6,9 @@ from StringIO import StringIO
 import pytest  # type: ignore
 from testlib.base import Scenario
 
+import cmk.utils.paths
+from cmk.utils.exceptions import MKGeneralException
+
 import cmk_base.core_config as core_config
 import cmk_base.core_nagios as core_nagios
 
@@ -187,3 +190,109 @@ def test_create_nagios_host_spec(hostname, result, monkeypatch):
 
     host_spec = core_nagios._create_nagios_host_spec(cfg, config_cache, hostname, host_attrs)
     assert host_spec == result
+
+
+def test_host_shards():
+    hostnames = ["host%d" % i for i in range(10)]
+    shards = core_config.host_shards(hostnames, 4)
+    assert [len(s) for s in shards] == [3, 3, 2, 2]
+    assert list(itertools.chain(*shards)) == hostnames
+    assert core_config.host_shards(hostnames[:2], 4) == [["host0"], ["host1"]]
+
+
+def test_create_nagios_config_hosts_parallel(monkeypatch):
+    hostnames = ["host%02d" % i for i in range(20)]
+    ts = Scenario()
+    for hostname in hostnames:
+        ts.add_host(hostname)
+    ts.set_option("ipaddresses", {h: "127.0.0.%d" % i for i, h in enumerate(hostnames, 1)})
+    ts.set_option("host_check_commands", [
+        ("agent", [], ["host03", "host07", "host15"], {}),
+        (("service", "CPU load"), [], ["host16"], {}),
+    ])
+    config_cache = ts.apply(monkeypatch)
+
+    lookup_ip_address = core_config.ip_lookup.lookup_ip_address
+
+    def lookup_failing(hostname, family=None):
+        if hostname in ["host05", "host12"]:
+            raise MKGeneralException("Failed to lookup IP address")
+        return lookup_ip_address(hostname, family)
+
+    monkeypatch.setattr(core_config.ip_lookup, "lookup_ip_address", lookup_failing)
+
+    def create(processes):
+        monkeypatch.setattr(core_config.config, "core_config_processes", processes)
+        monkeypatch.setattr(core_config, "_failed_ip_lookups", [])
+        cfg = core_nagios.NagiosConfig(StringIO(), hostnames)
+        core_nagios._create_nagios_config_hosts(cfg, config_cache, hostnames)
+        cfg.failed_ip_lookups = core_config.failed_ip_lookups()
+        return cfg
+
+    monkeypatch.setattr(core_config, "_MIN_HOSTS_PER_PROCESS", 1)
+    serial = create(1)
+    parallel = create(3)
+
+    assert "check-mk-host-custom-4" in serial.outfile.getvalue()
+    assert parallel.outfile.getvalue() == serial.outfile.getvalue()
+    assert parallel.hostcheck_commands_to_define == serial.hostcheck_commands_to_define
+    assert parallel.hostgroups_to_define == serial.hostgroups_to_define
+    assert parallel.contactgroups_to_define == serial.contactgroups_to_define
+    assert sorted(set(serial.failed_ip_lookups)) == ["host05", "host12"]
+    assert parallel.failed_ip_lookups == serial.failed_ip_lookups
+
+
+def test_create_config_reuses_unchanged_hosts(monkeypatch, tmp_path):
+    monkeypatch.setattr(cmk.utils.paths, "autochecks_dir", str(tmp_path))
+    monkeypatch.setattr(cmk.utils.paths, "core_fingerprints_dir", str(tmp_path / "fingerprints"))
+
+    ts = Scenario().add_host("host1").add_host("host2")
+    ts.set_option("ipaddresses", {"host1": "127.0.0.1", "host2": "127.0.0.2"})
+    ts.set_option("host_check_commands", [("agent", [], ["host1", "host2"], {})])
+    ts.apply(monkeypatch)
+
+    created = []
+    create_host = core_nagios._create_nagios_config_host
+
+    def create_host_recorded(cfg, config_cache, hostname):
+        created.append(hostname)
+        return create_host(cfg, config_cache, hostname)
+
+    monkeypatch.setattr(core_nagios, "_create_nagios_config_host", create_host_recorded)
+
+    def create_config():
+        del created[:]
+        outfile = StringIO()
+        core_nagios.create_config(outfile, hostnames=None)
+        return outfile.getvalue()
+
+    initial = create_config()
+    assert sorted(created) == ["host1", "host2"]
+
+    assert create_config() == initial
+    assert created == []
+
+    (tmp_path / "host1.mk").write_text(u"[\n]\n")
+    assert create_config() == initial
+    assert created == ["host1"]
+
+
+def test_create_config_reports_failed_ip_lookups_of_unchanged_hosts(monkeypatch, tmp_path):
+    monkeypatch.setattr(cmk.utils.paths, "autochecks_dir", str(tmp_path))
+    monkeypatch.setattr(cmk.utils.paths, "core_fingerprints_dir", str(tmp_path / "fingerprints"))
+
+    ts = Scenario().add_host("host1").add_host("host2")
+    ts.set_option("ipaddresses", {"host1": "127.0.0.1"})
+    ts.apply(monkeypatch)
+
+    def lookup_failing(hostname, family=None):
+        if hostname == "host2":
+            raise MKGeneralException("Failed to lookup IP address")
+        return "127.0.0.1"
+
+    monkeypatch.setattr(core_config.ip_lookup, "lookup_ip_address", lookup_failing)
+
+    for _run in range(2):
+        monkeypatch.setattr(core_config, "_failed_ip_lookups", [])
+        core_nagios.create_config(StringIO(), hostnames=None)
+        assert set(core_config.failed_ip_lookups()) == {"host2"}
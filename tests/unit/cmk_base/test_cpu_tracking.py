@@ -1,5 +1,11 @@
 #!/usr/bin/env python
 
+import errno
+import os
+
+import pytest  # type: ignore
+
+import cmk.utils.paths
 import cmk_base.cpu_tracking as cpu_tracking
 
 
@@ -82,3 +88,102 @@ def test_cpu_tracking_add_times(monkeypatch):
     assert times["TOTAL"][4] == 7.0
     assert times["busy"][4] == 2.0
     assert times["agent"][4] == 5.0
+
+
+@pytest.fixture()
+def clear_records():
+    cpu_tracking.clear_records()
+    yield
+    cpu_tracking.clear_records()
+
+
+@pytest.mark.usefixtures("clear_records")
+def test_track_records(monkeypatch):
+    monkeypatch.setattr("time.time", lambda: 1.0)
+    with cpu_tracking.track("check", "df"):
+        monkeypatch.setattr("time.time", lambda: 3.0)
+
+    assert len(cpu_tracking.records) == 1
+    kind, name, wall_time, cpu_time = cpu_tracking.records[0]
+    assert (kind, name, wall_time) == ("check", "df", 2.0)
+    assert cpu_time >= 0.0
+
+
+@pytest.mark.usefixtures("clear_records")
+def test_track_records_on_exception():
+    with pytest.raises(ValueError):
+        with cpu_tracking.track("parse", "df"):
+            raise ValueError()
+
+    assert [r[:2] for r in cpu_tracking.records] == [("parse", "df")]
+
+
+@pytest.mark.usefixtures("clear_records")
+def test_records_ring_buffer(monkeypatch):
+    for _ in range(cpu_tracking.records.maxlen + 10):
+        with cpu_tracking.track("check", "df"):
+            pass
+    assert len(cpu_tracking.records) == cpu_tracking.records.maxlen
+
+
+@pytest.mark.usefixtures("clear_records")
+def test_aggregated_records():
+    cpu_tracking.records.extend([
+        ("check", "df", 1.0, 0.5),
+        ("source", "agent", 2.0, 0.25),
+        ("check", "df", 3.0, 1.5),
+    ])
+    assert cpu_tracking.aggregated_records() == [
+        ("check", "df", 2, 4.0, 2.0),
+        ("source", "agent", 1, 2.0, 0.25),
+    ]
+
+
+@pytest.mark.usefixtures("clear_records")
+def test_dump_and_rank_host_stats(monkeypatch, tmpdir):
+    monkeypatch.setattr(cmk.utils.paths, "tmp_dir", str(tmpdir))
+    monkeypatch.setattr("time.time", lambda: 0.0)
+
+    for hostname, check_cpu_time in [("a", 1.0), ("b", 3.0), ("a", 0.5)]:
+        cpu_tracking.start("busy")
+        cpu_tracking.records.extend([
+            ("source", "agent", 1.0, 0.25),
+            ("check", "df", check_cpu_time, check_cpu_time),
+        ])
+        cpu_tracking.end()
+        cpu_tracking.dump_host_stats(hostname)
+        assert not cpu_tracking.records
+
+    stats = list(cpu_tracking.load_host_stats())
+    assert [s[1] for s in stats] == ["a", "b", "a"]
+
+    top_hosts, top_plugins = cpu_tracking.rank_host_stats(iter(stats), top=1)
+    assert top_hosts == [("a", 2, 0.0, stats[0][3] + stats[2][3])]
+    assert top_plugins == [("check", "df", 3, 4.5, 4.5)]
+
+
+def test_dump_host_stats_concurrently_created_dir(monkeypatch, tmpdir):
+    monkeypatch.setattr(cmk.utils.paths, "tmp_dir", str(tmpdir))
+    makedirs = os.makedirs
+
+    def makedirs_racing(path):
+        makedirs(path)
+        raise OSError(errno.EEXIST, "File exists")
+
+    monkeypatch.setattr(os, "makedirs", makedirs_racing)
+    cpu_tracking.dump_host_stats("a")
+    assert [s[1] for s in cpu_tracking.load_host_stats()] == ["a"]
+
+
+def test_dump_host_stats_error(monkeypatch, tmpdir):
+    stats_dir = tmpdir.join("cpu_tracking")
+    stats_dir.write("not a directory")
+    monkeypatch.setattr(cmk.utils.paths, "tmp_dir", str(tmpdir))
+
+    cpu_tracking.records.append(("check", "df", 1.0, 1.0))
+    cpu_tracking.dump_host_stats("a")
+    assert not cpu_tracking.records
+
+
+def test_load_host_stats_missing(tmpdir):
+    assert list(cpu_tracking.load_host_stats(str(tmpdir.join("stats")))) == []
@@ -1,8 +1,12 @@
 # encoding: utf-8
 # pylint: disable=redefined-outer-name
 
+import time
+
 import pytest  # type: ignore
+from testlib.base import Scenario
 
+import cmk.utils.paths
 import cmk_base.discovery as discovery
 from cmk_base.check_api_utils import Service
 from cmk_base.discovered_labels import (
@@ -78,3 +82,61 @@ def test_discovered_service_labels_of_host():
             u"blä": u"bläb",
         },
     }
+
+
+@pytest.fixture()
+def marked_hosts(monkeypatch, tmp_path):
+    monkeypatch.setattr(cmk.utils.paths, "var_dir", str(tmp_path))
+    autodiscovery_dir = tmp_path / "autodiscovery"
+    autodiscovery_dir.mkdir()
+    for hostname in ["host1", "host2", "host3", "down", "unknown"]:
+        (autodiscovery_dir / hostname).write_bytes(b"")
+
+    ts = Scenario()
+    for hostname in ["host1", "host2", "host3", "down"]:
+        ts.add_host(hostname)
+    ts.set_option("monitoring_core", "nagios")
+    ts.apply(monkeypatch)
+
+    monkeypatch.setattr(discovery, "_fetch_host_states", lambda: {
+        "host1": 0,
+        "host2": 0,
+        "host3": 0,
+        "down": 1,
+    })
+    return autodiscovery_dir
+
+
+@pytest.mark.parametrize("processes", [1, 3])
+def test_discover_marked_hosts(monkeypatch, marked_hosts, processes):
+    monkeypatch.setattr(discovery.config, "marked_host_discovery_processes", processes)
+
+    def discover_marked_host(config_cache, host_config, now_ts, oldest_queued):
+        assert host_config.hostname in ["host1", "host2", "host3"]
+        (marked_hosts / host_config.hostname).unlink()
+        return host_config.hostname == "host2"
+
+    monkeypatch.setattr(discovery, "_discover_marked_host", discover_marked_host)
+
+    restarts = []
+    monkeypatch.setattr(discovery.cmk_base.core, "do_restart", restarts.append)
+
+    discovery.discover_marked_hosts("core")
+
+    assert restarts == ["core"]
+    # Marks of unknown hosts are removed, hosts that are not UP are kept
+    assert sorted(p.name for p in marked_hosts.iterdir()) == ["down"]
+
+
+def test_discover_marked_host_job_timeout(monkeypatch, marked_hosts):
+    monkeypatch.setattr(discovery.config, "marked_host_discovery_host_timeout", 1)
+    monkeypatch.setattr(discovery, "_discover_marked_host", lambda *args: time.sleep(5))
+
+    now = time.time()
+    hostname, state, services_changed, duration = discovery._discover_marked_host_job(
+        ("host1", now, now, now + 100))
+    assert (hostname, state, services_changed) == ("host1", "timeout", False)
+    assert duration < 5
+
+    assert discovery._discover_marked_host_job(("host1", now, now, now - 1)) == \
+        ("host1", "skipped", False, 0.0)
@@ -0,0 +1,139 @@
+# pylint: disable=redefined-outer-name
+
+import os
+
+import pytest  # type: ignore
+
+import cmk.utils.paths
+import cmk.utils.store as store
+import cmk_base.item_state as item_state
+
+
+@pytest.fixture(autouse=True)
+def counters_dir(tmp_path, monkeypatch):
+    path = str(tmp_path / "counters")
+    monkeypatch.setattr(cmk.utils.paths, "counters_dir", path)
+    return path
+
+
+def _loaded(store_class=item_state.BinaryItemStateStore):
+    states = item_state.CachedItemStates(store_class)
+    states.load("host")
+    return states
+
+
+@pytest.mark.parametrize("store_class", [
+    item_state.BinaryItemStateStore,
+    item_state.ReprItemStateStore,
+])
+def test_save_and_load(store_class):
+    states = _loaded(store_class)
+    states.set_item_state_prefix(("check", u"item"))
+    states.set_item_state("counter", (1.0, 2))
+    states.set_item_state("other", {"a": [1, None]})
+    states.save("host")
+
+    states = _loaded(store_class)
+    assert states.get_all_item_states() == {
+        ("check", u"item", "counter"): (1.0, 2),
+        ("check", u"item", "other"): {
+            "a": [1, None]
+        },
+    }
+
+
+def test_binary_store_decodes_on_access(counters_dir):
+    states = _loaded()
+    states.set_item_state("a", 1)
+    states.set_item_state("b", 2)
+    states.save("host")
+
+    states = _loaded()
+    assert states._item_states == {}
+    assert states.get_item_state("a") == 1
+    assert states._item_states == {("a",): 1}
+    assert states.get_item_state("x", "default") == "default"
+
+
+def test_binary_store_appends_modifications(counters_dir):
+    path = os.path.join(counters_dir, "host")
+    states = _loaded()
+    for i in range(10):
+        states.set_item_state(i, i)
+    states.save("host")
+    size = os.stat(path).st_size
+
+    states = _loaded()
+    states.set_item_state(1, "x")
+    states.clear_item_state(2)
+    states.save("host")
+    assert os.stat(path).st_size > size
+
+    states = _loaded()
+    assert states.get_all_item_states() == {(i,): "x" if i == 1 else i for i in range(10) if i != 2}
+
+
+def test_binary_store_compacts_outdated_entries(counters_dir):
+    path = os.path.join(counters_dir, "host")
+    states = _loaded()
+    for i in range(10):
+        states.set_item_state(i, i)
+    states.save("host")
+    size = os.stat(path).st_size
+
+    for _round in range(5):
+        states = _loaded()
+        for i in range(10):
+            states.set_item_state(i, i)
+        states.save("host")
+
+    assert os.stat(path).st_size < 3 * size
+    assert _loaded().get_all_item_states() == {(i,): i for i in range(10)}
+
+
+def test_binary_store_keeps_concurrent_modifications():
+    states1 = _loaded()
+    states1.set_item_state("a", 1)
+    states1.save("host")
+
+    states1 = _loaded()
+    states2 = _loaded()
+    states1.set_item_state("b", 2)
+    states2.set_item_state("c", 3)
+    states2.clear_item_state("a")
+    states1.save("host")
+    states2.save("host")
+
+    assert _loaded().get_all_item_states() == {("b",): 2, ("c",): 3}
+
+
+def test_binary_store_migrates_repr_file(counters_dir):
+    path = os.path.join(counters_dir, "host")
+    os.makedirs(counters_dir)
+    store.save_data_to_file(path, {("check", None, "a"): (1, 2)}, pretty=False)
+
+    states = _loaded()
+    assert states.get_all_item_states() == {("check", None, "a"): (1, 2)}
+    states.set_item_state("b", 3)
+    states.save("host")
+
+    assert open(path).read().startswith(item_state.BinaryItemStateStore._MAGIC)
+    assert _loaded().get_all_item_states() == {("check", None, "a"): (1, 2), ("b",): 3}
+
+
+def test_binary_store_ignores_incomplete_record(counters_dir):
+    path = os.path.join(counters_dir, "host")
+    states = _loaded()
+    states.set_item_state("a", 1)
+    states.save("host")
+
+    with open(path, "ab") as f:
+        f.write("\xff\x00\x00\x00incomplete")
+
+    states = _loaded()
+    assert states.get_all_item_states() == {("a",): 1}
+
+    # The next save must not append behind the incomplete record
+    states.set_item_state("b", 2)
+    states.save("host")
+    assert _loaded().get_all_item_states() == {("a",): 1, ("b",): 2}
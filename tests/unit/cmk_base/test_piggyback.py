@@ -17,7 +17,10 @@ def verbose_logging():
 
 
 @pytest.fixture(autouse=True)
-def test_config():
+def test_config(monkeypatch):
+    # The status files are modified in place below, which the index can not detect
+    monkeypatch.setattr(piggyback, "_source_index", None)
+
     piggyback_dir = cmk.utils.paths.piggyback_dir
     host_dir = piggyback_dir / "test-host"
     host_dir.mkdir(parents=True, exist_ok=True)  # pylint: disable=no-member
@@ -30,6 +33,9 @@ def test_config():
         f.write(u"<<<check_mk>>>\nlala\n")
 
     cmk.utils.paths.piggyback_source_dir.mkdir(parents=True, exist_ok=True)  # pylint: disable=no-member
+    for f in cmk.utils.paths.piggyback_source_dir.glob("*"):  # pylint: disable=no-member
+        f.unlink()
+
     source_status_file = cmk.utils.paths.piggyback_source_dir / "source1"
     with source_status_file.open("w", encoding="utf-8") as f:  # pylint: disable=no-member
         f.write(u"")
@@ -149,3 +155,52 @@ def test_get_source_and_piggyback_hosts():
         ('source2', 'test-host'),
         ('source2', 'test-host2'),
     ])
+
+
+def test_store_piggyback_raw_data_writes_source_index():
+    piggyback.store_piggyback_raw_data("source2", {
+        "test-host": [u"<<<check_mk>>>", u"lulu"],
+        "test-host2": [u"<<<check_mk>>>", u"lulu"],
+    })
+
+    status_file = cmk.utils.paths.piggyback_source_dir / "source2"
+    assert status_file.open().read() == "test-host\ntest-host2\n"  # pylint: disable=no-member
+
+
+def test_get_piggyback_files_uses_source_index():
+    piggyback.store_piggyback_raw_data("source2", {"test-host2": [u"<<<check_mk>>>", u"lulu"]})
+
+    # Only the hosts listed in the status file are considered
+    piggyback.store_piggyback_raw_data("source2", {"test-host": [u"<<<check_mk>>>", u"lulu"]})
+    assert piggyback.get_piggyback_files(piggyback_max_cachefile_age, "test-host2") == []
+    assert sorted(piggyback.get_piggyback_files(piggyback_max_cachefile_age, "test-host")) == [
+        ("source1", str(cmk.utils.paths.piggyback_dir / "test-host" / "source1")),
+        ("source2", str(cmk.utils.paths.piggyback_dir / "test-host" / "source2")),
+    ]
+
+
+def test_get_piggyback_files_source_index_outdated(monkeypatch):
+    piggyback.store_piggyback_raw_data("source2", {"test-host2": [u"<<<check_mk>>>", u"lulu"]})
+    assert piggyback.get_piggyback_files(piggyback_max_cachefile_age, "test-host2") != []
+
+    monkeypatch.setattr(time, "time", lambda: time.mktime(time.localtime()) + 10)
+    assert piggyback.get_piggyback_files(5, "test-host2") == []
+
+
+def test_source_index_rebuilt_on_change():
+    assert piggyback.get_piggyback_files(piggyback_max_cachefile_age, "test-host2") == []
+    piggyback.store_piggyback_raw_data("source2", {"test-host2": [u"<<<check_mk>>>", u"lulu"]})
+    assert piggyback.get_piggyback_files(piggyback_max_cachefile_age, "test-host2") != []
+
+    piggyback.remove_source_status_file("source2")
+    assert piggyback.get_piggyback_files(piggyback_max_cachefile_age, "test-host2") == []
+
+
+def test_cleanup_piggyback_files_not_in_source_index():
+    piggyback.store_piggyback_raw_data("source2", {"test-host2": [u"<<<check_mk>>>", u"lulu"]})
+    piggyback.store_piggyback_raw_data("source2", {"test-host": [u"<<<check_mk>>>", u"lulu"]})
+
+    piggyback.cleanup_piggyback_files(piggyback_max_cachefile_age)
+
+    assert not (cmk.utils.paths.piggyback_dir / "test-host2" / "source2").exists()
+    assert (cmk.utils.paths.piggyback_dir / "test-host" / "source2").exists()
@@ -1,8 +1,12 @@
+import json
 import math
+import random
 import time
 from pprint import pprint
+import numpy as np
 import pytest
 
+import cmk.utils.prediction
 from cmk_base import prediction
 from testlib import on_time
 
@@ -107,3 +111,40 @@ def test_time_slices(utcdate, timezone, horizon, period_info, timegroup, result)
 ])
 def test_data_stats(slices, result):
     assert prediction.data_stats(slices) == result
+    assert prediction.data_stats_of_matrix(np.array(slices, dtype=float)) == result
+
+
+def test_data_stats_of_matrix_identical():
+    rand = random.Random(42)
+    slices = [[
+        None if rand.random() < 0.2 else rand.uniform(-1e3, 1e6) * rand.choice([1, 1e-9, 1e9])
+        for _ in range(500)
+    ] for _ in range(8)]
+    assert json.dumps(prediction.data_stats_of_matrix(np.array(slices, dtype=float))) == \
+        json.dumps(prediction.data_stats(slices))
+
+
+def test_calculate_data_for_prediction_without_numpy(monkeypatch):
+    rand = random.Random(7)
+    time_windows = [(1000000 - n * 86400, 1000000 - (n - 1) * 86400) for n in range(4)]
+    queried = []
+
+    def rrd_datacolumn(windows):
+        queried.append(windows)
+        series = []
+        for nr, (start, end) in enumerate(windows):
+            step = 60 * (nr + 1)
+            start, end = start - start % step, end - end % step + step
+            values = [rand.random() for _ in range((end - start) // step)]
+            series.append(cmk.utils.prediction.TimeSeries([start, end, step] + values))
+        return series
+
+    with_numpy = prediction.calculate_data_for_prediction(time_windows, rrd_datacolumn)
+    monkeypatch.setattr(prediction, "np", None)
+    monkeypatch.setattr(cmk.utils.prediction, "np", None)
+    rand.seed(7)
+    without_numpy = prediction.calculate_data_for_prediction(time_windows, rrd_datacolumn)
+
+    assert queried == [time_windows, time_windows]
+    assert with_numpy["num_points"] == 1441
+    assert json.dumps(with_numpy) == json.dumps(without_numpy)
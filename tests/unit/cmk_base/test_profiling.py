@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+import os
+import signal
+import time
+
+import pytest  # type: ignore
+
+import cmk.utils.paths
+import cmk_base.check_api_utils as check_api_utils
+import cmk_base.cpu_tracking as cpu_tracking
+import cmk_base.profiling as profiling
+
+
+def _burn_cpu(sampler, min_samples=5, timeout=10.0):
+    end = time.time() + timeout
+    while time.time() < end and sum(sampler.samples().values()) < min_samples:
+        sum(i * i for i in xrange(1000))
+
+
+@pytest.fixture()
+def sampler():
+    sampler = profiling.StackSampler(interval=0.001)
+    yield sampler
+    if sampler.is_running():
+        sampler.stop()
+
+
+def test_sampler_collapsed_stacks(sampler, monkeypatch):
+    monkeypatch.setattr(check_api_utils, "_hostname", "heute")
+    sampler.start()
+    with cpu_tracking.track("check", "df"):
+        _burn_cpu(sampler)
+    sampler.stop()
+
+    samples = sampler.samples()
+    assert samples
+    tagged = [stack for stack in samples if stack.startswith("host:heute;check:df;")]
+    assert tagged
+    assert any("test_profiling.py:_burn_cpu" in stack for stack in tagged)
+
+
+def test_sampler_without_context(sampler, monkeypatch):
+    monkeypatch.setattr(check_api_utils, "_hostname", None)
+    sampler.start()
+    _burn_cpu(sampler)
+    sampler.stop()
+
+    assert all(not stack.startswith("host:") for stack in sampler.samples())
+
+
+def test_sampler_write(sampler, tmpdir):
+    sampler.samples().update({"a;b": 2, "a;c": 1})
+    path = str(tmpdir.join("profile.folded"))
+    sampler.write(path)
+    assert open(path).read() == "a;b 2\na;c 1\n"
+
+
+def test_sampling_toggle(monkeypatch, tmpdir):
+    monkeypatch.setattr(cmk.utils.paths, "var_dir", str(tmpdir))
+    orig_handler = signal.getsignal(signal.SIGUSR2)
+    try:
+        profiling.install_sampling_toggle()
+
+        os.kill(os.getpid(), signal.SIGUSR2)
+        assert profiling.sampling_enabled()
+
+        os.kill(os.getpid(), signal.SIGUSR2)
+        assert not profiling.sampling_enabled()
+    finally:
+        signal.signal(signal.SIGUSR2, orig_handler)
+
+    assert len(tmpdir.join("profiling").listdir()) == 1
@@ -0,0 +1,179 @@
+# encoding: utf-8
+
+import pytest  # type: ignore
+
+import cmk.utils.paths
+import cmk.utils.store as store
+import cmk_base.config as config
+import cmk_base.snmp as snmp
+import cmk_base.snmp_cache as snmp_cache
+import cmk_base.snmp_utils as snmp_utils
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(monkeypatch, tmpdir):
+    monkeypatch.setattr(cmk.utils.paths, "var_dir", str(tmpdir))
+    snmp.cleanup_host_caches()
+    yield tmpdir
+    snmp.cleanup_host_caches()
+
+
+def _other_process_cache(hostname, max_size=1024):
+    # A new object reads the file like another process would do
+    return snmp_cache.SNMPCache(hostname, max_size)
+
+
+def test_get_set():
+    cache = _other_process_cache("heute")
+    assert cache.get("key") is None
+    assert cache.get("key", 1) == 1
+    assert "key" not in cache
+
+    cache.set("key", [(".1.2.1", "abc")])
+    assert cache.get("key") == [(".1.2.1", "abc")]
+    assert "key" in cache
+
+    # Not visible to other processes until saved
+    assert _other_process_cache("heute").get("key") is None
+    cache.save()
+    assert _other_process_cache("heute").get("key") == [(".1.2.1", "abc")]
+
+
+def test_unmarshalable_value_is_not_cached():
+    cache = _other_process_cache("heute")
+    cache.set("key", object())
+    assert "key" not in cache
+
+
+def test_ttl(monkeypatch):
+    monkeypatch.setattr("time.time", lambda: 1000.0)
+    cache = _other_process_cache("heute")
+    cache.set("short", "a", ttl=10)
+    cache.set("forever", "b")
+    cache.save()
+
+    monkeypatch.setattr("time.time", lambda: 1011.0)
+    cache = _other_process_cache("heute")
+    assert cache.get("short") is None
+    assert cache.get("forever") == "b"
+
+
+def test_merge_changes_of_processes():
+    cache_a = _other_process_cache("heute")
+    cache_b = _other_process_cache("heute")
+    cache_a.get("a")
+    cache_b.get("b")
+
+    cache_a.set("a", "1")
+    cache_a.save()
+    cache_b.set("b", "2")
+    cache_b.save()
+
+    cache = _other_process_cache("heute")
+    assert (cache.get("a"), cache.get("b")) == ("1", "2")
+
+
+def test_lru_eviction(monkeypatch):
+    value = "x" * 400
+    for now, key in [(1.0, "a"), (2.0, "b")]:
+        monkeypatch.setattr("time.time", lambda now=now: now)
+        cache = _other_process_cache("heute")
+        cache.set(key, value)
+        cache.save()
+
+    # Using "a" makes "b" the least recently used entry
+    monkeypatch.setattr("time.time", lambda: 3.0)
+    cache = _other_process_cache("heute")
+    assert cache.get("a") == value
+    cache.set("c", value)
+    cache.save()
+
+    cache = _other_process_cache("heute")
+    assert sorted(k for k in ["a", "b", "c"] if k in cache) == ["a", "c"]
+
+
+def test_broken_file(cache_dir):
+    cache_dir.join("snmp_shared_cache").ensure(dir=True).join("heute").write("garbage")
+    cache = _other_process_cache("heute")
+    assert cache.get("key") is None
+    cache.set("key", "value")
+    cache.save()
+    assert _other_process_cache("heute").get("key") == "value"
+
+
+def _snmp_config():
+    return snmp_utils.SNMPHostConfig(
+        is_ipv6_primary=False,
+        hostname="heute",
+        ipaddress="127.0.0.1",
+        credentials="public",
+        port=161,
+        is_bulkwalk_host=False,
+        is_snmpv2or3_without_bulkwalk_host=False,
+        bulk_walk_size_of=10,
+        timing={},
+        oid_range_limits=[],
+        snmpv3_contexts=[],
+        character_encoding=None,
+        is_usewalk_host=False,
+        is_inline_snmp_host=False,
+    )
+
+
+class _CountingBackend(object):
+    def __init__(self):
+        self.num_gets = 0
+
+    def get(self, snmp_config, oid, context_name=None):
+        self.num_gets += 1
+        return "value of %s" % oid
+
+
+def test_single_oid_shared_between_processes(monkeypatch):
+    backend = _CountingBackend()
+    monkeypatch.setattr(snmp.SNMPBackendFactory, "factory",
+                        staticmethod(lambda snmp_config, enforce_stored_walks: backend))
+    snmp_config = _snmp_config()
+
+    snmp.initialize_single_oid_cache(snmp_config)
+    assert snmp.get_single_oid(snmp_config, ".1.3.6.1.2.1.1.1.0") == "value of .1.3.6.1.2.1.1.1.0"
+    snmp.write_single_oid_cache(snmp_config)
+    assert backend.num_gets == 1
+
+    # Another process scanning the same host
+    snmp.cleanup_host_caches()
+    snmp.initialize_single_oid_cache(snmp_config)
+    assert snmp.get_single_oid(snmp_config, ".1.3.6.1.2.1.1.1.0") == "value of .1.3.6.1.2.1.1.1.0"
+    assert backend.num_gets == 1
+
+
+def test_single_oid_ttl(monkeypatch):
+    monkeypatch.setattr(config, "snmp_cache_single_oid_ttl", 0)
+    backend = _CountingBackend()
+    monkeypatch.setattr(snmp.SNMPBackendFactory, "factory",
+                        staticmethod(lambda snmp_config, enforce_stored_walks: backend))
+    monkeypatch.setattr("time.time", lambda: 1000.0)
+    snmp_config = _snmp_config()
+
+    snmp.initialize_single_oid_cache(snmp_config)
+    snmp.get_single_oid(snmp_config, ".1.3.6.1.2.1.1.1.0")
+    snmp.write_single_oid_cache(snmp_config)
+
+    monkeypatch.setattr("time.time", lambda: 1001.0)
+    snmp.cleanup_host_caches()
+    snmp.initialize_single_oid_cache(snmp_config)
+    snmp.get_single_oid(snmp_config, ".1.3.6.1.2.1.1.1.0")
+    assert backend.num_gets == 2
+
+
+def test_walk_cache_takes_over_legacy_files(cache_dir):
+    legacy_path = cache_dir.join("snmp_cache", "heute").ensure(dir=True).join(".1.2.3")
+    store.save_data_to_file(str(legacy_path), [(".1.2.3.1", "abc")], pretty=False)
+
+    assert snmp._get_cached_snmpwalk("heute", ".1.2.3") == [(".1.2.3.1", "abc")]
+    assert snmp._get_cached_snmpwalk("heute", ".1.2.4") is None
+    snmp_cache.host_cache("heute", config.snmp_cache_max_size).save()
+
+    legacy_path.remove()
+    snmp.cleanup_host_caches()
+    assert snmp._get_cached_snmpwalk("heute", ".1.2.3") == [(".1.2.3.1", "abc")]